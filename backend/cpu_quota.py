@@ -0,0 +1,54 @@
+# RFM Insights - CPU Quota Module
+
+import os
+import math
+
+# cgroup v2 CPU quota file ("<quota> <period>", or "max <period>" without a quota)
+CGROUP_CPU_MAX_FILE = "/sys/fs/cgroup/cpu.max"
+
+# cgroup v1 CPU quota and period files (a quota of -1 means no quota)
+CGROUP_V1_QUOTA_FILES = ("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+
+def _read_values(path):
+    """Whitespace-separated values of a cgroup file (None when unreadable)"""
+    try:
+        with open(path, "r") as f:
+            return f.read().split()
+    except OSError:
+        return None
+
+def cgroup_cpu_limit():
+    """
+    CPUs allowed by the container (cgroup) CPU quota, possibly fractional
+    (None without a quota)
+    """
+    values = _read_values(CGROUP_CPU_MAX_FILE)
+    if values is None:
+        quota, period = (_read_values(path) for path in CGROUP_V1_QUOTA_FILES)
+        if not quota or not period:
+            return None
+        values = quota[:1] + period[:1]
+    try:
+        quota, period = float(values[0]), float(values[1])
+    except (IndexError, ValueError):
+        return None
+    if quota <= 0 or period <= 0:
+        return None
+    return quota / period
+
+def available_cpus():
+    """
+    CPUs this process can keep busy: the CPUs it may be scheduled on,
+    capped by the container CPU quota rounded up (at least 1)
+
+    os.cpu_count() reports the host's cores, which oversubscribes a
+    container limited to a fraction of them.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    limit = cgroup_cpu_limit()
+    if limit is not None:
+        cpus = min(cpus, math.ceil(limit))
+    return max(1, cpus)
@@ -0,0 +1,505 @@
+# RFM Insights - Data Loading Module
+
+import io
+import os
+import datetime
+import warnings
+import numpy as np
+import pandas as pd
+
+# File extensions accepted for analysis uploads
+SUPPORTED_FORMATS = {
+    '.csv': 'csv',
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.feather': 'feather',
+    '.arrow': 'arrow',
+    '.ipc': 'arrow',
+    '.xlsx': 'xlsx'
+}
+
+# Number of spreadsheet rows converted to typed arrays at a time
+EXCEL_BATCH_SIZE = 50000
+
+# Rows per chunk when datasets are streamed
+STREAM_CHUNK_ROWS = 500000
+
+# Bytes read from the start of a CSV upload for column previews
+PREVIEW_MAX_BYTES = 64 * 1024
+
+# Rows used to infer column types in previews
+PREVIEW_TYPE_ROWS = 200
+
+# Column name fragments used to suggest the RFM column mapping, best first
+MAPPING_HINTS = {
+    'user_id': ['customer_id', 'client_id', 'user_id', 'cliente', 'customer', 'usuario', 'user', 'cpf', 'email', 'id'],
+    'recency': ['last_purchase', 'ultima_compra', 'recency', 'recencia', 'ultima', 'last', 'data', 'date'],
+    'frequency': ['frequency', 'frequencia', 'purchase_count', 'compras', 'pedidos', 'orders', 'purchases', 'quantidade', 'qtd', 'count'],
+    'monetary': ['monetary', 'total_spent', 'valor_total', 'gasto', 'spent', 'receita', 'revenue', 'amount', 'valor', 'value', 'total']
+}
+
+# Inferred column types accepted for each RFM role
+MAPPING_TYPES = {
+    'user_id': ('string', 'integer'),
+    'recency': ('datetime',),
+    'frequency': ('integer', 'float'),
+    'monetary': ('float', 'integer')
+}
+
+def detect_format(filename, default='csv'):
+    """
+    Detect the file format from the file name extension
+
+    Parameters:
+    -----------
+    filename : str
+        Name of the uploaded file
+    default : str
+        Format returned when the file name or its extension is missing
+
+    Returns:
+    --------
+    str
+        One of 'csv', 'parquet', 'feather', 'arrow' or 'xlsx'
+
+    Raises ValueError for an unsupported extension (e.g. '.xls'), so binary
+    files are not parsed as CSV.
+    """
+    extension = os.path.splitext(filename or '')[1].lower()
+    if not extension:
+        return default
+    if extension not in SUPPORTED_FORMATS:
+        raise ValueError(f"Unsupported file type: {extension}. Expected one of {', '.join(SUPPORTED_FORMATS)}")
+    return SUPPORTED_FORMATS[extension]
+
+def _require_pyarrow():
+    """Import pyarrow, raising a clear error when it is not installed"""
+    try:
+        import pyarrow
+        return pyarrow
+    except ImportError:
+        raise ValueError("Parquet, Feather and Arrow files require the 'pyarrow' package")
+
+def _as_arrow_source(source):
+    """Wrap raw bytes in a zero-copy Arrow buffer reader"""
+    pa = _require_pyarrow()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return pa.BufferReader(source)
+    return source
+
+def _as_text_source(source):
+    """Wrap raw bytes in a file-like object for the CSV reader"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    return source
+
+def _read_arrow_table(source, file_format, columns=None):
+    """Read a Parquet, Feather or Arrow IPC source into an Arrow table"""
+    pa = _require_pyarrow()
+    source = _as_arrow_source(source)
+
+    if file_format == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.read_table(source, columns=columns)
+
+    if file_format == 'feather':
+        import pyarrow.feather as feather
+        return feather.read_table(source, columns=columns, memory_map=isinstance(source, str))
+
+    # Arrow IPC: try the random-access file format first, then the stream format
+    import pyarrow.ipc as ipc
+    try:
+        table = ipc.open_file(source).read_all()
+    except pa.ArrowInvalid:
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        table = ipc.open_stream(source).read_all()
+    return table.select(columns) if columns is not None else table
+
+def _require_openpyxl():
+    """Import openpyxl, raising a clear error when it is not installed"""
+    try:
+        import openpyxl
+        return openpyxl
+    except ImportError:
+        raise ValueError("Excel files require the 'openpyxl' package")
+
+def _open_worksheet(source):
+    """Open the first worksheet of a workbook in streaming read-only mode"""
+    openpyxl = _require_openpyxl()
+    workbook = openpyxl.load_workbook(_as_text_source(source), read_only=True, data_only=True)
+    return workbook, workbook.worksheets[0]
+
+def _to_typed_array(values):
+    """
+    Convert a batch of cell values to a datetime64, int64, float64 or object array
+
+    Integral cells stay integers (int64, or Python ints next to blank
+    cells), so numeric IDs keep their original text ('1', not '1.0').
+    """
+    sample = next((value for value in values if value is not None), None)
+    try:
+        if isinstance(sample, (datetime.datetime, datetime.date)):
+            # Other cells (e.g. numbers) would be read as nanosecond offsets
+            if all(value is None or isinstance(value, (datetime.datetime, datetime.date)) for value in values):
+                return np.array(values, dtype='datetime64[ns]')
+            return np.array(values, dtype=object)
+        if isinstance(sample, (int, float)) and not isinstance(sample, bool):
+            if all(type(value) is int for value in values):
+                return np.array(values, dtype=np.int64)
+            if all(value is None or type(value) is int for value in values):
+                return np.array(values, dtype=object)
+            return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError, OverflowError):
+        pass
+    return np.array(values, dtype=object)
+
+def _cell_values(array):
+    """Cell values back from a typed batch (datetimes, ints, floats, None for blanks)"""
+    if array.dtype.kind == 'M':
+        return array.astype('datetime64[us]').astype(object)
+    if array.dtype.kind == 'f':
+        values = array.astype(object)
+        values[np.isnan(array)] = None
+        return values
+    return array.astype(object)
+
+def _concat_typed(chunks):
+    """
+    Concatenate the typed batches of a column into the array the whole
+    column would have been typed as
+
+    Batches of the same dtype are joined as they are; otherwise their cell
+    values are re-typed at once, so e.g. a date batch next to a number
+    batch becomes an object column and integer IDs next to blank cells
+    keep their text.
+    """
+    if len({chunk.dtype for chunk in chunks}) == 1:
+        return np.concatenate(chunks)
+    return _to_typed_array(list(np.concatenate([_cell_values(chunk) for chunk in chunks])))
+
+def _read_excel_streaming(source, columns=None, batch_size=EXCEL_BATCH_SIZE):
+    """
+    Read an .xlsx worksheet row by row, keeping only the requested columns
+
+    Rows are pulled from openpyxl's read-only iterator and converted to typed
+    arrays every batch_size rows, so memory stays close to the size of the
+    projected columns instead of the whole workbook.
+    """
+    workbook, worksheet = _open_worksheet(source)
+    try:
+        rows = worksheet.iter_rows(values_only=True)
+        header = [str(name) if name is not None else '' for name in next(rows, ())]
+
+        if columns is None:
+            columns = [name for name in header if name]
+        missing = [col for col in columns if col not in header]
+        if missing:
+            raise ValueError(f"Missing required columns: {', '.join(missing)}")
+
+        positions = [header.index(col) for col in columns]
+        min_col, max_col = min(positions), max(positions)
+        offsets = [position - min_col for position in positions]
+
+        # Only the cell range spanning the mapped columns is materialized
+        rows = worksheet.iter_rows(min_row=2, min_col=min_col + 1, max_col=max_col + 1, values_only=True)
+
+        chunks = {col: [] for col in columns}
+        buffers = {col: [] for col in columns}
+        pending = 0
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            for col, offset in zip(columns, offsets):
+                buffers[col].append(row[offset] if offset < len(row) else None)
+            pending += 1
+            if pending >= batch_size:
+                for col in columns:
+                    chunks[col].append(_to_typed_array(buffers[col]))
+                    buffers[col] = []
+                pending = 0
+
+        for col in columns:
+            if buffers[col] or not chunks[col]:
+                chunks[col].append(_to_typed_array(buffers[col]))
+    finally:
+        workbook.close()
+
+    return pd.DataFrame({col: _concat_typed(chunks[col]) for col in columns}, columns=columns)
+
+def get_column_names(source, file_format='csv'):
+    """
+    Read only the column names of a dataset, without loading its rows
+
+    Parameters:
+    -----------
+    source : bytes, str or file-like
+        Raw file contents, a file path or an open binary file
+    file_format : str
+        One of 'csv', 'parquet', 'feather', 'arrow' or 'xlsx'
+
+    Returns:
+    --------
+    list
+        Column names in file order
+    """
+    if file_format == 'csv':
+        return list(pd.read_csv(_as_text_source(source), nrows=0).columns)
+
+    if file_format == 'xlsx':
+        workbook, worksheet = _open_worksheet(source)
+        try:
+            header = next(worksheet.iter_rows(max_row=1, values_only=True), ())
+        finally:
+            workbook.close()
+        return [str(name) for name in header if name is not None]
+
+    _require_pyarrow()
+    arrow_source = _as_arrow_source(source)
+    if file_format == 'parquet':
+        import pyarrow.parquet as pq
+        return list(pq.read_schema(arrow_source).names)
+    import pyarrow.ipc as ipc
+    if file_format == 'feather':
+        return list(ipc.open_file(arrow_source).schema.names)
+    # Arrow IPC: the stream format carries its schema up front, the
+    # random-access file format in its footer; neither reads the batches
+    pa = _require_pyarrow()
+    try:
+        return list(ipc.open_stream(arrow_source).schema.names)
+    except pa.ArrowInvalid:
+        if hasattr(arrow_source, 'seek'):
+            arrow_source.seek(0)
+        return list(ipc.open_file(arrow_source).schema.names)
+
+def load_dataset(source, file_format='csv', columns=None):
+    """
+    Load a dataset into a DataFrame, reading only the requested columns
+
+    Columnar formats are read through Arrow with column projection, so only
+    the mapped columns are decoded and typed timestamp/numeric columns reach
+    pandas without a text round-trip. Excel workbooks are streamed row by
+    row in read-only mode.
+
+    Parameters:
+    -----------
+    source : bytes, str or file-like
+        Raw file contents, a file path or an open binary file
+    file_format : str
+        One of 'csv', 'parquet', 'feather', 'arrow' or 'xlsx'
+    columns : list, optional
+        Columns to read (all columns when None)
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Loaded data
+    """
+    if file_format not in set(SUPPORTED_FORMATS.values()):
+        raise ValueError(f"Unsupported file format: {file_format}")
+
+    if columns is not None:
+        # The same column may be mapped to several roles
+        columns = list(dict.fromkeys(columns))
+
+    if file_format == 'csv':
+        return pd.read_csv(_as_text_source(source), usecols=columns)
+
+    if file_format == 'xlsx':
+        return _read_excel_streaming(source, columns=columns)
+
+    table = _read_arrow_table(source, file_format, columns=columns)
+    # split_blocks/self_destruct avoid holding two copies of every column
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+def iter_dataset(source, file_format='csv', columns=None, chunksize=STREAM_CHUNK_ROWS):
+    """
+    Stream a dataset as DataFrame chunks, reading only the requested columns
+
+    CSV files are read with the chunked parser and Parquet files batch by
+    batch; other formats are loaded at once and yielded as a single chunk.
+
+    Parameters:
+    -----------
+    source : bytes, str or file-like
+        Raw file contents, a file path or an open binary file
+    file_format : str
+        One of 'csv', 'parquet', 'feather', 'arrow' or 'xlsx'
+    columns : list, optional
+        Columns to read (all columns when None)
+    chunksize : int
+        Maximum number of rows per chunk
+
+    Yields:
+    -------
+    pandas.DataFrame
+        Consecutive chunks of the dataset
+    """
+    if columns is not None:
+        columns = list(dict.fromkeys(columns))
+
+    if file_format == 'csv':
+        with pd.read_csv(_as_text_source(source), usecols=columns, chunksize=chunksize) as reader:
+            for chunk in reader:
+                yield chunk
+        return
+
+    if file_format == 'parquet':
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(_as_arrow_source(source))
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+        return
+
+    yield load_dataset(source, file_format=file_format, columns=columns)
+
+def _infer_column_type(series):
+    """Infer a simple type name ('integer', 'float', 'boolean', 'datetime', 'string') for a column"""
+    if pd.api.types.is_bool_dtype(series):
+        return 'boolean'
+    if pd.api.types.is_integer_dtype(series):
+        return 'integer'
+    if pd.api.types.is_float_dtype(series):
+        values = series.dropna()
+        return 'integer' if len(values) and (values == values.round()).all() else 'float'
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return 'datetime'
+
+    values = series.dropna().astype(str)
+    if len(values) == 0:
+        return 'string'
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        parsed = pd.to_datetime(values, errors='coerce')
+    if parsed.notna().all() and pd.to_numeric(values, errors='coerce').isna().all():
+        return 'datetime'
+    return 'string'
+
+def _json_value(value):
+    """Convert a pandas/numpy scalar to a JSON-serializable value"""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+def _read_preview_frame(source, file_format, nrows, truncated=False):
+    """Read the first nrows of a dataset without loading the rest of the file"""
+    if file_format == 'csv':
+        if truncated and isinstance(source, (bytes, bytearray)):
+            # Drop the partial line left at the end of a range-limited upload
+            source = source[:source.rfind(b'\n') + 1] or source
+        return pd.read_csv(_as_text_source(source), nrows=nrows)
+
+    if file_format == 'xlsx':
+        workbook, worksheet = _open_worksheet(source)
+        try:
+            rows = list(worksheet.iter_rows(max_row=nrows + 1, values_only=True))
+        finally:
+            workbook.close()
+        header = [str(name) if name is not None else f'column_{i}' for i, name in enumerate(rows[0] if rows else ())]
+        return pd.DataFrame(rows[1:], columns=header)
+
+    pa = _require_pyarrow()
+    arrow_source = _as_arrow_source(source)
+    if file_format == 'parquet':
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(arrow_source)
+        batch = next(parquet_file.iter_batches(batch_size=nrows), None)
+        table = pa.Table.from_batches([batch]) if batch is not None else parquet_file.schema_arrow.empty_table()
+        return table.to_pandas()
+
+    import pyarrow.ipc as ipc
+    try:
+        reader = ipc.open_file(arrow_source)
+        batches = [reader.get_batch(0)] if reader.num_record_batches else []
+        schema = reader.schema
+    except pa.ArrowInvalid:
+        if hasattr(arrow_source, 'seek'):
+            arrow_source.seek(0)
+        reader = ipc.open_stream(arrow_source)
+        batches = [next(iter(reader), None)]
+        batches = [batch for batch in batches if batch is not None]
+        schema = reader.schema
+    return pa.Table.from_batches(batches, schema=schema).slice(0, nrows).to_pandas()
+
+def suggest_mapping(column_types):
+    """
+    Suggest which columns to use for user id, recency, frequency and monetary
+
+    Parameters:
+    -----------
+    column_types : dict
+        Inferred type name for each column, in file order
+
+    Returns:
+    --------
+    dict
+        Suggested column (or None) for 'user_id', 'recency', 'frequency' and 'monetary'
+    """
+    mapping = {}
+    used = set()
+    for role, hints in MAPPING_HINTS.items():
+        best_column, best_score = None, 0
+        for column, column_type in column_types.items():
+            if column in used or column_type not in MAPPING_TYPES[role]:
+                continue
+            name = column.lower()
+            score = 0
+            for rank, hint in enumerate(hints):
+                if hint in name:
+                    score = len(hints) - rank + (len(hints) if name == hint else 0)
+                    break
+            if score and column_type == MAPPING_TYPES[role][0]:
+                score += 1
+            if score > best_score:
+                best_column, best_score = column, score
+        mapping[role] = best_column
+        if best_column is not None:
+            used.add(best_column)
+    return mapping
+
+def preview_dataset(source, file_format='csv', sample_rows=5, truncated=False):
+    """
+    Preview the columns of a dataset from its first rows only
+
+    CSV previews work on a byte prefix of the file (truncated=True drops the
+    trailing partial line). Parquet, Feather, Arrow IPC and Excel previews
+    read the schema and the first batch/rows only.
+
+    Parameters:
+    -----------
+    source : bytes, str or file-like
+        Raw file contents (or a prefix of them), a file path or an open binary file
+    file_format : str
+        One of 'csv', 'parquet', 'feather', 'arrow' or 'xlsx'
+    sample_rows : int
+        Number of sample values returned per column
+    truncated : bool
+        Whether source is a prefix of a larger CSV file
+
+    Returns:
+    --------
+    dict
+        Columns with inferred types and sample values, and the suggested mapping
+    """
+    frame = _read_preview_frame(source, file_format, max(PREVIEW_TYPE_ROWS, sample_rows), truncated=truncated)
+    column_types = {str(col): _infer_column_type(frame[col]) for col in frame.columns}
+
+    columns = [
+        {
+            'name': str(col),
+            'type': column_types[str(col)],
+            'sample_values': [_json_value(value) for value in frame[col].head(sample_rows)]
+        }
+        for col in frame.columns
+    ]
+
+    return {
+        'file_format': file_format,
+        'rows_sampled': len(frame),
+        'columns': columns,
+        'suggested_mapping': suggest_mapping(column_types)
+    }
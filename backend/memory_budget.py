@@ -0,0 +1,159 @@
+# RFM Insights - Memory Budget Module
+
+import os
+import shutil
+import tempfile
+import pandas as pd
+
+# Explicit memory budget of one analysis, in MB (derived from the
+# container or machine memory when unset)
+MEMORY_BUDGET_ENV = "RFM_MEMORY_BUDGET_MB"
+
+# Share of the container (cgroup) or machine memory one analysis may use;
+# the rest is left to the worker itself and other in-flight requests
+MEMORY_BUDGET_FRACTION = 0.5
+
+# cgroup v2 and v1 memory limit files
+CGROUP_LIMIT_FILES = ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes")
+
+# Directory for spilled intermediates (system temporary directory when unset)
+SPILL_DIR_ENV = "RFM_SPILL_DIR"
+
+# Partitions intermediates are spilled into (each is reduced on its own)
+SPILL_PARTITIONS = 16
+
+class MemoryBudgetExceeded(MemoryError):
+    """Raised when an analysis cannot fit its memory budget, even spilled"""
+
+def default_memory_limit():
+    """
+    Memory budget of an analysis in bytes: RFM_MEMORY_BUDGET_MB, or a share
+    of the container memory limit (of the physical memory without one)
+    """
+    if os.environ.get(MEMORY_BUDGET_ENV):
+        return int(float(os.environ[MEMORY_BUDGET_ENV]) * 1024 * 1024)
+
+    total = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    for path in CGROUP_LIMIT_FILES:
+        try:
+            with open(path, "r") as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit():
+            total = min(total, int(value))
+        break
+    return int(total * MEMORY_BUDGET_FRACTION)
+
+def frame_bytes(df):
+    """In-memory size of a DataFrame, including the strings it holds"""
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+class MemoryBudget:
+    """
+    Estimated memory footprint of one analysis, by pipeline stage
+
+    Every stage (loaded input, per-customer aggregates, segments, models)
+    charges its estimated size when it is built and releases it when it is
+    dropped. Stages can check whether an intermediate fits before building
+    it, and switch to a spilled or sampled alternative (recorded in
+    fallbacks); a charge that does not fit raises MemoryBudgetExceeded, so
+    oversized uploads are rejected before the process runs out of memory.
+    """
+
+    def __init__(self, limit_bytes=None):
+        """
+        Parameters:
+        -----------
+        limit_bytes : int, optional
+            Budget in bytes (default_memory_limit() when omitted)
+        """
+        self.limit_bytes = int(limit_bytes or default_memory_limit())
+        self.stages = {}
+        self.peak_bytes = 0
+        # Cheaper strategies stages switched to (spills, sampled training)
+        self.fallbacks = []
+
+    @property
+    def used_bytes(self):
+        """Bytes currently charged across all stages"""
+        return sum(self.stages.values())
+
+    def available(self, stage=None):
+        """Bytes left in the budget (for a stage, including its own charge)"""
+        return self.limit_bytes - self.used_bytes + self.stages.get(stage, 0)
+
+    def fits(self, stage, nbytes):
+        """Whether a stage could be charged nbytes"""
+        return nbytes <= self.available(stage)
+
+    def charge(self, stage, nbytes):
+        """
+        Set the estimated size of a stage
+
+        Raises:
+        -------
+        MemoryBudgetExceeded
+            When the stage does not fit in the rest of the budget
+        """
+        nbytes = int(nbytes)
+        if not self.fits(stage, nbytes):
+            raise MemoryBudgetExceeded(
+                f"Analysis needs ~{(self.used_bytes - self.stages.get(stage, 0) + nbytes) // 2 ** 20}MB "
+                f"at the '{stage}' stage, above its {self.limit_bytes // 2 ** 20}MB memory budget; "
+                f"upload fewer rows or columns, or order lines as CSV or Parquet so they can be streamed"
+            )
+        self.stages[stage] = nbytes
+        self.peak_bytes = max(self.peak_bytes, self.used_bytes)
+
+    def release(self, stage):
+        """Drop the charge of a stage"""
+        self.stages.pop(stage, None)
+
+    def summary(self):
+        """Budget, peak estimate, current charges and fallbacks taken"""
+        return {
+            'limit_bytes': self.limit_bytes,
+            'peak_bytes': self.peak_bytes,
+            'stages': dict(self.stages),
+            'fallbacks': list(self.fallbacks)
+        }
+
+class SpillStore:
+    """
+    Hash-partitioned DataFrames on disk
+
+    Frames are split by a hash of their key columns (or index), so all rows
+    of a key land in the same partition, and appended to that partition as
+    pickle files; each partition can then be reduced on its own.
+    """
+
+    def __init__(self, partitions=SPILL_PARTITIONS):
+        """
+        Parameters:
+        -----------
+        partitions : int
+            Number of partitions
+        """
+        self.partitions = partitions
+        self.directory = tempfile.mkdtemp(prefix="rfm_spill_", dir=os.environ.get(SPILL_DIR_ENV) or None)
+        self.files = [[] for _ in range(partitions)]
+
+    def write(self, df, keys=None):
+        """Append a frame, partitioned by its key columns (its index when None)"""
+        values = df[keys] if keys else df.index.to_frame(index=False)
+        codes = pd.util.hash_pandas_object(values, index=False).to_numpy() % self.partitions
+        for partition in range(self.partitions):
+            part = df[codes == partition]
+            if len(part):
+                path = os.path.join(self.directory, f"{partition:03d}_{len(self.files[partition]):06d}.pkl")
+                part.to_pickle(path)
+                self.files[partition].append(path)
+
+    def read(self, partition):
+        """All frames written to a partition, in write order"""
+        return [pd.read_pickle(path) for path in self.files[partition]]
+
+    def cleanup(self):
+        """Delete the spilled files"""
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,158 @@
+# RFM Insights - Streaming Quantile Sketch Module
+
+import math
+import bisect
+import itertools
+import numpy as np
+
+# Default relative accuracy of log-scaled sketches (1%)
+DEFAULT_RELATIVE_ACCURACY = 0.01
+
+# Bucket key used for zero and negative values in log-scaled sketches
+ZERO_BUCKET = -(2 ** 31)
+
+class QuantileSketch:
+    """
+    Mergeable histogram sketch with O(1) updates and deletions
+
+    Log-scaled sketches bucket positive values so that every value in a
+    bucket is within relative_accuracy of the bucket's upper bound (as in
+    DDSketch). Linear sketches use unit-width buckets, which suits integer
+    day numbers. Quantiles are reported as bucket upper bounds, so a value
+    equal to an edge falls in the lower bin, like pd.qcut.
+    """
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY, linear=False):
+        """
+        Parameters:
+        -----------
+        relative_accuracy : float
+            Maximum relative error of log-scaled quantiles
+        linear : bool
+            Use unit-width buckets instead of log-scaled ones
+        """
+        self.relative_accuracy = relative_accuracy
+        self.linear = linear
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.counts = {}
+        self.total = 0
+
+    def key(self, value):
+        """Bucket key of a value"""
+        if self.linear:
+            return math.ceil(value)
+        if value <= 0:
+            return ZERO_BUCKET
+        return math.ceil(math.log(value) / self.log_gamma)
+
+    def bound(self, key):
+        """Upper bound of a bucket"""
+        if self.linear:
+            return float(key)
+        if key == ZERO_BUCKET:
+            return 0.0
+        return self.gamma ** key
+
+    def add(self, value, count=1):
+        """Add (or with a negative count, remove) occurrences of a value"""
+        key = self.key(value)
+        remaining = self.counts.get(key, 0) + count
+        if remaining:
+            self.counts[key] = remaining
+        else:
+            self.counts.pop(key, None)
+        self.total += count
+
+    def remove(self, value):
+        """Remove one occurrence of a value"""
+        self.add(value, -1)
+
+    def keys(self, values):
+        """Bucket keys of an array of values"""
+        values = np.asarray(values, dtype=float)
+        if self.linear:
+            return np.ceil(values).astype(np.int64)
+        keys = np.full(len(values), ZERO_BUCKET, dtype=np.int64)
+        positive = values > 0
+        keys[positive] = np.ceil(np.log(values[positive]) / self.log_gamma).astype(np.int64)
+        return keys
+
+    def add_many(self, values):
+        """Add an array of values in one vectorized pass"""
+        if len(values) == 0:
+            return
+        unique_keys, key_counts = np.unique(self.keys(values), return_counts=True)
+        for key, count in zip(unique_keys.tolist(), key_counts.tolist()):
+            self.counts[key] = self.counts.get(key, 0) + count
+        self.total += len(values)
+
+    def merge(self, other):
+        """Merge another sketch with the same settings into this one"""
+        if other.linear != self.linear or other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Only sketches with the same settings can be merged")
+        for key, count in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + count
+        self.total += other.total
+        return self
+
+    def quantiles(self, quantiles):
+        """
+        Estimate quantiles from the sketch
+
+        Parameters:
+        -----------
+        quantiles : list of float
+            Quantiles in [0, 1], in ascending order
+
+        Returns:
+        --------
+        list of float
+            Estimated value of each quantile (empty when the sketch is empty)
+        """
+        if self.total <= 0:
+            return []
+        keys = sorted(key for key, count in self.counts.items() if count > 0)
+        cumulative = list(itertools.accumulate(self.counts[key] for key in keys))
+        results = []
+        position = 0
+        for quantile in quantiles:
+            rank = quantile * (self.total - 1)
+            while position < len(keys) - 1 and cumulative[position] <= rank:
+                position += 1
+            results.append(self.bound(keys[position]))
+        return results
+
+    def locate(self, ranks):
+        """
+        Find the bucket holding each rank (0-based position in sorted order)
+
+        Returns:
+        --------
+        list of (int, int)
+            Bucket key and position of the rank within that bucket
+        """
+        keys = sorted(key for key, count in self.counts.items() if count > 0)
+        cumulative = list(itertools.accumulate(self.counts[key] for key in keys))
+        located = []
+        for rank in ranks:
+            position = bisect.bisect_right(cumulative, rank)
+            before = cumulative[position - 1] if position else 0
+            located.append((keys[position], rank - before))
+        return located
+
+    def to_dict(self):
+        """Serialize the sketch to JSON-compatible types"""
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'linear': self.linear,
+            'counts': [[int(key), int(count)] for key, count in self.counts.items()]
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a sketch serialized with to_dict"""
+        sketch = cls(relative_accuracy=data['relative_accuracy'], linear=data['linear'])
+        sketch.counts = {key: count for key, count in data['counts']}
+        sketch.total = sum(sketch.counts.values())
+        return sketch
@@ -2,97 +2,469 @@
 
 import pandas as pd
 import numpy as np
+import os
 import json
+import time
+import logging
 import datetime
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.linear_model import LogisticRegression
-import xgboost as xgb
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, roc_auc_score
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
-from sklearn.metrics import silhouette_score
+# scikit-learn and XGBoost are imported by PredictiveAnalytics when it
+# trains, so segment-only analyses (fast mode) never load them
+
+from .data_loader import detect_format, load_dataset, iter_dataset
+from .rfm_scoring import DEFAULT_SCORE_BINS, RULE_SCORE_BINS, resolve_bins, ntile_scores, grouped_ntile_scores, to_rule_scale, combined_score
+from .segment_rules import resolve_rule_set
+from .memory_budget import MemoryBudget, SpillStore, frame_bytes
+from .cpu_quota import available_cpus
+
+logger = logging.getLogger(__name__)
+
+# Input modes accepted by RFMAnalysis
+INPUT_MODES = ('customer', 'transaction')
+
+# Column holding the per-customer order count in transaction mode
+ORDER_COUNT_COL = 'order_count'
+
+# Number of partial aggregates kept before they are reduced in streaming mode
+PARTIAL_REDUCE_EVERY = 8
+
+# Per-customer outputs of PredictiveAnalytics
+PREDICTION_COLUMNS = ['churn_probability', 'predicted_ltv', 'ltv_segment', 'cluster', 'upsell_potential', 'crosssell_potential']
+
+# Column holding the snapshot index of each order line in migration analyses
+SNAPSHOT_COL = 'snapshot'
+
+# Default PredictiveAnalytics settings (the training profile); None
+# disables a limit
+MODEL_SETTINGS = {
+    # Customers the models are fitted on (a random sample above the limit)
+    'max_train_rows': None,
+    # Customers the silhouette score of each cluster count is computed on
+    'silhouette_sample_size': None,
+    # Threads building trees (random forest and XGBoost); the CPUs the
+    # container's quota allows, as -1 would start one per host core
+    'n_jobs': available_cpus(),
+    # Trees per model; None picks them from ESTIMATOR_BUDGETS by training size
+    'n_estimators': None,
+    # XGBoost split finding: 'hist' bins each feature once (max_bin bins)
+    # instead of sorting the values at every split ('exact')
+    'tree_method': 'hist',
+    'max_bin': 256,
+    # Stop boosting the LTV model after this many rounds without improvement
+    # on the held-out split (None trains every estimator)
+    'early_stopping_rounds': None,
+    # Hyperparameters of the churn random forest and the LTV XGBoost model
+    # over their defaults (e.g. the cached result of rfm_tuning)
+    'churn_params': None,
+    'ltv_params': None
+}
+
+# Trees per model by number of training customers (up to the first bound
+# that is not exceeded): large datasets get fewer, larger-sample trees
+ESTIMATOR_BUDGETS = [(100000, 100), (1000000, 60), (None, 40)]
+
+# Per-customer columns the predictive models are fitted on, followed by one
+# 'segment_<name>' indicator per segment of the rule set's catalogue
+FEATURE_COLUMNS = ['r_score', 'f_score', 'm_score', 'rfm_score', 'recency_days']
+
+# Estimated peak bytes of model training per training customer (feature
+# copies, train/test splits, tree nodes and boosting buffers)
+MODEL_BYTES_PER_ROW = 512
+
+# Fewest customers models are fitted on when the memory budget is tight
+MIN_TRAIN_ROWS = 10000
+
+# Largest working memory of the pairwise distance chunks of silhouette scores
+SILHOUETTE_WORKING_MEMORY_MB = 64
+
+def _coerce_rfm_types(df, date_col, numeric_cols):
+    """
+    Convert the date column to naive datetime64 and the numeric columns to numbers
+    
+    Already-typed columns (e.g. from Arrow-backed inputs) are used as they are.
+    """
+    if not pd.api.types.is_datetime64_any_dtype(df[date_col]):
+        df[date_col] = pd.to_datetime(df[date_col])
+    if getattr(df[date_col].dt, 'tz', None) is not None:
+        df[date_col] = df[date_col].dt.tz_localize(None)
+    
+    for col in numeric_cols:
+        if not pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    
+    return df
+
+def aggregate_transactions(data, user_id_col, date_col, amount_col, order_col=None, group_col=None):
+    """
+    Aggregate order lines into one row per customer with a single hashed groupby
+    
+    Parameters:
+    -----------
+    data : pandas.DataFrame
+        Order lines (one row per order or order line)
+    user_id_col : str
+        Column name for customer ID
+    date_col : str
+        Column name for the order date
+    amount_col : str
+        Column name for the line/order amount
+    order_col : str, optional
+        Column name for the order ID; orders are counted as distinct IDs,
+        otherwise every row counts as one order
+    group_col : str, optional
+        Column name for a group (store, region, channel); rows are then
+        aggregated per (group, customer)
+    
+    Returns:
+    --------
+    pandas.DataFrame
+        Columns group_col (if any), user_id_col, date_col (last purchase),
+        ORDER_COUNT_COL and amount_col (total)
+    """
+    keys = [group_col, user_id_col] if group_col else [user_id_col]
+    columns = [col for col in (group_col, user_id_col, date_col, order_col, amount_col) if col is not None]
+    df = _coerce_rfm_types(data[columns].copy(), date_col, [amount_col])
+    df = df.dropna(subset=keys + [date_col, amount_col])
+    
+    customers = df.groupby(keys, sort=False).agg(**{
+        date_col: (date_col, 'max'),
+        ORDER_COUNT_COL: (order_col, 'nunique') if order_col else (date_col, 'size'),
+        amount_col: (amount_col, 'sum')
+    })
+    
+    return customers.reset_index()
+
+def _reduce_partials(partials, order_pairs, keys, date_col, amount_col, order_col):
+    """
+    Merge per-customer partial aggregates (and the (customer, order) pairs)
+    into the layout of aggregate_transactions
+    """
+    customers = pd.concat(partials).groupby(level=list(range(len(keys))), sort=False).agg({date_col: 'max', amount_col: 'sum', ORDER_COUNT_COL: 'sum'})
+    customers.index.names = keys
+    
+    if order_col:
+        pairs = pd.concat(order_pairs).drop_duplicates()
+        customers[ORDER_COUNT_COL] = pairs.groupby(keys, sort=False)[order_col].count()
+    
+    return customers[[date_col, ORDER_COUNT_COL, amount_col]].reset_index()
+
+def aggregate_transaction_chunks(chunks, user_id_col, date_col, amount_col, order_col=None, group_col=None, memory_budget=None):
+    """
+    Streaming version of aggregate_transactions for inputs read in chunks
+    
+    Each chunk is reduced to per-customer partial aggregates (last date,
+    total amount, line count), which are merged as they accumulate, so memory
+    is bounded by the number of customers rather than the number of lines.
+    Distinct orders are counted exactly from deduplicated (customer, order) pairs.
+    
+    When the partial aggregates outgrow the memory budget, they are spilled
+    to disk partitioned by customer and each partition is reduced on its own.
+    
+    Parameters:
+    -----------
+    chunks : iterable of pandas.DataFrame
+        Order lines split in chunks
+    user_id_col, date_col, amount_col, order_col, group_col : str
+        Same as aggregate_transactions
+    memory_budget : MemoryBudget, optional
+        Budget the partial aggregates are charged to ('aggregation')
+    
+    Returns:
+    --------
+    pandas.DataFrame
+        Same layout as aggregate_transactions
+    """
+    reducers = {date_col: 'max', amount_col: 'sum', ORDER_COUNT_COL: 'sum'}
+    keys = [group_col, user_id_col] if group_col else [user_id_col]
+    levels = list(range(len(keys)))
+    partials = []
+    order_pairs = []
+    partial_bytes = 0
+    spills = None
+    
+    try:
+        for chunk in chunks:
+            columns = [col for col in (group_col, user_id_col, date_col, order_col, amount_col) if col is not None]
+            df = _coerce_rfm_types(chunk[columns].copy(), date_col, [amount_col])
+            df = df.dropna(subset=keys + [date_col, amount_col])
+            
+            partial = df.groupby(keys, sort=False).agg(**{
+                date_col: (date_col, 'max'),
+                ORDER_COUNT_COL: (date_col, 'size'),
+                amount_col: (amount_col, 'sum')
+            })
+            pairs = df[keys + [order_col]].drop_duplicates() if order_col else None
+            
+            if spills is not None:
+                spills[0].write(partial)
+                if order_col:
+                    spills[1].write(pairs, keys)
+                continue
+            
+            partials.append(partial)
+            if order_col:
+                order_pairs.append(pairs)
+            
+            if len(partials) >= PARTIAL_REDUCE_EVERY:
+                partials = [pd.concat(partials).groupby(level=levels, sort=False).agg(reducers)]
+                if order_col:
+                    order_pairs = [pd.concat(order_pairs).drop_duplicates()]
+                partial_bytes = sum(frame_bytes(frame) for frame in partials + order_pairs)
+            else:
+                partial_bytes += frame_bytes(partial) + (frame_bytes(pairs) if order_col else 0)
+            
+            if memory_budget is not None:
+                if memory_budget.fits('aggregation', partial_bytes):
+                    memory_budget.charge('aggregation', partial_bytes)
+                    continue
+                # Spill what has been aggregated so far; later chunks go straight to disk
+                logger.info(f"Spilling ~{partial_bytes // 2 ** 20}MB of partial aggregates to disk")
+                spills = (SpillStore(), SpillStore()) if order_col else (SpillStore(),)
+                for frame in partials:
+                    spills[0].write(frame)
+                for frame in order_pairs:
+                    spills[1].write(frame, keys)
+                partials, order_pairs = [], []
+                memory_budget.release('aggregation')
+                memory_budget.fallbacks.append("aggregation spilled to disk")
+        
+        if spills is not None:
+            # Customers of a partition never appear in another one
+            reduced = []
+            for partition in range(spills[0].partitions):
+                partition_partials = spills[0].read(partition)
+                if partition_partials:
+                    reduced.append(_reduce_partials(partition_partials, spills[1].read(partition) if order_col else [], keys, date_col, amount_col, order_col))
+            if reduced:
+                return pd.concat(reduced, ignore_index=True)
+    finally:
+        for store in spills or ():
+            store.cleanup()
+        if memory_budget is not None:
+            memory_budget.release('aggregation')
+    
+    if not partials:
+        return pd.DataFrame(columns=keys + [date_col, ORDER_COUNT_COL, amount_col])
+    
+    return _reduce_partials(partials, order_pairs, keys, date_col, amount_col, order_col)
+
+def feature_schema(segment_names):
+    """Feature matrix columns: FEATURE_COLUMNS, then one indicator per segment"""
+    return FEATURE_COLUMNS + [f'segment_{name}' for name in segment_names]
+
+def build_feature_matrix(df, segment_names=None):
+    """
+    Model features of scored and segmented customers as one contiguous
+    float32 matrix
+
+    Segments are one-hot encoded in the order of segment_names (the rule
+    set's catalogue), so every analysis of a rule set yields the same
+    columns in the same order whichever segments occur; without a
+    catalogue, only the segments present are encoded, sorted by name.
+    Customers whose segment is not in the catalogue have no indicator set.
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        Customers with the FEATURE_COLUMNS and a segment column
+    segment_names : list, optional
+        Segment catalogue
+
+    Returns:
+    --------
+    tuple
+        The (customers x features) float32 matrix, in the row order of df,
+        and its column names (see feature_schema)
+    """
+    if segment_names is None:
+        segment_names = sorted(df['segment'].dropna().unique())
+    columns = feature_schema(segment_names)
+    matrix = np.zeros((len(df), len(columns)), dtype=np.float32)
+    for position, col in enumerate(FEATURE_COLUMNS):
+        matrix[:, position] = df[col].to_numpy(dtype=np.float32)
+    codes = pd.Categorical(df['segment'], categories=segment_names).codes
+    rows = np.flatnonzero(codes >= 0)
+    matrix[rows, len(FEATURE_COLUMNS) + codes[rows]] = 1.0
+    return matrix, columns
+
+# Segmentation rules
+def segment_scores(r_scores, f_scores, m_scores, score_bins=DEFAULT_SCORE_BINS, rule_set=None):
+    """
+    Segment aligned arrays/Series of r, f and m scores
+    
+    Scores on another scale than the rule set's (score_bins) are first
+    mapped onto it.
+    
+    Parameters:
+    -----------
+    rule_set : CompiledRuleSet, dict or str, optional
+        Rule set, definition, built-in name or stored ID (see
+        segment_rules.resolve_rule_set); the built-in ecommerce rules by default
+    
+    Returns:
+    --------
+    numpy.ndarray
+        Segment name for each customer
+    """
+    return resolve_rule_set(rule_set=rule_set).segments(r_scores, f_scores, m_scores, score_bins)
 
 # RFM Segmentation Class
 class RFMAnalysis:
-    def __init__(self, data, user_id_col, recency_col, frequency_col, monetary_col, segment_type):
+    def __init__(self, data, user_id_col, recency_col, frequency_col, monetary_col, segment_type, input_mode='customer', score_bins=DEFAULT_SCORE_BINS, rule_set=None, group_col=None, memory_budget=None):
         """
         Initialize RFM Analysis with the customer data and column mappings
         
         Parameters:
         -----------
         data : pandas.DataFrame
-            Customer transaction data
+            Customer data (one row per customer), or order lines in
+            transaction mode (a DataFrame or an iterable of DataFrame chunks)
         user_id_col : str
             Column name for customer ID
         recency_col : str
-            Column name for recency (date of last purchase/activity)
+            Column name for recency (date of last purchase/activity;
+            order date in transaction mode)
         frequency_col : str
-            Column name for frequency (number of purchases/activities)
+            Column name for frequency (number of purchases/activities;
+            optional order ID in transaction mode)
         monetary_col : str
-            Column name for monetary value (total spent)
+            Column name for monetary value (total spent; line amount in
+            transaction mode)
         segment_type : str
-            Type of business segment (e.g., 'ecommerce', 'subscription')
+            Type of business segment (e.g., 'ecommerce', 'assinatura_de_varejo');
+            selects the built-in segment rule set
+        input_mode : str
+            'customer' for pre-aggregated rows or 'transaction' for order lines
+        score_bins : int or str
+            Number of score tiles: 4 (quartiles, default), 5 (quintiles),
+            10 (deciles) or a scale name
+        rule_set : dict or str, optional
+            Segment rule set overriding the one of segment_type: a definition,
+            a built-in name or the ID of a stored custom rule set
+        group_col : str, optional
+            Column name for a group (store, region, channel); scores and
+            aggregates are then computed within each group, and a customer
+            present in several groups is scored in each of them
+        memory_budget : MemoryBudget, optional
+            Budget the input and per-customer frames are charged to before
+            they are built (MemoryBudgetExceeded when they do not fit)
         """
+        if input_mode not in INPUT_MODES:
+            raise ValueError(f"Invalid input_mode: {input_mode}. Expected one of {', '.join(INPUT_MODES)}")
+        self.score_bins = resolve_bins(score_bins)
+        self.rule_set = resolve_rule_set(segment_type, rule_set)
+        
         self.data = data
         self.user_id_col = user_id_col
         self.recency_col = recency_col
-        self.frequency_col = frequency_col
         self.monetary_col = monetary_col
         self.segment_type = segment_type
+        self.input_mode = input_mode
+        self.group_col = group_col
+        # Order lines kept for snapshot analyses (the data is replaced by
+        # per-customer rows once preprocessed)
+        self.transactions = data if input_mode == 'transaction' and isinstance(data, pd.DataFrame) else None
         self.rfm_data = None
         self.rfm_segments = None
+        self.score_edges = None
+        # Input rows (customer rows or order lines) read by preprocess_data
+        self.input_rows = None
+        self.memory_budget = memory_budget
+        
+        if input_mode == 'transaction':
+            # Frequency is derived from the order lines
+            self.order_col = frequency_col
+            self.frequency_col = ORDER_COUNT_COL
+        else:
+            self.order_col = None
+            self.frequency_col = frequency_col
         
     def preprocess_data(self):
         """
         Preprocess the data for RFM analysis
         """
-        # Create a copy of the data
-        df = self.data.copy()
-        
-        # Convert recency column to datetime if it's not already
-        if df[self.recency_col].dtype != 'datetime64[ns]':
-            df[self.recency_col] = pd.to_datetime(df[self.recency_col])
-        
-        # Convert frequency and monetary columns to numeric
-        df[self.frequency_col] = pd.to_numeric(df[self.frequency_col], errors='coerce')
-        df[self.monetary_col] = pd.to_numeric(df[self.monetary_col], errors='coerce')
+        if self.input_mode == 'transaction' and not isinstance(self.data, pd.DataFrame):
+            # Aggregate streamed order lines chunk by chunk, counting them on the way
+            self.input_rows = 0
+            def counted(chunks):
+                for chunk in chunks:
+                    self.input_rows += len(chunk)
+                    yield chunk
+            df = aggregate_transaction_chunks(counted(self.data), self.user_id_col, self.recency_col, self.monetary_col, order_col=self.order_col, group_col=self.group_col, memory_budget=self.memory_budget)
+        elif self.input_mode == 'transaction':
+            # Aggregate order lines per customer (last purchase, order count, total)
+            self.input_rows = len(self.data)
+            self._charge('input', frame_bytes(self.data))
+            df = aggregate_transactions(self.data, self.user_id_col, self.recency_col, self.monetary_col, order_col=self.order_col, group_col=self.group_col)
+        else:
+            # Create a copy of the data and convert types where needed
+            self.input_rows = len(self.data)
+            input_bytes = frame_bytes(self.data)
+            self._charge('input', input_bytes)
+            self._charge('customers', input_bytes)
+            df = _coerce_rfm_types(self.data.copy(), self.recency_col, [self.frequency_col, self.monetary_col])
         
         # Drop rows with missing values
-        df = df.dropna(subset=[self.user_id_col, self.recency_col, self.frequency_col, self.monetary_col])
+        keys = [self.group_col, self.user_id_col] if self.group_col else [self.user_id_col]
+        df = df.dropna(subset=keys + [self.recency_col, self.frequency_col, self.monetary_col])
         
         # Calculate recency in days from today
-        today = datetime.datetime.now().date()
-        df['recency_days'] = (today - df[self.recency_col].dt.date).dt.days
+        today = pd.Timestamp(datetime.date.today())
+        df['recency_days'] = (today - df[self.recency_col].dt.normalize()).dt.days
         
         # Keep only necessary columns
-        self.data = df[[self.user_id_col, 'recency_days', self.frequency_col, self.monetary_col]]
+        self.data = df[keys + ['recency_days', self.frequency_col, self.monetary_col]]
+        self._charge('customers', frame_bytes(self.data))
         
         return self.data
     
+    def _charge(self, stage, nbytes):
+        """Charge a stage to the memory budget, if any"""
+        if self.memory_budget is not None:
+            self.memory_budget.charge(stage, nbytes)
+    
+    def _frame_estimate(self, extra_columns):
+        """Estimated size of a copy of the customer rows with extra numeric columns"""
+        if self.memory_budget is None:
+            return 0
+        return self.memory_budget.stages.get('customers', 0) + len(self.data) * 8 * extra_columns
+    
     def calculate_rfm_scores(self):
         """
-        Calculate RFM scores using quartiles
+        Calculate RFM n-tile scores (quartiles by default) and percentile ranks
+        
+        Each column is ranked once; ties share a rank, so scores are always
+        in 1..score_bins even on skewed data (e.g. most customers bought once),
+        and the same ranks give the percentiles. With a group column, all
+        groups are ranked together in one sort and score_edges holds the
+        edges of each group.
         """
         # Preprocess data if not done already
-        if 'recency_days' not in self.data.columns:
+        if not isinstance(self.data, pd.DataFrame) or 'recency_days' not in self.data.columns:
             self.preprocess_data()
         
-        # Create a copy of the data
+        # Create a copy of the data (with 3 scores, 3 percentiles and the RFM score)
+        self._charge('scores', self._frame_estimate(7))
         rfm_data = self.data.copy()
         
-        # Calculate quartiles for recency, frequency, and monetary value
-        r_quartiles = pd.qcut(rfm_data['recency_days'], 4, labels=False, duplicates='drop')
-        f_quartiles = pd.qcut(rfm_data[self.frequency_col], 4, labels=False, duplicates='drop')
-        m_quartiles = pd.qcut(rfm_data[self.monetary_col], 4, labels=False, duplicates='drop')
+        if self.group_col:
+            group_codes, groups = pd.factorize(rfm_data[self.group_col])
         
-        # Assign scores (1 is best for recency, 4 is best for frequency and monetary)
-        rfm_data['r_score'] = 4 - r_quartiles  # Invert recency score (lower days = higher score)
-        rfm_data['f_score'] = f_quartiles + 1
-        rfm_data['m_score'] = m_quartiles + 1
+        # Score each dimension (higher is better; fewer recency days is better)
+        self.score_edges = {}
+        for dimension, column in (('recency', 'recency_days'), ('frequency', self.frequency_col), ('monetary', self.monetary_col)):
+            values = rfm_data[column].to_numpy(dtype=float)
+            if self.group_col:
+                scores, percentiles, edges = grouped_ntile_scores(values, group_codes, self.score_bins, dimension)
+                edges = dict(zip(groups, edges))
+            else:
+                scores, percentiles, edges = ntile_scores(values, self.score_bins, dimension)
+            rfm_data[f'{dimension[0]}_score'] = scores
+            rfm_data[f'{dimension[0]}_percentile'] = percentiles
+            # Keep the cut points so new values can be scored consistently
+            self.score_edges[dimension] = edges
         
         # Calculate RFM score
-        rfm_data['rfm_score'] = rfm_data['r_score'] * 100 + rfm_data['f_score'] * 10 + rfm_data['m_score']
+        rfm_data['rfm_score'] = combined_score(rfm_data['r_score'], rfm_data['f_score'], rfm_data['m_score'], self.score_bins)
         
         self.rfm_data = rfm_data
         return self.rfm_data
@@ -105,63 +477,12 @@ class RFMAnalysis:
         if self.rfm_data is None:
             self.calculate_rfm_scores()
         
-        # Create a copy of the RFM data
+        # Create a copy of the RFM data (with the segment)
+        self._charge('segments', self._frame_estimate(8))
         rfm_segments = self.rfm_data.copy()
         
-        # Define segmentation rules
-        def segment_rule(row):
-            r, f, m = row['r_score'], row['f_score'], row['m_score']
-            
-            # Champions: high recency, frequency, and monetary value
-            if r >= 4 and f >= 4 and m >= 4:
-                return "Campeões"
-            
-            # Loyal Customers: high frequency and monetary value
-            elif (f >= 3 and m >= 3) and r >= 3:
-                return "Clientes Fiéis"
-            
-            # Potential Loyalists: recent customers with average frequency
-            elif r >= 4 and (f >= 2 and f < 4) and (m >= 2 and m < 4):
-                return "Fiéis em Potencial"
-            
-            # New Customers: recent customers with low frequency
-            elif r >= 4 and f <= 1:
-                return "Novos Clientes"
-            
-            # Promising: recent customers with low frequency but high monetary value
-            elif r >= 3 and f <= 2 and m >= 3:
-                return "Clientes Promissores"
-            
-            # Customers Needing Attention: average recency and frequency
-            elif (r >= 2 and r < 4) and (f >= 2 and f < 4) and (m >= 2 and m < 4):
-                return "Clientes que Precisam de Atenção"
-            
-            # About to Sleep: low recency, average frequency and monetary value
-            elif r <= 2 and (f >= 2 and f < 4) and (m >= 2 and m < 4):
-                return "Clientes Quase Dormentes"
-            
-            # Can't Lose Them: low recency but high frequency and monetary value
-            elif r <= 2 and f >= 3 and m >= 3:
-                return "Clientes que Não Posso Perder"
-            
-            # At Risk: low recency and average frequency
-            elif r <= 2 and (f >= 2 and f < 4):
-                return "Clientes em Risco"
-            
-            # Hibernating: low recency, frequency, and monetary value
-            elif r <= 1 and f <= 2 and m <= 2:
-                return "Clientes Hibernando"
-            
-            # Lost: lowest recency and frequency
-            elif r <= 1 and f <= 1:
-                return "Clientes Perdidos"
-            
-            # Default
-            else:
-                return "Outros"
-        
-        # Apply segmentation rule
-        rfm_segments['segment'] = rfm_segments.apply(segment_rule, axis=1)
+        # Apply the compiled segment rules
+        rfm_segments['segment'] = segment_scores(rfm_segments['r_score'], rfm_segments['f_score'], rfm_segments['m_score'], self.score_bins, self.rule_set)
         
         self.rfm_segments = rfm_segments
         return self.rfm_segments
@@ -239,9 +560,156 @@ class RFMAnalysis:
         
         return segment_counts.to_dict('records')
 
+    def get_group_results(self):
+        """
+        Get segment counts, stats, treemap and polar area data of each group
+        
+        All groups are aggregated with one groupby over (group, segment).
+        
+        Returns:
+        --------
+        dict
+            Group value -> the same layout as the 'rfm_analysis' section of
+            analyze_rfm_data
+        """
+        if not self.group_col:
+            raise ValueError("get_group_results requires a group_col")
+        if self.rfm_segments is None:
+            self.segment_customers()
+        from .rfm_state import results_from_totals
+        
+        totals = self.rfm_segments.groupby([self.group_col, 'segment'], sort=False).agg(
+            count=('segment', 'size'),
+            recency_sum=('recency_days', 'sum'),
+            frequency_sum=(self.frequency_col, 'sum'),
+            monetary_sum=(self.monetary_col, 'sum')
+        ).astype(float)
+        
+        group_totals = {}
+        for (group, segment), row in zip(totals.index, totals.to_dict('records')):
+            group_totals.setdefault(group, {})[segment] = row
+        
+        return {str(group): results_from_totals(segments) for group, segments in group_totals.items()}
+
+    def segment_migrations(self, as_of_dates, transactions=None):
+        """
+        Segment customers at several as-of dates and count the migrations
+        between consecutive snapshots (transaction mode)
+        
+        Order lines are tagged with the first snapshot they belong to and
+        aggregated per (snapshot, customer) in one groupby; snapshots are then
+        built in date order by folding each snapshot's aggregates into running
+        per-customer totals, so every snapshot costs one scoring pass over the
+        customers seen so far instead of a pass over the transactions.
+        
+        Parameters:
+        -----------
+        as_of_dates : list of datetime.date or str
+            Snapshot dates; each snapshot includes the orders up to and on
+            that date and measures recency from it
+        transactions : pandas.DataFrame or iterable of DataFrame chunks, optional
+            Order lines; defaults to the lines the analysis was created with
+        
+        Returns:
+        --------
+        dict
+            'snapshots': as-of date, segment counts and customer count of each
+            snapshot; 'transitions': for each consecutive pair, a
+            from-segment -> to-segment count matrix of the customers present
+            in both, and the segments of the customers first seen in the later one
+        """
+        if self.input_mode != 'transaction':
+            raise ValueError("Segment migrations require transaction input mode")
+        if self.group_col:
+            raise ValueError("Segment migrations are not supported with a group_col")
+        transactions = self.transactions if transactions is None else transactions
+        if transactions is None:
+            raise ValueError("Order lines are required: the chunked input has already been consumed")
+        
+        as_of = pd.DatetimeIndex(sorted({pd.Timestamp(date).normalize() for date in as_of_dates}))
+        if len(as_of) == 0:
+            raise ValueError("At least one as-of date is required")
+        as_of_days = as_of.to_numpy(dtype='datetime64[D]')
+        
+        def tag_snapshots(lines):
+            """Snapshot index of each line (lines after the last date are dropped)"""
+            lines = _coerce_rfm_types(lines.copy(), self.recency_col, [self.monetary_col])
+            days = lines[self.recency_col].to_numpy(dtype='datetime64[D]')
+            snapshot = np.searchsorted(as_of_days, days, side='left')
+            lines[SNAPSHOT_COL] = snapshot
+            return lines[snapshot < len(as_of_days)]
+        
+        # One aggregation pass: per (snapshot, customer) last date, orders and total
+        if isinstance(transactions, pd.DataFrame):
+            parts = aggregate_transactions(tag_snapshots(transactions), self.user_id_col, self.recency_col, self.monetary_col, order_col=self.order_col, group_col=SNAPSHOT_COL)
+        else:
+            parts = aggregate_transaction_chunks((tag_snapshots(chunk) for chunk in transactions), self.user_id_col, self.recency_col, self.monetary_col, order_col=self.order_col, group_col=SNAPSHOT_COL)
+        
+        customer_codes, _ = pd.factorize(parts[self.user_id_col])
+        snapshots = parts[SNAPSHOT_COL].to_numpy(dtype=np.int64)
+        order = np.argsort(snapshots, kind='stable')
+        bounds = np.searchsorted(snapshots[order], np.arange(len(as_of_days) + 1))
+        part_codes = customer_codes[order]
+        part_days = parts[self.recency_col].to_numpy(dtype='datetime64[D]')[order].astype(np.int64)
+        part_orders = parts[ORDER_COUNT_COL].to_numpy(dtype=float)[order]
+        part_amounts = parts[self.monetary_col].to_numpy(dtype=float)[order]
+        
+        customers = customer_codes.max() + 1 if len(customer_codes) else 0
+        last_day = np.full(customers, np.iinfo(np.int64).min, dtype=np.int64)
+        frequency = np.zeros(customers)
+        monetary = np.zeros(customers)
+        names = self.rule_set.segment_names
+        size = len(names)
+        
+        results = {'snapshots': [], 'transitions': []}
+        previous = None
+        for index, day in enumerate(as_of_days.astype(np.int64)):
+            # Fold this snapshot's orders into the running totals (one row per customer)
+            rows = slice(bounds[index], bounds[index + 1])
+            codes = part_codes[rows]
+            last_day[codes] = np.maximum(last_day[codes], part_days[rows])
+            frequency[codes] += part_orders[rows]
+            monetary[codes] += part_amounts[rows]
+            
+            present = np.flatnonzero(frequency > 0)
+            scores = [
+                ntile_scores(values, self.score_bins, dimension)[0]
+                for dimension, values in (
+                    ('recency', (day - last_day[present]).astype(float)),
+                    ('frequency', frequency[present]),
+                    ('monetary', monetary[present])
+                )
+            ]
+            current = np.full(customers, -1, dtype=np.int64)
+            current[present] = self.rule_set.segment_codes(*scores, self.score_bins)
+            
+            counts = np.bincount(current[present], minlength=size)
+            results['snapshots'].append({
+                'as_of': as_of[index].date().isoformat(),
+                'segment_counts': {names[code]: int(counts[code]) for code in np.flatnonzero(counts)},
+                'total_customers': int(len(present))
+            })
+            
+            if previous is not None:
+                stayed = previous >= 0
+                matrix = np.bincount(previous[stayed] * size + current[stayed], minlength=size * size).reshape(size, size)
+                entered = np.bincount(current[present[previous[present] < 0]], minlength=size)
+                results['transitions'].append({
+                    'from': results['snapshots'][-2]['as_of'],
+                    'to': results['snapshots'][-1]['as_of'],
+                    'matrix': {
+                        names[source]: {names[target]: int(matrix[source, target]) for target in np.flatnonzero(matrix[source])}
+                        for source in np.flatnonzero(matrix.sum(axis=1))
+                    },
+                    'new_customers': {names[code]: int(entered[code]) for code in np.flatnonzero(entered)}
+                })
+            previous = current
+        
+        return results
+
 # Predictive Analytics Class
 class PredictiveAnalytics:
-    def __init__(self, rfm_data):
+    def __init__(self, rfm_data, settings=None, memory_budget=None, segment_names=None, monetary_col='monetary'):
         """
         Initialize Predictive Analytics with RFM data
         
@@ -249,69 +717,161 @@ class PredictiveAnalytics:
         -----------
         rfm_data : pandas.DataFrame
             RFM data with customer segments
+        settings : dict, optional
+            Overrides of MODEL_SETTINGS (e.g. chosen by the execution planner
+            for large uploads)
+        memory_budget : MemoryBudget, optional
+            Budget the features and model training are charged to; models
+            are fitted on fewer customers when all of them do not fit
+        segment_names : list, optional
+            Segment catalogue of the rule set, fixing the order of the
+            segment features (see build_feature_matrix)
+        monetary_col : str
+            Column of rfm_data holding the monetary value (the LTV target)
         """
         self.rfm_data = rfm_data
+        self.settings = {**MODEL_SETTINGS, **(settings or {})}
+        self.memory_budget = memory_budget
         self.churn_model = None
         self.upsell_model = None
         self.ltv_model = None
+        # Feature matrix shared by all models, and its column names
         self.features = None
+        self.feature_columns = None
+        self.segment_names = segment_names
+        self.monetary_col = monetary_col
         
     def prepare_features(self):
         """
         Prepare features for predictive models
         """
-        # Create a copy of the RFM data
-        df = self.rfm_data.copy()
-        
-        # Create features from RFM scores and other metrics
-        features = df[['r_score', 'f_score', 'm_score', 'rfm_score', 'recency_days']]
-        
-        # Add segment as one-hot encoded features
-        segment_dummies = pd.get_dummies(df['segment'], prefix='segment')
-        features = pd.concat([features, segment_dummies], axis=1)
+        # RFM scores and other metrics, plus the one-hot encoded segment,
+        # written straight into one float32 matrix (no copy of the RFM data)
+        if self.memory_budget is not None:
+            segment_count = len(self.segment_names) if self.segment_names is not None else self.rfm_data['segment'].nunique()
+            self.memory_budget.charge('features', len(self.rfm_data) * (len(FEATURE_COLUMNS) + segment_count) * 4)
+        self.features, self.feature_columns = build_feature_matrix(self.rfm_data, self.segment_names)
+        
+        return self.features
+    
+    def _training_rows(self):
+        """
+        Positions of the customers models are fitted on: all of them, or a
+        fixed random sample of max_train_rows (fewer when the training
+        footprint would not fit the memory budget)
+        """
+        total = len(self.rfm_data)
+        limit = min(self.settings['max_train_rows'] or total, total)
+        if self.memory_budget is not None:
+            # Leave the smallest silhouette chunk (1MB) to the clustering
+            reserved = 0 if 'silhouette' in self.memory_budget.stages else 2 ** 20
+            affordable = (self.memory_budget.available('models') - reserved) // MODEL_BYTES_PER_ROW
+            if affordable < limit:
+                limit = min(max(affordable, MIN_TRAIN_ROWS), total)
+                if f"models fitted on {limit} customers" not in self.memory_budget.fallbacks:
+                    logger.info(f"Fitting models on {limit} of {total} customers to fit the memory budget")
+                    self.memory_budget.fallbacks.append(f"models fitted on {limit} customers")
+            self.memory_budget.charge('models', limit * MODEL_BYTES_PER_ROW)
+        if limit >= total:
+            return slice(None)
+        return np.sort(np.random.default_rng(42).choice(total, limit, replace=False))
+    
+    def _split_rows(self):
+        """Positions of the training customers, split 70/30 into fitting and held-out rows"""
+        from sklearn.model_selection import train_test_split
+        positions = np.arange(len(self.rfm_data))[self._training_rows()]
+        return train_test_split(positions, test_size=0.3, random_state=42)
+    
+    def _n_estimators(self, training_rows):
+        """Trees per model: the n_estimators setting, or the budget for the training size"""
+        if self.settings['n_estimators']:
+            return self.settings['n_estimators']
+        return next(estimators for bound, estimators in ESTIMATOR_BUDGETS if bound is None or training_rows <= bound)
+    
+    def churn_target(self):
+        """
+        Churn label of each customer: customers with low recency and
+        frequency scores are considered churned
+        """
+        return ((self.rfm_data['r_score'] <= 2) & (self.rfm_data['f_score'] <= 2)).to_numpy()
+    
+    def ltv_target(self):
+        """
+        LTV of each customer
         
-        self.features = features
-        return features
+        For simplicity, the monetary value is used as a proxy for LTV; in a
+        real-world scenario, you would use historical data to calculate
+        actual LTV.
+        """
+        return self.rfm_data[self.monetary_col].to_numpy(dtype=float)
+    
+    def churn_estimator(self, training_rows, params=None):
+        """
+        Unfitted churn model for a number of training customers, with the
+        churn_params setting (then params) over the training profile
+        """
+        from sklearn.ensemble import RandomForestClassifier
+        return RandomForestClassifier(**{
+            'n_estimators': self._n_estimators(training_rows), 'n_jobs': self.settings['n_jobs'], 'random_state': 42,
+            **(self.settings['churn_params'] or {}), **(params or {})
+        })
+    
+    def ltv_estimator(self, training_rows, params=None):
+        """
+        Unfitted LTV model for a number of training customers, with the
+        ltv_params setting (then params) over the training profile
+        """
+        import xgboost as xgb
+        return xgb.XGBRegressor(**{
+            'objective': 'reg:squarederror', 'n_estimators': self._n_estimators(training_rows), 'random_state': 42,
+            'n_jobs': self.settings['n_jobs'], 'tree_method': self.settings['tree_method'], 'max_bin': self.settings['max_bin'],
+            'early_stopping_rounds': self.settings['early_stopping_rounds'],
+            **(self.settings['ltv_params'] or {}), **(params or {})
+        })
     
     def predict_churn(self):
         """
         Predict customer churn using Random Forest
         """
+        from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, roc_auc_score
+        
         # Prepare features if not done already
         if self.features is None:
             self.prepare_features()
         
         # Create target variable (churn)
-        # Customers with low recency and frequency scores are considered churned
-        churn = (self.rfm_data['r_score'] <= 2) & (self.rfm_data['f_score'] <= 2)
+        churn = self.churn_target()
         
         # Split data into training and testing sets
-        X_train, X_test, y_train, y_test = train_test_split(
-            self.features, churn, test_size=0.3, random_state=42
-        )
+        train_rows, test_rows = self._split_rows()
         
-        # Train Random Forest model
-        model = RandomForestClassifier(n_estimators=100, random_state=42)
-        model.fit(X_train, y_train)
+        # Train Random Forest model (trees are built in parallel)
+        start_time = time.perf_counter()
+        model = self.churn_estimator(len(train_rows))
+        model.fit(self.features[train_rows], churn[train_rows])
+        training = {'n_estimators': model.n_estimators, 'fit_seconds': time.perf_counter() - start_time}
         
-        # Make predictions
-        y_pred = model.predict(X_test)
-        y_prob = model.predict_proba(X_test)[:, 1]
+        # Predict churn probability for all customers in one pass; the
+        # held-out predictions are read from it
+        churn_probability = model.predict_proba(self.features)[:, 1]
+        y_test = churn[test_rows]
+        y_prob = churn_probability[test_rows]
+        y_pred = y_prob > 0.5
         
         # Evaluate model
         metrics = {
-            'accuracy': accuracy_score(y_test, y_pred),
-            'precision': precision_score(y_test, y_pred),
-            'recall': recall_score(y_test, y_pred),
-            'f1': f1_score(y_test, y_pred),
-            'auc': roc_auc_score(y_test, y_prob)
+            'accuracy': float(accuracy_score(y_test, y_pred)),
+            'precision': float(precision_score(y_test, y_pred)),
+            'recall': float(recall_score(y_test, y_pred)),
+            'f1': float(f1_score(y_test, y_pred)),
+            'auc': float(roc_auc_score(y_test, y_prob))
         }
         
         # Get feature importance
-        feature_importance = dict(zip(self.features.columns, model.feature_importances_))
+        feature_importance = dict(zip(self.feature_columns, model.feature_importances_.tolist()))
         
-        # Predict churn probability for all customers
-        self.rfm_data['churn_probability'] = model.predict_proba(self.features)[:, 1]
+        # Keep the churn probability of all customers
+        self.rfm_data['churn_probability'] = churn_probability
         
         # Store model
         self.churn_model = model
@@ -319,6 +879,7 @@ class PredictiveAnalytics:
         return {
             'metrics': metrics,
             'feature_importance': feature_importance,
+            'training': training,
             'predictions': self.rfm_data[['churn_probability']].to_dict('records')
         }
     
@@ -326,34 +887,49 @@ class PredictiveAnalytics:
         """
         Identify upsell/cross-sell opportunities using K-Means clustering
         """
+        from sklearn import config_context
+        from sklearn.cluster import KMeans
+        from sklearn.metrics import silhouette_score
+        from sklearn.preprocessing import StandardScaler
+        
         # Prepare features if not done already
         if self.features is None:
             self.prepare_features()
         
         # Select relevant features for clustering
-        cluster_features = self.features[['r_score', 'f_score', 'm_score']]
+        cluster_features = self.features[:, :3]
         
         # Scale features
         scaler = StandardScaler()
         scaled_features = scaler.fit_transform(cluster_features)
         
-        # Find optimal number of clusters using silhouette score
+        # Find optimal number of clusters using silhouette score (on the
+        # training customers, scored on a sample of them when configured)
+        rows = self._training_rows()
+        training_features = scaled_features[rows]
         silhouette_scores = []
         K = range(2, 8)
+        # Pairwise distances are computed in bounded chunks (scikit-learn
+        # defaults to 1GB chunks), smaller when the budget is tight
+        working_memory = SILHOUETTE_WORKING_MEMORY_MB
+        if self.memory_budget is not None:
+            working_memory = max(min(working_memory, self.memory_budget.available('silhouette') // 2 ** 20), 1)
+            self.memory_budget.charge('silhouette', working_memory * 2 ** 20)
         for k in K:
             kmeans = KMeans(n_clusters=k, random_state=42)
-            kmeans.fit(scaled_features)
-            silhouette_scores.append(silhouette_score(scaled_features, kmeans.labels_))
+            kmeans.fit(training_features)
+            with config_context(working_memory=working_memory):
+                silhouette_scores.append(float(silhouette_score(training_features, kmeans.labels_, sample_size=self.settings['silhouette_sample_size'], random_state=42)))
         
         # Get optimal K
         optimal_k = K[np.argmax(silhouette_scores)]
         
         # Fit K-Means with optimal K
         kmeans = KMeans(n_clusters=optimal_k, random_state=42)
-        kmeans.fit(scaled_features)
+        kmeans.fit(training_features)
         
         # Add cluster labels to RFM data
-        self.rfm_data['cluster'] = kmeans.labels_
+        self.rfm_data['cluster'] = kmeans.labels_ if isinstance(rows, slice) else kmeans.predict(scaled_features)
         
         # Analyze clusters
         cluster_analysis = {}
@@ -394,22 +970,27 @@ class PredictiveAnalytics:
             self.prepare_features()
         
         # Create target variable (LTV)
-        # For simplicity, we'll use monetary value as a proxy for LTV
-        # In a real-world scenario, you would use historical data to calculate actual LTV
-        monetary_col = [col for col in self.rfm_data.columns if col not in ['r_score', 'f_score', 'm_score', 'rfm_score', 'recency_days', 'segment', 'cluster', 'churn_probability', 'upsell_potential', 'crosssell_potential']][0]
-        ltv = self.rfm_data[monetary_col]
+        ltv = self.ltv_target()
         
         # Split data into training and testing sets
-        X_train, X_test, y_train, y_test = train_test_split(
-            self.features, ltv, test_size=0.3, random_state=42
-        )
-        
-        # Train XGBoost model
-        model = xgb.XGBRegressor(objective='reg:squarederror', n_estimators=100, random_state=42)
-        model.fit(X_train, y_train)
+        train_rows, test_rows = self._split_rows()
+        X_test, y_test = self.features[test_rows], ltv[test_rows]
+        
+        # Train XGBoost model, optionally stopping early on the held-out split
+        start_time = time.perf_counter()
+        model = self.ltv_estimator(len(train_rows))
+        early_stopping_rounds = model.early_stopping_rounds
+        model.fit(self.features[train_rows], ltv[train_rows], eval_set=[(X_test, y_test)] if early_stopping_rounds else None, verbose=False)
+        training = {
+            'n_estimators': model.n_estimators,
+            'best_iteration': int(model.best_iteration) if early_stopping_rounds else None,
+            'fit_seconds': time.perf_counter() - start_time
+        }
         
-        # Make predictions
-        y_pred = model.predict(X_test)
+        # Predict LTV for all customers in one pass; the held-out
+        # predictions are read from it
+        predicted_ltv = model.predict(self.features)
+        y_pred = predicted_ltv[test_rows]
         
         # Evaluate model
         mse = np.mean((y_test - y_pred) ** 2)
@@ -418,17 +999,17 @@ class PredictiveAnalytics:
         r2 = 1 - (np.sum((y_test - y_pred) ** 2) / np.sum((y_test - np.mean(y_test)) ** 2))
         
         metrics = {
-            'mse': mse,
-            'rmse': rmse,
-            'mae': mae,
-            'r2': r2
+            'mse': float(mse),
+            'rmse': float(rmse),
+            'mae': float(mae),
+            'r2': float(r2)
         }
         
         # Get feature importance
-        feature_importance = dict(zip(self.features.columns, model.feature_importances_))
+        feature_importance = dict(zip(self.feature_columns, model.feature_importances_.tolist()))
         
-        # Predict LTV for all customers
-        self.rfm_data['predicted_ltv'] = model.predict(self.features)
+        # Keep the predicted LTV of all customers
+        self.rfm_data['predicted_ltv'] = predicted_ltv
         
         # Calculate LTV segments
         ltv_quantiles = pd.qcut(self.rfm_data['predicted_ltv'], 4, labels=['Low', 'Medium', 'High', 'Very High'])
@@ -440,6 +1021,7 @@ class PredictiveAnalytics:
         return {
             'metrics': metrics,
             'feature_importance': feature_importance,
+            'training': training,
             'ltv_segments': self.rfm_data['ltv_segment'].value_counts().to_dict()
         }
     
@@ -505,32 +1087,95 @@ class PredictiveAnalytics:
         return insights
 
 # API Functions for Frontend Integration
-def analyze_rfm_data(data, user_id_col, recency_col, frequency_col, monetary_col, segment_type):
+def analyze_rfm_data(data, user_id_col, recency_col, frequency_col, monetary_col, segment_type, file_format=None, input_mode='customer', output_dir=None, score_bins=DEFAULT_SCORE_BINS, rule_set=None, group_col=None, as_of_dates=None, preview=False, sample_size=None, model_settings=None, memory_budget=None, predictive=True):
     """
     Analyze RFM data and return results for frontend visualization
     
     Parameters:
     -----------
-    data : pandas.DataFrame
-        Customer transaction data
+    data : pandas.DataFrame, bytes or str
+        Customer transaction data, or raw file contents / a file path
+        in CSV, Parquet, Feather, Arrow IPC or Excel (.xlsx) format
     user_id_col : str
         Column name for customer ID
     recency_col : str
-        Column name for recency (date of last purchase/activity)
+        Column name for recency (date of last purchase/activity;
+        order date in transaction mode)
     frequency_col : str
-        Column name for frequency (number of purchases/activities)
+        Column name for frequency (number of purchases/activities;
+        optional order ID in transaction mode)
     monetary_col : str
-        Column name for monetary value (total spent)
+        Column name for monetary value (total spent; line amount in
+        transaction mode)
     segment_type : str
         Type of business segment (e.g., 'ecommerce', 'subscription')
+    file_format : str, optional
+        Format of a raw file input ('csv', 'parquet', 'feather', 'arrow', 'xlsx');
+        detected from the path extension when omitted
+    input_mode : str
+        'customer' for one row per customer or 'transaction' for order lines
+    output_dir : str, optional
+        Analysis directory where the per-customer RFM state is persisted so
+        later delta uploads can be merged incrementally, together with the
+        customer lookup and audience indexes and the trained churn and LTV
+        models
+    score_bins : int or str
+        Number of score tiles (4, 5, 10 or 'quartiles', 'quintiles', 'deciles')
+    rule_set : dict or str, optional
+        Segment rule set overriding the built-in one of segment_type
+    group_col : str, optional
+        Column name for a group (store, region, channel); scores are computed
+        within each group and per-group summaries are returned under
+        'rfm_analysis' -> 'groups' (grouped analyses are not persisted for
+        incremental updates)
+    as_of_dates : list, optional
+        Snapshot dates for segment migration reports (transaction mode),
+        returned under 'segment_migrations'
+    preview : bool
+        Score and segment a sample drawn while the input is read instead of
+        the whole dataset, returning segment share estimates with
+        confidence intervals (see rfm_preview.preview_rfm_data); predictive
+        models, migrations and persistence are skipped
+    sample_size : int, optional
+        Number of customers sampled in preview mode
+    model_settings : dict, optional
+        PredictiveAnalytics settings (see MODEL_SETTINGS)
+    memory_budget : MemoryBudget, optional
+        Budget the pipeline stages are charged to (a MemoryBudget with the
+        default limit when omitted); streamed aggregation spills to disk and
+        models are fitted on fewer customers near the limit, and
+        MemoryBudgetExceeded is raised when even those do not fit
+    predictive : bool
+        Run PredictiveAnalytics; without it (fast mode) only the segments
+        are computed and persisted, without trained models or predictions,
+        and scikit-learn and XGBoost are never imported
     
     Returns:
     --------
     dict
-        Results of RFM analysis and predictive analytics
+        Results of RFM analysis and predictive analytics ('predictive_analytics'
+        is None in fast mode), the number of input rows read ('record_count')
+        and the budget summary ('memory_budget')
     """
+    if preview:
+        from .rfm_preview import preview_rfm_data, PREVIEW_SAMPLE_SIZE
+        return preview_rfm_data(data, user_id_col, recency_col, frequency_col, monetary_col, segment_type, file_format=file_format, input_mode=input_mode, score_bins=score_bins, rule_set=rule_set, group_col=group_col, sample_size=sample_size or PREVIEW_SAMPLE_SIZE)
+    
+    # Load file inputs, reading only the mapped columns
+    source = data
+    if not isinstance(data, pd.DataFrame):
+        if file_format is None:
+            file_format = detect_format(data if isinstance(data, str) else None)
+        columns = [col for col in (group_col, user_id_col, recency_col, frequency_col, monetary_col) if col is not None]
+        if input_mode == 'transaction':
+            # Order lines are aggregated chunk by chunk without loading the whole file
+            data = iter_dataset(data, file_format=file_format, columns=columns)
+        else:
+            data = load_dataset(data, file_format=file_format, columns=columns)
+    
     # Initialize RFM Analysis
-    rfm = RFMAnalysis(data, user_id_col, recency_col, frequency_col, monetary_col, segment_type)
+    memory_budget = memory_budget or MemoryBudget()
+    rfm = RFMAnalysis(data, user_id_col, recency_col, frequency_col, monetary_col, segment_type, input_mode=input_mode, score_bins=score_bins, rule_set=rule_set, group_col=group_col, memory_budget=memory_budget)
     
     # Perform RFM Analysis
     rfm_segments = rfm.segment_customers()
@@ -539,14 +1184,49 @@ def analyze_rfm_data(data, user_id_col, recency_col, frequency_col, monetary_col
     treemap_data = rfm.get_treemap_data()
     polar_area_data = rfm.get_polar_area_data()
     
-    # Initialize Predictive Analytics
-    predictive = PredictiveAnalytics(rfm_segments)
+    # Persist the per-customer state for incremental re-analysis
+    if output_dir and not group_col:
+        from .rfm_state import RFMState
+        RFMState.from_analysis(rfm, os.path.basename(os.path.normpath(output_dir))).save(output_dir)
+    
+    # Initialize Predictive Analytics (its rules use the 1-4 score scale;
+    # models are trained across groups on the per-customer columns)
+    predictive_results = None
+    if predictive:
+        predictive_data = rfm_segments.drop(columns=[group_col]) if group_col else rfm_segments
+        if rfm.score_bins != RULE_SCORE_BINS:
+            predictive_data = predictive_data.assign(**{
+                col: to_rule_scale(predictive_data[col], rfm.score_bins) for col in ('r_score', 'f_score', 'm_score')
+            })
+        analytics = PredictiveAnalytics(predictive_data, settings=model_settings, memory_budget=memory_budget, segment_names=rfm.rule_set.segment_names, monetary_col=rfm.monetary_col)
+        
+        # Perform Predictive Analytics
+        predictive_results = {
+            'churn': analytics.predict_churn(),
+            'upsell_crosssell': analytics.predict_upsell_crosssell(),
+            'ltv': analytics.predict_ltv(),
+            'insights': analytics.get_predictive_insights()
+        }
     
-    # Perform Predictive Analytics
-    churn_results = predictive.predict_churn()
-    upsell_results = predictive.predict_upsell_crosssell()
-    ltv_results = predictive.predict_ltv()
-    insights = predictive.get_predictive_insights()
+    # Index the per-customer results for point lookups and audience queries
+    # (both indexes share one row order)
+    if output_dir and not group_col:
+        from .rfm_lookup import build_lookup_index
+        from .rfm_audience import build_audience_index
+        lookup_data = rfm_segments.rename(columns={rfm.frequency_col: 'frequency', rfm.monetary_col: 'monetary'})
+        if predictive:
+            predictions = analytics.rfm_data
+            lookup_data = lookup_data.assign(**{
+                col: predictions[col].to_numpy() for col in PREDICTION_COLUMNS if col in predictions.columns
+            })
+        lookup_data = lookup_data.drop_duplicates(subset=user_id_col, keep='last')
+        build_lookup_index(lookup_data, user_id_col, output_dir)
+        build_audience_index(lookup_data, output_dir, user_id_col=user_id_col)
+        
+        # Keep the trained churn and LTV models for batch scoring
+        if predictive:
+            from .rfm_models import ScoringModels
+            ScoringModels.from_analysis(rfm, analytics).save(output_dir)
     
     # Combine results
     results = {
@@ -556,12 +1236,15 @@ def analyze_rfm_data(data, user_id_col, recency_col, frequency_col, monetary_col
             'treemap_data': treemap_data,
             'polar_area_data': polar_area_data
         },
-        'predictive_analytics': {
-            'churn': churn_results,
-            'upsell_crosssell': upsell_results,
-            'ltv': ltv_results,
-            'insights': insights
-        }
+        'predictive_analytics': predictive_results,
+        'record_count': rfm.input_rows,
+        'memory_budget': memory_budget.summary()
     }
+    if group_col:
+        results['rfm_analysis']['groups'] = rfm.get_group_results()
+    if as_of_dates:
+        # Streamed files are read a second time for the snapshots
+        transactions = None if isinstance(source, pd.DataFrame) else iter_dataset(source, file_format=file_format, columns=columns)
+        results['segment_migrations'] = rfm.segment_migrations(as_of_dates, transactions)
     
     return results
\ No newline at end of file
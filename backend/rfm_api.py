@@ -1,48 +1,162 @@
 # RFM Insights - API Module
 
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, status
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request, BackgroundTasks, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 import pandas as pd
 import io
 import json
 import datetime
 import os
+import uuid
 from typing import Optional, List, Dict, Any
 
 # Import response utilities
 from .api_utils import success_response, error_response, paginated_response
-from .schemas import ResponseSuccess, ResponseError, PaginatedResponseSuccess
+from .schemas import ResponseSuccess, ResponseError, PaginatedResponseSuccess, PurchaseEvent, PurchaseEventBatch, SegmentRuleSet, SegmentWhatIf, CustomerLookupBatch, CustomerScoringBatch, CustomerScoringRequest, ModelTuningRequest, AudienceQuery
 
 # Import RFM Analysis module
-from .rfm_analysis import analyze_rfm_data
+from .rfm_analysis import analyze_rfm_data, INPUT_MODES
+from .data_loader import detect_format, get_column_names, load_dataset, preview_dataset, PREVIEW_MAX_BYTES
+from .rfm_scoring import resolve_bins
+from .rfm_state import apply_delta_upload, what_if_segments, STATE_META_FILE
+from .rfm_events import get_online_store, close_online_stores
+from .rfm_lookup import get_customer_lookup
+from .rfm_audience import get_audience_index
+from .rfm_export import CustomerExport, EXPORT_FORMATS, parse_byte_range
+from .rfm_models import ScoringModels
+from .rfm_realtime import get_batcher, realtime_stats
+from .rfm_tuning import tune_analysis, load_tuning, tuned_model_settings
+from .rfm_planner import analyze_rfm_planned, summarize_plans
+from .memory_budget import MemoryBudgetExceeded
+from .worker_hygiene import track_job
+from .segment_rules import (
+    BUILTIN_RULE_SETS, SEGMENT_TYPE_RULE_SETS, builtin_rule_set, resolve_rule_set,
+    save_custom_rule_set, load_custom_rule_set, list_custom_rule_sets
+)
 
 # Create router
 router = APIRouter()
 
+# Write unsaved purchase events of the online stores on shutdown
+router.add_event_handler("shutdown", close_online_stores)
+
 # Directory to store analysis history
 HISTORY_DIR = "analysis_history"
 os.makedirs(HISTORY_DIR, exist_ok=True)
 
-@router.post("/analyze-rfm", response_model=ResponseSuccess[Dict[str, Any]], description="Analyze RFM data from uploaded CSV file and generate customer segments")
+def _upload_format(file: UploadFile) -> str:
+    """
+    Format of an uploaded file from its name, rejecting unsupported file types
+    """
+    try:
+        return detect_format(file.filename)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+@router.post("/analyze-rfm", response_model=ResponseSuccess[Dict[str, Any]], description="Analyze RFM data from an uploaded CSV, Parquet, Feather, Arrow IPC or Excel (.xlsx) file and generate customer segments")
 async def analyze_rfm(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     segment_type: str = Form(...),
     user_id_col: str = Form(...),
     recency_col: str = Form(...),
-    frequency_col: str = Form(...),
-    monetary_col: str = Form(...)
+    frequency_col: Optional[str] = Form(None),
+    monetary_col: str = Form(...),
+    input_mode: str = Form("customer"),
+    score_bins: str = Form("4"),
+    rule_set: Optional[str] = Form(None),
+    group_col: Optional[str] = Form(None),
+    as_of_dates: Optional[str] = Form(None),
+    preview: bool = Form(False),
+    owner: Optional[str] = Form(None),
+    fast_mode: bool = Form(False),
+    summary_only: bool = Form(False)
 ):
     """
-    Analyze RFM data from uploaded CSV file
+    Analyze RFM data from uploaded file
+    
+    In 'transaction' input mode the file holds order lines: recency_col is the
+    order date, monetary_col the line amount and frequency_col an optional
+    order ID used to count distinct orders per customer.
+    
+    score_bins sets the score scale: 4 (quartiles), 5 (quintiles), 10
+    (deciles) or a scale name.
+    
+    Customers are segmented with the built-in rule set of segment_type, or
+    with rule_set: a built-in rule set name or the ID of a custom rule set.
+    
+    With group_col (e.g. a store or region column) customers are scored
+    within each group and per-group summaries are returned; grouped
+    analyses do not support delta uploads or what-if requests.
+    
+    In transaction mode, as_of_dates (comma-separated ISO dates) adds
+    segment snapshots at those dates and the migration matrices between
+    consecutive snapshots.
+    
+    With preview, customers are sampled while the file is read and only
+    the sample is scored: segment shares are returned with confidence
+    intervals, without predictive analytics, in seconds. The full analysis
+    then runs in the background; its progress is reported by
+    /analysis-jobs/{job_id}.
+    
+    With owner, the churn and LTV models use the hyperparameters tuned for
+    that user and segment_type (see /analyze-rfm/{analysis_id}/tune), when
+    there are any; the cached configuration adds no work to the request.
+    
+    With fast_mode only the segments are computed: predictive analytics
+    are skipped ('predictive_analytics' is null) and no models are stored
+    for scoring or tuning, so the request never loads scikit-learn or
+    XGBoost. The state and indexes are still persisted, so delta uploads,
+    lookups, audiences and exports work on the segments.
+    
+    With summary_only only the segment summaries are returned: nothing is
+    persisted for delta uploads, lookups, audiences or exports, and large
+    uploads can be scored across worker processes by the parallel engine.
     """
     try:
-        # Read CSV file
+        if input_mode not in INPUT_MODES:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid input_mode: {input_mode}. Expected one of {', '.join(INPUT_MODES)}"
+            )
+        if input_mode == "customer" and not frequency_col:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="frequency_col is required in customer input mode"
+            )
+        try:
+            score_bins = resolve_bins(score_bins)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        if as_of_dates:
+            if input_mode != "transaction":
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="as_of_dates requires transaction input mode"
+                )
+            try:
+                as_of_dates = [datetime.date.fromisoformat(date.strip()) for date in as_of_dates.split(",") if date.strip()]
+            except ValueError as e:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid as_of_dates: {str(e)}")
+        if summary_only and preview:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="preview cannot be combined with summary_only"
+            )
+        try:
+            compiled_rules = resolve_rule_set(segment_type, rule_set)
+        except (KeyError, ValueError) as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e.args[0])
+        
+        # Read uploaded file
         contents = await file.read()
-        data = pd.read_csv(io.StringIO(contents.decode('utf-8')))
+        file_format = _upload_format(file)
         
-        # Validate required columns
-        required_cols = [user_id_col, recency_col, frequency_col, monetary_col]
-        missing_cols = [col for col in required_cols if col not in data.columns]
+        # Validate required columns against the file header/schema
+        required_cols = [col for col in (group_col, user_id_col, recency_col, frequency_col, monetary_col) if col]
+        available_cols = get_column_names(contents, file_format=file_format)
+        missing_cols = [col for col in required_cols if col not in available_cols]
         
         if missing_cols:
             raise HTTPException(
@@ -50,55 +164,806 @@ async def analyze_rfm(
                 detail=f"Missing required columns: {', '.join(missing_cols)}"
             )
         
-        # Perform RFM analysis
-        results = analyze_rfm_data(
-            data=data,
-            user_id_col=user_id_col,
-            recency_col=recency_col,
-            frequency_col=frequency_col,
-            monetary_col=monetary_col,
-            segment_type=segment_type
-        )
-        
-        # Save analysis to history
+        # Each analysis gets its own directory for the persisted RFM state
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{timestamp}_{file.filename}"
-        
-        history_entry = {
-            "filename": file.filename,
-            "timestamp": datetime.datetime.now().isoformat(),
+        analysis_id = f"{timestamp}_{uuid.uuid4().hex[:8]}"
+        options = {
+            "user_id_col": user_id_col,
+            "recency_col": recency_col,
+            "frequency_col": frequency_col,
+            "monetary_col": monetary_col,
             "segment_type": segment_type,
-            "record_count": len(data),
-            "column_mapping": {
-                "user_id": user_id_col,
-                "recency": recency_col,
-                "frequency": frequency_col,
-                "monetary": monetary_col
-            },
-            "summary": {
-                "segment_counts": results["rfm_analysis"]["segment_counts"],
-                "total_customers": sum(results["rfm_analysis"]["segment_counts"].values())
-            }
+            "input_mode": input_mode,
+            "score_bins": score_bins,
+            "rule_set": compiled_rules,
+            "group_col": group_col,
+            "as_of_dates": as_of_dates,
+            "model_settings": tuned_model_settings(owner, segment_type) if owner and not fast_mode else {},
+            "predictive": not fast_mode
         }
         
-        # Save history entry
-        with open(os.path.join(HISTORY_DIR, f"{timestamp}_meta.json"), "w") as f:
-            json.dump(history_entry, f)
+        if preview:
+            # Estimate the segmentation from a sample; the full analysis runs in the background
+            results = await run_in_threadpool(analyze_rfm_data, data=contents, file_format=file_format, preview=True, **options)
+            _write_job_status(analysis_id, "queued")
+            background_tasks.add_task(_run_analysis_job, analysis_id, file.filename, contents, file_format, options)
+            results["job"] = {"job_id": analysis_id, "status": "queued"}
+            
+            return success_response(
+                data=results,
+                message="RFM preview completed; full analysis queued"
+            )
         
-        # Add history entry to results
-        results["history_entry"] = history_entry
+        # Run off the event loop so real-time scoring batches keep flowing
+        results = await run_in_threadpool(_run_tracked, "analysis", _run_full_analysis, analysis_id, file.filename, contents, file_format, options, summary_only=summary_only)
         
         return success_response(
             data=results,
             message="RFM analysis completed successfully"
         )
     
+    except HTTPException:
+        raise
+    except MemoryBudgetExceeded as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error processing file: {str(e)}"
         )
 
+def _run_full_analysis(analysis_id: str, filename: str, contents: bytes, file_format: str, options: Dict[str, Any], summary_only: bool = False) -> Dict[str, Any]:
+    """
+    Run the full RFM analysis of an uploaded file on the engine chosen by
+    the execution planner and save its history entry
+    """
+    # Perform RFM analysis (only the mapped columns are read)
+    results = analyze_rfm_planned(
+        source=contents,
+        file_format=file_format,
+        output_dir=os.path.join(HISTORY_DIR, analysis_id),
+        summary_only=summary_only,
+        **options
+    )
+    
+    # Save analysis to history
+    history_entry = {
+        "analysis_id": analysis_id,
+        "filename": filename,
+        "timestamp": datetime.datetime.now().isoformat(),
+        "segment_type": options["segment_type"],
+        "record_count": results["record_count"],
+        "input_mode": options["input_mode"],
+        "score_bins": options["score_bins"],
+        "rule_set": {"id": options["rule_set"].hash, "name": options["rule_set"].name},
+        "group_col": options["group_col"],
+        "column_mapping": {
+            "user_id": options["user_id_col"],
+            "recency": options["recency_col"],
+            "frequency": options["frequency_col"],
+            "monetary": options["monetary_col"]
+        },
+        "summary": {
+            "segment_counts": results["rfm_analysis"]["segment_counts"],
+            "total_customers": sum(results["rfm_analysis"]["segment_counts"].values())
+        },
+        "fast_mode": not options["predictive"],
+        "summary_only": summary_only,
+        "tuned_models": bool(options["model_settings"]),
+        "execution_plan": results["execution_plan"],
+        "memory_budget": results["memory_budget"]
+    }
+    
+    # Save history entry
+    with open(os.path.join(HISTORY_DIR, f"{analysis_id}_meta.json"), "w") as f:
+        json.dump(history_entry, f)
+    
+    # Add history entry to results
+    results["history_entry"] = history_entry
+    return results
+
+def _run_tracked(job_type: str, function, *args, **kwargs):
+    """
+    Run a job under worker hygiene tracking; called through
+    run_in_threadpool so the cleanup after the job stays off the event loop
+    """
+    with track_job(job_type):
+        return function(*args, **kwargs)
+
+def _job_path(job_id: str) -> str:
+    """
+    Status file of a background analysis job
+    """
+    return os.path.join(HISTORY_DIR, f"{os.path.basename(job_id)}_job.json")
+
+def _write_job_status(job_id: str, job_status: str, **details):
+    """
+    Atomically record the status of a background analysis job
+    """
+    path = _job_path(job_id)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"job_id": job_id, "status": job_status, "updated_at": datetime.datetime.now().isoformat(), **details}, f)
+    os.replace(path + ".tmp", path)
+
+def _run_analysis_job(analysis_id: str, filename: str, contents: bytes, file_format: str, options: Dict[str, Any]):
+    """
+    Run a full analysis queued after a preview, recording its progress
+    """
+    _write_job_status(analysis_id, "running")
+    with track_job("analysis_job"):
+        try:
+            results = _run_full_analysis(analysis_id, filename, contents, file_format, options)
+            _write_job_status(analysis_id, "completed", history_entry=results["history_entry"])
+        except Exception as e:
+            _write_job_status(analysis_id, "failed", error=str(e))
+
+def _merge_delta_upload(analysis_dir: str, contents: bytes, file_format: str, columns: List[str]) -> Dict[str, Any]:
+    """
+    Load a delta upload and merge it into the lineage state of an analysis
+    (the delta rows are released when this returns)
+    """
+    delta = load_dataset(contents, file_format=file_format, columns=columns)
+    return apply_delta_upload(analysis_dir, delta)
+
+def _analysis_dir(analysis_id: str) -> str:
+    """
+    Resolve the directory of a stored analysis, rejecting unknown IDs
+    """
+    analysis_dir = os.path.join(HISTORY_DIR, os.path.basename(analysis_id))
+    if not os.path.exists(os.path.join(analysis_dir, STATE_META_FILE)):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Analysis not found: {analysis_id}"
+        )
+    return analysis_dir
+
+@router.post("/analyze-rfm/{analysis_id}/delta", response_model=ResponseSuccess[Dict[str, Any]], description="Merge new or changed customers (or new transactions) into a stored analysis and re-segment incrementally")
+async def analyze_rfm_delta(
+    analysis_id: str,
+    file: UploadFile = File(...)
+):
+    """
+    Incrementally re-analyze a stored analysis from a delta upload
+    
+    The delta file uses the same column mapping as the original analysis.
+    Only customers whose values changed, or who sit between old and new
+    score cut points, are re-scored and re-segmented. Predictive models
+    are not retrained.
+    """
+    try:
+        analysis_dir = _analysis_dir(analysis_id)
+        with open(os.path.join(analysis_dir, STATE_META_FILE), "r") as f:
+            column_mapping = json.load(f)["column_mapping"]
+        
+        # Read uploaded file and validate the lineage's columns
+        contents = await file.read()
+        file_format = _upload_format(file)
+        required_cols = [col for col in column_mapping.values() if col]
+        available_cols = get_column_names(contents, file_format=file_format)
+        missing_cols = [col for col in required_cols if col not in available_cols]
+        
+        if missing_cols:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Missing required columns: {', '.join(missing_cols)}"
+            )
+        
+        results = await run_in_threadpool(_run_tracked, "delta_upload", _merge_delta_upload, analysis_dir, contents, file_format, required_cols)
+        
+        return success_response(
+            data=results,
+            message=f"Merged {results['delta']['delta_customers']} customers into analysis {analysis_id}"
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error processing delta file: {str(e)}"
+        )
+
+@router.post("/analyze-rfm/{analysis_id}/what-if", response_model=ResponseSuccess[Dict[str, Any]], description="Re-segment a stored analysis under alternative rules from its score-cube histogram")
+async def analyze_rfm_what_if(analysis_id: str, what_if: SegmentWhatIf):
+    """
+    Segment counts and stats of a stored analysis under alternative rules
+    
+    Give either rule_set (a built-in name or custom rule set ID) or ad hoc
+    rules. Results come from the per-cell totals of the analysis score cube,
+    without reading customer rows.
+    """
+    try:
+        if (what_if.rule_set is None) == (what_if.rules is None):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Provide either rule_set or rules"
+            )
+        rule_set = what_if.rule_set
+        if what_if.rules is not None:
+            rule_set = {
+                "score_bins": what_if.score_bins,
+                "default": what_if.default,
+                "rules": [rule.model_dump(exclude_none=True) for rule in what_if.rules]
+            }
+        analysis_dir = _analysis_dir(analysis_id)
+        
+        try:
+            results = what_if_segments(analysis_dir, rule_set)
+        except (KeyError, ValueError) as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=e.args[0])
+        
+        return success_response(
+            data=results,
+            message="What-if segmentation completed successfully"
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error running what-if segmentation: {str(e)}"
+        )
+
+def _customer_lookup(analysis_id: str):
+    """
+    Open the customer lookup index of a stored analysis
+    """
+    analysis_dir = _analysis_dir(analysis_id)
+    try:
+        return get_customer_lookup(analysis_dir)
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No customer index for analysis: {analysis_id}"
+        )
+
+@router.get("/analyze-rfm/{analysis_id}/customers/{customer_id}", response_model=ResponseSuccess[Dict[str, Any]], description="Get the RFM scores, segment and predictions of one customer from the analysis lookup index")
+async def get_customer_result(analysis_id: str, customer_id: str):
+    """
+    Look up one customer's results
+    """
+    try:
+        customer = _customer_lookup(analysis_id).get(customer_id)
+        if customer is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Customer not found: {customer_id}"
+            )
+        
+        return success_response(
+            data=customer,
+            message="Customer retrieved successfully"
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving customer: {str(e)}"
+        )
+
+@router.post("/analyze-rfm/{analysis_id}/customers/lookup", response_model=ResponseSuccess[Dict[str, Any]], description="Get the results of several customers from the analysis lookup index")
+async def lookup_customer_results(analysis_id: str, batch: CustomerLookupBatch):
+    """
+    Look up the results of several customers; unknown IDs are listed
+    under 'missing'
+    """
+    try:
+        customers, missing = _customer_lookup(analysis_id).get_many(batch.customer_ids)
+        
+        return success_response(
+            data={"customers": customers, "missing": missing},
+            message=f"Retrieved {len(customers)} customers"
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving customers: {str(e)}"
+        )
+
+@router.get("/analyze-rfm/{analysis_id}/export", description="Download the per-customer results of an analysis (scores, segment, predictions) as CSV or NDJSON, with optional segment filter and column selection; supports HTTP Range to resume downloads")
+async def export_customer_results(
+    analysis_id: str,
+    request: Request,
+    file_format: str = "csv",
+    segments: Optional[str] = None,
+    columns: Optional[str] = None
+):
+    """
+    Stream the per-customer results of a stored analysis
+    
+    segments and columns are comma-separated lists. Rows are streamed in
+    chunks from the analysis lookup index; the first complete download is
+    cached, and requests with a Range header are served from that file.
+    """
+    try:
+        # Rejects analyses without a customer index
+        _customer_lookup(analysis_id)
+        export = CustomerExport(
+            _analysis_dir(analysis_id),
+            file_format,
+            segments=[segment.strip() for segment in segments.split(",") if segment.strip()] if segments else None,
+            columns=[col.strip() for col in columns.split(",") if col.strip()] if columns else None
+        )
+        headers = {
+            "Accept-Ranges": "bytes",
+            "ETag": f'"{export.etag}"',
+            "Content-Disposition": f'attachment; filename="rfm_{os.path.basename(analysis_id)}.{file_format}"'
+        }
+        
+        # A Range request resumes the cached export unless If-Range names another version
+        range_header = request.headers.get("range")
+        if_range = request.headers.get("if-range")
+        if range_header and (not if_range or if_range.strip('"') == export.etag):
+            size = await run_in_threadpool(export.materialize)
+            try:
+                byte_range = parse_byte_range(range_header, size)
+            except ValueError as e:
+                raise HTTPException(
+                    status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                    detail=e.args[0],
+                    headers={"Content-Range": f"bytes */{size}"}
+                )
+            if byte_range:
+                start, end = byte_range
+                headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+                headers["Content-Length"] = str(end - start + 1)
+                return StreamingResponse(
+                    export.iter_file(start, end),
+                    status_code=status.HTTP_206_PARTIAL_CONTENT,
+                    media_type=export.media_type,
+                    headers=headers
+                )
+        
+        if os.path.exists(export.path):
+            headers["Content-Length"] = str(os.path.getsize(export.path))
+        return StreamingResponse(export.stream(), media_type=export.media_type, headers=headers)
+    
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=e.args[0]
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error exporting customers: {str(e)}"
+        )
+
+def _scoring_models(analysis_id: str):
+    """
+    Load the scoring models of a stored analysis
+    """
+    analysis_dir = _analysis_dir(analysis_id)
+    try:
+        return ScoringModels.load(analysis_dir)
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No scoring models for analysis: {analysis_id}"
+        )
+
+def _stream_predictions(models, data: pd.DataFrame, output_format: str, analysis_id: str):
+    """
+    Score customers eagerly (so invalid input fails before the response
+    starts) and stream the predictions batch by batch
+    """
+    customers = models.prepare(data)
+    chunks = models.iter_chunks(customers, output_format)
+    return StreamingResponse(
+        chunks,
+        media_type=EXPORT_FORMATS[output_format],
+        headers={"Content-Disposition": f'attachment; filename="scores_{os.path.basename(analysis_id)}.{output_format}"'}
+    )
+
+@router.post("/analyze-rfm/{analysis_id}/score", description="Score the customers of an uploaded file with the churn and LTV models of a stored analysis, streaming the predictions as CSV or NDJSON")
+async def score_customers(
+    analysis_id: str,
+    file: UploadFile = File(...),
+    output_format: str = "csv"
+):
+    """
+    Apply the trained models of an analysis to new customers
+    
+    The file uses the analysis column mapping. Customers are scored
+    against the analysis score cut points, segmented with its rule set
+    and run through the same feature preparation as the training; the
+    models are applied batch by batch while the predictions are streamed.
+    """
+    try:
+        models = await run_in_threadpool(_scoring_models, analysis_id)
+        
+        # Read uploaded file and validate the analysis columns
+        contents = await file.read()
+        file_format = _upload_format(file)
+        available_cols = get_column_names(contents, file_format=file_format)
+        missing_cols = [col for col in models.required_columns if col not in available_cols]
+        
+        if missing_cols:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Missing required columns: {', '.join(missing_cols)}"
+            )
+        
+        data = await run_in_threadpool(load_dataset, contents, file_format=file_format, columns=models.required_columns)
+        return await run_in_threadpool(_stream_predictions, models, data, output_format, analysis_id)
+    
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=e.args[0]
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error scoring customers: {str(e)}"
+        )
+
+@router.post("/analyze-rfm/{analysis_id}/score/batch", description="Score a JSON batch of customers with the churn and LTV models of a stored analysis, streaming the predictions as CSV or NDJSON")
+async def score_customer_batch(analysis_id: str, batch: CustomerScoringBatch, output_format: str = "ndjson"):
+    """
+    Apply the trained models of an analysis to a JSON batch of customers
+    """
+    try:
+        models = await run_in_threadpool(_scoring_models, analysis_id)
+        data = pd.DataFrame.from_records(batch.customers)
+        return await run_in_threadpool(_stream_predictions, models, data, output_format, analysis_id)
+    
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=e.args[0]
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error scoring customers: {str(e)}"
+        )
+
+@router.post("/analyze-rfm/{analysis_id}/score/realtime", response_model=ResponseSuccess[Dict[str, Any]], description="Score one customer in real time with the churn and LTV models of a stored analysis; concurrent requests are grouped into micro-batches")
+async def score_customer_realtime(analysis_id: str, request: CustomerScoringRequest):
+    """
+    Score one customer with the warm models of an analysis
+    
+    Requests arriving within a few milliseconds of each other are scored
+    together, with one call of each model per micro-batch.
+    """
+    try:
+        # Loads (or keeps) the models in memory and rejects analyses without them
+        await run_in_threadpool(_scoring_models, analysis_id)
+        prediction = await get_batcher(_analysis_dir(analysis_id)).score(request.customer)
+        
+        return success_response(
+            data=prediction,
+            message="Customer scored successfully"
+        )
+    
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=e.args[0]
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error scoring customer: {str(e)}"
+        )
+
+@router.get("/realtime-scoring/stats", response_model=ResponseSuccess[Dict[str, Any]], description="Get the p50/p99 latency and micro-batch size histogram of real-time scoring in this worker")
+async def get_realtime_scoring_stats():
+    """
+    Get real-time scoring latency percentiles and batch sizes
+    """
+    try:
+        stats = realtime_stats()
+        
+        return success_response(
+            data=stats,
+            message=f"Served {stats['requests']} requests in {stats['batches']} micro-batches"
+        )
+    
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving real-time scoring stats: {str(e)}"
+        )
+
+def _run_tuning_job(job_id: str, analysis_dir: str, request: ModelTuningRequest):
+    """
+    Run a hyperparameter search queued for a stored analysis, recording its progress
+    """
+    _write_job_status(job_id, "running")
+    with track_job("tuning_job"):
+        try:
+            entry = tune_analysis(analysis_dir, request.owner, time_budget=request.time_budget_seconds, workers=request.workers)
+            _write_job_status(job_id, "completed", tuning=entry)
+        except Exception as e:
+            _write_job_status(job_id, "failed", error=str(e))
+
+@router.post("/analyze-rfm/{analysis_id}/tune", response_model=ResponseSuccess[Dict[str, Any]], description="Queue a time-budgeted hyperparameter search of the churn and LTV models on the customers of a stored analysis")
+async def tune_analysis_models(analysis_id: str, request: ModelTuningRequest, background_tasks: BackgroundTasks):
+    """
+    Tune the predictive models of a stored analysis
+    
+    Configurations are searched in parallel by successive halving within
+    time_budget_seconds; the winner is cached for the owner and the
+    segment type of the analysis, and later /analyze-rfm requests of that
+    owner train with it. The search runs in the background; its progress
+    is reported by /analysis-jobs/{job_id}.
+    """
+    try:
+        # Tuning reads the customers of the analysis index and its models' metadata
+        await run_in_threadpool(_scoring_models, analysis_id)
+        analysis_dir = _analysis_dir(analysis_id)
+        # Unique per request, so concurrent searches of an analysis keep their own status
+        job_id = f"{os.path.basename(analysis_id)}_tuning_{uuid.uuid4().hex[:8]}"
+        _write_job_status(job_id, "queued")
+        background_tasks.add_task(_run_tuning_job, job_id, analysis_dir, request)
+        
+        return success_response(
+            data={"job": {"job_id": job_id, "status": "queued"}},
+            message="Model tuning queued"
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error queuing model tuning: {str(e)}"
+        )
+
+@router.get("/model-tuning", response_model=ResponseSuccess[Dict[str, Any]], description="Get the hyperparameters tuned for an owner and segment type")
+async def get_model_tuning(owner: str, segment_type: str):
+    """
+    Get the cached tuned configuration of an owner and segment type, with
+    the rungs of the search that found it
+    """
+    try:
+        entry = load_tuning(owner, segment_type)
+        if entry is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"No tuned models for {owner} and segment type {segment_type}"
+            )
+        
+        return success_response(
+            data=entry,
+            message="Tuned models retrieved successfully"
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving tuned models: {str(e)}"
+        )
+
+def _audience_index(analysis_id: str):
+    """
+    Open the audience index of a stored analysis
+    """
+    analysis_dir = _analysis_dir(analysis_id)
+    try:
+        return get_audience_index(analysis_dir)
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No audience index for analysis: {analysis_id}"
+        )
+
+@router.post("/analyze-rfm/{analysis_id}/audiences/count", response_model=ResponseSuccess[Dict[str, Any]], description="Count the customers of an audience combining segments, LTV segments, clusters, churn probability buckets and upsell/cross-sell flags with and/or/not")
+async def count_audience(analysis_id: str, audience: AudienceQuery):
+    """
+    Count an audience from the analysis bitmap index, with its breakdown
+    by RFM segment
+    """
+    try:
+        summary = _audience_index(analysis_id).summary(audience.query)
+        
+        return success_response(
+            data=summary,
+            message=f"Audience has {summary['count']} customers"
+        )
+    
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=e.args[0]
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error counting audience: {str(e)}"
+        )
+
+@router.post("/analyze-rfm/{analysis_id}/audiences/customers", description="Stream the customer IDs of an audience, one per line")
+async def export_audience(analysis_id: str, audience: AudienceQuery):
+    """
+    Stream the customer IDs of an audience as plain text, one ID per line
+    """
+    try:
+        chunks = _audience_index(analysis_id).iter_customer_ids(audience.query)
+        
+        return StreamingResponse(
+            ("".join(f"{customer_id}\n" for customer_id in chunk) for chunk in chunks),
+            media_type="text/plain"
+        )
+    
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=e.args[0]
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error exporting audience: {str(e)}"
+        )
+
+@router.post("/analyze-rfm/{analysis_id}/events", response_model=ResponseSuccess[Dict[str, Any]], description="Ingest a single purchase event and return the customer's updated RFM scores and segment")
+async def ingest_purchase_event(analysis_id: str, event: PurchaseEvent):
+    """
+    Update a customer's RFM state in real time from one purchase event
+    """
+    try:
+        store = await run_in_threadpool(get_online_store, _analysis_dir(analysis_id))
+        customer = await run_in_threadpool(store.ingest, event.customer_id, event.amount, event.timestamp)
+        
+        return success_response(
+            data=customer,
+            message=f"Customer {customer['customer_id']} is now in segment {customer['segment']}"
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error ingesting event: {str(e)}"
+        )
+
+@router.post("/analyze-rfm/{analysis_id}/events/batch", response_model=ResponseSuccess[Dict[str, Any]], description="Ingest a batch of purchase events in order")
+async def ingest_purchase_events(analysis_id: str, batch: PurchaseEventBatch):
+    """
+    Update customers' RFM state in real time from a batch of purchase events
+    """
+    try:
+        store = await run_in_threadpool(get_online_store, _analysis_dir(analysis_id))
+        summary = await run_in_threadpool(store.ingest_batch, [(event.customer_id, event.amount, event.timestamp) for event in batch.events])
+        
+        return success_response(
+            data=summary,
+            message=f"Ingested {summary['events']} events"
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error ingesting events: {str(e)}"
+        )
+
+@router.get("/analyze-rfm/{analysis_id}/live-segments", response_model=ResponseSuccess[Dict[str, Any]], description="Get live segment counts and quartile boundaries maintained by event ingestion")
+async def get_live_segments(analysis_id: str):
+    """
+    Get the segment counts of the online store of an analysis
+    """
+    try:
+        store = await run_in_threadpool(get_online_store, _analysis_dir(analysis_id))
+        with store.lock:
+            data = {
+                "segment_counts": store.get_segment_counts(),
+                "boundaries": store.get_boundaries(),
+                "total_customers": store.size,
+                "events_ingested": store.meta['events_ingested']
+            }
+        
+        return success_response(
+            data=data,
+            message="Live segments retrieved successfully"
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving live segments: {str(e)}"
+        )
+
+@router.post("/preview-columns", response_model=ResponseSuccess[Dict[str, Any]], description="Preview columns, inferred types, sample values and suggested RFM mapping from the start of a file")
+async def preview_columns(
+    file: UploadFile = File(...),
+    max_bytes: int = Form(PREVIEW_MAX_BYTES),
+    sample_rows: int = Form(5)
+):
+    """
+    Preview the columns of an uploaded file for the column mapping form
+    
+    CSV uploads only need the first max_bytes of the file (clients can send
+    file.slice(0, max_bytes)); anything beyond that is never read.
+    """
+    try:
+        file_format = _upload_format(file)
+        
+        if file_format == 'csv':
+            contents = await file.read(max_bytes)
+            truncated = len(contents) >= max_bytes
+        else:
+            # Columnar and Excel formats keep their schema in the file footer
+            contents = await file.read()
+            truncated = False
+        
+        preview = preview_dataset(contents, file_format=file_format, sample_rows=sample_rows, truncated=truncated)
+        preview["filename"] = file.filename
+        
+        return success_response(
+            data=preview,
+            message=f"Detected {len(preview['columns'])} columns"
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Error previewing file: {str(e)}"
+        )
+
+@router.get("/analysis-jobs/{job_id}", response_model=ResponseSuccess[Dict[str, Any]], description="Get the status of a full analysis queued after a preview, or of a model tuning job")
+async def get_analysis_job(job_id: str):
+    """
+    Get the status of a background analysis job: queued, running,
+    completed (with its history entry, or the tuned configuration of a
+    tuning job) or failed (with the error)
+    """
+    try:
+        path = _job_path(job_id)
+        if not os.path.exists(path):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Analysis job not found: {job_id}"
+            )
+        
+        with open(path, "r") as f:
+            job = json.load(f)
+        
+        return success_response(
+            data=job,
+            message=f"Analysis job is {job['status']}"
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving analysis job: {str(e)}"
+        )
+
 @router.get("/analysis-history", response_model=ResponseSuccess[Dict[str, List[Dict[str, Any]]]], description="Get analysis history with optional limit parameter")
 async def get_analysis_history(limit: int = 5):
     """
@@ -128,6 +993,33 @@ async def get_analysis_history(limit: int = 5):
             detail=f"Error retrieving analysis history: {str(e)}"
         )
 
+@router.get("/execution-planner/accuracy", response_model=ResponseSuccess[Dict[str, Any]], description="Get the engines chosen by the execution planner and the accuracy of its row and customer estimates over recent analyses")
+async def get_planner_accuracy(limit: int = 100):
+    """
+    Summarize the execution plans of the most recent analyses
+    """
+    try:
+        history_files = [f for f in os.listdir(HISTORY_DIR) if f.endswith("_meta.json")]
+        history_files.sort(key=lambda file: os.path.getmtime(os.path.join(HISTORY_DIR, file)), reverse=True)
+        
+        plans = []
+        for file in history_files[:limit]:
+            with open(os.path.join(HISTORY_DIR, file), "r") as f:
+                history_entry = json.load(f)
+            if "execution_plan" in history_entry:
+                plans.append(history_entry["execution_plan"])
+        
+        return success_response(
+            data=summarize_plans(plans),
+            message=f"Summarized {len(plans)} execution plans"
+        )
+    
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error summarizing execution plans: {str(e)}"
+        )
+
 @router.get("/segment-descriptions", response_model=ResponseSuccess[Dict[str, Dict[str, str]]], description="Get descriptions for RFM segments")
 async def get_segment_descriptions():
     """
@@ -229,4 +1121,86 @@ async def get_segment_recommendations():
     return success_response(
         data={"segment_recommendations": segment_recommendations},
         message="Segment recommendations retrieved successfully"
-    )
\ No newline at end of file
+    )
+
+@router.get("/segment-rule-sets", response_model=ResponseSuccess[Dict[str, Any]], description="List the built-in segment rule sets and the custom rule sets of an owner")
+async def get_segment_rule_sets(owner: Optional[str] = None):
+    """
+    List segment rule sets
+    
+    Built-in rule sets are listed with the business segment types that use
+    them; custom rule sets are filtered by owner when given.
+    """
+    try:
+        builtin = []
+        for name in BUILTIN_RULE_SETS:
+            entry = builtin_rule_set(name).describe()
+            entry["segment_types"] = [segment_type for segment_type, rules in SEGMENT_TYPE_RULE_SETS.items() if rules == name]
+            builtin.append(entry)
+        
+        return success_response(
+            data={"builtin": builtin, "custom": list_custom_rule_sets(owner)},
+            message="Segment rule sets retrieved successfully"
+        )
+    
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving segment rule sets: {str(e)}"
+        )
+
+@router.post("/segment-rule-sets", response_model=ResponseSuccess[Dict[str, Any]], description="Validate, compile and store a custom segment rule set")
+async def create_segment_rule_set(rule_set: SegmentRuleSet):
+    """
+    Store a custom segment rule set
+    
+    The returned ID can be passed as rule_set to /analyze-rfm. Rule sets
+    with the same rules share one ID and one compiled lookup.
+    """
+    try:
+        definition = rule_set.model_dump(exclude={"owner"})
+        definition["rules"] = [rule.model_dump(exclude_none=True) for rule in rule_set.rules]
+        try:
+            entry = save_custom_rule_set(definition, owner=rule_set.owner)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        
+        return success_response(
+            data=entry,
+            message="Segment rule set saved successfully"
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error saving segment rule set: {str(e)}"
+        )
+
+@router.get("/segment-rule-sets/{rule_set_id}", response_model=ResponseSuccess[Dict[str, Any]], description="Get a built-in or custom segment rule set")
+async def get_segment_rule_set(rule_set_id: str):
+    """
+    Get a segment rule set by built-in name or custom ID
+    """
+    try:
+        try:
+            compiled = builtin_rule_set(rule_set_id) if rule_set_id in BUILTIN_RULE_SETS else load_custom_rule_set(rule_set_id)
+        except (KeyError, ValueError):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Rule set not found: {rule_set_id}"
+            )
+        
+        return success_response(
+            data=compiled.describe(),
+            message="Segment rule set retrieved successfully"
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving segment rule set: {str(e)}"
+        )
@@ -0,0 +1,298 @@
+# RFM Insights - Audience Index Module
+
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: index rebuilds are not locked across processes
+    fcntl = None
+
+from .rfm_lookup import CustomerLookup, get_customer_lookup, refresh_lookup_index, LOOKUP_DIR, LOOKUP_META_FILE, _new_build, _read_meta, _build_path, _publish_build
+
+# Directory of the audience index inside an analysis directory
+AUDIENCE_DIR = "audience_index"
+
+# Index metadata file; it names the current build and is replaced last
+AUDIENCE_META_FILE = "audience_meta.json"
+
+# Per-customer result columns indexed with one bitmap per distinct value;
+# missing columns (e.g. no predictive results) are skipped
+AUDIENCE_FIELDS = ['segment', 'ltv_segment', 'cluster', 'upsell_potential', 'crosssell_potential']
+
+# Churn probability is indexed in equal-width buckets; query bounds must
+# fall on bucket edges
+CHURN_FIELD = 'churn_probability'
+CHURN_BUCKETS = 10
+
+# Number of set bits of every byte value
+_POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+# Lock file serializing index rebuilds of an analysis across processes
+INDEX_LOCK_FILE = "index.lock"
+
+# Opened indexes, keyed by analysis directory, with the modification time
+# of the index build they were opened from
+_AUDIENCES = {}
+_AUDIENCES_LOCK = threading.Lock()
+
+def _label(value):
+    """Bitmap label of an indexed value (booleans as 'true'/'false')"""
+    if isinstance(value, (bool, np.bool_)):
+        return 'true' if value else 'false'
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+def build_audience_index(results, analysis_dir, user_id_col=None):
+    """
+    Persist packed bitmaps of the customers holding each segment, LTV
+    segment, cluster, flag value and churn probability bucket
+
+    Parameters:
+    -----------
+    results : pandas.DataFrame
+        Per-customer results, in the row order of the customer lookup index
+    analysis_dir : str
+        Analysis directory; the index is written to its AUDIENCE_DIR
+    user_id_col : str, optional
+        Column name for customer ID; duplicate customers are dropped as
+        build_lookup_index drops them, so bitmap rows match index rows
+
+    The build records the current lookup index build, whose rows its
+    bitmaps refer to; build it right after the lookup index.
+
+    Returns:
+    --------
+    int
+        Number of bitmaps written
+    """
+    if user_id_col is not None:
+        results = results.drop_duplicates(subset=user_id_col, keep='last')
+    index_dir = os.path.join(analysis_dir, AUDIENCE_DIR)
+    os.makedirs(index_dir, exist_ok=True)
+    build, build_dir = _new_build(index_dir)
+    lookup_build = _read_meta(os.path.join(analysis_dir, LOOKUP_DIR), LOOKUP_META_FILE).get('build')
+
+    bitmaps = []
+    fields = {}
+    for name in AUDIENCE_FIELDS:
+        if name not in results.columns:
+            continue
+        codes, uniques = pd.factorize(results[name], sort=True)
+        fields[name] = {}
+        for code, value in enumerate(uniques):
+            fields[name][_label(value)] = len(bitmaps)
+            bitmaps.append(np.packbits(codes == code))
+
+    if CHURN_FIELD in results.columns:
+        probabilities = results[CHURN_FIELD].to_numpy(dtype=float)
+        buckets = np.clip(np.floor(probabilities * CHURN_BUCKETS), 0, CHURN_BUCKETS - 1)
+        fields[CHURN_FIELD] = {}
+        for bucket in range(CHURN_BUCKETS):
+            fields[CHURN_FIELD][str(bucket)] = len(bitmaps)
+            bitmaps.append(np.packbits(buckets == bucket))
+
+    width = (len(results) + 7) // 8
+    np.save(os.path.join(build_dir, "bitmaps.npy"), np.array(bitmaps, dtype=np.uint8).reshape(len(bitmaps), width))
+    _publish_build(index_dir, AUDIENCE_META_FILE, build, {
+        'customers': len(results), 'churn_buckets': CHURN_BUCKETS, 'fields': fields, 'lookup_build': lookup_build
+    })
+    with _AUDIENCES_LOCK:
+        _AUDIENCES.pop(analysis_dir, None)
+    return len(bitmaps)
+
+def refresh_customer_indexes(customers, analysis_dir, is_current=None):
+    """
+    Rebuild the lookup and audience indexes of an analysis from refreshed
+    RFM results (after a delta upload, or from the live values of the
+    online event store)
+
+    Both indexes are rebuilt together, so bitmap rows keep matching lookup
+    rows; rebuilds of one analysis take turns across processes.
+
+    Parameters:
+    -----------
+    customers : pandas.DataFrame
+        Customers indexed by customer ID with the RFM result columns
+    analysis_dir : str
+        Analysis directory holding the indexes
+    is_current : callable, optional
+        Checked once the rebuild holds the lock; returning False (the
+        results were superseded meanwhile, e.g. by a delta upload) skips it
+
+    Returns:
+    --------
+    int or None
+        Number of indexed customers, or None when the analysis has no index
+        or the rebuild was skipped
+    """
+    with open(os.path.join(analysis_dir, INDEX_LOCK_FILE), "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        if is_current is not None and not is_current():
+            return None
+        results = refresh_lookup_index(customers, analysis_dir)
+        if results is None:
+            return None
+        if os.path.exists(os.path.join(analysis_dir, AUDIENCE_DIR, AUDIENCE_META_FILE)):
+            build_audience_index(results, analysis_dir, user_id_col='customer_id')
+        return len(results)
+
+class AudienceIndex:
+    """
+    Read-only view of a persisted audience index
+
+    An audience query is a nested JSON object: {"and": [...]}, {"or": [...]}
+    and {"not": {...}} combine sub-queries, and leaves select customers by
+    indexed value, e.g. {"segment": "Campeões"}, {"ltv_segment": ["High",
+    "Very High"]}, {"upsell_potential": true} or
+    {"churn_probability": {"min": 0, "max": 0.3}}. Bitmaps are combined
+    byte-wise, so counting an audience never touches per-customer data.
+    Bitmap rows refer to the lookup index build the audience build was
+    made against, which customer IDs are read from.
+    """
+
+    def __init__(self, analysis_dir):
+        """
+        Parameters:
+        -----------
+        analysis_dir : str
+            Analysis directory holding an AUDIENCE_DIR index
+        """
+        index_dir = os.path.join(analysis_dir, AUDIENCE_DIR)
+        meta = _read_meta(index_dir, AUDIENCE_META_FILE)
+        self.analysis_dir = analysis_dir
+        self.customers = meta['customers']
+        self.churn_buckets = meta['churn_buckets']
+        self.fields = meta['fields']
+        self.lookup_build = meta.get('lookup_build')
+        self.bitmaps = np.load(os.path.join(_build_path(index_dir, meta), "bitmaps.npy"), mmap_mode='r')
+        # Every customer; clears the padding bits set by NOT
+        self.universe = np.packbits(np.ones(self.customers, dtype=bool))
+
+    def _values(self, name, value):
+        """Bitmap of the customers holding any of the requested values"""
+        labels = self.fields[name]
+        rows = [labels[_label(item)] for item in (value if isinstance(value, list) else [value]) if _label(item) in labels]
+        if not rows:
+            return np.zeros_like(self.universe)
+        return np.bitwise_or.reduce(self.bitmaps[rows], axis=0)
+
+    def _churn(self, bounds):
+        """Bitmap of the customers whose churn probability is in [min, max)"""
+        if not isinstance(bounds, dict):
+            raise ValueError(f"{CHURN_FIELD} expects an object with 'min' and/or 'max'")
+        edges = []
+        for key, default in (('min', 0.0), ('max', 1.0)):
+            edge = float(bounds.get(key, default)) * self.churn_buckets
+            if not 0 <= edge <= self.churn_buckets or abs(edge - round(edge)) > 1e-9:
+                raise ValueError(f"{CHURN_FIELD} bounds must be multiples of {1 / self.churn_buckets:g} between 0 and 1")
+            edges.append(int(round(edge)))
+        labels = self.fields[CHURN_FIELD]
+        return self._values(CHURN_FIELD, [bucket for bucket in range(*edges) if str(bucket) in labels])
+
+    def bitmap(self, query):
+        """
+        Evaluate an audience query into a packed bitmap of customer rows
+
+        Raises ValueError for malformed queries or fields not indexed in
+        this analysis.
+        """
+        if not isinstance(query, dict) or len(query) != 1:
+            raise ValueError("Each audience query node must be an object with exactly one key")
+        (key, value), = query.items()
+        if key in ('and', 'or'):
+            if not isinstance(value, list) or not value:
+                raise ValueError(f"'{key}' expects a non-empty list of queries")
+            combine = np.bitwise_and if key == 'and' else np.bitwise_or
+            result = self.bitmap(value[0])
+            for item in value[1:]:
+                combine(result, self.bitmap(item), out=result)
+            return result
+        if key == 'not':
+            return np.bitwise_and(np.invert(self.bitmap(value)), self.universe)
+        if key not in self.fields:
+            raise ValueError(f"Unknown audience field: {key}")
+        if key == CHURN_FIELD:
+            return self._churn(value)
+        return self._values(key, value)
+
+    def count(self, bitmap):
+        """Number of customers in a bitmap"""
+        return int(_POPCOUNT[bitmap].sum(dtype=np.int64))
+
+    def summary(self, query):
+        """
+        Size of an audience and its breakdown by RFM segment
+
+        Returns:
+        --------
+        dict
+            Audience count, total customers and per-segment counts
+        """
+        audience = self.bitmap(query)
+        segments = {
+            segment: self.count(np.bitwise_and(audience, self.bitmaps[row]))
+            for segment, row in self.fields.get('segment', {}).items()
+        }
+        return {
+            'count': self.count(audience),
+            'total_customers': self.customers,
+            'segment_counts': {segment: count for segment, count in segments.items() if count}
+        }
+
+    def rows(self, query):
+        """Row offsets of the audience in the customer lookup index"""
+        return np.flatnonzero(np.unpackbits(self.bitmap(query), count=self.customers))
+
+    def lookup(self):
+        """The lookup index build the bitmap rows refer to"""
+        lookup = get_customer_lookup(self.analysis_dir)
+        if self.lookup_build is None or lookup.build == self.lookup_build:
+            return lookup
+        return CustomerLookup(self.analysis_dir, build=self.lookup_build)
+
+    def iter_customer_ids(self, query, chunk_size=10000):
+        """
+        Yield the customer IDs of an audience in chunks
+
+        The query is evaluated up front, so errors are raised before the
+        first chunk; IDs are gathered from the memory-mapped lookup index
+        build of the bitmaps.
+        """
+        rows = self.rows(query)
+        ids = self.lookup().ids
+
+        def chunks():
+            for start in range(0, len(rows), chunk_size):
+                yield ids[rows[start:start + chunk_size]].tolist()
+        return chunks()
+
+def clear_audience_cache():
+    """Drop the opened audience indexes of this process"""
+    with _AUDIENCES_LOCK:
+        _AUDIENCES.clear()
+
+def get_audience_index(analysis_dir):
+    """
+    Return the opened audience index of an analysis (shared per process,
+    re-opened once the index is rebuilt)
+
+    Raises FileNotFoundError when the analysis has no index.
+    """
+    meta_path = os.path.join(analysis_dir, AUDIENCE_DIR, AUDIENCE_META_FILE)
+    if not os.path.exists(meta_path):
+        raise FileNotFoundError(f"No audience index found in {analysis_dir}")
+    mtime = os.path.getmtime(meta_path)
+    with _AUDIENCES_LOCK:
+        cached = _AUDIENCES.get(analysis_dir)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    audience = AudienceIndex(analysis_dir)
+    with _AUDIENCES_LOCK:
+        _AUDIENCES[analysis_dir] = (mtime, audience)
+    return audience
@@ -0,0 +1,705 @@
+# RFM Insights - Online Event Ingestion Module
+
+import os
+import json
+import bisect
+import hashlib
+import logging
+import datetime
+import threading
+import contextlib
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: snapshots are not locked across processes
+    fcntl = None
+
+from .rfm_state import RFMState, STATE_META_FILE
+from .rfm_audience import refresh_customer_indexes
+from .rfm_scoring import edge_ranks, combined_score
+from .segment_rules import DEFAULT_RULE_SET, builtin_rule_set, resolve_rule_set
+from .quantile_sketch import QuantileSketch
+
+logger = logging.getLogger(__name__)
+
+# File names of the online store inside an analysis directory
+EVENT_STATE_FILE = "events_state.npz"
+EVENT_META_FILE = "events_meta.json"
+EVENT_LOCK_FILE = "events.lock"
+
+# Prefix of the append-only event logs, one per process and state generation
+EVENT_LOG_PREFIX = "events_log_"
+
+# Seconds between background snapshots of a store with unsaved events
+PERSIST_INTERVAL_SECONDS = 30
+
+# Events between refreshes of the streaming score boundaries
+REFRESH_EVERY_EVENTS = 1000
+
+# Snapshots rebuild the lookup and audience indexes once this many events
+# (or this share of the customers, if more) arrived since the last rebuild,
+# or once the last rebuild is this many seconds old and events arrived since
+INDEX_REFRESH_EVENTS = 10000
+INDEX_REFRESH_SHARE = 0.01
+INDEX_REFRESH_SECONDS = 600
+
+# Online stores, keyed by analysis directory
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+
+def _generation(updated_at):
+    """Short identifier of a lineage state version"""
+    return hashlib.sha1(str(updated_at).encode()).hexdigest()[:12]
+
+def _state_meta(state_dir):
+    """Metadata of the lineage state of an analysis directory"""
+    with open(os.path.join(state_dir, STATE_META_FILE), "r") as f:
+        return json.load(f)
+
+def _state_generation(state_dir):
+    """Identifier of the current state version of an analysis directory"""
+    return _generation(_state_meta(state_dir).get('updated_at'))
+
+def _read_log(path, offset):
+    """
+    Complete (customer_id, amount, day) events of a log after an offset,
+    and the offset after the last complete line
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    # Lines still being written are read next time
+    end = data.rfind(b"\n") + 1
+    return [json.loads(line) for line in data[:end].splitlines()], offset + end
+
+def read_event_logs(state_dir, offsets):
+    """
+    Read the events appended to the event logs of an analysis directory
+    (of every state generation) after the given offsets, to fold them into
+    a delta upload
+
+    Parameters:
+    -----------
+    state_dir : str
+        Analysis directory
+    offsets : dict
+        Offset up to which each log was already folded
+
+    Returns:
+    --------
+    tuple
+        DataFrame of customer_id, amount and day (date ordinal) events, and
+        the offset up to which each log was read
+    """
+    events = []
+    read_to = {}
+    for name in sorted(os.listdir(state_dir)):
+        if not name.startswith(EVENT_LOG_PREFIX):
+            continue
+        log_events, read_to[name] = _read_log(os.path.join(state_dir, name), offsets.get(name, 0))
+        events.extend(log_events)
+    return pd.DataFrame(events, columns=['customer_id', 'amount', 'day']), read_to
+
+def remove_event_logs(state_dir, keep_generations):
+    """Remove the event logs of state generations other than keep_generations"""
+    prefixes = tuple(f"{EVENT_LOG_PREFIX}{generation}_" for generation in keep_generations)
+    for name in os.listdir(state_dir):
+        if name.startswith(EVENT_LOG_PREFIX) and not name.startswith(prefixes):
+            with contextlib.suppress(OSError):
+                os.remove(os.path.join(state_dir, name))
+
+@contextlib.contextmanager
+def _snapshot_lock(state_dir, exclusive=False):
+    """Hold a shared (reading) or exclusive (writing) file lock on the snapshot of an analysis directory"""
+    with open(os.path.join(state_dir, EVENT_LOCK_FILE), "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+
+def _inner_edges(sketch, bins, descending=False):
+    """
+    Inner n-tile edges estimated by a sketch
+
+    Recency is held as the last purchase date, so its n-tiles are counted
+    from the most recent date down (descending).
+    """
+    if sketch.total <= 0:
+        return []
+    ranks = edge_ranks(sketch.total, bins, descending=descending).tolist()
+    return [sketch.bound(key) for key, _ in sketch.locate(ranks)]
+
+class OnlineRFMStore:
+    """
+    In-memory per-customer RFM store updated by purchase events
+
+    Customers are located through a hash index into column arrays holding
+    the last purchase day (date ordinal), order count and monetary total.
+    Each event updates one row, the quantile sketches of the three
+    dimensions and the customer's scores and segment in O(1). Customers
+    are scored on the scale of the lineage's segment rule set. Score
+    boundaries are re-estimated from the sketches every
+    REFRESH_EVERY_EVENTS events; when they move, all customers are
+    re-scored in one vectorized pass.
+
+    Recency is scored on the last purchase date rather than on days since
+    it, so the passing of time never moves a boundary.
+
+    Each process appends the events it ingests to its own log in the
+    analysis directory and applies the other processes' logs on load and
+    at every persistence interval, so API workers converge on the same
+    state. Snapshots record how far each log was applied. Rebuilding the
+    analysis's lookup and audience indexes from the live values is O(N),
+    so snapshots only do it once enough events arrived or enough time
+    passed since the last rebuild of any process (INDEX_REFRESH_*), or
+    when asked to (persist(refresh_indexes=True)); lookups, audiences and
+    exports follow the events with that delay. Snapshots belong to one
+    version (generation) of the lineage state: a delta upload folds the
+    logged events into the new state, recording how far each log was
+    folded, and the store is re-seeded from it. Events that stores still
+    on the superseded generation append afterwards are picked up from
+    there.
+
+    Customers are scored on the lineage's score scale (score_bins) and
+    mapped onto the rule set's scale only to be segmented.
+    """
+
+    def __init__(self, customer_ids, last_day, frequency, monetary, state_dir=None, meta=None, writer_id=None):
+        """
+        Parameters:
+        -----------
+        customer_ids : sequence
+            Customer IDs (stored as strings)
+        last_day : array-like
+            Date ordinal of each customer's last purchase
+        frequency : array-like
+            Number of purchases of each customer
+        monetary : array-like
+            Total purchase value of each customer
+        state_dir : str, optional
+            Analysis directory the store is persisted to
+        meta : dict, optional
+            Store metadata (lineage, state generation, score scale,
+            segment rule set, event counters, applied log offsets)
+        writer_id : str, optional
+            Name of this process's event log (the process ID by default)
+        """
+        self.state_dir = state_dir
+        self.meta = meta or {}
+        self.meta.setdefault('events_ingested', 0)
+        # Seeded stores start from the indexes built with their state
+        self.meta.setdefault('indexed_events', self.meta['events_ingested'])
+        self.meta.setdefault('indexed_at', datetime.datetime.now().isoformat())
+        self.log_offsets = self.meta.setdefault('log_offsets', {})
+        self.writer_id = writer_id or str(os.getpid())
+        self.state_mtime = None
+        self._log = None
+        self.meta.setdefault('rule_set', builtin_rule_set(DEFAULT_RULE_SET).definition)
+        self.rule_set = resolve_rule_set(rule_set=self.meta['rule_set'])
+        self.score_bins = self.meta.setdefault('score_bins', self.rule_set.score_bins)
+        self.ids = [str(customer_id) for customer_id in customer_ids]
+        self.index = {customer_id: position for position, customer_id in enumerate(self.ids)}
+        self.size = len(self.ids)
+
+        capacity = max(self.size * 2, 1024)
+        self.last_day = np.zeros(capacity, dtype=np.int64)
+        self.frequency = np.zeros(capacity, dtype=float)
+        self.monetary = np.zeros(capacity, dtype=float)
+        self.scores = np.ones((capacity, 3), dtype=np.int8)
+        self.segments = np.zeros(capacity, dtype=np.int16)
+        self.last_day[:self.size] = last_day
+        self.frequency[:self.size] = frequency
+        self.monetary[:self.size] = monetary
+
+        self.sketches = {
+            'recency': QuantileSketch(linear=True),
+            'frequency': QuantileSketch(),
+            'monetary': QuantileSketch()
+        }
+        self.sketches['recency'].add_many(self.last_day[:self.size])
+        self.sketches['frequency'].add_many(self.frequency[:self.size])
+        self.sketches['monetary'].add_many(self.monetary[:self.size])
+
+        # Segment code of each (r, f, m) score on the lineage's scale (index 0 unused)
+        bins = self.score_bins
+        self.segment_cube = np.zeros((bins + 1,) * 3, dtype=np.int16)
+        self.segment_cube[1:, 1:, 1:] = self.rule_set.cell_codes(bins).reshape(bins, bins, bins)
+        self._segment_cube = self.segment_cube.tolist()
+        self.lock = threading.RLock()
+        self.pending_events = 0
+        self.dirty = False
+        self._stop = threading.Event()
+        self._persist_thread = None
+        self._edges = None
+        edges = self.meta.get('edges')
+        # Snapshot boundaries on another scale are re-estimated
+        if edges and any(len(dimension_edges) != bins - 1 for dimension_edges in edges.values()):
+            edges = None
+        self.refresh_boundaries(force=True, edges=edges)
+
+    @classmethod
+    def from_state(cls, state_dir, writer_id=None):
+        """
+        Seed a store from the RFM state of an analysis lineage
+        """
+        state = RFMState.load(state_dir)
+        as_of = datetime.date.fromisoformat(state.meta['as_of']).toordinal()
+        customers = state.customers
+        meta = {
+            'lineage_id': state.meta['lineage_id'],
+            'generation': _generation(state.meta.get('updated_at')),
+            'seeded_from_as_of': state.meta['as_of'],
+            'score_bins': state.meta['score_bins'],
+            'rule_set': state.meta['rule_set'],
+            # Events folded into the state by delta uploads are not re-applied
+            'log_offsets': dict(state.meta.get('events_folded', {}))
+        }
+        return cls(
+            customers.index,
+            as_of - customers['recency_days'].to_numpy(dtype=np.int64),
+            customers['frequency'].to_numpy(),
+            customers['monetary'].to_numpy(),
+            state_dir=state_dir,
+            meta=meta,
+            writer_id=writer_id
+        )
+
+    @classmethod
+    def load(cls, state_dir, writer_id=None):
+        """
+        Load the store of an analysis directory and apply the event logs
+
+        The last snapshot is used when it belongs to the current state
+        generation; otherwise (no events persisted yet, or a delta upload
+        rewrote the state) the store is seeded from the lineage state.
+        """
+        state_mtime = os.path.getmtime(os.path.join(state_dir, STATE_META_FILE))
+        state_meta = _state_meta(state_dir)
+        generation = _generation(state_meta.get('updated_at'))
+        store = None
+        with _snapshot_lock(state_dir):
+            meta_path = os.path.join(state_dir, EVENT_META_FILE)
+            if os.path.exists(meta_path):
+                with open(meta_path, "r") as f:
+                    meta = json.load(f)
+                # Snapshots written before generations were recorded belong to the current one
+                if meta.setdefault('generation', generation) == generation:
+                    meta.setdefault('score_bins', state_meta['score_bins'])
+                    with np.load(os.path.join(state_dir, EVENT_STATE_FILE)) as state_file:
+                        store = cls(
+                            state_file['customer_id'], state_file['last_day'], state_file['frequency'], state_file['monetary'],
+                            state_dir=state_dir, meta=meta, writer_id=writer_id
+                        )
+
+        if store is None:
+            store = cls.from_state(state_dir, writer_id=writer_id)
+        store.state_mtime = state_mtime
+        store.merge_logs()
+        return store
+
+    def _log_name(self, writer_id):
+        """File name of a process's event log in the current generation"""
+        return f"{EVENT_LOG_PREFIX}{self.meta['generation']}_{writer_id}.jsonl"
+
+    def _append_log(self, events):
+        """
+        Append (customer_id, amount, day) events to this process's log
+
+        Called under the lock before the events are applied. A torn last
+        line left by a crashed predecessor with the same writer ID was
+        never applied and is cut off when the log is opened.
+        """
+        if not self.state_dir or not events:
+            return
+        name = self._log_name(self.writer_id)
+        if self._log is None:
+            self._log = open(os.path.join(self.state_dir, name), "ab")
+            self._log.truncate(self.log_offsets.get(name, 0))
+        self._log.write(b"".join(json.dumps(event).encode() + b"\n" for event in events))
+        self._log.flush()
+        self.log_offsets[name] = self._log.tell()
+
+    def merge_logs(self):
+        """
+        Apply the events appended to the logs since they were last read or
+        folded into the state (this process's own log only before it
+        starts writing to it)
+
+        Returns:
+        --------
+        int
+            Number of events applied
+        """
+        if not self.state_dir:
+            return 0
+        own = self._log_name(self.writer_id)
+        count = 0
+        with self.lock:
+            for name in sorted(os.listdir(self.state_dir)):
+                if not name.startswith(EVENT_LOG_PREFIX) or (name == own and self._log is not None):
+                    continue
+                events, self.log_offsets[name] = _read_log(os.path.join(self.state_dir, name), self.log_offsets.get(name, 0))
+                for customer_id, amount, day in events:
+                    self._apply(customer_id, day, amount)
+                count += len(events)
+            if count:
+                self._after_events(count)
+        return count
+
+    def _grow(self):
+        """Double the capacity of the column arrays"""
+        capacity = len(self.last_day) * 2
+        for name in ('last_day', 'frequency', 'monetary', 'scores', 'segments'):
+            array = getattr(self, name)
+            grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            setattr(self, name, grown)
+
+    def _score(self, day, frequency, monetary):
+        """Score one customer against the current boundaries"""
+        r = bisect.bisect_right(self._edges['recency'], day) + 1
+        f = bisect.bisect_left(self._edges['frequency'], frequency) + 1
+        m = bisect.bisect_left(self._edges['monetary'], monetary) + 1
+        return r, f, m
+
+    def _apply(self, customer_id, day, amount):
+        """
+        Apply one purchase; returns (position, previous segment code or None)
+        """
+        position = self.index.get(customer_id)
+        sketches = self.sketches
+
+        if position is None:
+            if self.size == len(self.last_day):
+                self._grow()
+            position = self.size
+            self.size += 1
+            self.ids.append(customer_id)
+            self.index[customer_id] = position
+            previous = None
+            last_day, frequency, monetary = day, 1.0, amount
+            sketches['recency'].add(last_day)
+        else:
+            previous = int(self.segments[position])
+            self.segment_counts[previous] -= 1
+            old_day = int(self.last_day[position])
+            old_frequency = float(self.frequency[position])
+            old_monetary = float(self.monetary[position])
+            last_day = max(old_day, day)
+            frequency = old_frequency + 1
+            monetary = old_monetary + amount
+            if last_day != old_day:
+                sketches['recency'].remove(old_day)
+                sketches['recency'].add(last_day)
+            sketches['frequency'].remove(old_frequency)
+            sketches['monetary'].remove(old_monetary)
+
+        sketches['frequency'].add(frequency)
+        sketches['monetary'].add(monetary)
+        self.last_day[position] = last_day
+        self.frequency[position] = frequency
+        self.monetary[position] = monetary
+
+        r, f, m = self._score(last_day, frequency, monetary)
+        segment = self._segment_cube[r][f][m]
+        self.scores[position] = (r, f, m)
+        self.segments[position] = segment
+        self.segment_counts[segment] += 1
+        return position, previous
+
+    def refresh_boundaries(self, force=False, edges=None):
+        """
+        Re-estimate score boundaries and re-score everyone if they moved
+
+        Parameters:
+        -----------
+        force : bool
+            Re-score even if the boundaries did not move
+        edges : dict, optional
+            Boundaries to use instead of the sketch estimates (restored
+            from a snapshot)
+
+        Returns:
+        --------
+        bool
+            Whether the boundaries changed
+        """
+        with self.lock:
+            self.pending_events = 0
+            if edges is None:
+                edges = {
+                    dimension: _inner_edges(sketch, self.score_bins, descending=(dimension == 'recency'))
+                    for dimension, sketch in self.sketches.items()
+                }
+            if not force and edges == self._edges:
+                return False
+            self._edges = edges
+
+            size = self.size
+            r = np.searchsorted(edges['recency'], self.last_day[:size], side='right') + 1
+            f = np.searchsorted(edges['frequency'], self.frequency[:size], side='left') + 1
+            m = np.searchsorted(edges['monetary'], self.monetary[:size], side='left') + 1
+            self.scores[:size] = np.column_stack([r, f, m])
+            self.segments[:size] = self.segment_cube[r, f, m]
+            self.segment_counts = np.bincount(self.segments[:size], minlength=len(self.rule_set.segment_names)).tolist()
+            return True
+
+    def _after_events(self, count):
+        """Update counters and refresh boundaries when enough events arrived"""
+        self.meta['events_ingested'] += count
+        self.pending_events += count
+        self.dirty = True
+        if self.pending_events >= REFRESH_EVERY_EVENTS:
+            return self.refresh_boundaries()
+        return False
+
+    def ingest(self, customer_id, amount, timestamp=None):
+        """
+        Apply a single purchase event
+
+        Parameters:
+        -----------
+        customer_id : str or int
+            Customer ID
+        amount : float
+            Purchase value
+        timestamp : datetime.datetime or datetime.date, optional
+            Purchase time (now when omitted)
+
+        Returns:
+        --------
+        dict
+            The customer's updated values, scores and segment
+        """
+        customer_id, amount = str(customer_id), float(amount)
+        day = (timestamp or datetime.date.today()).toordinal()
+        with self.lock:
+            self._append_log([(customer_id, amount, day)])
+            position, previous = self._apply(customer_id, day, amount)
+            self._after_events(1)
+            customer = self.get_customer(customer_id)
+        customer['previous_segment'] = self.rule_set.segment_names[previous] if previous is not None else None
+        return customer
+
+    def ingest_batch(self, events):
+        """
+        Apply purchase events in order
+
+        Parameters:
+        -----------
+        events : iterable of (customer_id, amount, timestamp) tuples
+            timestamp may be None for "now"
+
+        Returns:
+        --------
+        dict
+            Event, new-customer and re-segmented counts and segment counts
+        """
+        today = datetime.date.today().toordinal()
+        events = [
+            (str(customer_id), float(amount), timestamp.toordinal() if timestamp is not None else today)
+            for customer_id, amount, timestamp in events
+        ]
+        count = new_customers = resegmented = 0
+        with self.lock:
+            self._append_log(events)
+            for customer_id, amount, day in events:
+                position, previous = self._apply(customer_id, day, amount)
+                count += 1
+                if previous is None:
+                    new_customers += 1
+                elif previous != self.segments[position]:
+                    resegmented += 1
+            refreshed = self._after_events(count)
+            return {
+                'events': count,
+                'new_customers': new_customers,
+                'resegmented_customers': resegmented,
+                'boundaries_refreshed': refreshed,
+                'total_customers': self.size,
+                'segment_counts': self.get_segment_counts()
+            }
+
+    def get_customer(self, customer_id):
+        """Current values, scores and segment of one customer (None if unknown)"""
+        with self.lock:
+            position = self.index.get(str(customer_id))
+            if position is None:
+                return None
+            r, f, m = (int(score) for score in self.scores[position])
+            return {
+                'customer_id': self.ids[position],
+                'last_purchase_date': datetime.date.fromordinal(int(self.last_day[position])).isoformat(),
+                'recency_days': datetime.date.today().toordinal() - int(self.last_day[position]),
+                'frequency': float(self.frequency[position]),
+                'monetary': float(self.monetary[position]),
+                'r_score': r,
+                'f_score': f,
+                'm_score': m,
+                'rfm_score': combined_score(r, f, m, self.score_bins),
+                'segment': self.rule_set.segment_names[self.segments[position]]
+            }
+
+    def get_segment_counts(self):
+        """Number of customers in each non-empty segment"""
+        return {name: count for name, count in zip(self.rule_set.segment_names, self.segment_counts) if count > 0}
+
+    def get_boundaries(self):
+        """Current inner n-tile boundaries (recency as ISO dates)"""
+        return {
+            'recency': [datetime.date.fromordinal(int(day)).isoformat() for day in self._edges['recency']],
+            'frequency': list(self._edges['frequency']),
+            'monetary': list(self._edges['monetary'])
+        }
+
+    def _index_refresh_due(self, indexed_events, indexed_at, events_ingested, size):
+        """Whether enough events or time passed since the indexes were last rebuilt"""
+        pending = events_ingested - indexed_events
+        if pending <= 0:
+            return False
+        age = (datetime.datetime.now() - datetime.datetime.fromisoformat(indexed_at)).total_seconds()
+        return pending >= max(INDEX_REFRESH_EVENTS, INDEX_REFRESH_SHARE * size) or age >= INDEX_REFRESH_SECONDS
+
+    def persist(self, refresh_indexes=None):
+        """
+        Write a snapshot of the store into its analysis directory
+
+        The other processes' logs are merged first. Arrays are copied under
+        the lock and written outside it, so event ingestion only pauses for
+        the copy; writers in different processes take turns through a file
+        lock. A snapshot of a superseded state generation is not written.
+        The lookup and audience indexes are then rebuilt from the snapshot
+        when requested or due.
+
+        Parameters:
+        -----------
+        refresh_indexes : bool, optional
+            Rebuild (True) or keep (False) the lookup and audience indexes;
+            by default they are rebuilt when enough events or time passed
+            since the last rebuild (INDEX_REFRESH_*), which the snapshot
+            records for every process
+        """
+        if not self.state_dir:
+            return
+        self.merge_logs()
+        with self.lock:
+            size = self.size
+            arrays = {
+                'customer_id': np.array(self.ids[:size], dtype=str),
+                'last_day': self.last_day[:size].copy(),
+                'frequency': self.frequency[:size].copy(),
+                'monetary': self.monetary[:size].copy()
+            }
+            scores = self.scores[:size].astype(np.int32)
+            segments = self.segments[:size].copy()
+            meta = dict(
+                self.meta, log_offsets=dict(self.log_offsets), edges=self._edges,
+                persisted_at=datetime.datetime.now().isoformat(), total_customers=size
+            )
+            self.dirty = False
+
+        with _snapshot_lock(self.state_dir, exclusive=True):
+            if _state_generation(self.state_dir) != meta['generation']:
+                return
+
+            # Another process may have rebuilt the indexes more recently
+            meta_path = os.path.join(self.state_dir, EVENT_META_FILE)
+            if os.path.exists(meta_path):
+                with open(meta_path, "r") as f:
+                    previous = json.load(f)
+                if previous.get('generation') == meta['generation'] and previous.get('indexed_events', 0) > meta['indexed_events']:
+                    meta['indexed_events'] = previous['indexed_events']
+                    meta['indexed_at'] = previous['indexed_at']
+            if refresh_indexes is None:
+                refresh_indexes = self._index_refresh_due(meta['indexed_events'], meta['indexed_at'], meta['events_ingested'], size)
+            if refresh_indexes:
+                meta['indexed_events'] = meta['events_ingested']
+                meta['indexed_at'] = meta['persisted_at']
+            with self.lock:
+                self.meta['indexed_events'] = meta['indexed_events']
+                self.meta['indexed_at'] = meta['indexed_at']
+
+            state_path = os.path.join(self.state_dir, EVENT_STATE_FILE)
+            with open(f"{state_path}.{self.writer_id}.tmp", "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(f"{state_path}.{self.writer_id}.tmp", state_path)
+
+            # The metadata file is written last and marks the snapshot as complete
+            with open(f"{meta_path}.{self.writer_id}.tmp", "w") as f:
+                json.dump(meta, f, default=str)
+            os.replace(f"{meta_path}.{self.writer_id}.tmp", meta_path)
+
+        if not refresh_indexes:
+            return
+        customers = pd.DataFrame({
+            'recency_days': (datetime.date.today().toordinal() - arrays['last_day']).astype(float),
+            'frequency': arrays['frequency'],
+            'monetary': arrays['monetary'],
+            'r_score': scores[:, 0],
+            'f_score': scores[:, 1],
+            'm_score': scores[:, 2],
+            'rfm_score': combined_score(scores[:, 0], scores[:, 1], scores[:, 2], self.score_bins),
+            'segment': np.asarray(self.rule_set.segment_names, dtype=object)[segments]
+        }, index=pd.Index(arrays['customer_id'], name='customer_id'))
+        refresh_customer_indexes(
+            customers, self.state_dir,
+            is_current=lambda: _state_generation(self.state_dir) == meta['generation']
+        )
+
+    def _persist_loop(self, interval):
+        """Background loop merging other processes' events and persisting unsaved ones"""
+        while not self._stop.wait(interval):
+            try:
+                self.merge_logs()
+                if self.dirty:
+                    self.persist()
+            except Exception as e:
+                logger.error(f"Error persisting online RFM store {self.state_dir}: {str(e)}")
+
+    def start_persistence(self, interval=PERSIST_INTERVAL_SECONDS):
+        """Start periodic background persistence"""
+        if self.state_dir and self._persist_thread is None:
+            self._persist_thread = threading.Thread(target=self._persist_loop, args=(interval,), daemon=True)
+            self._persist_thread.start()
+
+    def close(self, persist=True):
+        """Stop background persistence and write any unsaved events"""
+        self._stop.set()
+        if self._persist_thread is not None:
+            self._persist_thread.join()
+            self._persist_thread = None
+        if persist and self.dirty:
+            self.persist()
+        with self.lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+def get_online_store(state_dir):
+    """
+    Return the online store of an analysis directory, loading it and
+    starting its periodic persistence on first use in this process
+
+    A store whose lineage state was rewritten since it was loaded (by a
+    delta upload in any process) is dropped and re-seeded.
+    """
+    state_mtime = os.path.getmtime(os.path.join(state_dir, STATE_META_FILE))
+    with _STORES_LOCK:
+        store = _STORES.get(state_dir)
+        if store is not None and store.state_mtime != state_mtime:
+            store.close(persist=False)
+            store = None
+        if store is None:
+            store = OnlineRFMStore.load(state_dir)
+            store.start_persistence()
+            _STORES[state_dir] = store
+        return store
+
+def close_online_stores():
+    """Persist and release every online store (e.g. on application shutdown)"""
+    with _STORES_LOCK:
+        stores = list(_STORES.values())
+        _STORES.clear()
+    for store in stores:
+        store.close()
@@ -0,0 +1,181 @@
+# RFM Insights - Customer Export Module
+
+import os
+import json
+import uuid
+import hashlib
+import numpy as np
+import pandas as pd
+
+from .rfm_lookup import get_customer_lookup, LOOKUP_DIR, LOOKUP_META_FILE
+
+# Export formats and their media types
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson'
+}
+
+# Directory of cached export files inside an analysis directory
+EXPORT_DIR = "exports"
+
+# Customers serialized per chunk; bounds the memory used by an export
+EXPORT_CHUNK_ROWS = 50000
+
+# Bytes read per block when serving a cached export file
+EXPORT_READ_BYTES = 1 << 20
+
+class CustomerExport:
+    """
+    Per-customer results of an analysis, serialized chunk by chunk
+
+    Rows are read from the memory-mapped lookup index, so an export keeps
+    at most one chunk in memory. The output is deterministic: the first
+    full download is written to a cache file that serves HTTP range
+    requests of later downloads with the same options.
+    """
+
+    def __init__(self, analysis_dir, file_format='csv', segments=None, columns=None):
+        """
+        Parameters:
+        -----------
+        analysis_dir : str
+            Analysis directory holding a customer lookup index
+        file_format : str
+            'csv' or 'ndjson'
+        segments : list, optional
+            Segments to export (all customers when omitted)
+        columns : list, optional
+            Columns to export, in order (all indexed columns when omitted)
+        """
+        if file_format not in EXPORT_FORMATS:
+            raise ValueError(f"Invalid export format: {file_format}. Expected one of {', '.join(EXPORT_FORMATS)}")
+        self.lookup = get_customer_lookup(analysis_dir)
+        available = ['customer_id'] + list(self.lookup.columns)
+        columns = list(columns) if columns else available
+        unknown = [col for col in columns if col not in available]
+        if unknown:
+            raise ValueError(f"Unknown export columns: {', '.join(unknown)}. Available: {', '.join(available)}")
+
+        self.file_format = file_format
+        self.media_type = EXPORT_FORMATS[file_format]
+        self.columns = columns
+        self.segment_codes = None
+        if segments:
+            if 'segment' not in self.lookup.columns:
+                raise ValueError("The analysis index has no segment column")
+            labels = self.lookup.labels['segment']
+            self.segment_codes = [labels.index(segment) for segment in segments if segment in labels]
+
+        # The export is keyed by its options and the index build it reads,
+        # so a re-analysis or a rebuild never serves a stale cache file
+        build = self.lookup.build or os.stat(os.path.join(analysis_dir, LOOKUP_DIR, LOOKUP_META_FILE)).st_mtime_ns
+        key = json.dumps([file_format, sorted(segments) if segments else None, columns, build], ensure_ascii=False)
+        self.etag = hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+        self.path = os.path.join(analysis_dir, EXPORT_DIR, f"{self.etag}.{file_format}")
+
+    def _frame(self, start, stop):
+        """Selected columns of the index rows [start, stop) that pass the segment filter"""
+        rows = np.arange(start, stop)
+        if self.segment_codes is not None:
+            rows = rows[np.isin(self.lookup.columns['segment'][start:stop], self.segment_codes)]
+        frame = {}
+        for col in self.columns:
+            if col == 'customer_id':
+                frame[col] = self.lookup.ids[rows]
+                continue
+            values = self.lookup.columns[col][rows]
+            labels = self.lookup.labels[col]
+            if labels is not None:
+                # Code -1 (missing value) picks the trailing None
+                values = np.array(labels + [None], dtype=object)[values]
+            frame[col] = values
+        return pd.DataFrame(frame, columns=self.columns)
+
+    def iter_chunks(self):
+        """Yield the serialized export in chunks of encoded bytes"""
+        for start in range(0, self.lookup.customers, EXPORT_CHUNK_ROWS):
+            frame = self._frame(start, min(start + EXPORT_CHUNK_ROWS, self.lookup.customers))
+            if self.file_format == 'csv':
+                text = frame.to_csv(index=False, header=start == 0)
+            elif len(frame):
+                text = frame.to_json(orient='records', lines=True, force_ascii=False)
+            else:
+                text = ''
+            if text:
+                yield text.encode('utf-8')
+        if self.lookup.customers == 0 and self.file_format == 'csv':
+            yield (','.join(self.columns) + '\n').encode('utf-8')
+
+    def stream(self):
+        """
+        Yield the serialized export, writing it to the cache file as it goes
+
+        The cache file only appears once the whole export was sent, so an
+        interrupted download never leaves a truncated file behind.
+        """
+        if os.path.exists(self.path):
+            yield from self.iter_file()
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in self.iter_chunks():
+                    f.write(chunk)
+                    yield chunk
+            os.replace(tmp_path, self.path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def materialize(self):
+        """Write the cache file if missing and return its size in bytes"""
+        if not os.path.exists(self.path):
+            for _ in self.stream():
+                pass
+        return os.path.getsize(self.path)
+
+    def iter_file(self, start=0, end=None):
+        """Yield bytes [start, end] (inclusive) of the cache file in blocks"""
+        if end is None:
+            end = os.path.getsize(self.path) - 1
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                block = f.read(min(EXPORT_READ_BYTES, remaining))
+                if not block:
+                    break
+                remaining -= len(block)
+                yield block
+
+def parse_byte_range(header, size):
+    """
+    Parse a single-range 'bytes=start-end' header against a file size
+
+    Returns:
+    --------
+    tuple or None
+        Inclusive (start, end) offsets, or None when the header is not a
+        single byte range (the whole file is then served)
+
+    Raises ValueError when the range cannot be satisfied.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, _, last = header[len('bytes='):].strip().partition('-')
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        elif last:
+            # Suffix range: the last N bytes
+            start = max(size - int(last), 0)
+            end = size - 1
+        else:
+            return None
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise ValueError(f"Range not satisfiable: {header}")
+    return start, min(end, size - 1)
@@ -0,0 +1,354 @@
+# RFM Insights - Customer Lookup Index Module
+
+import os
+import json
+import uuid
+import shutil
+import threading
+import numpy as np
+import pandas as pd
+
+# Directory of the lookup index inside an analysis directory
+LOOKUP_DIR = "customer_index"
+
+# Index metadata file; it names the current build and is replaced last
+LOOKUP_META_FILE = "index_meta.json"
+
+# Prefix of the build directories inside an index directory; every build
+# is written to a fresh one, so readers never mix files of two builds
+BUILD_PREFIX = "build_"
+
+# Per-customer result columns stored in the index, with their storage type;
+# missing columns (e.g. no predictive results) are skipped
+LOOKUP_COLUMNS = [
+    ('recency_days', np.float64),
+    ('frequency', np.float64),
+    ('monetary', np.float64),
+    ('r_score', np.int16),
+    ('f_score', np.int16),
+    ('m_score', np.int16),
+    ('rfm_score', np.int32),
+    ('segment', 'category'),
+    ('churn_probability', np.float32),
+    ('predicted_ltv', np.float64),
+    ('ltv_segment', 'category'),
+    ('cluster', np.int16),
+    ('upsell_potential', np.bool_),
+    ('crosssell_potential', np.bool_)
+]
+
+# Minimum number of empty slots per customer in the hash table
+SLOT_LOAD_FACTOR = 2
+
+# Opened indexes, keyed by analysis directory, with the modification time
+# of the index build they were opened from
+_INDEXES = {}
+_INDEXES_LOCK = threading.Lock()
+
+def _hash_ids(ids):
+    """Stable 64-bit hashes of customer IDs (identical across processes)"""
+    return pd.util.hash_array(np.asarray(ids, dtype=object), categorize=False)
+
+def _build_slots(hashes):
+    """
+    Open-addressing (linear probing) table mapping hash slots to row offsets
+
+    Rows are placed in vectorized rounds: in each round every unplaced row
+    claims its current slot, the first claimant of each free slot wins and
+    the others move to the next slot.
+    """
+    size = 16
+    while size < SLOT_LOAD_FACTOR * len(hashes):
+        size *= 2
+    mask = size - 1
+    slots = np.full(size, -1, dtype=np.int64)
+
+    pending = np.arange(len(hashes))
+    position = (hashes & np.uint64(mask)).astype(np.int64)
+    while len(pending):
+        free = np.flatnonzero(slots[position] == -1)
+        _, first = np.unique(position[free], return_index=True)
+        winners = free[first]
+        slots[position[winners]] = pending[winners]
+
+        keep = np.ones(len(pending), dtype=bool)
+        keep[winners] = False
+        pending = pending[keep]
+        position = (position[keep] + 1) & mask
+    return slots
+
+def _new_build(index_dir):
+    """Create an empty build directory; returns its name and path"""
+    build = f"{BUILD_PREFIX}{uuid.uuid4().hex[:16]}"
+    path = os.path.join(index_dir, build)
+    os.makedirs(path)
+    return build, path
+
+def _read_meta(index_dir, meta_file):
+    """Metadata of the current build of an index directory"""
+    with open(os.path.join(index_dir, meta_file), "r") as f:
+        return json.load(f)
+
+def _build_path(index_dir, meta):
+    """Directory holding the files of a build (indexes written before builds were versioned hold them at the top level)"""
+    return os.path.join(index_dir, meta['build']) if meta.get('build') else index_dir
+
+def _publish_build(index_dir, meta_file, build, meta):
+    """
+    Make a complete build the current one by replacing the metadata file,
+    then remove the builds before the one it replaces
+
+    The replaced build is kept for readers that read the previous metadata
+    and are opening its files; memory-mapped files of removed builds stay
+    readable by the processes that mapped them. Builds of one index must
+    not run concurrently (see rfm_audience.refresh_customer_indexes).
+    """
+    meta = {**meta, 'build': build}
+    # A copy inside the build lets it be opened by name once superseded
+    with open(os.path.join(index_dir, build, meta_file), "w") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    meta_path = os.path.join(index_dir, meta_file)
+    previous = None
+    if os.path.exists(meta_path):
+        previous = _read_meta(index_dir, meta_file).get('build')
+    tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp_path, meta_path)
+
+    for name in os.listdir(index_dir):
+        if name.startswith(BUILD_PREFIX) and name not in (build, previous):
+            shutil.rmtree(os.path.join(index_dir, name), ignore_errors=True)
+
+def build_lookup_index(results, user_id_col, analysis_dir):
+    """
+    Persist per-customer results as memory-mappable columns with a hash index
+
+    Parameters:
+    -----------
+    results : pandas.DataFrame
+        One row per customer with the user ID column and any of LOOKUP_COLUMNS
+    user_id_col : str
+        Column name for customer ID
+    analysis_dir : str
+        Analysis directory; the index is written to its LOOKUP_DIR
+
+    Returns:
+    --------
+    int
+        Number of indexed customers
+    """
+    results = results.drop_duplicates(subset=user_id_col, keep='last')
+    index_dir = os.path.join(analysis_dir, LOOKUP_DIR)
+    os.makedirs(index_dir, exist_ok=True)
+    build, build_dir = _new_build(index_dir)
+
+    ids = results[user_id_col].astype(str).to_numpy()
+    hashes = _hash_ids(ids)
+    np.save(os.path.join(build_dir, "ids.npy"), ids.astype(str))
+    np.save(os.path.join(build_dir, "hashes.npy"), hashes)
+    np.save(os.path.join(build_dir, "slots.npy"), _build_slots(hashes))
+
+    columns = {}
+    for name, dtype in LOOKUP_COLUMNS:
+        if name not in results.columns:
+            continue
+        values = results[name]
+        if dtype == 'category':
+            codes, labels = pd.factorize(values.astype(str).where(values.notna()))
+            np.save(os.path.join(build_dir, f"{name}.npy"), codes.astype(np.int16))
+            columns[name] = [str(label) for label in labels]
+        else:
+            np.save(os.path.join(build_dir, f"{name}.npy"), values.to_numpy(dtype=dtype))
+            columns[name] = None
+
+    _publish_build(index_dir, LOOKUP_META_FILE, build, {'customers': len(ids), 'columns': columns})
+    with _INDEXES_LOCK:
+        _INDEXES.pop(analysis_dir, None)
+    return len(ids)
+
+def _missing_value(values):
+    """Value stored for a customer without results in a column"""
+    if values.dtype.kind == 'f':
+        return np.nan
+    if values.dtype.kind == 'b':
+        return False
+    return -1
+
+def refresh_lookup_index(customers, analysis_dir):
+    """
+    Rebuild the lookup index of an analysis from refreshed RFM results
+
+    Used after a delta upload: recency, frequency, monetary, scores and
+    segments come from the updated lineage state, while the columns only
+    the previous build holds (the predictive results, which deltas do not
+    recompute) are carried over per customer. New customers get missing
+    values there (no churn probability, LTV or LTV segment, cluster -1,
+    flags false) until the next full analysis.
+
+    Parameters:
+    -----------
+    customers : pandas.DataFrame
+        Lineage state customers, indexed by customer ID
+    analysis_dir : str
+        Analysis directory holding the index
+
+    Returns:
+    --------
+    pandas.DataFrame or None
+        The indexed rows (customer_id first, in index row order), or None
+        when the analysis has no index
+    """
+    if not os.path.exists(os.path.join(analysis_dir, LOOKUP_DIR, LOOKUP_META_FILE)):
+        return None
+    results = customers.rename_axis('customer_id').reset_index()
+    results = results.drop_duplicates(subset='customer_id', keep='last').reset_index(drop=True)
+
+    previous = CustomerLookup(analysis_dir)
+    rows = previous.rows(results['customer_id'].to_numpy())
+    found = rows >= 0
+    for name, values in previous.columns.items():
+        if name in results.columns:
+            continue
+        carried = np.full(len(results), _missing_value(values), dtype=values.dtype)
+        carried[found] = values[rows[found]]
+        labels = previous.labels[name]
+        if labels is not None:
+            # Code -1 (missing value) picks the trailing None
+            carried = np.array(labels + [None], dtype=object)[carried]
+        results[name] = carried
+    del previous
+
+    build_lookup_index(results, 'customer_id', analysis_dir)
+    return results
+
+class CustomerLookup:
+    """
+    Read-only view of a persisted lookup index build
+
+    All arrays are memory-mapped, so processes serving the same analysis
+    share one copy in the page cache and opening an index reads no data.
+    The arrays all come from the build the metadata named when the view
+    was opened, whatever rebuilds happen meanwhile.
+    """
+
+    def __init__(self, analysis_dir, build=None):
+        """
+        Parameters:
+        -----------
+        analysis_dir : str
+            Analysis directory holding a LOOKUP_DIR index
+        build : str, optional
+            Build to open instead of the current one (e.g. the one an
+            audience index was built against)
+        """
+        index_dir = os.path.join(analysis_dir, LOOKUP_DIR)
+        meta = _read_meta(index_dir, LOOKUP_META_FILE)
+        if build is not None and build != meta.get('build'):
+            meta = _read_meta(os.path.join(index_dir, build), LOOKUP_META_FILE)
+        build_dir = _build_path(index_dir, meta)
+        self.build = meta.get('build')
+        self.customers = meta['customers']
+        self.labels = meta['columns']
+        self.ids = np.load(os.path.join(build_dir, "ids.npy"), mmap_mode='r')
+        self.hashes = np.load(os.path.join(build_dir, "hashes.npy"), mmap_mode='r')
+        self.slots = np.load(os.path.join(build_dir, "slots.npy"), mmap_mode='r')
+        self.mask = len(self.slots) - 1
+        self.columns = {name: np.load(os.path.join(build_dir, f"{name}.npy"), mmap_mode='r') for name in self.labels}
+
+    def row(self, customer_id):
+        """Row offset of one customer (None if unknown)"""
+        key = str(customer_id)
+        hashed = _hash_ids([key])[0]
+        slot = int(hashed & np.uint64(self.mask))
+        while True:
+            row = int(self.slots[slot])
+            if row < 0:
+                return None
+            if self.hashes[row] == hashed and self.ids[row] == key:
+                return row
+            slot = (slot + 1) & self.mask
+
+    def rows(self, customer_ids):
+        """Row offsets of several customers (-1 for unknown ones), probed together"""
+        keys = np.asarray([str(customer_id) for customer_id in customer_ids])
+        hashed = _hash_ids(keys)
+        slot = (hashed & np.uint64(self.mask)).astype(np.int64)
+        found = np.full(len(keys), -1, dtype=np.int64)
+        active = np.arange(len(keys))
+        while len(active):
+            rows = np.asarray(self.slots[slot[active]])
+            occupied = rows >= 0
+            match = occupied.copy()
+            match[occupied] = (self.hashes[rows[occupied]] == hashed[active[occupied]]) & (self.ids[rows[occupied]] == keys[active[occupied]])
+            found[active[match]] = rows[match]
+            active = active[occupied & ~match]
+            slot[active] = (slot[active] + 1) & self.mask
+        return found
+
+    def records(self, rows):
+        """Result columns of the customers at row offsets, one gather per column"""
+        rows = np.asarray(rows, dtype=np.int64)
+        columns = {'customer_id': self.ids[rows].tolist()}
+        for name, values in self.columns.items():
+            labels = self.labels[name]
+            column = values[rows].tolist()
+            if labels is not None:
+                column = [labels[code] if code >= 0 else None for code in column]
+            columns[name] = column
+        names = list(columns)
+        return [dict(zip(names, values)) for values in zip(*columns.values())]
+
+    def get(self, customer_id):
+        """Results of one customer (None if unknown)"""
+        row = self.row(customer_id)
+        if row is None:
+            return None
+        record = {'customer_id': str(self.ids[row])}
+        for name, values in self.columns.items():
+            value = values[row].item()
+            labels = self.labels[name]
+            record[name] = (labels[value] if value >= 0 else None) if labels is not None else value
+        return record
+
+    def get_many(self, customer_ids):
+        """
+        Results of several customers
+
+        Returns:
+        --------
+        tuple
+            Results of the known customers, in request order, and the
+            unknown customer IDs
+        """
+        rows = self.rows(customer_ids)
+        found = self.records(rows[rows >= 0])
+        missing = [str(customer_id) for customer_id, row in zip(customer_ids, rows) if row < 0]
+        return found, missing
+
+def clear_lookup_cache():
+    """Drop the opened lookup indexes of this process"""
+    with _INDEXES_LOCK:
+        _INDEXES.clear()
+
+def get_customer_lookup(analysis_dir):
+    """
+    Return the opened lookup index of an analysis (shared per process,
+    re-opened once the index is rebuilt, e.g. after a delta upload)
+
+    Raises FileNotFoundError when the analysis has no index.
+    """
+    meta_path = os.path.join(analysis_dir, LOOKUP_DIR, LOOKUP_META_FILE)
+    if not os.path.exists(meta_path):
+        raise FileNotFoundError(f"No customer index found in {analysis_dir}")
+    mtime = os.path.getmtime(meta_path)
+    with _INDEXES_LOCK:
+        cached = _INDEXES.get(analysis_dir)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    lookup = CustomerLookup(analysis_dir)
+    with _INDEXES_LOCK:
+        _INDEXES[analysis_dir] = (mtime, lookup)
+    return lookup
@@ -0,0 +1,236 @@
+# RFM Insights - Model Scoring Module
+
+import os
+import datetime
+import threading
+import numpy as np
+import pandas as pd
+
+from .rfm_analysis import RFMAnalysis, build_feature_matrix, segment_scores
+from .rfm_scoring import scores_from_edges, to_rule_scale, combined_score
+from .rfm_export import EXPORT_FORMATS
+
+# Trained models and their scoring metadata inside an analysis directory
+MODELS_FILE = "models.joblib"
+
+# Customers whose features are built and scored per batch; bounds the
+# memory used while predictions are streamed
+SCORING_BATCH_ROWS = 50000
+
+# Columns of the scored customers, in output order
+SCORING_COLUMNS = [
+    'customer_id', 'recency_days', 'frequency', 'monetary',
+    'r_score', 'f_score', 'm_score', 'rfm_score', 'segment',
+    'churn_probability', 'predicted_ltv'
+]
+
+# RFM dimensions scored against the analysis edges, with their score column
+DIMENSIONS = {'recency': 'r_score', 'frequency': 'f_score', 'monetary': 'm_score'}
+
+# Loaded models, keyed by analysis directory
+_MODELS = {}
+_MODELS_LOCK = threading.Lock()
+
+class ScoringModels:
+    """
+    Churn and LTV models of an analysis, applied to new customers
+
+    New customers are scored against the analysis n-tile edges and
+    segmented with its rule set, then run through the same feature
+    preparation the models were trained on (build_feature_matrix with the
+    rule set's segment catalogue), so the feature columns always match the
+    training ones. Models are applied to whole batches of customers.
+    """
+
+    def __init__(self, churn_model, ltv_model, meta):
+        """
+        Parameters:
+        -----------
+        churn_model : sklearn classifier
+            Trained churn model (predict_proba)
+        ltv_model : regressor
+            Trained LTV model (predict)
+        meta : dict
+            Column mapping, score scale, rule set, edges and feature columns
+            of the analysis the models were trained on
+        """
+        self.churn_model = churn_model
+        self.ltv_model = ltv_model
+        self.meta = meta
+
+    @classmethod
+    def from_analysis(cls, rfm, predictive):
+        """
+        Collect the trained models of a completed analysis
+
+        Parameters:
+        -----------
+        rfm : RFMAnalysis
+            Ungrouped analysis on which segment_customers() has run
+        predictive : PredictiveAnalytics
+            Predictive analytics on which predict_churn() and predict_ltv() have run
+        """
+        if rfm.group_col:
+            raise ValueError("Grouped analyses have no per-customer scoring models")
+        if predictive.churn_model is None or predictive.ltv_model is None:
+            raise ValueError("The churn and LTV models have not been trained")
+        meta = {
+            'segment_type': rfm.segment_type,
+            'input_mode': rfm.input_mode,
+            'column_mapping': {
+                'user_id': rfm.user_id_col,
+                'recency': rfm.recency_col,
+                'frequency': rfm.order_col if rfm.input_mode == 'transaction' else rfm.frequency_col,
+                'monetary': rfm.monetary_col
+            },
+            'score_bins': rfm.score_bins,
+            'rule_set': rfm.rule_set.definition,
+            'segment_names': list(rfm.rule_set.segment_names),
+            'feature_columns': list(predictive.feature_columns),
+            'edges': {dimension: [float(edge) for edge in rfm.score_edges[dimension]] for dimension in DIMENSIONS},
+            'as_of': datetime.date.today().isoformat(),
+            'trained_at': datetime.datetime.now().isoformat()
+        }
+        return cls(predictive.churn_model, predictive.ltv_model, meta)
+
+    @classmethod
+    def load(cls, analysis_dir):
+        """
+        Load the models persisted in an analysis directory (cached per process)
+        """
+        import joblib
+        path = os.path.join(analysis_dir, MODELS_FILE)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No scoring models found in {analysis_dir}")
+
+        mtime = os.path.getmtime(path)
+        with _MODELS_LOCK:
+            cached = _MODELS.get(analysis_dir)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        bundle = joblib.load(path)
+        models = cls(bundle['churn_model'], bundle['ltv_model'], bundle['meta'])
+        with _MODELS_LOCK:
+            _MODELS[analysis_dir] = (mtime, models)
+        return models
+
+    def save(self, analysis_dir):
+        """
+        Persist the models into an analysis directory
+        """
+        import joblib
+        os.makedirs(analysis_dir, exist_ok=True)
+        path = os.path.join(analysis_dir, MODELS_FILE)
+        joblib.dump({'churn_model': self.churn_model, 'ltv_model': self.ltv_model, 'meta': self.meta}, path + ".tmp")
+        os.replace(path + ".tmp", path)
+        with _MODELS_LOCK:
+            _MODELS[analysis_dir] = (os.path.getmtime(path), self)
+
+    @property
+    def required_columns(self):
+        """Input columns of the analysis column mapping"""
+        return [col for col in self.meta['column_mapping'].values() if col]
+
+    def prepare(self, data):
+        """
+        Score and segment new customers as the analysis would have
+
+        Parameters:
+        -----------
+        data : pandas.DataFrame
+            Customer rows (order lines for transaction analyses) using the
+            analysis column mapping
+
+        Returns:
+        --------
+        pandas.DataFrame
+            One row per customer with the RFM values, scores and segment
+        """
+        mapping = self.meta['column_mapping']
+        missing_cols = [col for col in self.required_columns if col not in data.columns]
+        if missing_cols:
+            raise ValueError(f"Missing required columns: {', '.join(missing_cols)}")
+        rfm = RFMAnalysis(
+            data, mapping['user_id'], mapping['recency'], mapping['frequency'], mapping['monetary'],
+            self.meta['segment_type'], input_mode=self.meta['input_mode']
+        )
+        data = rfm.preprocess_data()
+        customers = pd.DataFrame({
+            'customer_id': data[rfm.user_id_col].to_numpy(),
+            'recency_days': data['recency_days'].to_numpy(dtype=float),
+            'frequency': data[rfm.frequency_col].to_numpy(dtype=float),
+            'monetary': data[rfm.monetary_col].to_numpy(dtype=float)
+        }).drop_duplicates(subset='customer_id', keep='last').reset_index(drop=True)
+
+        # Recency grows by the same number of days for every customer since
+        # the models were trained, and so do the recency edges
+        days = (datetime.date.today() - datetime.date.fromisoformat(self.meta['as_of'])).days
+        values = {'recency': customers['recency_days'], 'frequency': customers['frequency'], 'monetary': customers['monetary']}
+        for dimension, column in DIMENSIONS.items():
+            edges = np.asarray(self.meta['edges'][dimension]) + (days if dimension == 'recency' else 0)
+            customers[column] = scores_from_edges(values[dimension], edges, dimension)
+
+        score_bins = self.meta['score_bins']
+        customers['rfm_score'] = combined_score(customers['r_score'], customers['f_score'], customers['m_score'], score_bins)
+        customers['segment'] = segment_scores(customers['r_score'], customers['f_score'], customers['m_score'], score_bins, self.meta['rule_set'])
+        return customers
+
+    def predict(self, customers):
+        """
+        Apply the churn and LTV models to prepared customers
+
+        Parameters:
+        -----------
+        customers : pandas.DataFrame
+            Output of prepare() (or a slice of it)
+
+        Returns:
+        --------
+        pandas.DataFrame
+            The customers with churn_probability and predicted_ltv, in
+            SCORING_COLUMNS order
+        """
+        # The models were trained on scores on the rule scale (see analyze_rfm_data)
+        score_bins = self.meta['score_bins']
+        model_view = customers.assign(**{
+            col: to_rule_scale(customers[col].to_numpy(), score_bins) for col in DIMENSIONS.values()
+        })
+        features, _ = build_feature_matrix(model_view, self.meta['segment_names'])
+        if len(features):
+            churn_probability = self.churn_model.predict_proba(features)[:, 1]
+            predicted_ltv = self.ltv_model.predict(features)
+        else:
+            churn_probability = predicted_ltv = np.zeros(0)
+        return customers.assign(churn_probability=churn_probability, predicted_ltv=predicted_ltv)[SCORING_COLUMNS]
+
+    def iter_predictions(self, customers, batch_rows=SCORING_BATCH_ROWS):
+        """Yield the predictions of prepared customers batch by batch"""
+        for start in range(0, len(customers), batch_rows):
+            yield self.predict(customers.iloc[start:start + batch_rows])
+
+    def iter_chunks(self, customers, output_format='csv', batch_rows=SCORING_BATCH_ROWS):
+        """
+        Yield the predictions of prepared customers as encoded CSV or NDJSON chunks
+
+        Raises ValueError for an unknown output format.
+        """
+        if output_format not in EXPORT_FORMATS:
+            raise ValueError(f"Invalid output format: {output_format}. Expected one of {', '.join(EXPORT_FORMATS)}")
+        return self._encode(customers, output_format, batch_rows)
+
+    def _encode(self, customers, output_format, batch_rows):
+        """Serialize the predictions of each batch as it is scored"""
+        if len(customers) == 0 and output_format == 'csv':
+            yield (','.join(SCORING_COLUMNS) + '\n').encode('utf-8')
+        for index, frame in enumerate(self.iter_predictions(customers, batch_rows)):
+            if output_format == 'csv':
+                text = frame.to_csv(index=False, header=index == 0)
+            else:
+                text = frame.to_json(orient='records', lines=True, force_ascii=False)
+            yield text.encode('utf-8')
+
+def clear_model_cache():
+    """Drop the loaded scoring models of this process"""
+    with _MODELS_LOCK:
+        _MODELS.clear()
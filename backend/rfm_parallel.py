@@ -0,0 +1,323 @@
+# RFM Insights - Partitioned Parallel RFM Engine Module
+
+import multiprocessing
+import numpy as np
+import pandas as pd
+
+from .rfm_analysis import RFMAnalysis
+from .rfm_state import DIMENSIONS, TOTAL_COLUMNS, results_from_totals
+from .rfm_scoring import DEFAULT_SCORE_BINS, resolve_bins, edge_ranks, scores_from_edges
+from .segment_rules import resolve_rule_set
+from .quantile_sketch import QuantileSketch
+from .cpu_quota import available_cpus
+from .data_loader import iter_dataset, load_dataset
+from .memory_budget import SpillStore
+
+# Default number of worker processes (the CPUs the container may use)
+DEFAULT_WORKERS = available_cpus()
+
+# Start method of the worker processes. Forking the multithreaded API
+# server would copy locks held by its other threads into the workers, so
+# they start from a fresh interpreter instead
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+def partition_customers(data, user_id_col, partitions):
+    """
+    Hash-partition rows by customer ID so that every customer (and all of
+    their transactions) lands in exactly one partition
+
+    Returns:
+    --------
+    list of pandas.DataFrame
+        Non-empty partitions
+    """
+    codes = pd.util.hash_pandas_object(data[user_id_col], index=False).to_numpy() % partitions
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(partitions + 1))
+    return [data.iloc[order[start:end]] for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+class _Partition:
+    """
+    Worker-side state of one partition: its preprocessed customer values
+    and the sketch bucket of every value
+    """
+
+    def __init__(self, data, mapping):
+        rfm = RFMAnalysis(data, **mapping)
+        prepared = rfm.preprocess_data()
+        self.rule_set = rfm.rule_set
+        self.values = {
+            dimension: prepared[column].to_numpy(dtype=float)
+            for dimension, column in (
+                ('recency', 'recency_days'),
+                ('frequency', rfm.frequency_col),
+                ('monetary', rfm.monetary_col)
+            )
+        }
+        self.keys = {}
+
+    def sketch(self):
+        """Map step 1: bucket counts of each dimension"""
+        counts = {}
+        for dimension, values in self.values.items():
+            sketch = QuantileSketch(linear=(dimension == 'recency'))
+            self.keys[dimension] = sketch.keys(values)
+            sketch.add_many(values)
+            counts[dimension] = sketch.counts
+        return counts
+
+    def window(self, needed_keys):
+        """Map step 2: values falling in the buckets that hold the edge ranks"""
+        return {
+            dimension: self.values[dimension][np.isin(self.keys[dimension], keys)]
+            for dimension, keys in needed_keys.items()
+        }
+
+    def score(self, edges, bins):
+        """Map step 3: score, segment and aggregate per segment"""
+        r, f, m = (
+            scores_from_edges(self.values[dimension], edges[dimension], dimension)
+            for dimension in ('recency', 'frequency', 'monetary')
+        )
+        segments = self.rule_set.segment_codes(r, f, m, bins)
+
+        names = self.rule_set.segment_names
+        size = len(names)
+        sums = [
+            np.bincount(segments, minlength=size),
+            np.bincount(segments, weights=self.values['recency'], minlength=size),
+            np.bincount(segments, weights=self.values['frequency'], minlength=size),
+            np.bincount(segments, weights=self.values['monetary'], minlength=size)
+        ]
+        return {
+            names[code]: {column: float(total[code]) for column, total in zip(TOTAL_COLUMNS, sums)}
+            for code in np.flatnonzero(sums[0])
+        }
+
+def _worker_main(connection, paths, mapping):
+    """
+    Worker process loop: load one partition from its spilled files, keep it
+    resident and serve commands
+    """
+    partition = None
+    while True:
+        command, args = connection.recv()
+        if command == 'stop':
+            break
+        try:
+            if partition is None:
+                partition = _Partition(pd.concat([pd.read_pickle(path) for path in paths], ignore_index=True), mapping)
+            connection.send(('ok', getattr(partition, command)(*args)))
+        except Exception as e:
+            connection.send(('error', f"{type(e).__name__}: {str(e)}"))
+    connection.close()
+
+class _LocalPool:
+    """Runs partitions in the calling process (single worker)"""
+
+    def __init__(self, partitions, mapping):
+        self.partitions = [_Partition(data, mapping) for data in partitions]
+
+    def map(self, command, *args):
+        return [getattr(partition, command)(*args) for partition in self.partitions]
+
+    def close(self):
+        self.partitions = []
+
+class _ProcessPool:
+    """
+    One worker process per partition, with the partition kept resident
+    between steps
+
+    Workers read their partition from the files it was spilled to, so the
+    rows are never pickled through the coordinator.
+    """
+
+    def __init__(self, partition_files, mapping):
+        context = multiprocessing.get_context(START_METHOD)
+        self.connections = []
+        self.processes = []
+        for paths in partition_files:
+            parent, child = context.Pipe()
+            process = context.Process(target=_worker_main, args=(child, paths, mapping), daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(parent)
+            self.processes.append(process)
+
+    def map(self, command, *args):
+        for connection in self.connections:
+            connection.send((command, args))
+        replies = [connection.recv() for connection in self.connections]
+        errors = [result for status, result in replies if status == 'error']
+        if errors:
+            raise RuntimeError(f"RFM worker failed: {errors[0]}")
+        return [result for _, result in replies]
+
+    def close(self):
+        for connection, process in zip(self.connections, self.processes):
+            try:
+                connection.send(('stop', ()))
+            except (BrokenPipeError, OSError):
+                pass
+            connection.close()
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.connections = []
+        self.processes = []
+
+def _merge_sketches(partials):
+    """Reduce step 1: merge per-partition bucket counts"""
+    merged = {}
+    for dimension in DIMENSIONS:
+        sketch = QuantileSketch(linear=(dimension == 'recency'))
+        for counts in partials:
+            part = QuantileSketch(linear=(dimension == 'recency'))
+            part.counts = counts[dimension]
+            part.total = sum(part.counts.values())
+            sketch.merge(part)
+        merged[dimension] = sketch
+    return merged
+
+def _spill_partitions(data, file_format, columns, user_id_col, workers):
+    """
+    Hash-partition the rows by customer ID into spilled files, streaming
+    uploads chunk by chunk
+
+    Returns:
+    --------
+    tuple
+        The SpillStore (to clean up), the files of each non-empty partition
+        and the number of rows
+    """
+    store = SpillStore(partitions=workers)
+    chunks = [data] if isinstance(data, pd.DataFrame) else iter_dataset(data, file_format=file_format, columns=columns)
+    rows = 0
+    try:
+        for chunk in chunks:
+            store.write(chunk, keys=[user_id_col])
+            rows += len(chunk)
+    except Exception:
+        store.cleanup()
+        raise
+    return store, [files for files in store.files if files], rows
+
+def analyze_rfm_partitioned(data, user_id_col, recency_col, frequency_col, monetary_col, segment_type, input_mode='customer', workers=None, score_bins=DEFAULT_SCORE_BINS, rule_set=None, file_format='csv'):
+    """
+    Run the RFM scoring and segmentation across worker processes
+
+    Customers are hash-partitioned across workers. Uploads are streamed
+    into per-partition spill files (see memory_budget.SpillStore) that the
+    workers load themselves, so the coordinator never holds the whole
+    dataset; workers are started with START_METHOD. Each worker preprocesses
+    its partition and returns bucket counts of recency, frequency and
+    monetary; the coordinator merges them, asks the workers only for the
+    values in the buckets that hold the n-tile edge positions, and picks
+    the exact edges from those. Workers then score, segment and aggregate
+    locally and return per-segment totals.
+
+    Segment counts are identical to the single-process RFMAnalysis; segment
+    averages and totals match up to floating-point summation order
+    (relative difference below 1e-9).
+
+    Parameters:
+    -----------
+    data : pandas.DataFrame, bytes, str or file-like
+        Customer rows or transaction lines, or the raw upload (contents,
+        path or open file)
+    user_id_col, recency_col, frequency_col, monetary_col, segment_type, input_mode
+        Same as RFMAnalysis
+    workers : int, optional
+        Number of worker processes (DEFAULT_WORKERS when omitted); 1 runs
+        the partitions in the calling process
+    score_bins : int or str
+        Number of score tiles, as in RFMAnalysis
+    rule_set : dict or str, optional
+        Segment rule set, as in RFMAnalysis
+    file_format : str
+        Format of a raw upload (see data_loader.iter_dataset)
+
+    Returns:
+    --------
+    dict
+        'rfm_analysis' summaries in the layout of analyze_rfm_data, the
+        inner n-tile 'score_edges', the number of 'partitions' and the
+        'record_count' of input rows; empty summaries and edges when no
+        customer is left to score
+    """
+    bins = resolve_bins(score_bins)
+    workers = workers or DEFAULT_WORKERS
+    if isinstance(data, pd.DataFrame):
+        workers = max(1, min(workers, len(data)))
+    columns = [col for col in (user_id_col, recency_col, frequency_col, monetary_col) if col is not None]
+    mapping = {
+        'user_id_col': user_id_col,
+        'recency_col': recency_col,
+        'frequency_col': frequency_col,
+        'monetary_col': monetary_col,
+        'segment_type': segment_type,
+        'input_mode': input_mode,
+        'score_bins': bins,
+        'rule_set': resolve_rule_set(segment_type, rule_set).definition
+    }
+    spill = pool = None
+    if workers == 1:
+        if not isinstance(data, pd.DataFrame):
+            data = load_dataset(data, file_format=file_format, columns=columns)
+        rows = len(data)
+        partitions = partition_customers(data, user_id_col, 1)
+        pool = _LocalPool(partitions, mapping)
+    else:
+        spill, partitions, rows = _spill_partitions(data, file_format, columns, user_id_col, workers)
+
+    try:
+        if pool is None:
+            pool = _ProcessPool(partitions, mapping)
+        sketches = _merge_sketches(pool.map('sketch'))
+        if not sketches['recency'].total:
+            return {
+                'rfm_analysis': results_from_totals({}),
+                'score_edges': {dimension: [] for dimension in DIMENSIONS},
+                'partitions': len(partitions),
+                'record_count': rows
+            }
+
+        # Locate the buckets holding the order statistic of each edge
+        located = {}
+        needed_keys = {}
+        for dimension, sketch in sketches.items():
+            located[dimension] = sketch.locate(edge_ranks(sketch.total, bins).tolist())
+            needed_keys[dimension] = sorted({key for key, _ in located[dimension]})
+
+        # Exact order statistics from the (small) bucket windows
+        windows = pool.map('window', needed_keys)
+        edges = {}
+        for dimension, positions in located.items():
+            window = np.concatenate([part[dimension] for part in windows])
+            bucket_values = {
+                key: np.sort(window[sketches[dimension].keys(window) == key])
+                for key in needed_keys[dimension]
+            }
+            edges[dimension] = np.array([bucket_values[key][offset] for key, offset in positions])
+
+        partial_totals = pool.map('score', edges, bins)
+    finally:
+        if pool is not None:
+            pool.close()
+        if spill is not None:
+            spill.cleanup()
+
+    totals = {}
+    for partial in partial_totals:
+        for segment, values in partial.items():
+            merged = totals.setdefault(segment, {column: 0.0 for column in TOTAL_COLUMNS})
+            for column in TOTAL_COLUMNS:
+                merged[column] += values[column]
+
+    return {
+        'rfm_analysis': results_from_totals(totals),
+        'score_edges': {dimension: [float(edge) for edge in dimension_edges] for dimension, dimension_edges in edges.items()},
+        'partitions': len(partitions),
+        'record_count': rows
+    }
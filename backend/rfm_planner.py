@@ -0,0 +1,468 @@
+# RFM Insights - Execution Planner Module
+
+import io
+import os
+import math
+import time
+import logging
+import zipfile
+import numpy as np
+import pandas as pd
+
+from .data_loader import iter_dataset, load_dataset, get_column_names
+from .hyperloglog import HyperLogLog
+from .memory_budget import MemoryBudget
+from .rfm_analysis import RFMAnalysis, analyze_rfm_data
+from .rfm_parallel import DEFAULT_WORKERS, analyze_rfm_partitioned
+from .rfm_scoring import DEFAULT_SCORE_BINS
+
+logger = logging.getLogger(__name__)
+
+# Execution engines the planner chooses from
+ENGINES = ('in_memory', 'chunked', 'parallel')
+
+# Formats read chunk by chunk (others are loaded at once)
+STREAMED_FORMATS = ('csv', 'parquet')
+
+# Bytes of a CSV upload read to estimate its rows and customers
+PREFIX_BYTES = 4 * 1024 * 1024
+
+# Rows of other formats read to estimate their customers
+PREFIX_ROWS = 100000
+
+# Customers whose exact frequencies profile a prefix
+PROFILE_CUSTOMERS = 5000
+
+# Peak memory of an in-memory analysis relative to its loaded input
+# (typed copies, aggregation, scores and model features)
+MEMORY_OVERHEAD_FACTOR = 4
+
+# Bytes a string value takes in a pandas object column beyond its Arrow
+# encoding (Python str header and the column's pointer to it)
+STRING_OBJECT_BYTES = 57
+
+# Loaded DataFrame size relative to the uncompressed worksheet XML of an
+# .xlsx file (cell markup outweighs typed values; text cells come close to it)
+XLSX_FRAME_RATIO = 0.75
+
+# Loaded DataFrame size relative to the file size, when a file's metadata
+# cannot be read
+LOADED_EXPANSION_FACTOR = 5
+
+# Estimated peak memory above which order lines are streamed in chunks
+IN_MEMORY_MAX_BYTES = int(os.environ.get("RFM_IN_MEMORY_MAX_MB", "256")) * 1024 * 1024
+
+# Customers from which a process pool pays for its startup
+PARALLEL_MIN_CUSTOMERS = 1000000
+
+# Customers above which models are fitted on a sample
+MODEL_SAMPLE_CUSTOMERS = 200000
+
+# Model settings used above MODEL_SAMPLE_CUSTOMERS
+LARGE_MODEL_SETTINGS = {
+    'max_train_rows': MODEL_SAMPLE_CUSTOMERS,
+    'silhouette_sample_size': 20000,
+    'early_stopping_rounds': 10
+}
+
+def _read_prefix(source, size_limit):
+    """
+    First bytes of an upload and the total size of the upload
+
+    Returns:
+    --------
+    tuple
+        Prefix bytes and total size in bytes (None when unknown)
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source[:size_limit]), len(source)
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            return f.read(size_limit), os.path.getsize(source)
+    position = source.tell()
+    prefix = source.read(size_limit)
+    source.seek(position)
+    try:
+        size = os.fstat(source.fileno()).st_size
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        size = None
+    return prefix, size
+
+def _distinct_customers(ids, rows):
+    """
+    Distinct customers of a whole upload, extrapolated from its prefix
+
+    The prefix's distinct count comes from a HyperLogLog sketch. Customers
+    not seen in the prefix are extrapolated from the share of customers seen
+    once and twice (Chao's estimator, extended to the remaining rows), which
+    is profiled exactly on a hash-sampled subset of the customers.
+    """
+    if len(ids) == 0:
+        return 0
+    sketch = HyperLogLog()
+    sketch.add_many(ids)
+    distinct = max(sketch.count(), 1)
+    if rows <= len(ids):
+        return distinct
+
+    ids = np.asarray(ids)
+    hashes = pd.util.hash_array(ids.astype(object) if ids.dtype.kind in 'OUS' else ids, categorize=False)
+    if distinct > PROFILE_CUSTOMERS:
+        hashes = hashes[hashes < np.uint64(int(PROFILE_CUSTOMERS / distinct * 2 ** 64))]
+    counts = np.unique(hashes, return_counts=True)[1]
+    singletons = distinct * np.count_nonzero(counts == 1) / max(len(counts), 1)
+    doubletons = distinct * np.count_nonzero(counts == 2) / max(len(counts), 1)
+    if not singletons:
+        return distinct
+    unseen = singletons * singletons / (2 * doubletons) if doubletons else singletons * (singletons - 1) / 2
+    discovered = 1 - (1 - singletons / (len(ids) * unseen + singletons)) ** (rows - len(ids))
+    return int(min(distinct + unseen * discovered, rows))
+
+def _arrow_batches(source, file_format):
+    """Record batches of a Feather or Arrow IPC source, decoded one at a time"""
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = pa.BufferReader(source)
+    elif isinstance(source, str):
+        source = pa.memory_map(source)
+    try:
+        reader = ipc.open_file(source)
+        for index in range(reader.num_record_batches):
+            yield reader.get_batch(index)
+    except pa.ArrowInvalid:
+        if file_format == 'feather':
+            raise
+        source.seek(0)
+        yield from ipc.open_stream(source)
+
+def estimate_loaded_bytes(source, file_format, columns):
+    """
+    Estimate the in-memory size of the mapped columns of an upload that is
+    loaded whole, without loading it
+
+    Feather and Arrow IPC files are sized batch by batch from their Arrow
+    buffers (plus the Python objects strings become in pandas); .xlsx files
+    from the uncompressed size of their worksheet XML, scaled to the mapped
+    share of the columns. Files whose metadata cannot be read are sized
+    from their length.
+
+    Parameters:
+    -----------
+    source : bytes, str or file-like
+        Raw file contents, a file path or an open binary file
+    file_format : str
+        'feather', 'arrow' or 'xlsx'
+    columns : list
+        Mapped columns that an analysis reads
+
+    Returns:
+    --------
+    int
+        Estimated bytes of the loaded DataFrame
+    """
+    columns = list(dict.fromkeys(columns))
+    try:
+        if file_format in ('feather', 'arrow'):
+            import pyarrow as pa
+            total = 0
+            for batch in _arrow_batches(source, file_format):
+                for name in columns:
+                    column = batch.column(name)
+                    total += column.nbytes
+                    if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+                        total += len(column) * STRING_OBJECT_BYTES
+            return int(total)
+        if file_format == 'xlsx':
+            with zipfile.ZipFile(io.BytesIO(source) if isinstance(source, (bytes, bytearray, memoryview)) else source) as workbook:
+                sheet_bytes = max(info.file_size for info in workbook.infolist() if info.filename.startswith('xl/worksheets/'))
+            if not isinstance(source, (bytes, bytearray, memoryview, str)):
+                source.seek(0)
+            share = len(columns) / max(len(get_column_names(source, file_format=file_format)), 1)
+            return int(sheet_bytes * XLSX_FRAME_RATIO * min(share, 1.0))
+    except Exception as e:
+        logger.warning(f"Could not size the {file_format} upload from its metadata: {str(e)}")
+    _, size = _read_prefix(source, 0)
+    return int((size or 0) * LOADED_EXPANSION_FACTOR)
+
+def estimate_upload(source, file_format, user_id_col, columns):
+    """
+    Estimate the rows, distinct customers and in-memory footprint of an
+    upload from its size and a prefix
+
+    CSV rows are extrapolated from the bytes per row of the first
+    PREFIX_BYTES; Parquet row counts come from the file metadata and other
+    formats (which are never streamed) are passed already loaded. Distinct
+    customers come from a HyperLogLog pass over the prefix, extrapolated
+    to the estimated rows.
+
+    Parameters:
+    -----------
+    source : pandas.DataFrame, bytes, str or file-like
+        Loaded data, raw file contents, a file path or an open binary file
+    file_format : str
+        One of the formats of data_loader.load_dataset
+    user_id_col : str
+        Column name for customer ID
+    columns : list
+        Mapped columns that an analysis reads
+
+    Returns:
+    --------
+    dict
+        'file_bytes', 'rows', 'customers', 'memory_bytes', the
+        'prefix_rows' the estimates are based on and whether the source
+        can be 'streamed'
+    """
+    size = None
+    if isinstance(source, pd.DataFrame):
+        frame, rows = source, len(source)
+    elif file_format == 'csv':
+        prefix, size = _read_prefix(source, PREFIX_BYTES)
+        complete = size is not None and len(prefix) >= size
+        if not complete:
+            # Drop the partial last line
+            prefix = prefix[:prefix.rfind(b"\n") + 1]
+        frame = pd.read_csv(io.BytesIO(prefix), usecols=list(dict.fromkeys(columns)))
+        header_bytes = prefix.find(b"\n") + 1
+        if complete or size is None or not len(frame):
+            rows = len(frame)
+        else:
+            rows = int((size - header_bytes) / ((len(prefix) - header_bytes) / len(frame)))
+    elif file_format == 'parquet':
+        import pyarrow.parquet as pq
+        from .data_loader import _as_arrow_source
+        rows = pq.ParquetFile(_as_arrow_source(source)).metadata.num_rows
+        frame = next(iter_dataset(source, file_format=file_format, columns=columns, chunksize=PREFIX_ROWS), pd.DataFrame(columns=columns))
+    else:
+        raise ValueError(f"Unsupported streamed format: {file_format}")
+    if size is None and isinstance(source, (bytes, bytearray, memoryview)):
+        size = len(source)
+
+    row_bytes = frame.memory_usage(deep=True, index=False).sum() / len(frame) if len(frame) else 0
+    return {
+        'file_bytes': size,
+        'rows': rows,
+        'customers': _distinct_customers(frame[user_id_col].to_numpy(), rows),
+        'memory_bytes': int(row_bytes * rows * MEMORY_OVERHEAD_FACTOR),
+        'prefix_rows': len(frame),
+        'streamed': not isinstance(source, pd.DataFrame)
+    }
+
+def plan_analysis(estimates, input_mode, per_customer=True, workers=None, memory_limit=None, predictive=True):
+    """
+    Choose the execution engine and model settings of an analysis
+
+    - 'parallel' (analyze_rfm_partitioned) when only segment summaries are
+      needed, several CPUs are available and there are enough customers to
+      amortize the process pool
+    - 'chunked' (streamed aggregation of order lines) when the order lines
+      of a CSV or Parquet file would not fit the in-memory limit
+    - 'in_memory' otherwise; customer rows have no streamed engine
+
+    Models are fitted on a sample of customers above MODEL_SAMPLE_CUSTOMERS
+    (no model settings are chosen when no models are trained).
+
+    Parameters:
+    -----------
+    estimates : dict
+        Output of estimate_upload
+    input_mode : str
+        'customer' or 'transaction'
+    per_customer : bool
+        Whether per-customer results (models, state, indexes) are needed;
+        the parallel engine only produces segment summaries
+    workers : int, optional
+        Worker processes available (DEFAULT_WORKERS when omitted)
+    memory_limit : int, optional
+        Estimated peak bytes allowed in memory (IN_MEMORY_MAX_BYTES when omitted)
+    predictive : bool
+        Whether the predictive models are trained
+
+    Returns:
+    --------
+    dict
+        'engine', 'workers', 'model_settings', the 'estimates' and the
+        'reasons' of the choice
+    """
+    workers = workers or DEFAULT_WORKERS
+    memory_limit = memory_limit or IN_MEMORY_MAX_BYTES
+    reasons = []
+
+    if not per_customer and workers > 1 and estimates['customers'] >= PARALLEL_MIN_CUSTOMERS:
+        engine = 'parallel'
+        reasons.append(f"~{estimates['customers']} customers across {workers} workers amortize the process pool")
+    elif input_mode == 'transaction' and estimates['streamed'] and estimates['memory_bytes'] > memory_limit:
+        engine = 'chunked'
+        reasons.append(f"~{estimates['memory_bytes'] // 2 ** 20}MB in memory exceeds {memory_limit // 2 ** 20}MB; order lines are streamed")
+    else:
+        engine = 'in_memory'
+        if estimates['memory_bytes'] > memory_limit:
+            reasons.append(f"~{estimates['memory_bytes'] // 2 ** 20}MB in memory exceeds {memory_limit // 2 ** 20}MB, but only order lines in CSV or Parquet files are streamed")
+        else:
+            reasons.append(f"~{estimates['rows']} rows fit in memory")
+    if engine != 'parallel':
+        workers = 1
+
+    model_settings = {}
+    if per_customer and predictive and estimates['customers'] > MODEL_SAMPLE_CUSTOMERS:
+        model_settings = dict(LARGE_MODEL_SETTINGS)
+        reasons.append(f"models are fitted on {MODEL_SAMPLE_CUSTOMERS} sampled customers, with early stopping")
+
+    return {
+        'engine': engine,
+        'workers': workers,
+        'model_settings': model_settings,
+        'estimates': estimates,
+        'reasons': reasons
+    }
+
+def _relative_error(estimate, actual):
+    """Signed relative error of an estimate (None without an actual value)"""
+    if actual is None:
+        return None
+    return round((estimate - actual) / actual, 4) if actual else float(estimate != actual)
+
+def analyze_rfm_planned(source, user_id_col, recency_col, frequency_col, monetary_col, segment_type, file_format='csv', input_mode='customer', output_dir=None, score_bins=DEFAULT_SCORE_BINS, rule_set=None, group_col=None, as_of_dates=None, summary_only=False, workers=None, memory_budget=None, model_settings=None, predictive=True):
+    """
+    Plan and run an RFM analysis of an upload
+
+    The upload is sized from a prefix (estimate_upload), an engine and
+    model settings are chosen (plan_analysis) and the analysis runs on that
+    engine. The plan, the actual rows and customers and the relative error
+    of the estimates are logged and returned under 'execution_plan'.
+
+    Uploads that are loaded whole are charged to the memory budget before
+    they are read (estimate_loaded_bytes), so one that cannot fit is
+    rejected up front.
+
+    Parameters:
+    -----------
+    source : pandas.DataFrame, bytes, str or file-like
+        Loaded data, raw file contents, a file path or an open binary file
+    user_id_col, recency_col, frequency_col, monetary_col, segment_type,
+    file_format, input_mode, output_dir, score_bins, rule_set, group_col,
+    as_of_dates :
+        As in analyze_rfm_data
+    summary_only : bool
+        Only compute the segment summaries ('rfm_analysis'), without
+        predictive models, persisted state or indexes
+    workers : int, optional
+        Worker processes available to the parallel engine
+    memory_budget : MemoryBudget, optional
+        Budget of the analysis (a MemoryBudget with the default limit when
+        omitted); in-memory engines are only chosen below its limit
+    model_settings : dict, optional
+        PredictiveAnalytics settings applied over the planned ones (e.g.
+        the tuned hyperparameters of the requesting user)
+    predictive : bool
+        Train the predictive models (see analyze_rfm_data); fast mode
+        (False) only computes and persists the segments
+
+    Returns:
+    --------
+    dict
+        Results in the layout of analyze_rfm_data, plus 'execution_plan'
+        and 'memory_budget'
+
+    Raises:
+    -------
+    MemoryBudgetExceeded
+        When the upload or one of the analysis stages does not fit the budget
+    """
+    start_time = time.perf_counter()
+    columns = [col for col in (group_col, user_id_col, recency_col, frequency_col, monetary_col) if col is not None]
+    memory_budget = memory_budget or MemoryBudget()
+    if not isinstance(source, pd.DataFrame) and file_format not in STREAMED_FORMATS:
+        # Formats without a chunked reader are loaded once, before sizing
+        memory_budget.charge('input', estimate_loaded_bytes(source, file_format, columns))
+        source = load_dataset(source, file_format=file_format, columns=columns)
+    estimates = estimate_upload(source, file_format, user_id_col, columns)
+    per_customer = not summary_only or bool(group_col) or bool(as_of_dates)
+    plan = plan_analysis(estimates, input_mode, per_customer=per_customer, workers=workers, memory_limit=min(IN_MEMORY_MAX_BYTES, memory_budget.limit_bytes), predictive=predictive)
+    if predictive:
+        plan['model_settings'].update(model_settings or {})
+    plan['planning_seconds'] = round(time.perf_counter() - start_time, 4)
+    logger.info(f"Planned {plan['engine']} analysis: {'; '.join(plan['reasons'])}")
+
+    start_time = time.perf_counter()
+    if plan['engine'] == 'chunked':
+        data = iter_dataset(source, file_format=file_format, columns=columns)
+    elif isinstance(source, pd.DataFrame) or plan['engine'] == 'parallel':
+        # The parallel engine streams uploads into per-worker partitions
+        data = source
+    else:
+        memory_budget.charge('input', estimates['memory_bytes'] // MEMORY_OVERHEAD_FACTOR)
+        data = load_dataset(source, file_format=file_format, columns=columns)
+
+    if plan['engine'] == 'parallel':
+        results = analyze_rfm_partitioned(data, user_id_col, recency_col, frequency_col, monetary_col, segment_type, input_mode=input_mode, workers=plan['workers'], score_bins=score_bins, rule_set=rule_set, file_format=file_format)
+        results = {'rfm_analysis': results['rfm_analysis'], 'record_count': results['record_count']}
+    elif summary_only:
+        rfm = RFMAnalysis(data, user_id_col, recency_col, frequency_col, monetary_col, segment_type, input_mode=input_mode, score_bins=score_bins, rule_set=rule_set, group_col=group_col, memory_budget=memory_budget)
+        results = {
+            'rfm_analysis': {
+                'segment_counts': rfm.get_segment_counts(),
+                'segment_stats': rfm.get_segment_stats(),
+                'treemap_data': rfm.get_treemap_data(),
+                'polar_area_data': rfm.get_polar_area_data()
+            },
+            'record_count': rfm.input_rows
+        }
+        if group_col:
+            results['rfm_analysis']['groups'] = rfm.get_group_results()
+        if as_of_dates:
+            transactions = iter_dataset(source, file_format=file_format, columns=columns) if plan['engine'] == 'chunked' else None
+            results['segment_migrations'] = rfm.segment_migrations(as_of_dates, transactions)
+    else:
+        # Chunked runs hand the source itself over, so analyze_rfm_data
+        # streams it (and re-reads it for migration snapshots)
+        data = source if plan['engine'] == 'chunked' else data
+        results = analyze_rfm_data(data, user_id_col, recency_col, frequency_col, monetary_col, segment_type, file_format=file_format, input_mode=input_mode, output_dir=output_dir, score_bins=score_bins, rule_set=rule_set, group_col=group_col, as_of_dates=as_of_dates, model_settings=plan['model_settings'], memory_budget=memory_budget, predictive=predictive)
+    plan['execution_seconds'] = round(time.perf_counter() - start_time, 4)
+
+    # Compare the estimates with what the run actually read
+    plan['actual'] = {
+        'rows': results['record_count'],
+        'customers': int(sum(results['rfm_analysis']['segment_counts'].values()))
+    }
+    plan['errors'] = {key: _relative_error(estimates[key], actual) for key, actual in plan['actual'].items()}
+    logger.info(f"Executed {plan['engine']} analysis in {plan['execution_seconds']}s; estimate errors: {plan['errors']}")
+
+    results['execution_plan'] = plan
+    results['memory_budget'] = memory_budget.summary()
+    return results
+
+def summarize_plans(plans):
+    """
+    Engine usage and estimate accuracy over executed plans
+
+    Parameters:
+    -----------
+    plans : list of dict
+        'execution_plan' sections of analysis results
+
+    Returns:
+    --------
+    dict
+        'plans' count, 'engines' usage counts and, for 'rows' and
+        'customers', the mean and largest absolute relative error and the
+        mean signed error (bias) of the estimates
+    """
+    engines = {engine: 0 for engine in ENGINES}
+    errors = {'rows': [], 'customers': []}
+    for plan in plans:
+        engines[plan['engine']] = engines.get(plan['engine'], 0) + 1
+        for key, values in errors.items():
+            if plan.get('errors', {}).get(key) is not None:
+                values.append(plan['errors'][key])
+
+    accuracy = {}
+    for key, values in errors.items():
+        values = np.asarray(values, dtype=float)
+        accuracy[key] = {
+            'mean_abs_error': round(float(np.abs(values).mean()), 4) if len(values) else None,
+            'max_abs_error': round(float(np.abs(values).max()), 4) if len(values) else None,
+            'bias': round(float(values.mean()), 4) if len(values) else None
+        }
+    return {'plans': len(plans), 'engines': engines, 'accuracy': accuracy}
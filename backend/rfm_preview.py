@@ -0,0 +1,260 @@
+# RFM Insights - Preview Analysis Module
+
+import numpy as np
+import pandas as pd
+
+from .data_loader import detect_format, iter_dataset
+from .rfm_analysis import RFMAnalysis
+from .rfm_scoring import DEFAULT_SCORE_BINS
+
+# Customers scored in a preview
+PREVIEW_SAMPLE_SIZE = 100000
+
+# Confidence level of the segment share intervals
+PREVIEW_CONFIDENCE = 0.95
+
+# Bootstrap replicates behind the segment share intervals
+PREVIEW_REPLICATES = 100
+
+# Largest 64-bit hash plus one, for distinct-count estimates
+_HASH_SPACE = float(2 ** 64)
+
+def reservoir_sample(chunks, sample_size, seed=0):
+    """
+    Uniform sample of rows from a stream of chunks, in one pass
+
+    Every row draws a random key and the rows with the sample_size smallest
+    keys are kept (a bottom-k reservoir), so memory is bounded by the sample
+    and one chunk. Rows keep their input order.
+
+    Returns:
+    --------
+    tuple
+        Sampled rows and the number of rows read
+    """
+    rng = np.random.default_rng(seed)
+    sample, keys, rows_read = None, None, 0
+    for chunk in chunks:
+        chunk_keys = rng.random(len(chunk))
+        rows_read += len(chunk)
+        if sample is not None:
+            if len(sample) == sample_size:
+                # Rows above the largest kept key can never enter the sample
+                entering = chunk_keys < keys.max()
+                chunk, chunk_keys = chunk[entering], chunk_keys[entering]
+            chunk = pd.concat([sample, chunk], ignore_index=True)
+            chunk_keys = np.concatenate([keys, chunk_keys])
+        if len(chunk) > sample_size:
+            keep = np.sort(np.argpartition(chunk_keys, sample_size - 1)[:sample_size])
+            chunk, chunk_keys = chunk.iloc[keep].reset_index(drop=True), chunk_keys[keep]
+        sample, keys = chunk, chunk_keys
+    return sample, rows_read
+
+def customer_sample(chunks, user_id_col, sample_size, seed=0):
+    """
+    All order lines of a uniform sample of customers, in one pass
+
+    Customer IDs are hashed and the customers with the sample_size smallest
+    hashes are kept (bottom-k), so a customer's lines are kept or dropped
+    together whatever chunk they appear in. The k-th smallest hash also
+    estimates the number of distinct customers.
+
+    Returns:
+    --------
+    tuple
+        Order lines of the sampled customers, the number of rows read and
+        the (estimated, once more than sample_size customers were seen)
+        number of distinct customers
+    """
+    hash_key = f"{seed:016d}"[-16:]
+    threshold = np.iinfo(np.uint64).max
+    lines, hashes, rows_read = None, None, 0
+    for chunk in chunks:
+        rows_read += len(chunk)
+        chunk_hashes = pd.util.hash_array(chunk[user_id_col].to_numpy(), hash_key=hash_key, categorize=False)
+        entering = chunk_hashes <= threshold
+        chunk, chunk_hashes = chunk[entering], chunk_hashes[entering]
+        if lines is not None:
+            chunk = pd.concat([lines, chunk], ignore_index=True)
+            chunk_hashes = np.concatenate([hashes, chunk_hashes])
+        distinct = np.unique(chunk_hashes)
+        if len(distinct) > sample_size:
+            threshold = distinct[sample_size - 1]
+            keep = chunk_hashes <= threshold
+            chunk, chunk_hashes = chunk[keep].reset_index(drop=True), chunk_hashes[keep]
+        lines, hashes = chunk, chunk_hashes
+
+    customers = len(np.unique(hashes)) if hashes is not None else 0
+    if threshold == np.iinfo(np.uint64).max:
+        return lines, rows_read, customers
+    return lines, rows_read, int(round((sample_size - 1) / ((float(threshold) + 1) / _HASH_SPACE)))
+
+def _rank_keys(values, group_codes):
+    """
+    Tie groups of a column within each group, from one sort
+
+    Returns:
+    --------
+    tuple
+        Key (tie group) of each row, the group of each key and the first
+        key of each group
+    """
+    order = np.lexsort((values, group_codes))
+    sorted_values, sorted_groups = values[order], group_codes[order]
+    changed = np.ones(len(values), dtype=bool)
+    changed[1:] = (sorted_values[1:] != sorted_values[:-1]) | (sorted_groups[1:] != sorted_groups[:-1])
+    key_of_sorted = np.cumsum(changed) - 1
+    keys = np.empty(len(values), dtype=np.int64)
+    keys[order] = key_of_sorted
+    key_groups = sorted_groups[changed]
+    first_keys = np.searchsorted(key_groups, np.arange(key_groups.max() + 1 if len(key_groups) else 0))
+    return keys, key_groups, first_keys
+
+def bootstrap_share_intervals(rfm, population, replicates=PREVIEW_REPLICATES, confidence=PREVIEW_CONFIDENCE, seed=0):
+    """
+    Confidence intervals of segment shares estimated from a sample
+
+    A Poisson bootstrap re-derives the score cut points in every replicate,
+    so the intervals cover the uncertainty of the sample's n-tile edges as
+    well as of segment membership. Each replicate reuses one sort per
+    dimension: weighted ranks follow from the weights summed per tie group.
+
+    Intervals are symmetric around the sample share, with the larger of the
+    two bootstrap percentile deviations: when an n-tile edge falls inside a
+    large tie group (e.g. one recency day) the whole group moves between
+    scores, which biases the sample share in a way a percentile interval
+    alone does not cover. Widths are scaled by the finite population
+    correction, so a sample of every customer gives exact shares.
+
+    Parameters:
+    -----------
+    rfm : RFMAnalysis
+        Analysis of the sample, already segmented
+    population : int
+        (Estimated) number of customers in the full dataset
+    replicates : int
+        Number of bootstrap replicates
+    confidence : float
+        Confidence level of the intervals
+    seed : int
+        Seed of the replicate weights
+
+    Returns:
+    --------
+    dict
+        Segment -> share in the sample and interval bounds
+    """
+    data = rfm.rfm_segments
+    size = len(data)
+    bins = rfm.score_bins
+    rule_set = rfm.rule_set
+    group_codes = pd.factorize(data[rfm.group_col])[0] if rfm.group_col else np.zeros(size, dtype=np.int64)
+    dimensions = [
+        (dimension,) + _rank_keys(data[column].to_numpy(dtype=float), group_codes)
+        for dimension, column in (('recency', 'recency_days'), ('frequency', rfm.frequency_col), ('monetary', rfm.monetary_col))
+    ]
+
+    rng = np.random.default_rng(seed)
+    shares = np.empty((replicates, len(rule_set.segment_names)))
+    for replicate in range(replicates):
+        weights = rng.poisson(1.0, size).astype(float)
+        group_totals = np.maximum(np.bincount(group_codes, weights=weights), 1.0)[group_codes]
+        scores = []
+        for dimension, keys, key_groups, first_keys in dimensions:
+            key_weights = np.bincount(keys, weights=weights, minlength=len(key_groups))
+            smaller = np.cumsum(key_weights) - key_weights
+            smaller -= smaller[first_keys][key_groups]
+            score = np.minimum(np.floor(smaller[keys] * bins / group_totals).astype(np.int64), bins - 1) + 1
+            scores.append(bins + 1 - score if dimension == 'recency' else score)
+        codes = rule_set.segment_codes(*scores, score_bins=bins)
+        shares[replicate] = np.bincount(codes, weights=weights, minlength=shares.shape[1]) / weights.sum()
+
+    alpha = (1 - confidence) / 2 * 100
+    low, high = np.percentile(shares, [alpha, 100 - alpha], axis=0)
+    correction = np.sqrt((population - size) / (population - 1)) if population > size else 0.0
+    observed = data['segment'].value_counts()
+    intervals = {}
+    for code, segment in enumerate(rule_set.segment_names):
+        if segment not in observed.index:
+            continue
+        share = observed[segment] / size
+        half_width = correction * max(high[code] - share, share - low[code])
+        intervals[segment] = {
+            'share': float(share),
+            'lower': float(max(share - half_width, 0.0)),
+            'upper': float(min(share + half_width, 1.0))
+        }
+    return intervals
+
+def preview_rfm_data(data, user_id_col, recency_col, frequency_col, monetary_col, segment_type, file_format=None, input_mode='customer', score_bins=DEFAULT_SCORE_BINS, rule_set=None, group_col=None, sample_size=PREVIEW_SAMPLE_SIZE, seed=0):
+    """
+    Estimate the RFM segmentation of a dataset from a sample
+
+    Rows (or, in transaction mode, customers) are sampled while the input
+    is read chunk by chunk, then scored and segmented as in
+    analyze_rfm_data. Score cut points come from the sample, so segment
+    shares are estimates and are returned with confidence intervals.
+    Predictive models are not trained and nothing is persisted.
+
+    Parameters:
+    -----------
+    data : pandas.DataFrame, str, bytes or file-like
+        Input data, as accepted by analyze_rfm_data
+    user_id_col, recency_col, frequency_col, monetary_col, segment_type,
+    file_format, input_mode, score_bins, rule_set, group_col :
+        As in analyze_rfm_data
+    sample_size : int
+        Number of customers to score
+    seed : int
+        Seed of the sample
+
+    Returns:
+    --------
+    dict
+        'preview' (sample size, rows read, estimated total customers,
+        confidence level) and 'rfm_analysis' with the usual sections
+        computed on the sample plus 'segment_shares'
+    """
+    if isinstance(data, pd.DataFrame):
+        chunks = [data]
+    else:
+        if file_format is None:
+            file_format = detect_format(data if isinstance(data, str) else None)
+        columns = [col for col in (group_col, user_id_col, recency_col, frequency_col, monetary_col) if col is not None]
+        chunks = iter_dataset(data, file_format=file_format, columns=columns)
+
+    if input_mode == 'transaction':
+        sample, rows_read, population = customer_sample(chunks, user_id_col, sample_size, seed)
+    else:
+        sample, rows_read = reservoir_sample(chunks, sample_size, seed)
+
+    rfm = RFMAnalysis(sample, user_id_col, recency_col, frequency_col, monetary_col, segment_type, input_mode=input_mode, score_bins=score_bins, rule_set=rule_set, group_col=group_col)
+    segment_counts = rfm.get_segment_counts()
+    sampled = len(rfm.rfm_segments)
+    if input_mode != 'transaction':
+        # Rows dropped for missing values are discounted from the population
+        population = int(round(rows_read * sampled / len(sample))) if len(sample) else 0
+    population = max(population, sampled)
+
+    segment_shares = bootstrap_share_intervals(rfm, population, seed=seed)
+    for shares in segment_shares.values():
+        shares['estimated_count'] = int(round(shares['share'] * population))
+
+    results = {
+        'preview': {
+            'sample_size': sampled,
+            'rows_read': rows_read,
+            'estimated_total_customers': population,
+            'confidence_level': PREVIEW_CONFIDENCE
+        },
+        'rfm_analysis': {
+            'segment_counts': segment_counts,
+            'segment_shares': segment_shares,
+            'segment_stats': rfm.get_segment_stats(),
+            'treemap_data': rfm.get_treemap_data(),
+            'polar_area_data': rfm.get_polar_area_data()
+        }
+    }
+    if group_col:
+        results['rfm_analysis']['groups'] = rfm.get_group_results()
+    return results
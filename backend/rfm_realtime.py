@@ -0,0 +1,231 @@
+# RFM Insights - Real-time Scoring Module
+
+import os
+import time
+import asyncio
+import logging
+import threading
+import collections
+import numpy as np
+import pandas as pd
+
+from . import monitoring
+from .rfm_models import ScoringModels
+
+logger = logging.getLogger(__name__)
+
+# Window (ms) during which concurrent requests of an analysis are grouped
+# into one micro-batch, counted from the first request of the batch
+MICRO_BATCH_WINDOW_MS = float(os.getenv("RFM_MICRO_BATCH_WINDOW_MS", "2"))
+
+# Requests that close a micro-batch before its window ends
+MICRO_BATCH_MAX_SIZE = int(os.getenv("RFM_MICRO_BATCH_MAX", "256"))
+
+# Recent request latencies kept for the percentiles
+LATENCY_SAMPLE_SIZE = 10000
+
+# Upper bounds of the batch-size histogram buckets
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512]
+
+# Micro-batchers, keyed by analysis directory
+_BATCHERS = {}
+_BATCHERS_LOCK = threading.Lock()
+
+# Request latencies (seconds) and batch sizes seen by this worker
+_STATS_LOCK = threading.Lock()
+_LATENCIES = collections.deque(maxlen=LATENCY_SAMPLE_SIZE)
+_BATCH_SIZES = collections.Counter()
+_REQUESTS = 0
+
+def _record_batch(size, latencies):
+    """Record the size of a micro-batch and the latencies of its requests"""
+    global _REQUESTS
+    bucket = next((bound for bound in BATCH_SIZE_BUCKETS if size <= bound), None)
+    with _STATS_LOCK:
+        _BATCH_SIZES[bucket] += 1
+        _LATENCIES.extend(latencies)
+        _REQUESTS += size
+    if monitoring.PROMETHEUS_ENABLE:
+        monitoring.observe_histogram("realtime_scoring_batch_size", size)
+        for latency in latencies:
+            monitoring.observe_histogram("realtime_scoring_latency_seconds", latency)
+
+def realtime_stats():
+    """
+    Latency percentiles and batch-size histogram of real-time scoring
+
+    Returns:
+    --------
+    dict
+        Requests and micro-batches served, p50/p99/max latency in ms over
+        the last LATENCY_SAMPLE_SIZE requests, the mean batch size and the
+        number of batches per size bucket ('<=N', '>N' past the last bound)
+    """
+    with _STATS_LOCK:
+        latencies = np.array(_LATENCIES, dtype=float) * 1000
+        batch_sizes = dict(_BATCH_SIZES)
+        requests = _REQUESTS
+    batches = sum(batch_sizes.values())
+    return {
+        'requests': requests,
+        'batches': batches,
+        'mean_batch_size': requests / batches if batches else 0.0,
+        'latency_ms': {
+            'p50': float(np.percentile(latencies, 50)) if len(latencies) else None,
+            'p99': float(np.percentile(latencies, 99)) if len(latencies) else None,
+            'max': float(latencies.max()) if len(latencies) else None
+        },
+        'batch_sizes': {
+            (f"<={bound}" if bound else f">{BATCH_SIZE_BUCKETS[-1]}"): batch_sizes.get(bound, 0)
+            for bound in BATCH_SIZE_BUCKETS + [None]
+        }
+    }
+
+def reset_realtime_stats():
+    """Clear the recorded latencies and batch sizes"""
+    global _REQUESTS
+    with _STATS_LOCK:
+        _LATENCIES.clear()
+        _BATCH_SIZES.clear()
+        _REQUESTS = 0
+
+class MicroBatcher:
+    """
+    Groups concurrent single-customer scoring requests of an analysis
+
+    The first request of a batch opens a window of window_ms; every request
+    arriving before it closes (or before max_size requests are queued)
+    joins the batch. The batch is scored with one call of each model in a
+    worker thread, so the event loop keeps queueing the next batch
+    meanwhile. The models stay loaded (see ScoringModels.load) and are
+    only reloaded when the analysis persists new ones.
+    """
+
+    def __init__(self, analysis_dir, window_ms=MICRO_BATCH_WINDOW_MS, max_size=MICRO_BATCH_MAX_SIZE):
+        """
+        Parameters:
+        -----------
+        analysis_dir : str
+            Analysis directory holding the scoring models
+        window_ms : float
+            Batching window in milliseconds
+        max_size : int
+            Requests that close a batch early
+        """
+        self.analysis_dir = analysis_dir
+        self.window = window_ms / 1000.0
+        self.max_size = max_size
+        self._pending = []
+        self._timer = None
+        # Running batch tasks: the event loop only keeps weak references
+        # to tasks, so an unreferenced one may be collected mid-batch
+        self._tasks = set()
+
+    async def score(self, customer):
+        """
+        Score one customer row (one order line for transaction analyses)
+
+        Returns:
+        --------
+        dict
+            The customer's RFM values, scores, segment, churn probability
+            and predicted LTV
+
+        Raises ValueError when the row cannot be scored.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((customer, future, time.perf_counter()))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        """Close the pending batch and schedule its scoring"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        """Score a closed batch off the event loop and resolve its requests"""
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(None, self.score_rows, [customer for customer, _, _ in batch])
+        except Exception as e:
+            logger.error(f"Real-time scoring batch of {len(batch)} requests failed: {str(e)}")
+            results = [e] * len(batch)
+        finished = time.perf_counter()
+        for (_, future, _), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+        _record_batch(len(batch), [finished - enqueued for _, _, enqueued in batch])
+
+    def score_rows(self, rows):
+        """
+        Score customer rows with one call of each model
+
+        Each row is scored as its own customer, whatever its customer ID.
+        When the batch cannot be scored as a whole (e.g. a malformed date),
+        its rows are scored one by one so only the invalid ones fail.
+
+        Returns:
+        --------
+        list
+            A result dict, or the ValueError of the row, per row
+        """
+        models = ScoringModels.load(self.analysis_dir)
+        try:
+            return self._score_frame(models, rows)
+        except (ValueError, TypeError) as e:
+            if len(rows) == 1:
+                return [e if isinstance(e, ValueError) else ValueError(str(e))]
+        return [self.score_rows([row])[0] for row in rows]
+
+    def _score_frame(self, models, rows):
+        """Score rows keyed by their position in the batch"""
+        user_id_col = models.meta['column_mapping']['user_id']
+        frame = pd.DataFrame.from_records(rows)
+        if user_id_col not in frame.columns:
+            raise ValueError(f"Missing required columns: {user_id_col}")
+        customer_ids = frame[user_id_col].tolist()
+        frame[user_id_col] = np.arange(len(rows))
+        # Each row's date is parsed on its own, so a malformed one only
+        # drops its row instead of failing the batch
+        recency_col = models.meta['column_mapping']['recency']
+        if recency_col in frame.columns and not pd.api.types.is_datetime64_any_dtype(frame[recency_col]):
+            frame[recency_col] = pd.to_datetime(frame[recency_col], errors='coerce', format='mixed')
+        predictions = {record['customer_id']: record for record in models.predict(models.prepare(frame)).to_dict('records')}
+
+        results = []
+        for position, customer_id in enumerate(customer_ids):
+            if position not in predictions:
+                results.append(ValueError("Customer row has missing or invalid RFM values"))
+                continue
+            results.append({**predictions[position], 'customer_id': customer_id})
+        return results
+
+def get_batcher(analysis_dir):
+    """Return the micro-batcher of an analysis in this process"""
+    with _BATCHERS_LOCK:
+        batcher = _BATCHERS.get(analysis_dir)
+        if batcher is None:
+            batcher = _BATCHERS[analysis_dir] = MicroBatcher(analysis_dir)
+        return batcher
+
+def clear_batchers():
+    """
+    Drop the micro-batchers of this process (batches already queued still
+    complete)
+    """
+    with _BATCHERS_LOCK:
+        _BATCHERS.clear()
@@ -0,0 +1,216 @@
+# RFM Insights - N-tile Scoring Module
+
+import numpy as np
+
+# Named score scales accepted wherever a number of score bins is
+SCORE_SCALES = {'quartiles': 4, 'quintiles': 5, 'deciles': 10}
+
+# Default number of score bins (quartiles)
+DEFAULT_SCORE_BINS = 4
+
+# Score range the segment rules are written for
+RULE_SCORE_BINS = 4
+
+# Largest supported number of score bins
+MAX_SCORE_BINS = 100
+
+# Integer columns spanning at most this many values per row are ranked by counting
+COUNTING_RANK_SPAN_FACTOR = 4
+
+def resolve_bins(score_bins):
+    """
+    Validate a number of score bins given as an int, a digit string or a
+    scale name ('quartiles', 'quintiles', 'deciles')
+    """
+    if isinstance(score_bins, str):
+        name = score_bins.strip().lower()
+        if name in SCORE_SCALES:
+            return SCORE_SCALES[name]
+        if not name.isdigit():
+            raise ValueError(f"Invalid score_bins: {score_bins}. Expected a number or one of {', '.join(SCORE_SCALES)}")
+        score_bins = int(name)
+    if not 2 <= int(score_bins) <= MAX_SCORE_BINS:
+        raise ValueError(f"Invalid score_bins: {score_bins}. Expected between 2 and {MAX_SCORE_BINS}")
+    return int(score_bins)
+
+def rank_values(values):
+    """
+    Rank values with one sort
+
+    Ties get the same 'min' rank (the number of strictly smaller values),
+    so equal values always share a score whatever the row order. Integer
+    columns with a small range (days, order counts) are ranked with a
+    counting pass instead of a sort.
+
+    Returns:
+    --------
+    tuple of numpy.ndarray
+        Ranks in row order and the sorted values
+    """
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0:
+        return np.zeros(0, dtype=np.int64), values
+
+    low, high = values.min(), values.max()
+    if high - low <= COUNTING_RANK_SPAN_FACTOR * len(values) and np.array_equal(values, np.floor(values)):
+        offsets = (values - low).astype(np.int64)
+        counts = np.bincount(offsets)
+        smaller = np.cumsum(counts) - counts
+        sorted_values = np.repeat(np.arange(len(counts), dtype=float) + low, counts)
+        return smaller[offsets], sorted_values
+
+    order = np.argsort(values)
+    sorted_values = values[order]
+    group_start = np.zeros(len(values), dtype=np.int64)
+    starts = np.flatnonzero(sorted_values[1:] != sorted_values[:-1]) + 1
+    group_start[starts] = starts
+    np.maximum.accumulate(group_start, out=group_start)
+
+    ranks = np.empty(len(values), dtype=np.int64)
+    ranks[order] = group_start
+    return ranks, sorted_values
+
+def edge_ranks(total, bins, descending=False):
+    """
+    Sorted-order positions of the inner n-tile edges
+
+    A value lands above tile k when at least ceil(k * total / bins) values
+    are smaller. With descending=True the positions are mirrored, for
+    values whose n-tiles are counted from the top (e.g. purchase dates,
+    where the most recent ties must share the highest tile); score those
+    with searchsorted(side='right').
+    """
+    thresholds = np.ceil(np.arange(1, bins) * total / bins).astype(np.int64)
+    if descending:
+        return np.sort(total - thresholds)
+    return thresholds - 1
+
+def ntile_edges(sorted_values, bins):
+    """
+    Inner edges (bins - 1 values) reproducing ntile_scores for new values
+    """
+    if len(sorted_values) == 0:
+        return np.array([])
+    return np.asarray(sorted_values)[edge_ranks(len(sorted_values), bins)]
+
+def scores_from_edges(values, edges, dimension):
+    """
+    Score values against inner n-tile edges
+
+    Recency scores are inverted (fewer days = higher score).
+    """
+    below = np.searchsorted(edges, np.asarray(values, dtype=float), side='left')
+    if dimension == 'recency':
+        return len(edges) + 1 - below
+    return below + 1
+
+def ntile_scores(values, bins=DEFAULT_SCORE_BINS, dimension='monetary'):
+    """
+    Score a column into n-tiles from a single ranking
+
+    Like pd.qcut, n-tiles are taken over ascending values and ties fall in
+    the tile of their lowest rank; recency scores are then inverted, so
+    customers tied on the most recent day share the top score.
+
+    Parameters:
+    -----------
+    values : array-like
+        Column values
+    bins : int
+        Number of tiles (4 = quartiles, 5 = quintiles, 10 = deciles)
+    dimension : str
+        'recency' scores fewer days higher; other dimensions score higher
+        values higher
+
+    Returns:
+    --------
+    tuple
+        Scores in 1..bins, percentile ranks of the values in [0, 100) and
+        the inner edges
+    """
+    values = np.asarray(values, dtype=float)
+    total = len(values)
+    ranks, sorted_values = rank_values(values)
+
+    if total == 0:
+        return ranks, ranks.astype(float), np.array([])
+    scores = ranks * bins // total + 1
+    if dimension == 'recency':
+        scores = bins + 1 - scores
+    percentiles = ranks * 100.0 / total
+    return scores, percentiles, ntile_edges(sorted_values, bins)
+
+def grouped_ntile_scores(values, group_codes, bins=DEFAULT_SCORE_BINS, dimension='monetary'):
+    """
+    Score a column into n-tiles within groups from a single sort
+
+    Rows are sorted by (group, value) once; ranks, scores and percentiles
+    follow ntile_scores within each group, with no loop over groups.
+
+    Parameters:
+    -----------
+    values : array-like
+        Column values
+    group_codes : array-like of int
+        Group of each row, as codes 0..n_groups-1 (e.g. from pd.factorize)
+    bins, dimension
+        Same as ntile_scores
+
+    Returns:
+    --------
+    tuple
+        Scores, percentiles and the inner edges of each group (an
+        n_groups x (bins - 1) array)
+    """
+    values = np.asarray(values, dtype=float)
+    group_codes = np.asarray(group_codes, dtype=np.int64)
+    total = len(values)
+    if total == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros((0, bins - 1))
+
+    # Sort by value, then stably by group (faster than np.lexsort)
+    order = np.argsort(values)
+    order = order[np.argsort(group_codes[order], kind='stable')]
+    sorted_values = values[order]
+    sorted_groups = group_codes[order]
+    positions = np.arange(total)
+    group_change = np.concatenate(([True], sorted_groups[1:] != sorted_groups[:-1]))
+    value_change = group_change | np.concatenate(([True], sorted_values[1:] != sorted_values[:-1]))
+    group_start = np.maximum.accumulate(np.where(group_change, positions, 0))
+    value_start = np.maximum.accumulate(np.where(value_change, positions, 0))
+
+    ranks = np.empty(total, dtype=np.int64)
+    ranks[order] = value_start - group_start
+    sizes = np.bincount(group_codes)
+    row_sizes = sizes[group_codes]
+
+    scores = ranks * bins // row_sizes + 1
+    if dimension == 'recency':
+        scores = bins + 1 - scores
+    percentiles = ranks * 100.0 / row_sizes
+
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    thresholds = np.ceil(np.arange(1, bins)[None, :] * sizes[:, None] / bins).astype(np.int64)
+    edges = sorted_values[starts[:, None] + thresholds - 1]
+    return scores, percentiles, edges
+
+def to_rule_scale(scores, bins, rule_bins=RULE_SCORE_BINS):
+    """
+    Map n-tile scores onto the scale a rule set is written for (1-4 by default)
+
+    Finer scores are grouped into the coarser tiles; coarser scores are
+    mapped to the finer tile holding their midpoint.
+    """
+    if bins == rule_bins:
+        return scores
+    if rule_bins > bins:
+        return (2 * np.asarray(scores) - 1) * rule_bins // (2 * bins) + 1
+    return (np.asarray(scores) - 1) * rule_bins // bins + 1
+
+def combined_score(r_scores, f_scores, m_scores, bins=DEFAULT_SCORE_BINS):
+    """
+    Concatenate r, f and m scores into one number (e.g. 423), using two
+    digits per score when bins >= 10
+    """
+    base = 10 if bins < 10 else 100
+    return (r_scores * base + f_scores) * base + m_scores
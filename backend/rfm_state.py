@@ -0,0 +1,722 @@
+# RFM Insights - Incremental RFM State Module
+
+import os
+import json
+import datetime
+import threading
+import contextlib
+import collections
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: deltas are only serialized within a process
+    fcntl = None
+
+from .rfm_analysis import RFMAnalysis, segment_scores
+from .rfm_scoring import DEFAULT_SCORE_BINS, ntile_edges, scores_from_edges, combined_score
+from .segment_rules import DEFAULT_RULE_SET, builtin_rule_set, resolve_rule_set
+from .memory_budget import frame_bytes
+from .rfm_audience import refresh_customer_indexes
+
+# RFM dimensions tracked in the state, with the state column holding each one
+DIMENSIONS = {
+    'recency': 'recency_days',
+    'frequency': 'frequency',
+    'monetary': 'monetary'
+}
+
+# Per-segment running totals used to rebuild summaries without a full scan
+TOTAL_COLUMNS = ['count', 'recency_sum', 'frequency_sum', 'monetary_sum']
+
+# Columns of the rows whose contribution to the totals and the score-cube
+# histogram is moved when they are re-scored
+STATE_ROW_COLUMNS = ['recency_days', 'frequency', 'monetary', 'r_score', 'f_score', 'm_score', 'segment']
+
+# File names inside an analysis directory
+STATE_FILE = "state.feather"
+STATE_META_FILE = "state_meta.json"
+SORTED_VALUES_FILE = "state_sorted.npz"
+SCORE_CUBE_FILE = "score_cube.npy"
+
+# Lock file serializing delta updates of a lineage across processes
+STATE_LOCK_FILE = "state.lock"
+
+# Loaded states kept per process; the least recently used are evicted past
+# either limit
+STATE_CACHE_MAX_ENTRIES = 8
+STATE_CACHE_MAX_BYTES = int(os.getenv("RFM_STATE_CACHE_MAX_MB", "256")) * 1024 * 1024
+
+# Loaded states, keyed by analysis directory, reused while the files are
+# unchanged, in least recently used order (with their size in bytes)
+_STATE_CACHE = collections.OrderedDict()
+_STATE_LOCKS = {}
+_HISTOGRAM_CACHE = {}
+_CACHE_LOCK = threading.Lock()
+
+def _cached_state(state_dir, mtime):
+    """Cached state of an analysis directory if its files are unchanged"""
+    with _CACHE_LOCK:
+        cached = _STATE_CACHE.get(state_dir)
+        if cached is None or cached[0] != mtime:
+            return None
+        _STATE_CACHE.move_to_end(state_dir)
+        return cached[1]
+
+def _cache_state(state_dir, mtime, state):
+    """Cache a loaded state, evicting the least recently used ones past the limits"""
+    size = frame_bytes(state.customers) + sum(values.nbytes for values in state.sorted_values.values())
+    with _CACHE_LOCK:
+        _STATE_CACHE[state_dir] = (mtime, state, size)
+        _STATE_CACHE.move_to_end(state_dir)
+        while len(_STATE_CACHE) > 1 and (
+            len(_STATE_CACHE) > STATE_CACHE_MAX_ENTRIES or
+            sum(entry[2] for entry in _STATE_CACHE.values()) > STATE_CACHE_MAX_BYTES
+        ):
+            _STATE_CACHE.popitem(last=False)
+
+def _load_meta(meta_path):
+    """Read the metadata of a state, filling in what older states lack"""
+    with open(meta_path, "r") as f:
+        meta = json.load(f)
+    if 'score_bins' not in meta:
+        # States saved before n-tile scoring hold pd.qcut edges; clearing
+        # them makes the next delta re-score every customer
+        meta['score_bins'] = DEFAULT_SCORE_BINS
+        meta['edges'] = {dimension: [] for dimension in DIMENSIONS}
+    if 'rule_set' not in meta:
+        # States saved before rule sets were segmented with the ecommerce rules
+        meta['rule_set'] = builtin_rule_set(DEFAULT_RULE_SET).definition
+    return meta
+
+def _remove_sorted(sorted_values, values):
+    """Remove one occurrence of each value from a sorted array"""
+    if len(values) == 0:
+        return sorted_values
+    values = np.sort(np.asarray(values, dtype=float))
+    positions = np.searchsorted(sorted_values, values, side='left')
+    # Equal values removed together must hit consecutive positions
+    positions += np.arange(len(values)) - np.searchsorted(values, values, side='left')
+    return np.delete(sorted_values, positions)
+
+def _insert_sorted(sorted_values, values):
+    """Insert values into a sorted array, keeping it sorted"""
+    if len(values) == 0:
+        return sorted_values
+    values = np.sort(np.asarray(values, dtype=float))
+    return np.insert(sorted_values, np.searchsorted(sorted_values, values), values)
+
+def _segment_totals(frame):
+    """Aggregate count and value sums per segment"""
+    totals = frame.groupby('segment').agg(
+        count=('segment', 'size'),
+        recency_sum=('recency_days', 'sum'),
+        frequency_sum=('frequency', 'sum'),
+        monetary_sum=('monetary', 'sum')
+    )
+    return totals.reindex(columns=TOTAL_COLUMNS).astype(float)
+
+def _totals_dict(frame):
+    """Per-segment totals as plain JSON-serializable floats"""
+    return {
+        segment: {column: float(value) for column, value in row.items()}
+        for segment, row in _segment_totals(frame).iterrows()
+    }
+
+def results_from_totals(totals):
+    """
+    Build the RFM analysis summaries from per-segment totals
+
+    Parameters:
+    -----------
+    totals : dict
+        Segment name -> count, recency_sum, frequency_sum and monetary_sum
+
+    Returns:
+    --------
+    dict
+        segment_counts, segment_stats, treemap_data and polar_area_data in
+        the same layout as analyze_rfm_data's 'rfm_analysis' section
+    """
+    totals = {segment: values for segment, values in totals.items() if values['count'] > 0}
+    total_customers = sum(values['count'] for values in totals.values())
+    total_value = sum(values['monetary_sum'] for values in totals.values())
+
+    segment_counts = {segment: int(round(values['count'])) for segment, values in totals.items()}
+    segment_stats = {
+        segment: {
+            'count': int(round(values['count'])),
+            'avg_recency': values['recency_sum'] / values['count'],
+            'avg_frequency': values['frequency_sum'] / values['count'],
+            'avg_monetary': values['monetary_sum'] / values['count'],
+            'total_monetary': values['monetary_sum']
+        }
+        for segment, values in totals.items()
+    }
+    treemap_data = [
+        {
+            'segment': segment,
+            'customer_count': int(round(totals[segment]['count'])),
+            'total_value': totals[segment]['monetary_sum'],
+            'customer_percentage': round(totals[segment]['count'] / total_customers * 100, 1),
+            'value_percentage': round(totals[segment]['monetary_sum'] / total_value * 100, 1) if total_value else 0.0
+        }
+        for segment in sorted(totals)
+    ]
+    polar_area_data = [
+        {
+            'segment': segment,
+            'count': int(round(values['count'])),
+            'percentage': round(values['count'] / total_customers * 100, 1)
+        }
+        for segment, values in sorted(totals.items(), key=lambda item: -item[1]['count'])
+    ]
+
+    return {
+        'segment_counts': segment_counts,
+        'segment_stats': segment_stats,
+        'treemap_data': treemap_data,
+        'polar_area_data': polar_area_data
+    }
+
+def score_histogram(customers, bins):
+    """
+    Per-cell totals of the (r, f, m) score cube
+
+    Parameters:
+    -----------
+    customers : pandas.DataFrame
+        State customers (scores and recency_days, frequency, monetary)
+    bins : int
+        Score scale of the customers' scores
+
+    Returns:
+    --------
+    numpy.ndarray
+        Shape (bins, bins, bins, len(TOTAL_COLUMNS)); cell [r-1, f-1, m-1]
+        holds the count and value sums of the customers scored (r, f, m)
+    """
+    cells = (
+        (customers['r_score'].to_numpy(dtype=np.int64) - 1) * bins
+        + customers['f_score'].to_numpy(dtype=np.int64) - 1
+    ) * bins + customers['m_score'].to_numpy(dtype=np.int64) - 1
+    columns = [np.bincount(cells, minlength=bins ** 3).astype(float)] + [
+        np.bincount(cells, weights=customers[column].to_numpy(dtype=float), minlength=bins ** 3)
+        for column in DIMENSIONS.values()
+    ]
+    return np.stack(columns, axis=-1).reshape(bins, bins, bins, len(TOTAL_COLUMNS))
+
+def totals_from_histogram(histogram, rule_set):
+    """
+    Per-segment totals of a score-cube histogram under a rule set, computed
+    from the cells alone (no customer rows)
+    """
+    bins = histogram.shape[0]
+    codes = rule_set.cell_codes(bins)
+    cells = histogram.reshape(-1, len(TOTAL_COLUMNS))
+    names = rule_set.segment_names
+    sums = [np.bincount(codes, weights=cells[:, column], minlength=len(names)) for column in range(len(TOTAL_COLUMNS))]
+    return {
+        names[code]: {column: float(total[code]) for column, total in zip(TOTAL_COLUMNS, sums)}
+        for code in np.flatnonzero(sums[0])
+    }
+
+class RFMState:
+    """
+    Persisted per-customer RFM state for an analysis lineage
+
+    A lineage starts with a full analysis; delta uploads of new or changed
+    customers (or new transactions) are merged into it. Only customers whose
+    values changed, or whose values lie between old and new n-tile cut
+    points, are re-scored and re-segmented. Segment summaries are maintained
+    from running per-segment totals.
+    """
+
+    def __init__(self, customers, meta, sorted_values, histogram=None):
+        """
+        Parameters:
+        -----------
+        customers : pandas.DataFrame
+            Indexed by customer ID with recency_days, frequency, monetary,
+            r_score, f_score, m_score, rfm_score and segment columns
+        meta : dict
+            Lineage metadata (column mapping, as-of date, rule set, edges, totals)
+        sorted_values : dict
+            Sorted values of each dimension, used for O(1) quantiles
+        histogram : numpy.ndarray, optional
+            Score-cube histogram of the customers (see score_histogram),
+            built from them when omitted
+        """
+        self.customers = customers
+        self.meta = meta
+        self.sorted_values = sorted_values
+        self.histogram = histogram if histogram is not None else score_histogram(customers, meta['score_bins'])
+
+    @classmethod
+    def from_analysis(cls, rfm, lineage_id):
+        """
+        Build the state from a completed RFMAnalysis
+
+        Parameters:
+        -----------
+        rfm : RFMAnalysis
+            Analysis on which segment_customers() has run
+        lineage_id : str
+            Identifier of the lineage (the analysis ID of the base upload)
+        """
+        if rfm.group_col:
+            raise ValueError("Grouped analyses cannot be persisted as an incremental state")
+        segments = rfm.rfm_segments
+        customers = pd.DataFrame({
+            'recency_days': segments['recency_days'].to_numpy(dtype=float),
+            'frequency': segments[rfm.frequency_col].to_numpy(dtype=float),
+            'monetary': segments[rfm.monetary_col].to_numpy(dtype=float),
+            'r_score': segments['r_score'].to_numpy(),
+            'f_score': segments['f_score'].to_numpy(),
+            'm_score': segments['m_score'].to_numpy(),
+            'rfm_score': segments['rfm_score'].to_numpy(),
+            'segment': segments['segment'].to_numpy()
+        }, index=pd.Index(segments[rfm.user_id_col].to_numpy(), name='customer_id'))
+        customers = customers[~customers.index.duplicated(keep='last')]
+
+        meta = {
+            'lineage_id': lineage_id,
+            'segment_type': rfm.segment_type,
+            'input_mode': rfm.input_mode,
+            'column_mapping': {
+                'user_id': rfm.user_id_col,
+                'recency': rfm.recency_col,
+                'frequency': rfm.order_col if rfm.input_mode == 'transaction' else rfm.frequency_col,
+                'monetary': rfm.monetary_col
+            },
+            'as_of': datetime.date.today().isoformat(),
+            'created_at': datetime.datetime.now().isoformat(),
+            'updated_at': datetime.datetime.now().isoformat(),
+            'score_bins': rfm.score_bins,
+            'rule_set': rfm.rule_set.definition,
+            'edges': {dimension: [float(edge) for edge in rfm.score_edges[dimension]] for dimension in DIMENSIONS},
+            'totals': _totals_dict(customers),
+            'deltas': []
+        }
+
+        sorted_values = {dimension: np.sort(customers[column].to_numpy()) for dimension, column in DIMENSIONS.items()}
+        return cls(customers, meta, sorted_values)
+
+    @classmethod
+    def load(cls, state_dir):
+        """
+        Load the state persisted in an analysis directory (cached per process)
+        """
+        meta_path = os.path.join(state_dir, STATE_META_FILE)
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(f"No RFM state found in {state_dir}")
+
+        mtime = os.path.getmtime(meta_path)
+        cached = _cached_state(state_dir, mtime)
+        if cached is not None:
+            return cached
+
+        meta = _load_meta(meta_path)
+        customers = pd.read_feather(os.path.join(state_dir, STATE_FILE)).set_index('customer_id')
+        with np.load(os.path.join(state_dir, SORTED_VALUES_FILE)) as sorted_file:
+            sorted_values = {dimension: sorted_file[dimension] for dimension in DIMENSIONS}
+        histogram_path = os.path.join(state_dir, SCORE_CUBE_FILE)
+        histogram = np.load(histogram_path) if os.path.exists(histogram_path) else None
+
+        state = cls(customers, meta, sorted_values, histogram)
+        _cache_state(state_dir, mtime, state)
+        return state
+
+    def save(self, state_dir):
+        """
+        Persist the state into an analysis directory
+        """
+        os.makedirs(state_dir, exist_ok=True)
+        self.customers.reset_index().to_feather(os.path.join(state_dir, STATE_FILE))
+        np.savez(os.path.join(state_dir, SORTED_VALUES_FILE), **self.sorted_values)
+        np.save(os.path.join(state_dir, SCORE_CUBE_FILE), self.histogram)
+
+        # The metadata file is written last and marks the state as complete
+        meta_path = os.path.join(state_dir, STATE_META_FILE)
+        with open(meta_path + ".tmp", "w") as f:
+            json.dump(self.meta, f, default=str)
+        os.replace(meta_path + ".tmp", meta_path)
+
+        _cache_state(state_dir, os.path.getmtime(meta_path), self)
+        with _CACHE_LOCK:
+            _HISTOGRAM_CACHE.pop(state_dir, None)
+
+    def advance_to(self, as_of):
+        """
+        Move the state to a new as-of date
+
+        Every customer's recency grows by the same number of days, so the
+        recency edges shift by that amount and no score changes.
+        """
+        days = (as_of - datetime.date.fromisoformat(self.meta['as_of'])).days
+        if days == 0:
+            return
+        self.customers['recency_days'] += days
+        self.sorted_values['recency'] = self.sorted_values['recency'] + days
+        self.meta['edges']['recency'] = [edge + days for edge in self.meta['edges']['recency']]
+        for totals in self.meta['totals'].values():
+            totals['recency_sum'] += totals['count'] * days
+        self.histogram[..., TOTAL_COLUMNS.index('recency_sum')] += self.histogram[..., TOTAL_COLUMNS.index('count')] * days
+        self.meta['as_of'] = as_of.isoformat()
+
+    def _normalize_delta(self, delta):
+        """Preprocess a delta upload into per-customer recency/frequency/monetary values"""
+        mapping = self.meta['column_mapping']
+        rfm = RFMAnalysis(
+            delta, mapping['user_id'], mapping['recency'], mapping['frequency'], mapping['monetary'],
+            self.meta['segment_type'], input_mode=self.meta['input_mode']
+        )
+        data = rfm.preprocess_data()
+        values = pd.DataFrame({
+            'recency_days': data['recency_days'].to_numpy(dtype=float),
+            'frequency': data[rfm.frequency_col].to_numpy(dtype=float),
+            'monetary': data[rfm.monetary_col].to_numpy(dtype=float)
+        }, index=pd.Index(data[rfm.user_id_col].to_numpy(), name='customer_id'))
+        return values[~values.index.duplicated(keep='last')]
+
+    def _add_totals(self, frame, sign):
+        """
+        Add (sign=1) or subtract (sign=-1) the contribution of scored rows
+        to the segment totals and the score-cube histogram
+        """
+        if len(frame) == 0:
+            return
+        self.histogram += sign * score_histogram(frame, self.meta['score_bins'])
+        for segment, row in _totals_dict(frame).items():
+            totals = self.meta['totals'].setdefault(segment, {column: 0.0 for column in TOTAL_COLUMNS})
+            for column in TOTAL_COLUMNS:
+                totals[column] += sign * row[column]
+            if totals['count'] <= 0:
+                del self.meta['totals'][segment]
+
+    def apply_delta(self, delta, as_of=None, events=None):
+        """
+        Merge a delta upload and re-score/re-segment only what moved
+
+        In customer mode the delta holds the current values of new or changed
+        customers. In transaction mode it holds new order lines, which are
+        added to each customer's order count and total.
+
+        Scoring work (re-scoring, re-segmenting, segment totals and the
+        score-cube histogram) scales with the delta plus the customers lying
+        between an old and a new cut point. The as-of shift, the sorted
+        value insert/remove and the cut point masks remain vectorized O(N)
+        passes over the customer base; see
+        scripts/benchmarks/bench_delta_upload.py for the measured scaling.
+
+        Parameters:
+        -----------
+        delta : pandas.DataFrame
+            Delta rows using the lineage's column mapping
+        as_of : datetime.date, optional
+            Analysis date (today when omitted)
+        events : pandas.DataFrame, optional
+            Online purchase events (customer_id, amount, day ordinal)
+            ingested against the current state, folded in before the delta
+
+        Returns:
+        --------
+        dict
+            Counts of new, changed and re-scored customers and moved dimensions
+        """
+        self.advance_to(as_of or datetime.date.today())
+        folded = 0
+        if events is not None and len(events):
+            # Purchases ingested online happened before this upload
+            self._merge_values(self._event_values(events), additive=True)
+            folded = len(events)
+
+        summary = self._merge_values(self._normalize_delta(delta), additive=self.meta['input_mode'] == 'transaction')
+        summary['folded_events'] = folded
+        self.meta['updated_at'] = datetime.datetime.now().isoformat()
+        self.meta['deltas'].append({'applied_at': self.meta['updated_at'], **summary})
+        return summary
+
+    def _event_values(self, events):
+        """
+        Aggregate online purchase events (customer_id, amount, day ordinal)
+        into per-customer recency/frequency/monetary increments
+        """
+        as_of = datetime.date.fromisoformat(self.meta['as_of']).toordinal()
+        grouped = events.groupby('customer_id', sort=False)
+        values = pd.DataFrame({
+            'recency_days': (as_of - grouped['day'].max()).astype(float),
+            'frequency': grouped.size().astype(float),
+            'monetary': grouped['amount'].sum().astype(float)
+        })
+        # Events carry customer IDs as strings; match them to the state's IDs
+        state_ids = self.customers.index.to_numpy()
+        positions = self.customers.index.astype(str).get_indexer(values.index)
+        values.index = pd.Index(
+            [state_ids[position] if position >= 0 else customer_id for position, customer_id in zip(positions, values.index)],
+            name='customer_id'
+        )
+        return values
+
+    def _merge_values(self, values, additive):
+        """
+        Merge per-customer values into the state and re-score what moved
+
+        Additive values (new orders) extend the customers' histories;
+        otherwise they replace the customers' values.
+
+        Returns:
+        --------
+        dict
+            Counts of new, changed and re-scored customers and moved dimensions
+        """
+        existing = values.index[values.index.isin(self.customers.index)]
+        new_ids = values.index[~values.index.isin(self.customers.index)]
+        previous = self.customers.loc[existing, STATE_ROW_COLUMNS].copy()
+
+        if additive and len(existing):
+            # New orders extend the customer's history
+            values.loc[existing, 'recency_days'] = np.minimum(values.loc[existing, 'recency_days'], previous['recency_days'])
+            values.loc[existing, 'frequency'] += previous['frequency']
+            values.loc[existing, 'monetary'] += previous['monetary']
+
+        # Keep the sorted value arrays in step with the customer values
+        for dimension, column in DIMENSIONS.items():
+            sorted_values = _remove_sorted(self.sorted_values[dimension], previous[column].to_numpy())
+            self.sorted_values[dimension] = _insert_sorted(sorted_values, values[column].to_numpy())
+
+        self.customers.loc[existing, ['recency_days', 'frequency', 'monetary']] = values.loc[existing]
+        if len(new_ids):
+            added = values.loc[new_ids].assign(r_score=0, f_score=0, m_score=0, rfm_score=0, segment=None)
+            self.customers = pd.concat([self.customers, added[self.customers.columns]])
+
+        # Customers between an old and a new cut point change score
+        affected = pd.Series(False, index=self.customers.index)
+        affected[values.index] = True
+        moved = []
+        new_edges = {}
+        for dimension, column in DIMENSIONS.items():
+            old = np.asarray(self.meta['edges'][dimension])
+            new = ntile_edges(self.sorted_values[dimension], self.meta['score_bins'])
+            new_edges[dimension] = new
+            # Any move counts: customers between the edges change score
+            if np.array_equal(old, new):
+                continue
+            moved.append(dimension)
+            column_values = self.customers[column].to_numpy()
+            if len(old) != len(new):
+                affected[:] = True
+                continue
+            for old_edge, new_edge in zip(old, new):
+                low, high = min(old_edge, new_edge), max(old_edge, new_edge)
+                affected |= (column_values >= low) & (column_values <= high)
+
+        rescored = self.customers.index[affected.to_numpy()]
+        before = pd.concat([
+            previous,
+            self.customers.loc[rescored.difference(values.index), STATE_ROW_COLUMNS]
+        ])
+        self._add_totals(before, -1)
+
+        # Re-score affected customers and re-segment those whose scores changed
+        rows = self.customers.loc[rescored]
+        scores = {
+            'r_score': scores_from_edges(rows['recency_days'], new_edges['recency'], 'recency'),
+            'f_score': scores_from_edges(rows['frequency'], new_edges['frequency'], 'frequency'),
+            'm_score': scores_from_edges(rows['monetary'], new_edges['monetary'], 'monetary')
+        }
+        changed = (
+            (scores['r_score'] != rows['r_score'].to_numpy()) |
+            (scores['f_score'] != rows['f_score'].to_numpy()) |
+            (scores['m_score'] != rows['m_score'].to_numpy()) |
+            rows['segment'].isna().to_numpy()
+        )
+        for column, column_scores in scores.items():
+            self.customers.loc[rescored, column] = column_scores
+        self.customers.loc[rescored, 'rfm_score'] = combined_score(scores['r_score'], scores['f_score'], scores['m_score'], self.meta['score_bins'])
+
+        resegment = rescored[changed]
+        if len(resegment):
+            rows = self.customers.loc[resegment]
+            self.customers.loc[resegment, 'segment'] = segment_scores(rows['r_score'], rows['f_score'], rows['m_score'], self.meta['score_bins'], self.meta['rule_set'])
+
+        self._add_totals(self.customers.loc[rescored, STATE_ROW_COLUMNS], 1)
+
+        self.meta['edges'] = {dimension: [float(edge) for edge in edges] for dimension, edges in new_edges.items()}
+        return {
+            'delta_customers': len(values),
+            'new_customers': len(new_ids),
+            'changed_customers': len(existing),
+            'rescored_customers': len(rescored),
+            'resegmented_customers': len(resegment),
+            'moved_dimensions': moved,
+            'total_customers': len(self.customers)
+        }
+
+
+    def get_results(self):
+        """
+        Build the RFM analysis summaries from the running segment totals
+        """
+        return results_from_totals(self.meta['totals'])
+
+def get_state_lock(state_dir):
+    """Return the lock serializing delta updates of one lineage in this process"""
+    with _CACHE_LOCK:
+        return _STATE_LOCKS.setdefault(state_dir, threading.Lock())
+
+@contextlib.contextmanager
+def state_lock(state_dir):
+    """
+    Hold the lock serializing updates of a lineage state, across the
+    threads of this process and across processes (API workers)
+    """
+    with get_state_lock(state_dir):
+        with open(os.path.join(state_dir, STATE_LOCK_FILE), "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+def apply_delta_upload(state_dir, delta, as_of=None):
+    """
+    Load a lineage state, merge a delta upload into it and persist the
+    result, rebuilding the customer lookup and audience indexes of the
+    analysis
+
+    Besides apply_delta, persisting the state (customers feather, sorted
+    values, histogram) and rebuilding the indexes rewrite the whole lineage,
+    so an upload costs roughly as much as one segment-only pass over the
+    customer base no matter how small the delta is. Uploads of the same
+    lineage are serialized across threads and worker processes. Purchase
+    events ingested online against the previous state (see rfm_events) are
+    folded into the new one first.
+
+    Parameters:
+    -----------
+    state_dir : str
+        Analysis directory holding the lineage state
+    delta : pandas.DataFrame
+        New or changed customers (or new transactions)
+    as_of : datetime.date, optional
+        Analysis date (today when omitted)
+
+    Returns:
+    --------
+    dict
+        Delta summary and refreshed RFM analysis summaries
+    """
+    # Imported here: the online store module builds on this one
+    from .rfm_events import _generation, read_event_logs, remove_event_logs
+
+    with state_lock(state_dir):
+        # Another process may have saved a newer state; load() re-reads it
+        state = RFMState.load(state_dir)
+        superseded = _generation(state.meta.get('updated_at'))
+        try:
+            # Events ingested online since the last upload become part of the state
+            events, folded = read_event_logs(state_dir, state.meta.get('events_folded', {}))
+            summary = state.apply_delta(delta, as_of=as_of, events=events)
+            state.meta['events_folded'] = folded
+            state.save(state_dir)
+        except Exception:
+            # The cached state may be partially updated; reload it next time
+            with _CACHE_LOCK:
+                _STATE_CACHE.pop(state_dir, None)
+            raise
+
+        # Older logs were folded by earlier uploads; stores still on the
+        # superseded generation may keep appending to theirs until they reload
+        remove_event_logs(state_dir, (superseded, _generation(state.meta['updated_at'])))
+
+        # Lookups, audiences and exports serve the re-scored customers
+        refresh_customer_indexes(state.customers, state_dir)
+        return {
+            'lineage_id': state.meta['lineage_id'],
+            'delta': summary,
+            'rfm_analysis': state.get_results()
+        }
+
+def clear_state_cache():
+    """Drop the loaded states and histograms of this process"""
+    with _CACHE_LOCK:
+        _STATE_CACHE.clear()
+        _HISTOGRAM_CACHE.clear()
+
+def load_score_histogram(state_dir):
+    """
+    Load the score-cube histogram of a lineage (cached per process)
+
+    Only the state metadata and the histogram are read. States saved
+    before histograms were persisted get theirs built from the customer
+    rows once.
+
+    Returns:
+    --------
+    tuple
+        The histogram, the lineage's compiled rule set and the per-segment
+        totals under it
+    """
+    meta_path = os.path.join(state_dir, STATE_META_FILE)
+    if not os.path.exists(meta_path):
+        raise FileNotFoundError(f"No RFM state found in {state_dir}")
+
+    mtime = os.path.getmtime(meta_path)
+    with _CACHE_LOCK:
+        cached = _HISTOGRAM_CACHE.get(state_dir)
+    if cached and cached[0] == mtime:
+        return cached[1:]
+
+    histogram_path = os.path.join(state_dir, SCORE_CUBE_FILE)
+    meta = _load_meta(meta_path)
+    if os.path.exists(histogram_path):
+        histogram = np.load(histogram_path)
+    else:
+        state = RFMState.load(state_dir)
+        meta = state.meta
+        histogram = state.histogram
+        with state_lock(state_dir):
+            with open(histogram_path + ".tmp", "wb") as f:
+                np.save(f, histogram)
+            os.replace(histogram_path + ".tmp", histogram_path)
+
+    rule_set = resolve_rule_set(rule_set=meta['rule_set'])
+    entry = (mtime, histogram, rule_set, totals_from_histogram(histogram, rule_set))
+    with _CACHE_LOCK:
+        _HISTOGRAM_CACHE[state_dir] = entry
+    return entry[1:]
+
+def what_if_segments(state_dir, rule_set):
+    """
+    Re-segment a lineage under alternative rules from its score-cube histogram
+
+    Parameters:
+    -----------
+    state_dir : str
+        Analysis directory holding the lineage state
+    rule_set : dict, str or CompiledRuleSet
+        Alternative rules (see segment_rules.resolve_rule_set)
+
+    Returns:
+    --------
+    dict
+        RFM analysis summaries under the alternative rules and the change
+        in customers per segment against the lineage's own rules
+    """
+    histogram, _, baseline = load_score_histogram(state_dir)
+    rule_set = resolve_rule_set(rule_set=rule_set)
+    totals = totals_from_histogram(histogram, rule_set)
+
+    changes = {}
+    for segment in set(totals) | set(baseline):
+        count = totals.get(segment, {}).get('count', 0.0)
+        previous = baseline.get(segment, {}).get('count', 0.0)
+        if count != previous:
+            changes[segment] = int(round(count - previous))
+
+    return {
+        'rule_set': {'id': rule_set.hash, 'name': rule_set.name},
+        'rfm_analysis': results_from_totals(totals),
+        'baseline_segment_counts': {segment: int(round(values['count'])) for segment, values in baseline.items()},
+        'segment_count_changes': changes
+    }
@@ -0,0 +1,358 @@
+# RFM Insights - Model Tuning Module
+
+import os
+import json
+import time
+import hashlib
+import logging
+import datetime
+import itertools
+import threading
+import concurrent.futures
+import numpy as np
+import pandas as pd
+
+from .rfm_analysis import PredictiveAnalytics
+from .rfm_lookup import get_customer_lookup
+from .rfm_models import ScoringModels, DIMENSIONS
+from .rfm_scoring import to_rule_scale
+from .cpu_quota import available_cpus
+
+logger = logging.getLogger(__name__)
+
+# Directory of the tuned configurations, one file per owner and segment type
+TUNING_DIR = "model_tuning"
+
+# Default wall-clock budget of a tuning job (seconds), shared by both models
+TUNING_TIME_BUDGET_SECONDS = 60
+
+# Configurations tried per model, the default one included
+TUNING_CANDIDATES = 12
+
+# Successive halving: each rung keeps 1/TUNING_ETA of the configurations
+# and fits the survivors on TUNING_ETA times more training customers
+TUNING_ETA = 3
+
+# Fewest training customers of the first rung
+TUNING_MIN_ROWS = 2000
+
+# Held-out customers the configurations are scored on (a fixed sample above)
+TUNING_EVAL_ROWS = 50000
+
+# Trees a churn random forest grows between two deadline checks while tuning
+FOREST_TREES_PER_CHECK = 10
+
+# Hyperparameter values searched for the churn random forest
+CHURN_SEARCH_SPACE = {
+    'max_depth': [None, 6, 10, 16],
+    'min_samples_leaf': [1, 5, 20, 50],
+    'max_features': ['sqrt', 0.5, 1.0]
+}
+
+# Hyperparameter values searched for the LTV XGBoost model
+LTV_SEARCH_SPACE = {
+    'max_depth': [3, 4, 6, 8],
+    'learning_rate': [0.03, 0.1, 0.3],
+    'min_child_weight': [1, 5, 20],
+    'subsample': [0.7, 1.0],
+    'colsample_bytree': [0.7, 1.0]
+}
+
+# Loaded tuned configurations, keyed by file
+_TUNINGS = {}
+_TUNINGS_LOCK = threading.Lock()
+
+def _candidates(space, count, rng):
+    """The default configuration ({}) followed by distinct random ones of a search space"""
+    grid = list(itertools.product(*space.values()))
+    return [{}] + [dict(zip(space, grid[index])) for index in rng.permutation(len(grid))[:count - 1]]
+
+def _rung_count(candidates, eta):
+    """Rungs after which successive halving is left with one configuration"""
+    rungs = 1
+    while eta ** rungs < candidates:
+        rungs += 1
+    return rungs
+
+def successive_halving(evaluate, candidates, training_rows, deadline, workers=1, eta=TUNING_ETA, min_rows=TUNING_MIN_ROWS):
+    """
+    Pick the best configuration by successive halving under a deadline
+
+    Every surviving configuration of a rung is evaluated in parallel on the
+    same number of training customers; the best 1/eta move on to the next
+    rung, which uses eta times more customers (the last one uses all of
+    them). A rung that does not finish before the deadline is abandoned
+    and the best configuration of the last finished rung wins. Evaluations
+    still running at the deadline are waited for before returning, so
+    evaluate should give up (raise) once the deadline has passed.
+
+    Parameters:
+    -----------
+    evaluate : callable
+        evaluate(params, rows) fits a model with params on the first rows
+        training customers and returns its held-out score (higher is better)
+    candidates : list
+        Configurations, the preferred one first (it wins ties)
+    training_rows : int
+        Training customers available
+    deadline : float
+        time.monotonic() value after which no rung is waited for
+    workers : int
+        Configurations evaluated at once
+    eta : int
+        Elimination rate
+    min_rows : int
+        Fewest training customers of the first rung
+
+    Returns:
+    --------
+    dict
+        The winning 'params' and 'score', the 'rungs' run (customers,
+        configurations, evaluated ones and best score) and whether every
+        rung finished in time ('complete'); configurations that fail to fit
+        are dropped
+    """
+    rung_count = _rung_count(len(candidates), eta)
+    survivors = list(candidates)
+    best = {'params': candidates[0], 'score': None}
+    rungs = []
+    complete = False
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(workers, 1))
+    try:
+        for rung in range(rung_count):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            rows = max(training_rows // eta ** (rung_count - 1 - rung), min(min_rows, training_rows))
+            futures = {executor.submit(evaluate, params, rows): position for position, params in enumerate(survivors)}
+            done, pending = concurrent.futures.wait(futures, timeout=remaining)
+            scores = []
+            for future in done:
+                if future.exception() is not None:
+                    logger.warning(f"Dropping configuration {survivors[futures[future]]}: {str(future.exception())}")
+                    continue
+                scores.append((future.result(), futures[future]))
+            scores.sort(key=lambda entry: (-entry[0], entry[1]))
+            rungs.append({
+                'rows': rows,
+                'candidates': len(survivors),
+                'evaluated': len(scores),
+                'best_score': scores[0][0] if scores else None
+            })
+            if pending:
+                # Partial rungs only stand in for a first rung that never finished
+                if best['score'] is None and scores:
+                    best = {'params': survivors[scores[0][1]], 'score': scores[0][0]}
+                break
+            if not scores:
+                break
+            best = {'params': survivors[scores[0][1]], 'score': scores[0][0]}
+            survivors = [survivors[position] for _, position in scores[:max(-(-len(scores) // eta), 1)]]
+        else:
+            complete = True
+    finally:
+        # Fits running past the deadline stop at their next deadline check;
+        # waiting for them keeps them from competing with the next search
+        executor.shutdown(wait=True, cancel_futures=True)
+    return {**best, 'rungs': rungs, 'complete': complete}
+
+def _check_deadline(deadline):
+    """Raise TimeoutError once the deadline has passed"""
+    if time.monotonic() > deadline:
+        raise TimeoutError("Tuning deadline reached")
+
+def _fit_forest(model, features, target, deadline):
+    """
+    Fit a random forest FOREST_TREES_PER_CHECK trees at a time, giving up
+    (TimeoutError) once the deadline has passed
+
+    The trees grown are the ones of a single fit (see warm_start).
+    """
+    total = model.n_estimators
+    model.set_params(warm_start=True)
+    trees = 0
+    while trees < total:
+        _check_deadline(deadline)
+        trees = min(trees + FOREST_TREES_PER_CHECK, total)
+        model.set_params(n_estimators=trees)
+        model.fit(features, target)
+    return model
+
+def _deadline_callback(deadline):
+    """XGBoost callback that stops boosting once the deadline has passed"""
+    import xgboost as xgb
+
+    class DeadlineCallback(xgb.callback.TrainingCallback):
+        def after_iteration(self, model, epoch, evals_log):
+            return time.monotonic() > deadline
+    return DeadlineCallback()
+
+def _positive_probability(model, features):
+    """Churn probability of a classifier that may have seen only one class"""
+    classes = list(model.classes_)
+    if True not in classes:
+        return np.zeros(len(features))
+    return model.predict_proba(features)[:, classes.index(True)]
+
+def _log_loss(labels, probability):
+    """Mean binary log loss"""
+    probability = np.clip(probability, 1e-15, 1 - 1e-15)
+    return float(-np.mean(np.where(labels, np.log(probability), np.log(1 - probability))))
+
+def _r2(target, predicted):
+    """Coefficient of determination"""
+    return float(1 - np.sum((target - predicted) ** 2) / np.sum((target - np.mean(target)) ** 2))
+
+def tune_models(predictive, time_budget=TUNING_TIME_BUDGET_SECONDS, workers=None, candidates=TUNING_CANDIDATES, seed=42):
+    """
+    Tune the churn and LTV models of a PredictiveAnalytics by successive halving
+
+    Both models are tuned on the shared feature matrix and the training /
+    held-out split of predict_churn and predict_ltv, within the same
+    training profile (trees per model, tree method); each configuration
+    is fitted single-threaded and workers of them run at once, and stops
+    once the model's deadline has passed (forests between groups of trees,
+    boosting between rounds). Churn
+    configurations are ranked by held-out log loss (the AUC of the derived
+    churn label saturates), LTV ones by held-out R². The churn model gets
+    the first half of the budget, the LTV model the rest.
+
+    Parameters:
+    -----------
+    predictive : PredictiveAnalytics
+        Customers to tune on, with their default settings
+    time_budget : float
+        Wall-clock seconds of the whole search
+    workers : int, optional
+        Configurations fitted at once (the CPUs the container may use when
+        omitted)
+    candidates : int
+        Configurations tried per model, the default one included
+    seed : int
+        Seed of the sampled configurations
+
+    Returns:
+    --------
+    dict
+        'churn' and 'ltv' search results (see successive_halving, with the
+        'metric' they are ranked by) and 'elapsed_seconds'
+    """
+    start_time = time.monotonic()
+    workers = workers or available_cpus()
+    rng = np.random.default_rng(seed)
+    features = predictive.features if predictive.features is not None else predictive.prepare_features()
+    train_rows, test_rows = predictive._split_rows()
+    if len(test_rows) > TUNING_EVAL_ROWS:
+        test_rows = np.sort(rng.choice(test_rows, TUNING_EVAL_ROWS, replace=False))
+    X_eval = features[test_rows]
+    churn, ltv = predictive.churn_target(), predictive.ltv_target()
+    churn_deadline, ltv_deadline = start_time + time_budget / 2, start_time + time_budget
+
+    def evaluate_churn(params, rows):
+        model = predictive.churn_estimator(rows, {**params, 'n_jobs': 1})
+        _fit_forest(model, features[train_rows[:rows]], churn[train_rows[:rows]], churn_deadline)
+        return -_log_loss(churn[test_rows], _positive_probability(model, X_eval))
+
+    def evaluate_ltv(params, rows):
+        _check_deadline(ltv_deadline)
+        model = predictive.ltv_estimator(rows, {**params, 'n_jobs': 1, 'callbacks': [_deadline_callback(ltv_deadline)]})
+        eval_set = [(X_eval, ltv[test_rows])] if model.early_stopping_rounds else None
+        model.fit(features[train_rows[:rows]], ltv[train_rows[:rows]], eval_set=eval_set, verbose=False)
+        # Boosting cut short by the deadline does not score the configuration
+        _check_deadline(ltv_deadline)
+        return _r2(ltv[test_rows], model.predict(X_eval))
+
+    churn_result = successive_halving(evaluate_churn, _candidates(CHURN_SEARCH_SPACE, candidates, rng), len(train_rows), churn_deadline, workers)
+    ltv_result = successive_halving(evaluate_ltv, _candidates(LTV_SEARCH_SPACE, candidates, rng), len(train_rows), ltv_deadline, workers)
+    return {
+        'churn': {**churn_result, 'metric': 'neg_log_loss'},
+        'ltv': {**ltv_result, 'metric': 'r2'},
+        'elapsed_seconds': round(time.monotonic() - start_time, 3)
+    }
+
+def load_predictive(analysis_dir):
+    """
+    PredictiveAnalytics over the customers of a stored analysis
+
+    The per-customer scores, segment and values are read back from the
+    analysis lookup index and put on the scale the models were trained on,
+    so the feature matrix matches the one of the analysis.
+
+    Returns:
+    --------
+    tuple
+        The PredictiveAnalytics (default settings) and the scoring metadata
+        of the analysis (see ScoringModels)
+    """
+    meta = ScoringModels.load(analysis_dir).meta
+    lookup = get_customer_lookup(analysis_dir)
+    data = pd.DataFrame({col: np.asarray(lookup.columns[col]) for col in ('recency_days', 'monetary', 'rfm_score')})
+    for col in DIMENSIONS.values():
+        data[col] = to_rule_scale(np.asarray(lookup.columns[col]), meta['score_bins'])
+    data['segment'] = pd.Categorical.from_codes(np.asarray(lookup.columns['segment']), categories=lookup.labels['segment'])
+    return PredictiveAnalytics(data, segment_names=meta['segment_names']), meta
+
+def _tuning_path(owner, segment_type, tuning_dir=TUNING_DIR):
+    """File of the tuned configuration of an owner and segment type"""
+    key = hashlib.sha256(f"{owner}\n{segment_type}".encode('utf-8')).hexdigest()[:16]
+    return os.path.join(tuning_dir, f"{key}.json")
+
+def save_tuning(entry, tuning_dir=TUNING_DIR):
+    """Store a tuned configuration under its owner and segment type"""
+    os.makedirs(tuning_dir, exist_ok=True)
+    path = _tuning_path(entry['owner'], entry['segment_type'], tuning_dir)
+    with open(path + ".tmp", "w") as f:
+        json.dump(entry, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+def load_tuning(owner, segment_type, tuning_dir=TUNING_DIR):
+    """Tuned configuration of an owner and segment type (None if never tuned)"""
+    path = _tuning_path(owner, segment_type, tuning_dir)
+    if not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+    with _TUNINGS_LOCK:
+        cached = _TUNINGS.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, "r") as f:
+        entry = json.load(f)
+    with _TUNINGS_LOCK:
+        _TUNINGS[path] = (mtime, entry)
+    return entry
+
+def tuned_model_settings(owner, segment_type, tuning_dir=TUNING_DIR):
+    """
+    PredictiveAnalytics settings applying the tuned configuration of an
+    owner and segment type ({} if never tuned)
+    """
+    entry = load_tuning(owner, segment_type, tuning_dir)
+    if entry is None:
+        return {}
+    return {'churn_params': entry['churn']['params'], 'ltv_params': entry['ltv']['params']}
+
+def tune_analysis(analysis_dir, owner, time_budget=TUNING_TIME_BUDGET_SECONDS, workers=None, tuning_dir=TUNING_DIR):
+    """
+    Tune the models on the customers of a stored analysis and cache the
+    winning configuration for its owner and segment type
+
+    Returns:
+    --------
+    dict
+        The stored entry: owner, segment type, source analysis, customers,
+        budget and the search results (see tune_models)
+    """
+    predictive, meta = load_predictive(analysis_dir)
+    results = tune_models(predictive, time_budget=time_budget, workers=workers)
+    entry = {
+        'owner': owner,
+        'segment_type': meta['segment_type'],
+        'analysis_id': os.path.basename(os.path.normpath(analysis_dir)),
+        'customers': len(predictive.rfm_data),
+        'time_budget_seconds': time_budget,
+        'tuned_at': datetime.datetime.now().isoformat(),
+        **results
+    }
+    save_tuning(entry, tuning_dir)
+    logger.info(f"Tuned models of {owner}/{meta['segment_type']} in {results['elapsed_seconds']}s: churn {entry['churn']['params']}, LTV {entry['ltv']['params']}")
+    return entry
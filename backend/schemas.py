@@ -1,5 +1,6 @@
 # RFM Insights - API Response Schemas
 
+from datetime import datetime
 from typing import TypeVar, Generic, Optional, List, Dict, Any, Union
 from pydantic import BaseModel, Field
 
@@ -50,6 +51,61 @@ class TokenResponse(BaseModel):
     token_type: str
     expires_in: int
 
+# Request models
+class PurchaseEvent(BaseModel):
+    """Purchase event for online RFM ingestion"""
+    customer_id: Union[str, int]
+    amount: float = Field(..., description="Purchase value")
+    timestamp: Optional[datetime] = Field(None, description="Purchase time (now when omitted)")
+
+class PurchaseEventBatch(BaseModel):
+    """Batch of purchase events"""
+    events: List[PurchaseEvent] = Field(..., description="Purchase events, applied in order")
+
+class CustomerLookupBatch(BaseModel):
+    """Customers to look up in an analysis"""
+    customer_ids: List[Union[str, int]] = Field(..., description="Customer IDs")
+
+class CustomerScoringBatch(BaseModel):
+    """Customers to score with the models of an analysis"""
+    customers: List[Dict[str, Any]] = Field(..., description="Customer rows (order lines for transaction analyses) using the analysis column mapping")
+
+class CustomerScoringRequest(BaseModel):
+    """One customer to score in real time with the models of an analysis"""
+    customer: Dict[str, Any] = Field(..., description="Customer row (one order line for transaction analyses) using the analysis column mapping")
+
+class ModelTuningRequest(BaseModel):
+    """Hyperparameter search over the customers of a stored analysis"""
+    owner: str = Field(..., description="User the tuned configuration is cached for")
+    time_budget_seconds: float = Field(60.0, gt=0, le=3600, description="Wall-clock budget of the search")
+    workers: Optional[int] = Field(None, ge=1, description="Configurations fitted at once (all cores when omitted)")
+
+class AudienceQuery(BaseModel):
+    """Audience over the indexed segments and predictive flags of an analysis"""
+    query: Dict[str, Any] = Field(..., description="Nested query: {'and'|'or': [...]}, {'not': {...}} or a field leaf such as {'segment': 'Campeões'}")
+
+class SegmentRule(BaseModel):
+    """Segment rule: score ranges ([min, max] or a single score) that assign a segment"""
+    segment: str = Field(..., description="Segment assigned when all ranges match")
+    r: Optional[Union[int, List[int]]] = Field(None, description="Recency score range (any when omitted)")
+    f: Optional[Union[int, List[int]]] = Field(None, description="Frequency score range (any when omitted)")
+    m: Optional[Union[int, List[int]]] = Field(None, description="Monetary score range (any when omitted)")
+
+class SegmentRuleSet(BaseModel):
+    """Custom segment rule set; the first matching rule wins"""
+    name: str = Field(..., description="Rule set name")
+    owner: Optional[str] = Field(None, description="User the rule set belongs to")
+    score_bins: int = Field(4, description="Score scale the ranges are written on")
+    default: str = Field("Outros", description="Segment of customers no rule matches")
+    rules: List[SegmentRule] = Field(..., description="Rules, evaluated in order")
+
+class SegmentWhatIf(BaseModel):
+    """Alternative segment rules to evaluate against a stored analysis"""
+    rule_set: Optional[str] = Field(None, description="Built-in rule set name or custom rule set ID")
+    rules: Optional[List[SegmentRule]] = Field(None, description="Ad hoc rules, evaluated in order")
+    score_bins: int = Field(4, description="Score scale the ad hoc ranges are written on")
+    default: str = Field("Outros", description="Segment of customers no ad hoc rule matches")
+
 # Example of how to use these models in FastAPI endpoints:
 """
 from fastapi import APIRouter, Depends, HTTPException
@@ -0,0 +1,329 @@
+# RFM Insights - Segment Rule Sets Module
+
+import os
+import json
+import hashlib
+import threading
+import functools
+import numpy as np
+
+from .rfm_scoring import to_rule_scale
+
+# Directory where custom rule sets are stored
+RULES_DIR = "segment_rules"
+
+# Score dimensions a rule can constrain
+RULE_DIMENSIONS = ('r', 'f', 'm')
+
+# Built-in rule set used for unknown segment types
+DEFAULT_RULE_SET = 'ecommerce'
+
+# Rule sets are lists of rules evaluated in order; the first rule whose
+# score ranges ([min, max], inclusive) all match assigns the segment.
+# Omitted dimensions match any score.
+BUILTIN_RULE_SETS = {
+    # Retail purchases (the original segmentation)
+    'ecommerce': {
+        'score_bins': 4,
+        'default': "Outros",
+        'rules': [
+            {'segment': "Campeões", 'r': [4, 4], 'f': [4, 4], 'm': [4, 4]},
+            {'segment': "Clientes Fiéis", 'r': [3, 4], 'f': [3, 4], 'm': [3, 4]},
+            {'segment': "Fiéis em Potencial", 'r': [4, 4], 'f': [2, 3], 'm': [2, 3]},
+            {'segment': "Novos Clientes", 'r': [4, 4], 'f': [1, 1]},
+            {'segment': "Clientes Promissores", 'r': [3, 4], 'f': [1, 2], 'm': [3, 4]},
+            {'segment': "Clientes que Precisam de Atenção", 'r': [2, 3], 'f': [2, 3], 'm': [2, 3]},
+            {'segment': "Clientes Quase Dormentes", 'r': [1, 2], 'f': [2, 3], 'm': [2, 3]},
+            {'segment': "Clientes que Não Posso Perder", 'r': [1, 2], 'f': [3, 4], 'm': [3, 4]},
+            {'segment': "Clientes em Risco", 'r': [1, 2], 'f': [2, 3]},
+            {'segment': "Clientes Hibernando", 'r': [1, 1], 'f': [1, 2], 'm': [1, 2]},
+            {'segment': "Clientes Perdidos", 'r': [1, 1], 'f': [1, 1]}
+        ]
+    },
+    # Recurring billing (subscriptions, telecom, insurance): frequency counts
+    # payments, so a lapse in recency is the main churn signal
+    'recorrente': {
+        'score_bins': 4,
+        'default': "Outros",
+        'rules': [
+            {'segment': "Campeões", 'r': [4, 4], 'f': [4, 4], 'm': [3, 4]},
+            {'segment': "Clientes Fiéis", 'r': [3, 4], 'f': [3, 4]},
+            {'segment': "Novos Clientes", 'r': [3, 4], 'f': [1, 1]},
+            {'segment': "Fiéis em Potencial", 'r': [3, 4], 'f': [2, 2]},
+            {'segment': "Clientes que Não Posso Perder", 'r': [1, 2], 'f': [3, 4], 'm': [3, 4]},
+            {'segment': "Clientes em Risco", 'r': [2, 2]},
+            {'segment': "Clientes Hibernando", 'r': [1, 1], 'f': [2, 4]},
+            {'segment': "Clientes Perdidos", 'r': [1, 1], 'f': [1, 1]}
+        ]
+    },
+    # Occasional high-value purchases (travel, hospitality): few customers
+    # buy often, so frequency thresholds are lower and value weighs more
+    'ocasional': {
+        'score_bins': 4,
+        'default': "Outros",
+        'rules': [
+            {'segment': "Campeões", 'r': [4, 4], 'f': [3, 4], 'm': [3, 4]},
+            {'segment': "Clientes Fiéis", 'r': [2, 4], 'f': [3, 4], 'm': [2, 4]},
+            {'segment': "Clientes Promissores", 'r': [3, 4], 'm': [4, 4]},
+            {'segment': "Novos Clientes", 'r': [4, 4], 'f': [1, 2]},
+            {'segment': "Fiéis em Potencial", 'r': [3, 3], 'f': [2, 2]},
+            {'segment': "Clientes que Precisam de Atenção", 'r': [2, 3], 'f': [1, 2], 'm': [2, 3]},
+            {'segment': "Clientes que Não Posso Perder", 'r': [1, 1], 'f': [3, 4], 'm': [3, 4]},
+            {'segment': "Clientes em Risco", 'r': [1, 2], 'f': [2, 4]},
+            {'segment': "Clientes Perdidos", 'r': [1, 1]}
+        ]
+    }
+}
+
+# Built-in rule set of each business segment type offered by the frontend
+SEGMENT_TYPE_RULE_SETS = {
+    'ecommerce': 'ecommerce',
+    'educacao_cursos_online': 'ecommerce',
+    'assinatura_de_varejo': 'recorrente',
+    'seguros_plano_de_saude': 'recorrente',
+    'telecomunicacao_provedores_de_internet': 'recorrente',
+    'agencia_de_turismo-hotelaria': 'ocasional'
+}
+
+# Compiled rule sets, keyed by rule-set hash
+_COMPILED = {}
+_COMPILED_LOCK = threading.Lock()
+
+def validate_rule_set(definition):
+    """
+    Check a rule-set definition and return it in normalized form
+
+    Parameters:
+    -----------
+    definition : dict
+        'rules' (list of {'segment', 'r', 'f', 'm'}), optional 'score_bins'
+        (scale the ranges are written on, default 4), 'default' (segment of
+        customers no rule matches) and 'name'; a range is [min, max] or a
+        single score
+
+    Returns:
+    --------
+    dict
+        Definition with explicit [min, max] ranges for every dimension
+    """
+    if not isinstance(definition, dict) or not isinstance(definition.get('rules'), list) or not definition['rules']:
+        raise ValueError("A rule set needs a non-empty 'rules' list")
+    unknown = set(definition) - {'name', 'score_bins', 'default', 'rules'}
+    if unknown:
+        raise ValueError(f"Unknown rule set fields: {', '.join(sorted(unknown))}")
+
+    score_bins = definition.get('score_bins', 4)
+    if not isinstance(score_bins, int) or not 2 <= score_bins <= 10:
+        raise ValueError("score_bins must be an integer between 2 and 10")
+    default = definition.get('default', "Outros")
+    if not isinstance(default, str) or not default:
+        raise ValueError("default must be a segment name")
+
+    rules = []
+    for position, rule in enumerate(definition['rules'], start=1):
+        if not isinstance(rule, dict) or not isinstance(rule.get('segment'), str) or not rule['segment']:
+            raise ValueError(f"Rule {position} needs a 'segment' name")
+        unknown = set(rule) - {'segment', *RULE_DIMENSIONS}
+        if unknown:
+            raise ValueError(f"Rule {position} has unknown fields: {', '.join(sorted(unknown))}")
+        normalized = {'segment': rule['segment']}
+        for dimension in RULE_DIMENSIONS:
+            bounds = rule.get(dimension, [1, score_bins])
+            if isinstance(bounds, int):
+                bounds = [bounds, bounds]
+            if (not isinstance(bounds, (list, tuple)) or len(bounds) != 2
+                    or not all(isinstance(bound, int) for bound in bounds)
+                    or not 1 <= bounds[0] <= bounds[1] <= score_bins):
+                raise ValueError(f"Rule {position}: '{dimension}' must be a score or [min, max] within 1..{score_bins}")
+            normalized[dimension] = [bounds[0], bounds[1]]
+        rules.append(normalized)
+
+    normalized = {'score_bins': score_bins, 'default': default, 'rules': rules}
+    if definition.get('name'):
+        normalized['name'] = str(definition['name'])
+    return normalized
+
+def rule_set_hash(definition):
+    """
+    Content hash of a normalized rule set (its name is not part of the logic)
+    """
+    logic = {key: value for key, value in definition.items() if key != 'name'}
+    return hashlib.sha256(json.dumps(logic, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+
+class CompiledRuleSet:
+    """
+    Rule set compiled into a dense lookup over the (r, f, m) score cube
+
+    Segmenting customers is one fancy-indexing operation whatever the
+    number or complexity of the rules.
+    """
+
+    def __init__(self, definition):
+        """
+        Parameters:
+        -----------
+        definition : dict
+            Normalized rule-set definition (see validate_rule_set)
+        """
+        self.definition = definition
+        self.hash = rule_set_hash(definition)
+        self.name = definition.get('name', self.hash)
+        self.score_bins = definition['score_bins']
+
+        names = []
+        for rule in definition['rules']:
+            if rule['segment'] not in names:
+                names.append(rule['segment'])
+        if definition['default'] not in names:
+            names.append(definition['default'])
+        self.segment_names = names
+        self._names = np.array(names, dtype=object)
+
+        # Index 0 of every axis is unused so scores index the cube directly
+        size = self.score_bins + 1
+        scores = np.arange(size)
+        r, f, m = np.meshgrid(scores, scores, scores, indexing='ij')
+        cube = np.full((size, size, size), -1, dtype=np.int16)
+        for rule in definition['rules']:
+            matches = cube == -1
+            for dimension, grid in zip(RULE_DIMENSIONS, (r, f, m)):
+                low, high = rule[dimension]
+                matches &= (grid >= low) & (grid <= high)
+            cube[matches] = names.index(rule['segment'])
+        cube[cube == -1] = names.index(definition['default'])
+        self.cube = cube
+        self._cell_codes = {}
+
+    def to_scale(self, scores, score_bins):
+        """Map scores on a score_bins scale onto the rule set's scale"""
+        return to_rule_scale(np.asarray(scores, dtype=np.int64), score_bins, self.score_bins)
+
+    def segment_codes(self, r_scores, f_scores, m_scores, score_bins=None):
+        """Segment code (index into segment_names) of each customer"""
+        score_bins = score_bins or self.score_bins
+        return self.cube[
+            self.to_scale(r_scores, score_bins),
+            self.to_scale(f_scores, score_bins),
+            self.to_scale(m_scores, score_bins)
+        ]
+
+    def cell_codes(self, score_bins):
+        """
+        Segment code of every cell of a score_bins score cube, flattened in
+        (r, f, m) order over scores 1..score_bins
+        """
+        codes = self._cell_codes.get(score_bins)
+        if codes is None:
+            scores = np.arange(1, score_bins + 1)
+            r, f, m = np.meshgrid(scores, scores, scores, indexing='ij')
+            codes = self.segment_codes(r, f, m, score_bins).ravel()
+            self._cell_codes[score_bins] = codes
+        return codes
+
+    def segments(self, r_scores, f_scores, m_scores, score_bins=None):
+        """Segment name of each customer"""
+        return self._names[self.segment_codes(r_scores, f_scores, m_scores, score_bins)]
+
+    def describe(self):
+        """Summary of the rule set for API responses"""
+        return {
+            'id': self.hash,
+            'name': self.name,
+            'score_bins': self.score_bins,
+            'segments': list(self.segment_names),
+            'definition': self.definition
+        }
+
+def compile_rule_set(definition):
+    """
+    Compile a rule-set definition, reusing the compiled form of any rule
+    set with the same hash
+    """
+    definition = validate_rule_set(definition)
+    key = rule_set_hash(definition)
+    with _COMPILED_LOCK:
+        compiled = _COMPILED.get(key)
+    if compiled is None:
+        compiled = CompiledRuleSet(definition)
+        with _COMPILED_LOCK:
+            compiled = _COMPILED.setdefault(key, compiled)
+    return compiled
+
+@functools.lru_cache(maxsize=None)
+def builtin_rule_set(name):
+    """Compiled built-in rule set"""
+    return compile_rule_set(dict(BUILTIN_RULE_SETS[name], name=name))
+
+def _custom_rule_set_path(rule_set_id, rules_dir=RULES_DIR):
+    """File of a stored custom rule set (IDs are hex hashes)"""
+    if not rule_set_id or not all(char in '0123456789abcdef' for char in rule_set_id):
+        raise ValueError(f"Invalid rule set ID: {rule_set_id}")
+    return os.path.join(rules_dir, f"{rule_set_id}.json")
+
+def save_custom_rule_set(definition, owner=None, rules_dir=RULES_DIR):
+    """
+    Validate, compile and store a custom rule set
+
+    Rule sets are stored by content hash, so saving the same logic twice
+    returns the same ID.
+
+    Returns:
+    --------
+    dict
+        Rule set summary (see CompiledRuleSet.describe) with its owner
+    """
+    compiled = compile_rule_set(definition)
+    os.makedirs(rules_dir, exist_ok=True)
+    entry = {'owner': owner, **compiled.describe()}
+    path = _custom_rule_set_path(compiled.hash, rules_dir)
+    with open(path + ".tmp", "w") as f:
+        json.dump(entry, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+    return entry
+
+def load_custom_rule_set(rule_set_id, rules_dir=RULES_DIR):
+    """Compiled custom rule set stored under an ID"""
+    path = _custom_rule_set_path(rule_set_id, rules_dir)
+    if not os.path.exists(path):
+        raise KeyError(f"Rule set not found: {rule_set_id}")
+    with open(path, "r") as f:
+        return compile_rule_set(json.load(f)['definition'])
+
+def list_custom_rule_sets(owner=None, rules_dir=RULES_DIR):
+    """Stored custom rule sets, optionally only those of one owner"""
+    if not os.path.isdir(rules_dir):
+        return []
+    entries = []
+    for filename in sorted(os.listdir(rules_dir)):
+        if filename.endswith(".json"):
+            with open(os.path.join(rules_dir, filename), "r") as f:
+                entry = json.load(f)
+            if owner is None or entry.get('owner') == owner:
+                entries.append(entry)
+    return entries
+
+def resolve_rule_set(segment_type=None, rule_set=None, rules_dir=RULES_DIR):
+    """
+    Find the rule set of an analysis
+
+    Parameters:
+    -----------
+    segment_type : str, optional
+        Business segment type; selects its built-in rule set
+    rule_set : dict, str or CompiledRuleSet, optional
+        Overrides segment_type: a rule-set definition, a built-in name or
+        the ID of a stored custom rule set
+
+    Returns:
+    --------
+    CompiledRuleSet
+    """
+    if isinstance(rule_set, CompiledRuleSet):
+        return rule_set
+    if isinstance(rule_set, dict):
+        return compile_rule_set(rule_set)
+    if rule_set:
+        if rule_set in BUILTIN_RULE_SETS:
+            return builtin_rule_set(rule_set)
+        return load_custom_rule_set(rule_set, rules_dir)
+    return builtin_rule_set(SEGMENT_TYPE_RULE_SETS.get(segment_type, DEFAULT_RULE_SET))
@@ -0,0 +1,213 @@
+# RFM Insights - Worker Memory Hygiene Module
+
+import os
+import gc
+import sys
+import ctypes
+import signal
+import logging
+import threading
+import contextlib
+
+from . import monitoring
+from config.monitoring_config import WORKER_CLEANUP_MIN_MB, WORKER_RSS_HIGH_WATER_MB
+
+logger = logging.getLogger(__name__)
+
+# Job RSS growth from which memory is released explicitly
+CLEANUP_MIN_BYTES = WORKER_CLEANUP_MIN_MB * 1024 * 1024
+
+# Worker RSS after cleanup above which the worker is recycled (0 disables)
+RSS_HIGH_WATER_BYTES = WORKER_RSS_HIGH_WATER_MB * 1024 * 1024
+
+# Signal that recycles the worker: uvicorn shuts down gracefully (in-flight
+# requests complete) and the process manager starts a fresh process
+RECYCLE_SIGNAL = signal.SIGTERM
+
+# Analysis jobs running in this worker, and whether a recycle is due once
+# they have finished
+_JOBS_LOCK = threading.Lock()
+_ACTIVE_JOBS = 0
+_RECYCLE_PENDING = False
+
+# C library handle for malloc_trim (loaded on first use)
+_LIBC = None
+
+def current_rss():
+    """Resident memory of this process in bytes (0 when unavailable)"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+def _malloc_trim():
+    """
+    Return free heap memory of the glibc allocator to the OS
+
+    pandas and numpy free their buffers, but glibc keeps the freed pages of
+    its arenas mapped, so RSS stays at the job's peak without a trim.
+
+    Returns:
+    --------
+    bool
+        Whether memory was released (False off glibc, e.g. musl or macOS)
+    """
+    global _LIBC
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        if _LIBC is None:
+            _LIBC = ctypes.CDLL("libc.so.6")
+        return bool(_LIBC.malloc_trim(0))
+    except (OSError, AttributeError):
+        return False
+
+def release_memory():
+    """
+    Collect garbage and trim the allocator
+
+    Returns:
+    --------
+    dict
+        Objects collected, whether the allocator was trimmed, RSS before
+        and after and the bytes released
+    """
+    rss_before = current_rss()
+    collected = gc.collect()
+    trimmed = _malloc_trim()
+    rss_after = current_rss()
+    return {
+        'collected': collected,
+        'trimmed': trimmed,
+        'rss_before': rss_before,
+        'rss_after': rss_after,
+        'released_bytes': max(rss_before - rss_after, 0)
+    }
+
+def release_caches():
+    """
+    Drop the per-process caches of loaded analyses, then release memory
+
+    Lineage states, lookup and audience indexes, scoring models and
+    micro-batchers are reloaded on their next use; online event stores
+    persist their events before they are dropped.
+
+    Returns:
+    --------
+    dict
+        The release_memory() report
+    """
+    # Imported here: the analysis modules are heavy and import this one's users
+    from .rfm_state import clear_state_cache
+    from .rfm_lookup import clear_lookup_cache
+    from .rfm_audience import clear_audience_cache
+    from .rfm_models import clear_model_cache
+    from .rfm_realtime import clear_batchers
+    from .rfm_events import close_online_stores
+    clear_state_cache()
+    clear_lookup_cache()
+    clear_audience_cache()
+    clear_model_cache()
+    clear_batchers()
+    close_online_stores()
+    return release_memory()
+
+def _respawned_by_process_manager():
+    """
+    Whether this process is a worker that a process manager replaces when
+    it exits: a child of gunicorn, or of uvicorn running with --workers
+
+    A lone uvicorn process (as in the Docker image) has no such parent;
+    stopping it would stop the whole API.
+    """
+    try:
+        with open(f"/proc/{os.getppid()}/cmdline", "rb") as f:
+            command = f.read().replace(b"\0", b" ").decode("utf-8", errors="replace")
+    except OSError:
+        return False
+    if "gunicorn" in command:
+        return True
+    return "uvicorn" in command and ("--workers" in command or bool(os.environ.get("WEB_CONCURRENCY")))
+
+def _recycle_worker():
+    """Ask the server to shut this worker down gracefully"""
+    logger.warning(f"Recycling worker {os.getpid()} after crossing the {RSS_HIGH_WATER_BYTES // 2 ** 20}MB RSS high-water mark")
+    os.kill(os.getpid(), RECYCLE_SIGNAL)
+
+@contextlib.contextmanager
+def track_job(job_type):
+    """
+    Track the worker's RSS around an analysis job and clean up after it
+
+    When the job grew RSS by CLEANUP_MIN_BYTES or more, garbage is
+    collected and free allocator memory returned to the OS. When RSS is
+    still above the high-water mark afterwards, once no other job is
+    running in the worker its caches are dropped (release_caches); if
+    that does not bring RSS under the mark, the worker is recycled, but
+    only when a process manager will replace it. Every action is logged
+    and recorded in the Prometheus metrics.
+
+    Parameters:
+    -----------
+    job_type : str
+        Label of the job in logs and metrics
+
+    Yields:
+    -------
+    dict
+        Report filled when the job ends: 'rss_before', 'rss_after',
+        'rss_growth', the 'cleanup' and 'cache_release' results (when
+        run), 'recycle' and, when a due recycle was skipped,
+        'recycle_skipped'
+    """
+    global _ACTIVE_JOBS, _RECYCLE_PENDING
+    report = {'job_type': job_type, 'rss_before': current_rss()}
+    with _JOBS_LOCK:
+        _ACTIVE_JOBS += 1
+    try:
+        yield report
+    finally:
+        rss_after = current_rss()
+        report['rss_growth'] = rss_after - report['rss_before']
+        if report['rss_growth'] >= CLEANUP_MIN_BYTES:
+            report['cleanup'] = release_memory()
+            rss_after = report['cleanup']['rss_after']
+            logger.info(f"Released {report['cleanup']['released_bytes'] // 2 ** 20}MB after {job_type} job (RSS grew {report['rss_growth'] // 2 ** 20}MB)")
+            if monitoring.PROMETHEUS_ENABLE:
+                monitoring.increment_counter("memory_cleanups_total", {"job_type": job_type})
+                monitoring.observe_histogram("memory_cleanup_released_bytes", report['cleanup']['released_bytes'], {"job_type": job_type})
+        with _JOBS_LOCK:
+            _ACTIVE_JOBS -= 1
+            if RSS_HIGH_WATER_BYTES and rss_after >= RSS_HIGH_WATER_BYTES:
+                _RECYCLE_PENDING = True
+            recycle = _RECYCLE_PENDING and _ACTIVE_JOBS == 0
+            if recycle:
+                _RECYCLE_PENDING = False
+        if recycle:
+            report['cache_release'] = release_caches()
+            rss_after = report['cache_release']['rss_after']
+            logger.info(f"Dropped cached analyses of worker {os.getpid()}; RSS is now {rss_after // 2 ** 20}MB")
+            if rss_after < RSS_HIGH_WATER_BYTES:
+                recycle = False
+            elif not _respawned_by_process_manager():
+                logger.warning(
+                    f"Worker {os.getpid()} stays above the {RSS_HIGH_WATER_BYTES // 2 ** 20}MB RSS high-water mark, "
+                    f"but is not recycled: no process manager would start a replacement"
+                )
+                report['recycle_skipped'] = 'no_process_manager'
+                recycle = False
+        report['rss_after'] = rss_after
+        report['recycle'] = recycle
+        if monitoring.PROMETHEUS_ENABLE:
+            monitoring.observe_histogram("rfm_job_rss_growth_bytes", max(report['rss_growth'], 0), {"job_type": job_type})
+            monitoring.set_gauge("worker_rss_bytes", rss_after, {"service": "api"})
+        if recycle:
+            if monitoring.PROMETHEUS_ENABLE:
+                monitoring.increment_counter("worker_recycles_total", {"reason": "rss_high_water"})
+            _recycle_worker()
@@ -20,6 +20,12 @@ PROMETHEUS_ENABLE = os.getenv("PROMETHEUS_ENABLE", "True").lower() == "true"
 # Grafana Configuration
 GRAFANA_URL = os.getenv("GRAFANA_URL", "http://grafana:3000")
 
+# Worker Memory Hygiene Configuration
+# Job RSS growth (MB) from which memory is released explicitly after an analysis
+WORKER_CLEANUP_MIN_MB = int(os.getenv("RFM_CLEANUP_MIN_MB", "64"))
+# Worker RSS (MB) after cleanup above which the worker is recycled (0 disables)
+WORKER_RSS_HIGH_WATER_MB = int(os.getenv("RFM_WORKER_RSS_HIGH_WATER_MB", "384"))
+
 # Alert Configuration
 ALERT_EMAIL_RECIPIENTS = os.getenv("ALERT_EMAIL_RECIPIENTS", "").split(",")
 ALERT_SLACK_WEBHOOK = os.getenv("ALERT_SLACK_WEBHOOK", "")
@@ -85,5 +91,44 @@ METRICS = {
         "type": "gauge",
         "description": "CPU usage percentage",
         "labels": ["service"]
+    },
+    "worker_rss_bytes": {
+        "type": "gauge",
+        "description": "Resident memory of the API worker after each analysis job",
+        "labels": ["service"]
+    },
+    "rfm_job_rss_growth_bytes": {
+        "type": "histogram",
+        "description": "Worker resident memory growth over an analysis job",
+        "labels": ["job_type"],
+        "buckets": [1048576, 16777216, 67108864, 134217728, 268435456, 536870912, 1073741824]
+    },
+    "memory_cleanups_total": {
+        "type": "counter",
+        "description": "Explicit memory cleanups (gc and allocator trim) after large analysis jobs",
+        "labels": ["job_type"]
+    },
+    "memory_cleanup_released_bytes": {
+        "type": "histogram",
+        "description": "Resident memory returned to the OS by a cleanup",
+        "labels": ["job_type"],
+        "buckets": [0, 1048576, 16777216, 67108864, 134217728, 268435456, 536870912]
+    },
+    "worker_recycles_total": {
+        "type": "counter",
+        "description": "API worker recycles requested after crossing the memory high-water mark",
+        "labels": ["reason"]
+    },
+    "realtime_scoring_latency_seconds": {
+        "type": "histogram",
+        "description": "Latency of real-time scoring requests, from queueing to prediction",
+        "labels": [],
+        "buckets": [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.5]
+    },
+    "realtime_scoring_batch_size": {
+        "type": "histogram",
+        "description": "Requests grouped into each real-time scoring micro-batch",
+        "labels": [],
+        "buckets": [1, 2, 4, 8, 16, 32, 64, 128, 256, 512]
     }
 }
\ No newline at end of file
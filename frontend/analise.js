@@ -216,6 +216,7 @@ document.addEventListener('DOMContentLoaded', function() {
                     csvFile = file;
                     displayFileInfo(file);
                     readCSVFile(file);
+                    applySuggestedMapping(file);
                 } else {
                     alert('O arquivo excede o limite de 30MB. Por favor, selecione um arquivo menor.');
                 }
@@ -372,6 +373,43 @@ document.addEventListener('DOMContentLoaded', function() {
                 select.appendChild(option);
             });
         });
+        
+        // Aplica a sugestão de mapeamento se ela já tiver chegado
+        selectSuggestedColumns();
+    }
+    
+    // Mapeamento sugerido pelo servidor a partir do início do arquivo
+    let suggestedMapping = {};
+    
+    async function applySuggestedMapping(file) {
+        suggestedMapping = {};
+        try {
+            const preview = await apiClient.previewColumns(file);
+            suggestedMapping = (preview.data || preview).suggested_mapping || {};
+            selectSuggestedColumns();
+        } catch (error) {
+            // A sugestão é opcional; o usuário ainda pode mapear manualmente
+            console.warn('Não foi possível obter a sugestão de mapeamento:', error);
+        }
+    }
+    
+    // Pré-seleciona as colunas sugeridas, mantendo escolhas já feitas pelo usuário
+    function selectSuggestedColumns() {
+        const selects = {
+            'user_id': userIdSelect,
+            'recency': activityDateSelect,
+            'frequency': frequencySelect,
+            'monetary': consumptionTimeSelect
+        };
+        
+        Object.entries(selects).forEach(([role, select]) => {
+            const column = suggestedMapping[role];
+            if (column && !select.value && Array.from(select.options).some(option => option.value === column)) {
+                select.value = column;
+            }
+        });
+        
+        validateForm();
     }
     
     // Valida o formulário
@@ -208,6 +208,21 @@ class APIClient {
         return await this.uploadFile('/rfm/analyze-rfm', formData);
     }
 
+    /**
+     * Preview file columns and suggested mapping from the start of the file
+     * @param {File} file - Selected file
+     * @param {number} maxBytes - Bytes sent for CSV files
+     * @returns {Promise} Promise with columns, types, samples and suggested mapping
+     */
+    async previewColumns(file, maxBytes = 64 * 1024) {
+        const formData = new FormData();
+        // CSV previews only need the first bytes of the file
+        const isCSV = file.name.toLowerCase().endsWith('.csv');
+        formData.append('file', isCSV ? file.slice(0, maxBytes) : file, file.name);
+        formData.append('max_bytes', maxBytes);
+        return await this.uploadFile('/rfm/preview-columns', formData);
+    }
+
     async getAnalysisHistory(limit = 5) {
         return await this.get(`/rfm/analysis-history?limit=${limit}`);
     }
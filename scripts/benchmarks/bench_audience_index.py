@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# RFM Insights - Audience Index Benchmark
+# Compares boolean-mask audience filters with bitmap index queries
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+# Add the project root to the path so we can import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import numpy as np
+import pandas as pd
+
+from backend.rfm_lookup import build_lookup_index
+from backend.rfm_audience import build_audience_index, get_audience_index
+
+def build_results(rows, seed):
+    """Synthetic per-customer results with predictive columns"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'customer_id': [f'CUST-{i:09d}' for i in range(rows)],
+        'segment': rng.choice(['Campeões', 'Clientes Fiéis', 'Clientes em Risco', 'Hibernando', 'Outros'], rows),
+        'churn_probability': rng.random(rows),
+        'ltv_segment': pd.Categorical(rng.choice(['Low', 'Medium', 'High', 'Very High'], rows)),
+        'cluster': rng.integers(0, 6, rows),
+        'upsell_potential': rng.random(rows) < 0.3,
+        'crosssell_potential': rng.random(rows) < 0.2
+    })
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark audience queries")
+    parser.add_argument("--rows", type=int, default=2000000, help="Number of customers")
+    parser.add_argument("--repeat", type=int, default=20, help="Runs per query")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+
+    print(f"[INFO] Indexing {args.rows} customers")
+    results = build_results(args.rows, args.seed)
+    query = {'and': [
+        {'or': [{'upsell_potential': True}, {'crosssell_potential': True}]},
+        {'churn_probability': {'max': 0.3}},
+        {'not': {'segment': 'Hibernando'}}
+    ]}
+
+    with tempfile.TemporaryDirectory() as analysis_dir:
+        build_lookup_index(results, 'customer_id', analysis_dir)
+        start_time = time.perf_counter()
+        bitmaps = build_audience_index(results, analysis_dir)
+        print(f"[RESULT] build             bitmaps={bitmaps:<4} time={time.perf_counter() - start_time:8.3f}s")
+        audience = get_audience_index(analysis_dir)
+
+        start_time = time.perf_counter()
+        for _ in range(args.repeat):
+            mask = (
+                (results['upsell_potential'] | results['crosssell_potential']) &
+                (results['churn_probability'] < 0.3) &
+                (results['segment'] != 'Hibernando')
+            )
+            expected = int(mask.sum())
+        print(f"[RESULT] boolean masks     time={(time.perf_counter() - start_time) / args.repeat * 1e3:8.3f}ms")
+
+        start_time = time.perf_counter()
+        for _ in range(args.repeat):
+            summary = audience.summary(query)
+        print(f"[RESULT] bitmap count      time={(time.perf_counter() - start_time) / args.repeat * 1e3:8.3f}ms")
+
+        start_time = time.perf_counter()
+        exported = sum(len(chunk) for chunk in audience.iter_customer_ids(query))
+        print(f"[RESULT] stream ids        time={(time.perf_counter() - start_time) * 1e3:8.3f}ms  customers={exported}")
+        print(f"[INFO] Counts match: {summary['count'] == expected == exported}")
+
+if __name__ == "__main__":
+    main()
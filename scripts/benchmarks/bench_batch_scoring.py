@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# RFM Insights - Batch Scoring Benchmark
+# Compares applying the stored churn and LTV models of an analysis to new
+# customers one at a time with the vectorized batch scoring
+
+import os
+import sys
+import time
+import argparse
+import datetime
+import tempfile
+
+# Add the project root to the path so we can import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import numpy as np
+import pandas as pd
+
+from backend.rfm_analysis import analyze_rfm_data
+from backend import rfm_models
+from backend.rfm_models import ScoringModels
+
+def build_customers(rows, seed, offset=0):
+    """Synthetic customer rows"""
+    rng = np.random.default_rng(seed)
+    today = pd.Timestamp(datetime.date.today())
+    return pd.DataFrame({
+        'customer_id': np.arange(offset, offset + rows),
+        'last_purchase_date': today - pd.to_timedelta(rng.integers(0, 730, rows), unit='D'),
+        'purchase_count': rng.integers(1, 50, rows),
+        'total_spent': rng.gamma(2.0, 120.0, rows).round(2)
+    })
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batch scoring with stored models")
+    parser.add_argument("--train-rows", type=int, default=50000, help="Customers of the trained analysis")
+    parser.add_argument("--rows", type=int, default=500000, help="New customers to score")
+    parser.add_argument("--single-rows", type=int, default=200, help="Customers scored one at a time (extrapolated)")
+    parser.add_argument("--batch-rows", type=int, nargs="+", default=[1000, 10000, 50000], help="Batch sizes")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        analysis_dir = os.path.join(tmp_dir, 'analysis')
+        start_time = time.perf_counter()
+        analyze_rfm_data(build_customers(args.train_rows, args.seed), 'customer_id', 'last_purchase_date', 'purchase_count', 'total_spent', 'ecommerce', output_dir=analysis_dir, model_settings={'silhouette_sample_size': 10000})
+        print(f"[INFO] Trained on {args.train_rows} customers in {time.perf_counter() - start_time:.2f}s")
+
+        # Load from disk as a fresh worker would
+        rfm_models._MODELS.clear()
+        start_time = time.perf_counter()
+        models = ScoringModels.load(analysis_dir)
+        print(f"[INFO] Models loaded in {time.perf_counter() - start_time:.3f}s")
+
+        data = build_customers(args.rows, args.seed + 1, offset=args.train_rows)
+        start_time = time.perf_counter()
+        customers = models.prepare(data)
+        print(f"[INFO] {args.rows} customers scored and segmented in {time.perf_counter() - start_time:.3f}s")
+
+        # One request per customer: features and both models per row
+        start_time = time.perf_counter()
+        for row in range(args.single_rows):
+            models.predict(customers.iloc[row:row + 1])
+        per_row = (time.perf_counter() - start_time) / args.single_rows
+        print(f"[RESULT] one at a time   {per_row * 1000:8.3f}ms/customer  ~{per_row * args.rows:9.1f}s for {args.rows}")
+
+        for batch_rows in args.batch_rows:
+            start_time = time.perf_counter()
+            size = sum(len(chunk) for chunk in models.iter_chunks(customers, 'csv', batch_rows=batch_rows))
+            elapsed = time.perf_counter() - start_time
+            print(f"[RESULT] batch {batch_rows:>7}   {elapsed * 1000 / args.rows:8.4f}ms/customer  {elapsed:9.2f}s  {args.rows / elapsed:10.0f} customers/s  ({size / 2 ** 20:.1f}MB CSV)")
+
+if __name__ == "__main__":
+    main()
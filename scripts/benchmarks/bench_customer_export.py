@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# RFM Insights - Customer Export Benchmark
+# Compares serializing the whole result frame at once with the chunked export stream
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+# Add the project root to the path so we can import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import numpy as np
+import pandas as pd
+
+from backend.rfm_lookup import build_lookup_index
+from backend.rfm_export import CustomerExport
+
+def build_results(rows, seed):
+    """Synthetic per-customer results"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'customer_id': [f'CUST-{i:09d}' for i in range(rows)],
+        'recency_days': rng.integers(0, 730, rows).astype(float),
+        'frequency': rng.integers(1, 60, rows).astype(float),
+        'monetary': rng.gamma(2.0, 150.0, rows).round(2),
+        'r_score': rng.integers(1, 5, rows),
+        'f_score': rng.integers(1, 5, rows),
+        'm_score': rng.integers(1, 5, rows),
+        'segment': rng.choice(['Campeões', 'Clientes Fiéis', 'Clientes em Risco', 'Outros'], rows),
+        'churn_probability': rng.random(rows),
+        'predicted_ltv': rng.gamma(2.0, 300.0, rows)
+    })
+
+def measure(label, func):
+    """Run func once for its time and once under tracemalloc for its peak memory"""
+    start_time = time.perf_counter()
+    size = func()
+    elapsed = time.perf_counter() - start_time
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"[RESULT] {label:<18} time={elapsed:8.3f}s  size={size / 1e6:8.1f}MB  peak={peak / 1e6:8.1f}MB")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark customer exports")
+    parser.add_argument("--rows", type=int, default=2000000, help="Number of customers")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+
+    print(f"[INFO] Exporting {args.rows} customers")
+    results = build_results(args.rows, args.seed)
+
+    with tempfile.TemporaryDirectory() as analysis_dir:
+        build_lookup_index(results, 'customer_id', analysis_dir)
+        measure("in-memory to_csv", lambda: len(results.to_csv(index=False).encode('utf-8')))
+        measure("chunked csv", lambda: sum(len(chunk) for chunk in CustomerExport(analysis_dir, 'csv').iter_chunks()))
+        measure("chunked ndjson", lambda: sum(len(chunk) for chunk in CustomerExport(analysis_dir, 'ndjson').iter_chunks()))
+        CustomerExport(analysis_dir, 'csv').materialize()
+        measure("cached csv file", lambda: sum(len(chunk) for chunk in CustomerExport(analysis_dir, 'csv').stream()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# RFM Insights - Customer Lookup Benchmark
+# Measures index build time and point/batch lookup latency of the customer lookup index
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+# Add the project root to the path so we can import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import numpy as np
+import pandas as pd
+
+from backend.rfm_lookup import build_lookup_index, get_customer_lookup
+
+def build_results(rows, seed):
+    """Synthetic per-customer results"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'customer_id': [f'CUST-{i:09d}' for i in range(rows)],
+        'recency_days': rng.integers(0, 730, rows),
+        'frequency': rng.integers(1, 60, rows),
+        'monetary': rng.gamma(2.0, 150.0, rows).round(2),
+        'r_score': rng.integers(1, 5, rows),
+        'f_score': rng.integers(1, 5, rows),
+        'm_score': rng.integers(1, 5, rows),
+        'segment': rng.choice(['Campeões', 'Clientes Fiéis', 'Clientes em Risco', 'Outros'], rows),
+        'churn_probability': rng.random(rows),
+        'predicted_ltv': rng.gamma(2.0, 300.0, rows)
+    })
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the customer lookup index")
+    parser.add_argument("--rows", type=int, default=2000000, help="Number of customers")
+    parser.add_argument("--queries", type=int, default=20000, help="Point lookups to time")
+    parser.add_argument("--batch", type=int, default=1000, help="Customers per batch lookup")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+
+    print(f"[INFO] Indexing {args.rows} customers")
+    results = build_results(args.rows, args.seed)
+    rng = np.random.default_rng(args.seed)
+
+    with tempfile.TemporaryDirectory() as analysis_dir:
+        start_time = time.perf_counter()
+        build_lookup_index(results, 'customer_id', analysis_dir)
+        print(f"[RESULT] build             time={time.perf_counter() - start_time:8.3f}s")
+
+        start_time = time.perf_counter()
+        lookup = get_customer_lookup(analysis_dir)
+        print(f"[RESULT] open (mmap)       time={(time.perf_counter() - start_time) * 1e3:8.3f}ms")
+
+        ids = results['customer_id'].to_numpy()[rng.integers(0, args.rows, args.queries)].tolist()
+        latencies = []
+        for customer_id in ids:
+            start_time = time.perf_counter()
+            lookup.get(customer_id)
+            latencies.append(time.perf_counter() - start_time)
+        latencies = np.array(latencies) * 1e6
+        print(f"[RESULT] point lookup      p50={np.percentile(latencies, 50):8.1f}us  p99={np.percentile(latencies, 99):8.1f}us")
+
+        start_time = time.perf_counter()
+        lookup.get_many(ids[:args.batch])
+        print(f"[RESULT] batch of {args.batch:<6}  time={(time.perf_counter() - start_time) * 1e3:8.3f}ms")
+
+if __name__ == "__main__":
+    main()
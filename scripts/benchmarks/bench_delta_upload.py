@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# RFM Insights - Delta Upload Benchmark
+# Measures how the cost of merging a fixed-size delta upload into a
+# persisted lineage grows with the customer base, step by step (state
+# load, re-scoring, persistence, index rebuild), against re-running the
+# segment-only analysis on the whole base
+
+import os
+import sys
+import time
+import argparse
+import datetime
+import tempfile
+
+# Add the project root to the path so we can import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import numpy as np
+import pandas as pd
+
+from backend.rfm_analysis import analyze_rfm_data
+from backend.rfm_state import RFMState, clear_state_cache
+from backend.rfm_audience import refresh_customer_indexes
+
+def build_customers(rows, seed):
+    """Synthetic customer rows"""
+    rng = np.random.default_rng(seed)
+    today = pd.Timestamp(datetime.date.today())
+    return pd.DataFrame({
+        'customer_id': np.char.add('C', np.arange(rows).astype(str)),
+        'last_purchase_date': today - pd.to_timedelta(rng.integers(0, 730, rows), unit='D'),
+        'purchase_count': rng.integers(1, 50, rows),
+        'total_spent': rng.gamma(2.0, 120.0, rows).round(2)
+    })
+
+def build_delta(customers, rows, new_share, seed):
+    """Changed existing customers (a purchase today) followed by new ones"""
+    rng = np.random.default_rng(seed + 1)
+    new_rows = int(rows * new_share)
+    changed = customers.iloc[rng.choice(len(customers), rows - new_rows, replace=False)]
+    added = build_customers(new_rows, seed + 2)
+    return pd.DataFrame({
+        'customer_id': np.concatenate([changed['customer_id'].to_numpy(), np.char.add('N', added['customer_id'].to_numpy().astype(str))]),
+        'last_purchase_date': np.concatenate([
+            np.full(len(changed), np.datetime64(datetime.date.today(), 'ns')),
+            added['last_purchase_date'].to_numpy()
+        ]),
+        'purchase_count': np.concatenate([changed['purchase_count'].to_numpy() + 1, added['purchase_count'].to_numpy()]),
+        'total_spent': np.concatenate([
+            changed['total_spent'].to_numpy() + rng.gamma(2.0, 50.0, len(changed)).round(2),
+            added['total_spent'].to_numpy()
+        ])
+    })
+
+def timed(function, *args, **kwargs):
+    """Result and seconds of one call"""
+    start_time = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start_time
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark delta uploads against full re-analysis")
+    parser.add_argument("--customers", type=int, nargs="+", default=[100000, 1000000], help="Customers in the lineage")
+    parser.add_argument("--delta", type=int, default=1000, help="Customers per delta upload")
+    parser.add_argument("--new-share", type=float, default=0.2, help="Share of the delta that are new customers")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+
+    for rows in args.customers:
+        customers = build_customers(rows, args.seed)
+        delta = build_delta(customers, args.delta, args.new_share, args.seed)
+        with tempfile.TemporaryDirectory() as analysis_dir:
+            _, full = timed(
+                analyze_rfm_data, customers, 'customer_id', 'last_purchase_date', 'purchase_count', 'total_spent', 'ecommerce',
+                output_dir=analysis_dir, predictive=False
+            )
+            clear_state_cache()
+            state, load = timed(RFMState.load, analysis_dir)
+            summary, apply = timed(state.apply_delta, delta)
+            _, save = timed(state.save, analysis_dir)
+            _, indexes = timed(refresh_customer_indexes, state.customers, analysis_dir)
+        total = load + apply + save + indexes
+        print(f"[RESULT] {rows:>9} customers  delta={len(delta)} (re-scored {summary['rescored_customers']})  "
+              f"load={load:6.3f}s  apply={apply:6.3f}s  save={save:6.3f}s  indexes={indexes:6.3f}s  "
+              f"total={total:6.3f}s  full analysis={full:6.3f}s  ({full / total:4.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# RFM Insights - Event Ingestion Benchmark
+# Replays a synthetic purchase event log through the online RFM store
+
+import os
+import sys
+import time
+import argparse
+import datetime
+
+# Add the project root to the path so we can import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import numpy as np
+
+from backend.rfm_events import OnlineRFMStore
+
+def build_store(customers, seed):
+    """Build an in-memory store for a synthetic customer base"""
+    rng = np.random.default_rng(seed)
+    today = datetime.date.today().toordinal()
+    return OnlineRFMStore(
+        [f'C{i:07d}' for i in range(customers)],
+        today - rng.integers(0, 730, customers),
+        rng.integers(1, 40, customers),
+        rng.gamma(2.0, 150.0, customers).round(2)
+    )
+
+def build_event_log(events, customers, new_share, seed):
+    """Synthetic purchase log: mostly existing customers, some new ones"""
+    rng = np.random.default_rng(seed + 1)
+    now = datetime.datetime.now()
+    ids = rng.integers(0, int(customers * (1 + new_share)), events)
+    amounts = rng.gamma(2.0, 50.0, events).round(2)
+    return [(f'C{i:07d}', float(amount), now) for i, amount in zip(ids.tolist(), amounts)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark online purchase event ingestion")
+    parser.add_argument("--customers", type=int, default=500000, help="Customers in the seeded store")
+    parser.add_argument("--events", type=int, default=200000, help="Events in the replayed log")
+    parser.add_argument("--batch-size", type=int, default=500, help="Events per batched ingestion call")
+    parser.add_argument("--new-share", type=float, default=0.05, help="Share of events from previously unseen customers")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+
+    print(f"[INFO] Seeding store with {args.customers} customers")
+    start_time = time.perf_counter()
+    store = build_store(args.customers, args.seed)
+    print(f"[INFO] Store built in {time.perf_counter() - start_time:.2f}s")
+    events = build_event_log(args.events, args.customers, args.new_share, args.seed)
+
+    # Single-event calls, with per-event latency
+    single = events[:min(len(events), 50000)]
+    latencies = np.empty(len(single))
+    start_time = time.perf_counter()
+    for i, (customer_id, amount, timestamp) in enumerate(single):
+        event_start = time.perf_counter()
+        store.ingest(customer_id, amount, timestamp)
+        latencies[i] = time.perf_counter() - event_start
+    elapsed = time.perf_counter() - start_time
+    print(
+        f"[RESULT] single events   events={len(single):>8}  rate={len(single) / elapsed:10.0f}/s"
+        f"  p50={np.percentile(latencies, 50) * 1e6:7.1f}us  p99={np.percentile(latencies, 99) * 1e6:7.1f}us"
+    )
+
+    # Batched calls over the whole log
+    refreshes = 0
+    start_time = time.perf_counter()
+    for offset in range(0, len(events), args.batch_size):
+        refreshes += store.ingest_batch(events[offset:offset + args.batch_size])['boundaries_refreshed']
+    elapsed = time.perf_counter() - start_time
+    print(
+        f"[RESULT] batched events  events={len(events):>8}  rate={len(events) / elapsed:10.0f}/s"
+        f"  boundary_refreshes={refreshes}  customers={store.size}"
+    )
+
+if __name__ == "__main__":
+    main()
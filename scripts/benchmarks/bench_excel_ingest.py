@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# RFM Insights - Excel Ingestion Benchmark
+# Compares pandas.read_excel with the streaming read-only loader on a large workbook
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+import datetime
+
+# Add the project root to the path so we can import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import pandas as pd
+from openpyxl import Workbook
+
+from backend.data_loader import load_dataset
+
+COLUMNS = ['customer_id', 'last_purchase_date', 'purchase_count', 'total_spent']
+
+def build_workbook(path, rows, extra_columns):
+    """Write a synthetic customer workbook using openpyxl's write-only mode"""
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet()
+    extra = [f'extra_{i}' for i in range(extra_columns)]
+    worksheet.append(COLUMNS + extra)
+
+    today = datetime.datetime.now()
+    for i in range(rows):
+        worksheet.append(
+            [f'C{i:07d}', today - datetime.timedelta(days=i % 365), (i % 20) + 1, float((i * 37) % 5000)]
+            + [f'value {i}'] * extra_columns
+        )
+    workbook.save(path)
+
+def measure(label, func, trace_memory=False):
+    """Time func, optionally re-running it under tracemalloc for peak memory"""
+    start_time = time.perf_counter()
+    data = func()
+    elapsed = time.perf_counter() - start_time
+    result = f"[RESULT] {label:<22} rows={len(data):>8}  time={elapsed:8.2f}s"
+
+    if trace_memory:
+        # tracemalloc slows allocation-heavy code down a lot, so time separately
+        del data
+        tracemalloc.start()
+        data = func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result += f"  peak={peak / (1024 * 1024):8.1f} MB"
+
+    print(result)
+    return data
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Excel ingestion for RFM analysis")
+    parser.add_argument("--rows", type=int, default=100000, help="Number of customer rows")
+    parser.add_argument("--extra-columns", type=int, default=6, help="Unmapped columns added to each row")
+    parser.add_argument("--skip-pandas", action="store_true", help="Skip the pandas.read_excel baseline")
+    parser.add_argument("--trace-memory", action="store_true", help="Also report peak Python memory (runs each loader twice)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "customers.xlsx")
+        print(f"[INFO] Building workbook with {args.rows} rows and {args.extra_columns} extra columns")
+        build_workbook(path, args.rows, args.extra_columns)
+        print(f"[INFO] Workbook size: {os.path.getsize(path) / (1024 * 1024):.1f} MB")
+
+        if not args.skip_pandas:
+            measure("pandas.read_excel", lambda: pd.read_excel(path, usecols=COLUMNS), args.trace_memory)
+        measure("streaming loader", lambda: load_dataset(path, file_format='xlsx', columns=COLUMNS), args.trace_memory)
+
+if __name__ == "__main__":
+    main()
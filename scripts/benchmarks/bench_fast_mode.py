@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# RFM Insights - Fast Mode Benchmark
+# Compares the latency of a segment-only analysis (fast mode, no predictive
+# models) with the full analysis at several dataset sizes, in a warm process
+# and in a fresh interpreter (including the library imports)
+
+import io
+import os
+import sys
+import time
+import argparse
+import tempfile
+import datetime
+import subprocess
+
+# Add the project root to the path so we can import modules
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(ROOT)
+
+import numpy as np
+import pandas as pd
+
+from backend.rfm_planner import analyze_rfm_planned
+
+# Analysis run in a fresh interpreter: file path, fast mode flag
+COLD_SCRIPT = """
+import sys, time
+start_time = time.perf_counter()
+from backend.rfm_planner import analyze_rfm_planned
+with open(sys.argv[1], 'rb') as f:
+    analyze_rfm_planned(f.read(), 'customer_id', 'last_purchase_date', 'purchase_count', 'total_spent', 'ecommerce', predictive=sys.argv[2] != 'fast')
+print(time.perf_counter() - start_time)
+"""
+
+def build_csv(rows, seed):
+    """Synthetic customer rows as CSV bytes"""
+    rng = np.random.default_rng(seed)
+    today = pd.Timestamp(datetime.date.today())
+    data = pd.DataFrame({
+        'customer_id': np.char.add('C', np.arange(rows).astype(str)),
+        'last_purchase_date': (today - pd.to_timedelta(rng.integers(0, 730, rows), unit='D')).strftime('%Y-%m-%d'),
+        'purchase_count': rng.integers(1, 50, rows),
+        'total_spent': rng.gamma(2.0, 120.0, rows).round(2)
+    })
+    buffer = io.BytesIO()
+    data.to_csv(buffer, index=False)
+    return buffer.getvalue()
+
+def run(contents, predictive, output_dir):
+    """Seconds of one planned analysis persisted to output_dir"""
+    start_time = time.perf_counter()
+    analyze_rfm_planned(contents, 'customer_id', 'last_purchase_date', 'purchase_count', 'total_spent', 'ecommerce', output_dir=output_dir, predictive=predictive)
+    return time.perf_counter() - start_time
+
+def run_cold(path, mode):
+    """Seconds of one analysis in a fresh interpreter, imports included"""
+    output = subprocess.run([sys.executable, '-c', COLD_SCRIPT, path, mode], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fast mode against the full analysis")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 50000], help="Customers")
+    parser.add_argument("--repeat", type=int, default=3, help="Warm runs per mode (best is reported)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for rows in args.rows:
+            contents = build_csv(rows, args.seed)
+            path = os.path.join(tmp_dir, f"customers_{rows}.csv")
+            with open(path, 'wb') as f:
+                f.write(contents)
+            cold = {mode: run_cold(path, mode) for mode in ('fast', 'full')}
+            warm = {
+                mode: min(run(contents, mode == 'full', os.path.join(tmp_dir, f"{mode}_{rows}_{index}")) for index in range(args.repeat))
+                for mode in ('fast', 'full')
+            }
+            print(f"[RESULT] {rows:>8} customers  warm: fast={warm['fast']:7.3f}s  full={warm['full']:7.3f}s  ({warm['full'] / warm['fast']:5.1f}x)  "
+                  f"cold: fast={cold['fast']:7.3f}s  full={cold['full']:7.3f}s  ({cold['full'] / cold['fast']:5.1f}x)")
+
+if __name__ == "__main__":
+    main()
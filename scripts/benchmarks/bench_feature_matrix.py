@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# RFM Insights - Feature Matrix Benchmark
+# Compares the model features built as a DataFrame (get_dummies + concat on a
+# copy of the RFM data) with the contiguous float32 feature matrix: build
+# time, traced peak memory and the fit time of the three predictive models
+
+import os
+import sys
+import time
+import argparse
+import datetime
+import tracemalloc
+
+# Add the project root to the path so we can import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from sklearn.cluster import KMeans
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+
+from backend.rfm_analysis import RFMAnalysis, build_feature_matrix
+
+def build_segments(rows, seed):
+    """Scored and segmented synthetic customers"""
+    rng = np.random.default_rng(seed)
+    today = pd.Timestamp(datetime.date.today())
+    data = pd.DataFrame({
+        'customer_id': np.char.add('C', np.arange(rows).astype(str)),
+        'last_purchase_date': today - pd.to_timedelta(rng.integers(0, 730, rows), unit='D'),
+        'purchase_count': rng.integers(1, 50, rows),
+        'total_spent': rng.gamma(2.0, 120.0, rows).round(2)
+    })
+    rfm = RFMAnalysis(data, 'customer_id', 'last_purchase_date', 'purchase_count', 'total_spent', 'ecommerce')
+    return rfm.segment_customers(), rfm.rule_set.segment_names
+
+def frame_features(segments, segment_names):
+    """Features as built before the matrix: a DataFrame of the RFM columns and dummies"""
+    df = segments.copy()
+    features = df[['r_score', 'f_score', 'm_score', 'rfm_score', 'recency_days']]
+    segment_dummies = pd.get_dummies(df['segment'], prefix='segment')
+    return pd.concat([features, segment_dummies], axis=1)
+
+def matrix_features(segments, segment_names):
+    """Features as the float32 matrix"""
+    return build_feature_matrix(segments, segment_names)[0]
+
+def fit_models(features, segments):
+    """Fit the churn, clustering and LTV models, returning their fit times"""
+    churn = ((segments['r_score'] <= 2) & (segments['f_score'] <= 2)).to_numpy()
+    ltv = segments['total_spent'].to_numpy(dtype=float)
+    rfm_columns = features[:, :3] if isinstance(features, np.ndarray) else features[['r_score', 'f_score', 'm_score']]
+
+    timings = {}
+    start_time = time.perf_counter()
+    RandomForestClassifier(n_estimators=100, random_state=42).fit(features, churn)
+    timings['churn'] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    KMeans(n_clusters=4, n_init=10, random_state=42).fit(StandardScaler().fit_transform(rfm_columns))
+    timings['kmeans'] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    xgb.XGBRegressor(objective='reg:squarederror', n_estimators=100, random_state=42).fit(features, ltv)
+    timings['ltv'] = time.perf_counter() - start_time
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the float32 feature matrix")
+    parser.add_argument("--rows", type=int, nargs="+", default=[100000, 500000], help="Customers")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        segments, segment_names = build_segments(rows, args.seed)
+        print(f"[INFO] {rows} customers, {len(segment_names)} segments")
+        for label, build in (("DataFrame", frame_features), ("float32", matrix_features)):
+            start_time = time.perf_counter()
+            features = build(segments, segment_names)
+            elapsed = time.perf_counter() - start_time
+
+            # Peak memory of a second, traced build
+            tracemalloc.start()
+            build(segments, segment_names)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            timings = fit_models(features, segments)
+            print(f"[RESULT] {label:<9}  build={elapsed:7.3f}s  peak={peak / 2 ** 20:7.1f}MB  "
+                  f"churn fit={timings['churn']:7.2f}s  kmeans fit={timings['kmeans']:6.2f}s  ltv fit={timings['ltv']:6.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# RFM Insights - Grouped RFM Benchmark
+# Compares one RFM analysis per group with a single grouped analysis
+
+import os
+import sys
+import time
+import argparse
+import datetime
+
+# Add the project root to the path so we can import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import numpy as np
+import pandas as pd
+
+from backend.rfm_analysis import RFMAnalysis
+
+def build_customers(rows, groups, seed):
+    """Synthetic customer rows spread over groups (e.g. stores)"""
+    rng = np.random.default_rng(seed)
+    today = pd.Timestamp(datetime.date.today())
+    return pd.DataFrame({
+        'store': rng.integers(0, groups, rows).astype(str),
+        'customer_id': np.arange(rows),
+        'last_purchase_date': today - pd.to_timedelta(rng.integers(0, 730, rows), unit='D'),
+        'purchase_count': np.where(rng.random(rows) < 0.6, 1, rng.integers(2, 60, rows)),
+        'total_spent': rng.gamma(2.0, 150.0, rows).round(2)
+    })
+
+def per_group(data):
+    """Previous workflow: one analysis per group"""
+    results = {}
+    for store, customers in data.groupby('store'):
+        rfm = RFMAnalysis(customers, 'customer_id', 'last_purchase_date', 'purchase_count', 'total_spent', 'ecommerce')
+        rfm.segment_customers()
+        results[store] = (rfm.get_segment_counts(), rfm.get_treemap_data(), rfm.get_polar_area_data())
+    return results
+
+def grouped(data):
+    """Single grouped analysis"""
+    rfm = RFMAnalysis(data, 'customer_id', 'last_purchase_date', 'purchase_count', 'total_spent', 'ecommerce', group_col='store')
+    return rfm.get_group_results()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark grouped RFM analysis")
+    parser.add_argument("--rows", type=int, default=1000000, help="Number of customers")
+    parser.add_argument("--groups", type=int, nargs="+", default=[10, 100, 1000], help="Numbers of groups")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+
+    for groups in args.groups:
+        print(f"[INFO] {args.rows} customers in {groups} groups")
+        data = build_customers(args.rows, groups, args.seed)
+        for label, func in (("per-group loop", per_group), ("grouped", grouped)):
+            start_time = time.perf_counter()
+            results = func(data)
+            elapsed = time.perf_counter() - start_time
+            print(f"[RESULT] {label:<16} groups={len(results):<6} time={elapsed:8.3f}s")
+
+if __name__ == "__main__":
+    main()
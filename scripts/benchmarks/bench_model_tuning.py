@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# RFM Insights - Model Tuning Benchmark
+# Runs the successive-halving hyperparameter search under several time
+# budgets and compares the held-out quality and fit time of the churn and
+# LTV models trained with the default and the tuned configurations
+
+import os
+import sys
+import argparse
+import datetime
+
+# Add the project root to the path so we can import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import numpy as np
+import pandas as pd
+
+from backend.rfm_analysis import RFMAnalysis, PredictiveAnalytics
+from backend.rfm_tuning import tune_models, _log_loss
+from backend.cpu_quota import available_cpus
+
+def build_segments(rows, seed):
+    """Scored and segmented synthetic customers"""
+    rng = np.random.default_rng(seed)
+    today = pd.Timestamp(datetime.date.today())
+    data = pd.DataFrame({
+        'customer_id': np.arange(rows),
+        'last_purchase_date': today - pd.to_timedelta(rng.integers(0, 730, rows), unit='D'),
+        'purchase_count': rng.integers(1, 50, rows),
+        'total_spent': rng.gamma(2.0, 120.0, rows).round(2)
+    })
+    rfm = RFMAnalysis(data, 'customer_id', 'last_purchase_date', 'purchase_count', 'total_spent', 'ecommerce')
+    return rfm.segment_customers(), rfm.rule_set.segment_names
+
+def train(segments, segment_names, settings):
+    """Fit the churn and LTV models; held-out churn log loss, LTV R² and fit seconds"""
+    predictive = PredictiveAnalytics(segments.copy(), settings=settings, segment_names=segment_names, monetary_col='total_spent')
+    churn = predictive.predict_churn()
+    ltv = predictive.predict_ltv()
+    _, test_rows = predictive._split_rows()
+    log_loss = _log_loss(predictive.churn_target()[test_rows], predictive.rfm_data['churn_probability'].to_numpy()[test_rows])
+    return log_loss, ltv['metrics']['r2'], churn['training']['fit_seconds'] + ltv['training']['fit_seconds']
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark time-budgeted model tuning")
+    parser.add_argument("--rows", type=int, default=200000, help="Customers")
+    parser.add_argument("--budgets", type=float, nargs="+", default=[10, 30, 120], help="Tuning budgets (seconds)")
+    parser.add_argument("--workers", type=int, default=None, help="Configurations fitted at once (all available CPUs when omitted)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+
+    segments, segment_names = build_segments(args.rows, args.seed)
+    print(f"[INFO] {args.rows} customers, {available_cpus()} CPUs available")
+    log_loss, r2, fit_seconds = train(segments, segment_names, {})
+    print(f"[RESULT] default          churn log loss={log_loss:.3e}  ltv r2={r2:.4f}  fit={fit_seconds:6.2f}s")
+
+    for budget in args.budgets:
+        predictive = PredictiveAnalytics(segments.copy(), segment_names=segment_names, monetary_col='total_spent')
+        search = tune_models(predictive, time_budget=budget, workers=args.workers)
+        rungs = {model: f"{sum(1 for rung in search[model]['rungs'] if rung['evaluated'] == rung['candidates'])}/{len(search[model]['rungs'])}" for model in ('churn', 'ltv')}
+        settings = {'churn_params': search['churn']['params'], 'ltv_params': search['ltv']['params']}
+        log_loss, r2, fit_seconds = train(segments, segment_names, settings)
+        print(f"[RESULT] budget={budget:5.0f}s  churn log loss={log_loss:.3e}  ltv r2={r2:.4f}  fit={fit_seconds:6.2f}s  "
+              f"search={search['elapsed_seconds']:6.2f}s  rungs churn={rungs['churn']} ltv={rungs['ltv']}")
+        print(f"[INFO]   churn {search['churn']['params']}  ltv {search['ltv']['params']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# RFM Insights - Partitioned RFM Engine Benchmark
+# Compares the single-process RFMAnalysis with the multi-process partitioned engine
+
+import os
+import sys
+import time
+import argparse
+import datetime
+
+# Add the project root to the path so we can import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import numpy as np
+import pandas as pd
+
+from backend.rfm_analysis import RFMAnalysis
+from backend.rfm_parallel import analyze_rfm_partitioned, DEFAULT_WORKERS
+
+COLUMNS = ('customer_id', 'last_purchase_date', 'purchase_count', 'total_spent', 'ecommerce')
+
+def build_customers(rows, seed):
+    """Synthetic customer table with a skewed frequency distribution"""
+    rng = np.random.default_rng(seed)
+    today = pd.Timestamp(datetime.date.today())
+    return pd.DataFrame({
+        'customer_id': np.char.add('C', np.arange(rows).astype(str)),
+        'last_purchase_date': today - pd.to_timedelta(rng.integers(0, 730, rows), unit='D'),
+        'purchase_count': np.where(rng.random(rows) < 0.5, 1, rng.integers(2, 60, rows)),
+        'total_spent': rng.gamma(2.0, 150.0, rows).round(2)
+    })
+
+def single_process(data):
+    """Segment counts from the single-process path"""
+    rfm = RFMAnalysis(data, *COLUMNS)
+    rfm.segment_customers()
+    return rfm.get_segment_counts()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the partitioned multi-process RFM engine")
+    parser.add_argument("--rows", type=int, default=2000000, help="Number of customer rows")
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, DEFAULT_WORKERS], help="Worker counts to measure")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+
+    print(f"[INFO] Building {args.rows} customers ({DEFAULT_WORKERS} CPUs available)")
+    data = build_customers(args.rows, args.seed)
+
+    start_time = time.perf_counter()
+    expected = single_process(data)
+    print(f"[RESULT] single process   time={time.perf_counter() - start_time:8.2f}s")
+
+    for workers in args.workers:
+        start_time = time.perf_counter()
+        results = analyze_rfm_partitioned(data, *COLUMNS, workers=workers)
+        elapsed = time.perf_counter() - start_time
+        matches = results['rfm_analysis']['segment_counts'] == expected
+        print(f"[RESULT] workers={workers:<3}      time={elapsed:8.2f}s  segment_counts_match={matches}")
+
+if __name__ == "__main__":
+    main()
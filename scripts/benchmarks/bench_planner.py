@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# RFM Insights - Execution Planner Benchmark
+# Runs uploads of several sizes through the execution planner and compares
+# its estimates and engine choice with the actual rows, customers and timings
+
+import io
+import os
+import sys
+import time
+import argparse
+import datetime
+
+# Add the project root to the path so we can import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import numpy as np
+import pandas as pd
+
+from backend.rfm_planner import analyze_rfm_planned
+
+def build_csv(rows, customers, seed):
+    """Synthetic order lines (skewed purchases per customer) as CSV bytes"""
+    rng = np.random.default_rng(seed)
+    today = pd.Timestamp(datetime.date.today())
+    weights = rng.lognormal(0.0, 1.0, customers)
+    data = pd.DataFrame({
+        'customer_id': rng.choice(customers, rows, p=weights / weights.sum()),
+        'order_date': (today - pd.to_timedelta(rng.integers(0, 730, rows), unit='D')).strftime('%Y-%m-%d'),
+        'amount': rng.gamma(2.0, 60.0, rows).round(2)
+    })
+    buffer = io.BytesIO()
+    data.to_csv(buffer, index=False)
+    return buffer.getvalue()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the execution planner")
+    parser.add_argument("--rows", type=int, nargs="+", default=[5000, 500000, 5000000], help="Order lines per upload")
+    parser.add_argument("--lines-per-customer", type=float, default=8.0, help="Average order lines per customer")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes available to the parallel engine")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        customers = max(int(rows / args.lines_per_customer), 1)
+        contents = build_csv(rows, customers, args.seed)
+        print(f"[INFO] {rows} order lines ({len(contents) / 2 ** 20:.1f}MB)")
+
+        # Segment summaries only, so every engine is eligible
+        start_time = time.perf_counter()
+        results = analyze_rfm_planned(contents, 'customer_id', 'order_date', None, 'amount', 'ecommerce', input_mode='transaction', summary_only=True, workers=args.workers)
+        elapsed = time.perf_counter() - start_time
+        plan = results['execution_plan']
+        estimates = plan['estimates']
+        print(f"[RESULT] engine={plan['engine']:<9}  planning={plan['planning_seconds']:7.3f}s  total={elapsed:8.3f}s")
+        print(f"[RESULT] rows      estimated={estimates['rows']:>9}  actual={plan['actual']['rows']:>9}  error={plan['errors']['rows']:+.2%}")
+        print(f"[RESULT] customers estimated={estimates['customers']:>9}  actual={plan['actual']['customers']:>9}  error={plan['errors']['customers']:+.2%}")
+        print(f"[INFO] {'; '.join(plan['reasons'])}")
+
+if __name__ == "__main__":
+    main()
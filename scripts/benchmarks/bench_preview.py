@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# RFM Insights - Preview Analysis Benchmark
+# Compares the full RFM segmentation of a CSV file with the sample-based preview
+
+import io
+import os
+import sys
+import time
+import argparse
+import datetime
+
+# Add the project root to the path so we can import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import numpy as np
+import pandas as pd
+
+from backend.data_loader import load_dataset
+from backend.rfm_analysis import RFMAnalysis, analyze_rfm_data
+
+def build_csv(rows, seed):
+    """Synthetic customer rows as CSV bytes"""
+    rng = np.random.default_rng(seed)
+    today = pd.Timestamp(datetime.date.today())
+    data = pd.DataFrame({
+        'customer_id': np.arange(rows),
+        'last_purchase_date': (today - pd.to_timedelta(rng.integers(0, 730, rows), unit='D')).strftime('%Y-%m-%d'),
+        'purchase_count': np.where(rng.random(rows) < 0.6, 1, rng.integers(2, 60, rows)),
+        'total_spent': rng.gamma(2.0, 150.0, rows).round(2)
+    })
+    buffer = io.BytesIO()
+    data.to_csv(buffer, index=False)
+    return buffer.getvalue()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark preview analyses")
+    parser.add_argument("--rows", type=int, default=5000000, help="Number of customers")
+    parser.add_argument("--sample-size", type=int, default=100000, help="Customers scored by the preview")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+
+    print(f"[INFO] {args.rows} customers, preview sample of {args.sample_size}")
+    contents = build_csv(args.rows, args.seed)
+    columns = ['customer_id', 'last_purchase_date', 'purchase_count', 'total_spent']
+
+    # The full run also trains the predictive models, which the preview skips
+    start_time = time.perf_counter()
+    data = load_dataset(contents, file_format='csv', columns=columns)
+    full = RFMAnalysis(data, *columns, 'ecommerce').get_segment_counts()
+    print(f"[RESULT] full segmentation  time={time.perf_counter() - start_time:8.3f}s  (without predictive models)")
+
+    start_time = time.perf_counter()
+    preview = analyze_rfm_data(contents, *columns, 'ecommerce', file_format='csv', preview=True, sample_size=args.sample_size)
+    print(f"[RESULT] preview            time={time.perf_counter() - start_time:8.3f}s")
+
+    total = sum(full.values())
+    shares = preview['rfm_analysis']['segment_shares']
+    errors = [abs(values['share'] - full.get(segment, 0) / total) for segment, values in shares.items()]
+    widths = [values['upper'] - values['lower'] for values in shares.values()]
+    covered = sum(values['lower'] <= full.get(segment, 0) / total <= values['upper'] for segment, values in shares.items())
+    print(f"[INFO] Max share error {max(errors):.4f}, mean interval width {np.mean(widths):.4f}, {covered}/{len(shares)} intervals cover the full shares")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# RFM Insights - Real-time Scoring Benchmark
+# Compares concurrent single-customer scoring requests served one model call
+# per request with micro-batched serving (throughput, p50/p99 latency and
+# batch sizes)
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import datetime
+import tempfile
+
+# Add the project root to the path so we can import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import numpy as np
+import pandas as pd
+
+from backend.rfm_analysis import analyze_rfm_data
+from backend.rfm_realtime import MicroBatcher, realtime_stats, reset_realtime_stats
+
+def build_customers(rows, seed, offset=0):
+    """Synthetic customer rows with ISO dates, as sent by a client"""
+    rng = np.random.default_rng(seed)
+    today = pd.Timestamp(datetime.date.today())
+    return pd.DataFrame({
+        'customer_id': np.arange(offset, offset + rows),
+        'last_purchase_date': (today - pd.to_timedelta(rng.integers(0, 730, rows), unit='D')).strftime('%Y-%m-%d'),
+        'purchase_count': rng.integers(1, 50, rows),
+        'total_spent': rng.gamma(2.0, 120.0, rows).round(2)
+    })
+
+async def run_clients(batcher, rows, clients):
+    """Closed loop: each client sends its next request once answered"""
+    async def client(index):
+        for row in rows[index::clients]:
+            await batcher.score(row)
+    await asyncio.gather(*[client(index) for index in range(clients)])
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark micro-batched real-time scoring")
+    parser.add_argument("--train-rows", type=int, default=50000, help="Customers of the trained analysis")
+    parser.add_argument("--requests", type=int, default=5000, help="Scoring requests")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 16, 64], help="Concurrent clients")
+    parser.add_argument("--window-ms", type=float, default=2.0, help="Micro-batch window")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        analysis_dir = os.path.join(tmp_dir, 'analysis')
+        analyze_rfm_data(build_customers(args.train_rows, args.seed), 'customer_id', 'last_purchase_date', 'purchase_count', 'total_spent', 'ecommerce', output_dir=analysis_dir, model_settings={'silhouette_sample_size': 10000})
+        rows = build_customers(args.requests, args.seed + 1, offset=args.train_rows).to_dict('records')
+        print(f"[INFO] Trained on {args.train_rows} customers; {args.requests} requests per run")
+
+        for clients in args.clients:
+            # max_size=1 scores every request on its own
+            for label, batcher in (("per request", MicroBatcher(analysis_dir, window_ms=0, max_size=1)),
+                                   ("micro-batch", MicroBatcher(analysis_dir, window_ms=args.window_ms))):
+                reset_realtime_stats()
+                start_time = time.perf_counter()
+                asyncio.run(run_clients(batcher, rows, clients))
+                elapsed = time.perf_counter() - start_time
+                stats = realtime_stats()
+                print(f"[RESULT] clients={clients:>3}  {label:<11}  {args.requests / elapsed:8.0f} req/s  "
+                      f"p50={stats['latency_ms']['p50']:8.2f}ms  p99={stats['latency_ms']['p99']:8.2f}ms  "
+                      f"mean batch={stats['mean_batch_size']:6.1f}")
+
+if __name__ == "__main__":
+    main()
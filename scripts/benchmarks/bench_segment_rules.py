@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# RFM Insights - Segment Rules Benchmark
+# Compares per-customer rule evaluation with compiled rule-set lookups
+
+import os
+import sys
+import time
+import argparse
+
+# Add the project root to the path so we can import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import numpy as np
+
+from backend.segment_rules import BUILTIN_RULE_SETS, builtin_rule_set, compile_rule_set
+
+def custom_rule_set(rules, seed):
+    """Random custom rule set with the given number of rules"""
+    rng = np.random.default_rng(seed)
+    definition = {'name': f"custom-{rules}", 'rules': []}
+    for position in range(rules):
+        rule = {'segment': f"Segmento {position % 12}"}
+        for dimension in ('r', 'f', 'm'):
+            low = int(rng.integers(1, 5))
+            rule[dimension] = [low, int(rng.integers(low, 5))]
+        definition['rules'].append(rule)
+    return definition
+
+def interpreted(rule_set, r, f, m):
+    """Evaluate the rules in order for every customer (no compilation)"""
+    rules = rule_set['rules']
+    segments = []
+    for scores in zip(r.tolist(), f.tolist(), m.tolist()):
+        for rule in rules:
+            if all(rule[dimension][0] <= score <= rule[dimension][1] for dimension, score in zip('rfm', scores)):
+                segments.append(rule['segment'])
+                break
+        else:
+            segments.append(rule_set['default'])
+    return segments
+
+def measure(label, func, repeat):
+    """Best-of-repeat timing"""
+    best = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"[RESULT] {label:<28} time={best:8.3f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark segment rule evaluation")
+    parser.add_argument("--rows", type=int, default=1000000, help="Number of customers")
+    parser.add_argument("--rules", type=int, default=40, help="Rules in the custom rule set")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement (best is reported)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+
+    print(f"[INFO] Scoring {args.rows} customers")
+    rng = np.random.default_rng(args.seed)
+    r, f, m = (rng.integers(1, 5, args.rows) for _ in range(3))
+
+    builtin = builtin_rule_set('ecommerce')
+    definition = custom_rule_set(args.rules, args.seed)
+    start_time = time.perf_counter()
+    custom = compile_rule_set(definition)
+    print(f"[INFO] Compiled {args.rules} rules in {time.perf_counter() - start_time:.4f}s (hash {custom.hash})")
+
+    measure("interpreted ecommerce", lambda: interpreted(builtin.definition, r, f, m), 1)
+    measure(f"interpreted custom ({args.rules})", lambda: interpreted(custom.definition, r, f, m), 1)
+    measure(f"compiled custom ({args.rules})", lambda: custom.segments(r, f, m), args.repeat)
+    for name in BUILTIN_RULE_SETS:
+        measure(f"compiled {name}", lambda: builtin_rule_set(name).segments(r, f, m), args.repeat)
+
+if __name__ == "__main__":
+    main()
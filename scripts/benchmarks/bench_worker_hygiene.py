@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# RFM Insights - Worker Memory Hygiene Benchmark
+# Measures the resident memory a worker keeps after an RFM analysis of order
+# lines, before and after the explicit cleanup (gc and allocator trim)
+
+import io
+import os
+import sys
+import time
+import argparse
+import datetime
+
+# Add the project root to the path so we can import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import numpy as np
+import pandas as pd
+
+from backend.rfm_analysis import RFMAnalysis
+from backend.data_loader import load_dataset
+from backend.worker_hygiene import current_rss, release_memory
+
+def build_csv(rows, customers, seed):
+    """Synthetic order lines as CSV bytes"""
+    rng = np.random.default_rng(seed)
+    today = pd.Timestamp(datetime.date.today())
+    data = pd.DataFrame({
+        'customer_id': np.char.add('C', rng.integers(0, customers, rows).astype(str)),
+        'order_date': (today - pd.to_timedelta(rng.integers(0, 730, rows), unit='D')).strftime('%Y-%m-%d'),
+        'amount': rng.gamma(2.0, 60.0, rows).round(2)
+    })
+    buffer = io.BytesIO()
+    data.to_csv(buffer, index=False)
+    return buffer.getvalue()
+
+def run_analysis(contents):
+    """Segment the order lines, keeping only the segment counts"""
+    data = load_dataset(contents, file_format='csv', columns=['customer_id', 'order_date', 'amount'])
+    return RFMAnalysis(data, 'customer_id', 'order_date', None, 'amount', 'ecommerce', input_mode='transaction').get_segment_counts()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark worker memory hygiene")
+    parser.add_argument("--rows", type=int, default=3000000, help="Number of order lines")
+    parser.add_argument("--customers", type=int, default=500000, help="Number of customers")
+    parser.add_argument("--jobs", type=int, default=3, help="Consecutive analyses")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+
+    contents = build_csv(args.rows, args.customers, args.seed)
+    print(f"[INFO] {args.rows} order lines ({len(contents) / 2 ** 20:.1f}MB), baseline RSS {current_rss() / 2 ** 20:.1f}MB")
+
+    for job in range(args.jobs):
+        rss_before = current_rss()
+        run_analysis(contents)
+        rss_after = current_rss()
+        start_time = time.perf_counter()
+        cleanup = release_memory()
+        print(f"[RESULT] job {job + 1}  before={rss_before / 2 ** 20:7.1f}MB  after={rss_after / 2 ** 20:7.1f}MB  "
+              f"cleaned={cleanup['rss_after'] / 2 ** 20:7.1f}MB  released={cleanup['released_bytes'] / 2 ** 20:7.1f}MB  "
+              f"trimmed={cleanup['trimmed']}  cleanup={time.perf_counter() - start_time:.3f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+# RFM Insights - Unit Tests for Data Loading Module
+
+import io
+import unittest
+import datetime
+from unittest import mock
+import pandas as pd
+from backend.data_loader import detect_format, get_column_names, load_dataset, preview_dataset
+from backend.rfm_analysis import RFMAnalysis
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.feather as feather
+    import pyarrow.ipc as ipc
+except ImportError:
+    pa = None
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+class TestDataLoader(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a typed sample dataset"""
+        now = datetime.datetime.now()
+        self.test_data = pd.DataFrame({
+            'customer_id': ['C001', 'C002', 'C003', 'C004'],
+            'last_purchase_date': pd.to_datetime([now - datetime.timedelta(days=d) for d in (3, 30, 90, 200)]),
+            'purchase_count': [12, 6, 2, 1],
+            'total_spent': [1200.0, 600.0, 150.0, 30.0],
+            'notes': ['a', 'b', 'c', 'd']
+        })
+        self.columns = ['customer_id', 'last_purchase_date', 'purchase_count', 'total_spent']
+
+    def _to_bytes(self, file_format):
+        """Serialize the sample dataset in the given format"""
+        sink = io.BytesIO()
+        if file_format == 'csv':
+            self.test_data.to_csv(sink, index=False)
+            return sink.getvalue()
+        table = pa.Table.from_pandas(self.test_data, preserve_index=False)
+        if file_format == 'parquet':
+            pq.write_table(table, sink)
+        elif file_format == 'feather':
+            feather.write_feather(table, sink)
+        else:
+            with ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        return sink.getvalue()
+
+    def test_detect_format(self):
+        """Test format detection from file extensions"""
+        self.assertEqual(detect_format('data.csv'), 'csv')
+        self.assertEqual(detect_format('data.PARQUET'), 'parquet')
+        self.assertEqual(detect_format('data.feather'), 'feather')
+        self.assertEqual(detect_format('data.arrow'), 'arrow')
+        self.assertEqual(detect_format(None), 'csv')
+        self.assertEqual(detect_format('data'), 'csv')
+        with self.assertRaises(ValueError):
+            detect_format('data.xls')
+
+    def test_csv_projection(self):
+        """Test that CSV loading reads only the requested columns"""
+        data = load_dataset(self._to_bytes('csv'), 'csv', columns=self.columns)
+        self.assertEqual(list(data.columns), self.columns)
+        self.assertIn('notes', get_column_names(self._to_bytes('csv'), 'csv'))
+
+    @unittest.skipIf(pa is None, "pyarrow not installed")
+    def test_columnar_formats_keep_types(self):
+        """Test projection and typed columns for Parquet, Feather and Arrow IPC"""
+        for file_format in ('parquet', 'feather', 'arrow'):
+            contents = self._to_bytes(file_format)
+            self.assertIn('notes', get_column_names(contents, file_format))
+
+            data = load_dataset(contents, file_format, columns=self.columns)
+            self.assertEqual(sorted(data.columns), sorted(self.columns))
+            self.assertTrue(pd.api.types.is_datetime64_any_dtype(data['last_purchase_date']))
+            self.assertTrue(pd.api.types.is_numeric_dtype(data['total_spent']))
+
+    @unittest.skipIf(pa is None, "pyarrow not installed")
+    def test_arrow_column_names_from_header(self):
+        """Test that Arrow IPC column names are read without decoding the batches"""
+        from backend import data_loader
+        table = pa.Table.from_pandas(self.test_data, preserve_index=False)
+        sink = io.BytesIO()
+        with ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        with mock.patch.object(data_loader, '_read_arrow_table', side_effect=AssertionError("batches read")):
+            for contents in (self._to_bytes('arrow'), sink.getvalue()):
+                self.assertEqual(get_column_names(contents, 'arrow'), list(self.test_data.columns))
+
+    @unittest.skipIf(pa is None, "pyarrow not installed")
+    def test_parquet_input_matches_csv_input(self):
+        """Test that Parquet and CSV inputs produce the same recency values"""
+        results = []
+        for file_format in ('csv', 'parquet'):
+            data = load_dataset(self._to_bytes(file_format), file_format, columns=self.columns)
+            rfm = RFMAnalysis(data, 'customer_id', 'last_purchase_date', 'purchase_count', 'total_spent', 'ecommerce')
+            results.append(rfm.preprocess_data()['recency_days'].tolist())
+        self.assertEqual(results[0], results[1])
+
+    @unittest.skipIf(openpyxl is None, "openpyxl not installed")
+    def test_xlsx_streaming(self):
+        """Test streaming Excel ingestion with projection across batches"""
+        from backend import data_loader
+
+        sink = io.BytesIO()
+        self.test_data.to_excel(sink, index=False)
+        contents = sink.getvalue()
+        self.assertIn('notes', get_column_names(contents, 'xlsx'))
+
+        # A batch size smaller than the row count exercises batch concatenation
+        data = data_loader._read_excel_streaming(contents, columns=self.columns, batch_size=3)
+
+        self.assertEqual(list(data.columns), self.columns)
+        self.assertEqual(len(data), 4)
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(data['last_purchase_date']))
+        self.assertEqual(data['purchase_count'].tolist(), [12, 6, 2, 1])
+
+        # Integer IDs keep their text, with or without blank cells
+        sink = io.BytesIO()
+        pd.DataFrame({'customer_id': [101, 102, None, 104], 'total_spent': [10, 20.5, 30, 40]}).to_excel(sink, index=False)
+        data = data_loader._read_excel_streaming(sink.getvalue(), batch_size=2)
+        self.assertEqual(data['customer_id'].astype(str).tolist()[:2], ['101', '102'])
+        self.assertEqual(data['customer_id'].tolist()[3], 104)
+        self.assertEqual(data['total_spent'].tolist(), [10.0, 20.5, 30.0, 40.0])
+
+        # Batches typed differently are read as the whole column would be
+        sink = io.BytesIO()
+        pd.DataFrame({
+            'customer_id': [101, None, 102, 103],
+            'last_purchase_date': [datetime.datetime(2024, 1, 5), 7, None, datetime.datetime(2024, 2, 1)],
+            'total_spent': [10, 20.5, None, 40]
+        }).to_excel(sink, index=False)
+        data = data_loader._read_excel_streaming(sink.getvalue(), batch_size=1)
+        expected = data_loader._read_excel_streaming(sink.getvalue())
+        pd.testing.assert_frame_equal(data, expected)
+        self.assertEqual(data['customer_id'].tolist(), [101, None, 102, 103])
+        self.assertEqual(data['last_purchase_date'].tolist()[:2], [datetime.datetime(2024, 1, 5), 7])
+        self.assertEqual(data['total_spent'].tolist()[:2], [10.0, 20.5])
+
+    def test_preview_from_csv_prefix(self):
+        """Test column preview and mapping suggestion from a truncated CSV prefix"""
+        contents = self._to_bytes('csv')
+        prefix = contents[:contents.index(b'\n', contents.index(b'\n') + 1) + 10]
+        preview = preview_dataset(prefix, 'csv', sample_rows=2, truncated=True)
+
+        self.assertEqual(preview['rows_sampled'], 1)
+        types = {col['name']: col['type'] for col in preview['columns']}
+        self.assertEqual(types['last_purchase_date'], 'datetime')
+        self.assertEqual(types['purchase_count'], 'integer')
+        self.assertEqual(preview['suggested_mapping'], {
+            'user_id': 'customer_id',
+            'recency': 'last_purchase_date',
+            'frequency': 'purchase_count',
+            'monetary': 'total_spent'
+        })
+
+    @unittest.skipIf(pa is None, "pyarrow not installed")
+    def test_preview_columnar_formats(self):
+        """Test column preview for Parquet and Arrow IPC files"""
+        for file_format in ('parquet', 'arrow'):
+            preview = preview_dataset(self._to_bytes(file_format), file_format, sample_rows=3)
+            self.assertEqual(len(preview['columns']), 5)
+            self.assertEqual(len(preview['columns'][0]['sample_values']), 3)
+            self.assertEqual(preview['suggested_mapping']['recency'], 'last_purchase_date')
+
+    def test_unsupported_format(self):
+        """Test that unknown formats are rejected"""
+        with self.assertRaises(ValueError):
+            load_dataset(b'', 'xml')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+# RFM Insights - Unit Tests for Memory Budget Module
+
+import io
+import os
+import tempfile
+import unittest
+import datetime
+from unittest import mock
+import numpy as np
+import pandas as pd
+from backend import rfm_analysis, rfm_planner
+from backend.memory_budget import MemoryBudget, MemoryBudgetExceeded
+from backend.rfm_analysis import aggregate_transaction_chunks, analyze_rfm_data
+from backend.rfm_planner import analyze_rfm_planned
+
+class TestMemoryBudget(unittest.TestCase):
+
+    def setUp(self):
+        """Set up order lines and customer rows"""
+        rng = np.random.default_rng(9)
+        today = pd.Timestamp(datetime.date.today())
+        self.lines = pd.DataFrame({
+            'customer_id': np.array([f"C{i}" for i in rng.integers(0, 3000, 30000)]),
+            'order_id': rng.integers(0, 12000, 30000),
+            'order_date': today - pd.to_timedelta(rng.integers(0, 700, 30000), unit='D'),
+            'amount': rng.gamma(2.0, 50.0, 30000).round(2)
+        })
+        self.customers = pd.DataFrame({
+            'customer_id': np.arange(5000),
+            'last_purchase_date': today - pd.to_timedelta(rng.integers(0, 700, 5000), unit='D'),
+            'purchase_count': rng.integers(1, 40, 5000),
+            'total_spent': rng.gamma(2.0, 100.0, 5000).round(2)
+        })
+
+    def test_budget_charges(self):
+        """Test stage charges, releases and clean rejection"""
+        budget = MemoryBudget(1000)
+        budget.charge('input', 600)
+        self.assertTrue(budget.fits('customers', 400))
+        self.assertFalse(budget.fits('customers', 401))
+        budget.charge('input', 900)
+        self.assertEqual(budget.available(), 100)
+        with self.assertRaises(MemoryBudgetExceeded):
+            budget.charge('customers', 200)
+        budget.release('input')
+        budget.charge('customers', 200)
+        self.assertEqual(budget.summary()['peak_bytes'], 900)
+
+    def test_spilled_aggregation(self):
+        """Test that spilled aggregation matches the in-memory one"""
+        chunks = [self.lines.iloc[start:start + 2000] for start in range(0, 30000, 2000)]
+        expected = aggregate_transaction_chunks(chunks, 'customer_id', 'order_date', 'amount', order_col='order_id')
+
+        budget = MemoryBudget(200000)
+        with tempfile.TemporaryDirectory() as spill_dir, mock.patch.dict(os.environ, {'RFM_SPILL_DIR': spill_dir}):
+            spilled = aggregate_transaction_chunks(chunks, 'customer_id', 'order_date', 'amount', order_col='order_id', memory_budget=budget)
+            # Spilled files are removed once reduced
+            self.assertEqual(os.listdir(spill_dir), [])
+        self.assertIn("aggregation spilled to disk", budget.fallbacks)
+        self.assertEqual(budget.stages, {})
+        pd.testing.assert_frame_equal(
+            spilled.sort_values('customer_id').reset_index(drop=True),
+            expected.sort_values('customer_id').reset_index(drop=True)
+        )
+
+    def test_analysis_budget(self):
+        """Test sampled training near the limit and rejection above it"""
+        args = ('customer_id', 'last_purchase_date', 'purchase_count', 'total_spent', 'ecommerce')
+        with mock.patch.object(rfm_analysis, 'MIN_TRAIN_ROWS', 1000):
+            results = analyze_rfm_data(self.customers, *args, model_settings={'silhouette_sample_size': 1000}, memory_budget=MemoryBudget(3 * 2 ** 20))
+        budget = results['memory_budget']
+        self.assertTrue(any(fallback.startswith("models fitted on") for fallback in budget['fallbacks']))
+        self.assertLessEqual(budget['peak_bytes'], 3 * 2 ** 20)
+
+        with self.assertRaises(MemoryBudgetExceeded):
+            analyze_rfm_data(self.customers, *args, memory_budget=MemoryBudget(2 ** 18))
+
+        # Uploads loaded whole are rejected before they are read
+        csv = io.BytesIO()
+        self.customers.to_csv(csv, index=False)
+        with mock.patch.object(rfm_planner, 'load_dataset') as load_dataset:
+            with self.assertRaises(MemoryBudgetExceeded):
+                analyze_rfm_planned(csv.getvalue(), *args, memory_budget=MemoryBudget(2 ** 16))
+        load_dataset.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
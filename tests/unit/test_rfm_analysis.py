@@ -1,10 +1,19 @@
 # RFM Insights - Unit Tests for RFM Analysis Module
 
+import os
+import sys
 import unittest
+import tempfile
+import subprocess
 import pandas as pd
 import numpy as np
 import datetime
-from backend.rfm_analysis import RFMAnalysis
+from unittest import mock
+from backend import rfm_analysis
+from backend.rfm_analysis import RFMAnalysis, PredictiveAnalytics, aggregate_transactions, aggregate_transaction_chunks, build_feature_matrix, feature_schema, ORDER_COUNT_COL
+from backend.rfm_scoring import ntile_scores
+from backend.rfm_lookup import get_customer_lookup
+from backend.cpu_quota import available_cpus
 
 class TestRFMAnalysis(unittest.TestCase):
     
@@ -81,5 +90,252 @@ class TestRFMAnalysis(unittest.TestCase):
         for segment in segments['segment'].unique():
             self.assertIn(segment, expected_segments)
 
+class TestTransactionMode(unittest.TestCase):
+    
+    def setUp(self):
+        """Set up order-line test data"""
+        today = datetime.datetime.now()
+        self.transactions = pd.DataFrame({
+            'customer_id': ['C001', 'C001', 'C001', 'C002', 'C002', 'C003'],
+            'order_id': ['O1', 'O1', 'O2', 'O3', 'O4', 'O5'],
+            'order_date': [
+                today - datetime.timedelta(days=30),
+                today - datetime.timedelta(days=30),
+                today - datetime.timedelta(days=2),
+                today - datetime.timedelta(days=90),
+                today - datetime.timedelta(days=60),
+                today - datetime.timedelta(days=200)
+            ],
+            'amount': [10.0, 15.0, 40.0, 100.0, 50.0, 5.0]
+        })
+    
+    def test_aggregate_transactions(self):
+        """Test per-customer aggregation of order lines"""
+        customers = aggregate_transactions(self.transactions, 'customer_id', 'order_date', 'amount', order_col='order_id')
+        customers = customers.set_index('customer_id')
+        
+        self.assertEqual(customers.loc['C001', ORDER_COUNT_COL], 2)
+        self.assertEqual(customers.loc['C001', 'amount'], 65.0)
+        self.assertEqual(customers.loc['C001', 'order_date'], self.transactions['order_date'][2])
+        self.assertEqual(customers.loc['C002', ORDER_COUNT_COL], 2)
+        
+        # Without an order column every line counts as an order
+        lines = aggregate_transactions(self.transactions, 'customer_id', 'order_date', 'amount').set_index('customer_id')
+        self.assertEqual(lines.loc['C001', ORDER_COUNT_COL], 3)
+    
+    def test_chunked_aggregation_matches_single_pass(self):
+        """Test that streaming aggregation matches the single groupby"""
+        expected = aggregate_transactions(self.transactions, 'customer_id', 'order_date', 'amount', order_col='order_id')
+        chunks = [self.transactions.iloc[i:i + 2] for i in range(0, len(self.transactions), 2)]
+        actual = aggregate_transaction_chunks(chunks, 'customer_id', 'order_date', 'amount', order_col='order_id')
+        
+        expected = expected.set_index('customer_id').sort_index()
+        actual = actual.set_index('customer_id').sort_index()
+        pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+    
+    def test_transaction_mode_segments(self):
+        """Test that transaction mode feeds straight into scoring and segmentation"""
+        rfm = RFMAnalysis(self.transactions, 'customer_id', 'order_date', 'order_id', 'amount', 'ecommerce', input_mode='transaction')
+        segments = rfm.segment_customers()
+        
+        self.assertEqual(len(segments), 3)
+        self.assertIn('segment', segments.columns)
+        self.assertEqual(rfm.frequency_col, ORDER_COUNT_COL)
+    
+    def test_invalid_input_mode(self):
+        """Test that unknown input modes are rejected"""
+        with self.assertRaises(ValueError):
+            RFMAnalysis(self.transactions, 'customer_id', 'order_date', None, 'amount', 'ecommerce', input_mode='orders')
+
+class TestGroupedRFM(unittest.TestCase):
+    
+    def setUp(self):
+        """Set up order lines of customers buying in several stores"""
+        rng = np.random.default_rng(3)
+        today = datetime.datetime.now()
+        self.lines = pd.DataFrame({
+            'store': rng.choice(['Centro', 'Norte', 'Sul'], 3000, p=[0.5, 0.3, 0.2]),
+            'customer_id': rng.integers(0, 600, 3000),
+            'order_date': [today - datetime.timedelta(days=int(d)) for d in rng.integers(0, 365, 3000)],
+            'amount': rng.gamma(2.0, 50.0, 3000).round(2)
+        })
+    
+    def test_grouped_scores_match_per_group_analyses(self):
+        """Test that grouped scoring matches analyzing each group separately"""
+        rfm = RFMAnalysis(self.lines, 'customer_id', 'order_date', None, 'amount', 'ecommerce', input_mode='transaction', group_col='store')
+        segments = rfm.segment_customers().set_index(['store', 'customer_id'])
+        groups = rfm.get_group_results()
+        
+        self.assertEqual(set(groups), {'Centro', 'Norte', 'Sul'})
+        for store, lines in self.lines.groupby('store'):
+            expected = RFMAnalysis(lines, 'customer_id', 'order_date', None, 'amount', 'ecommerce', input_mode='transaction')
+            expected_segments = expected.segment_customers().set_index('customer_id')
+            actual = segments.loc[store].loc[expected_segments.index]
+            for column in ('r_score', 'f_score', 'm_score', 'r_percentile', 'segment'):
+                self.assertTrue((actual[column].to_numpy() == expected_segments[column].to_numpy()).all(), column)
+            np.testing.assert_array_equal(rfm.score_edges['monetary'][store], expected.score_edges['monetary'])
+            
+            self.assertEqual(groups[store]['segment_counts'], expected.get_segment_counts())
+            stats = expected.get_segment_stats()
+            for segment, values in groups[store]['segment_stats'].items():
+                self.assertAlmostEqual(values['avg_monetary'], stats[segment]['avg_monetary'])
+            self.assertEqual(sum(item['count'] for item in groups[store]['polar_area_data']), len(expected_segments))
+    
+    def test_grouped_chunked_aggregation(self):
+        """Test that streaming aggregation keeps groups apart"""
+        expected = aggregate_transactions(self.lines, 'customer_id', 'order_date', 'amount', group_col='store')
+        chunks = [self.lines.iloc[i:i + 500] for i in range(0, len(self.lines), 500)]
+        actual = aggregate_transaction_chunks(chunks, 'customer_id', 'order_date', 'amount', group_col='store')
+        
+        expected = expected.set_index(['store', 'customer_id']).sort_index()
+        actual = actual.set_index(['store', 'customer_id']).sort_index()
+        pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+        self.assertEqual(expected[ORDER_COUNT_COL].sum(), len(self.lines))
+
+class TestSegmentMigrations(unittest.TestCase):
+    
+    def setUp(self):
+        """Set up a year of order lines and quarterly snapshot dates"""
+        rng = np.random.default_rng(11)
+        today = pd.Timestamp(datetime.date.today())
+        self.lines = pd.DataFrame({
+            'customer_id': rng.integers(0, 500, 4000),
+            'order_date': today - pd.to_timedelta(rng.integers(0, 365, 4000), unit='D'),
+            'order_id': np.arange(4000),
+            'amount': rng.gamma(2.0, 50.0, 4000).round(2)
+        })
+        self.dates = [(today - pd.Timedelta(days=days)).date() for days in (270, 180, 90, 0)]
+        self.rfm = RFMAnalysis(self.lines, 'customer_id', 'order_date', 'order_id', 'amount', 'ecommerce', input_mode='transaction')
+    
+    def test_snapshots_match_per_date_analyses(self):
+        """Test that each snapshot matches aggregating and scoring the lines up to its date"""
+        migrations = self.rfm.segment_migrations(self.dates)
+        
+        for snapshot, date in zip(migrations['snapshots'], self.dates):
+            as_of = pd.Timestamp(date)
+            customers = aggregate_transactions(self.lines[self.lines['order_date'] <= as_of], 'customer_id', 'order_date', 'amount', order_col='order_id')
+            scores = [
+                ntile_scores(values.to_numpy(dtype=float), 4, dimension)[0]
+                for dimension, values in (
+                    ('recency', (as_of - customers['order_date']).dt.days),
+                    ('frequency', customers[ORDER_COUNT_COL]),
+                    ('monetary', customers['amount'])
+                )
+            ]
+            expected = pd.Series(self.rfm.rule_set.segments(*scores)).value_counts().to_dict()
+            self.assertEqual(snapshot['as_of'], date.isoformat())
+            self.assertEqual(snapshot['segment_counts'], expected)
+        
+        # Every customer of a snapshot either came from the previous one or is new
+        for transition, snapshot in zip(migrations['transitions'], migrations['snapshots'][1:]):
+            moved = sum(sum(targets.values()) for targets in transition['matrix'].values())
+            self.assertEqual(moved + sum(transition['new_customers'].values()), snapshot['total_customers'])
+    
+    def test_chunked_lines_and_validation(self):
+        """Test chunked order lines and the input checks"""
+        chunks = [self.lines.iloc[i:i + 1000] for i in range(0, len(self.lines), 1000)]
+        self.assertEqual(self.rfm.segment_migrations(self.dates, chunks), self.rfm.segment_migrations(self.dates))
+        
+        customers = RFMAnalysis(self.lines, 'customer_id', 'order_date', 'order_id', 'amount', 'ecommerce')
+        with self.assertRaises(ValueError):
+            customers.segment_migrations(self.dates)
+
+class TestPredictiveFeatures(unittest.TestCase):
+    
+    def setUp(self):
+        """Set up segmented customers with string IDs"""
+        rng = np.random.default_rng(17)
+        today = pd.Timestamp(datetime.date.today())
+        data = pd.DataFrame({
+            'customer_id': [f'C{i}' for i in range(3000)],
+            'last_purchase_date': today - pd.to_timedelta(rng.integers(0, 700, 3000), unit='D'),
+            'purchase_count': rng.integers(1, 40, 3000),
+            'total_spent': rng.gamma(2.0, 100.0, 3000).round(2)
+        })
+        self.rfm = RFMAnalysis(data, 'customer_id', 'last_purchase_date', 'purchase_count', 'total_spent', 'ecommerce')
+        self.segments = self.rfm.segment_customers()
+    
+    def test_feature_matrix_schema(self):
+        """Test the float32 matrix against one-hot encoding with pandas"""
+        segment_names = self.rfm.rule_set.segment_names
+        matrix, columns = build_feature_matrix(self.segments, segment_names)
+        self.assertEqual(columns, feature_schema(segment_names))
+        self.assertEqual(matrix.dtype, np.float32)
+        self.assertTrue(matrix.flags['C_CONTIGUOUS'])
+        
+        expected = pd.concat([
+            self.segments[['r_score', 'f_score', 'm_score', 'rfm_score', 'recency_days']],
+            pd.get_dummies(self.segments['segment'].astype(pd.CategoricalDtype(segment_names)), prefix='segment')
+        ], axis=1)
+        np.testing.assert_array_equal(matrix, expected.to_numpy(dtype=np.float32))
+        
+        # The schema does not depend on the segments present
+        _, subset_columns = build_feature_matrix(self.segments[self.segments['segment'] == 'Campeões'], segment_names)
+        self.assertEqual(subset_columns, columns)
+    
+    def test_ltv_target_is_monetary(self):
+        """Test that the LTV model predicts the monetary column"""
+        predictive = PredictiveAnalytics(self.segments, settings={'silhouette_sample_size': 500}, segment_names=self.rfm.rule_set.segment_names, monetary_col='total_spent')
+        features = predictive.prepare_features()
+        results = predictive.predict_ltv()
+        self.assertGreater(results['metrics']['r2'], 0.5)
+        # The matrix is built once and shared by the models
+        self.assertIs(predictive.features, features)
+        self.assertEqual(list(results['feature_importance']), predictive.feature_columns)
+        self.assertTrue(all(type(value) is float for value in results['feature_importance'].values()))
+    
+    def test_training_profile(self):
+        """Test estimator budgets by training size and early stopping on the held-out split"""
+        settings = {'silhouette_sample_size': 500, 'n_jobs': 2, 'early_stopping_rounds': 5}
+        with mock.patch.object(rfm_analysis, 'ESTIMATOR_BUDGETS', [(1000, 100), (None, 30)]):
+            predictive = PredictiveAnalytics(self.segments, settings=settings, segment_names=self.rfm.rule_set.segment_names, monetary_col='total_spent')
+            churn = predictive.predict_churn()
+            ltv = predictive.predict_ltv()
+        # 2100 training customers fall in the second budget
+        self.assertEqual((churn['training']['n_estimators'], ltv['training']['n_estimators']), (30, 30))
+        self.assertEqual(predictive.churn_model.n_jobs, 2)
+        # By default the trees are built on the CPUs the container may use
+        self.assertEqual(rfm_analysis.MODEL_SETTINGS['n_jobs'], available_cpus())
+        # Boosting stopped 5 rounds after the best one
+        self.assertEqual(predictive.ltv_model.get_booster().num_boosted_rounds(), ltv['training']['best_iteration'] + 6)
+        self.assertLess(ltv['training']['best_iteration'] + 6, 30)
+        self.assertGreater(ltv['metrics']['r2'], 0.5)
+        
+        predictive = PredictiveAnalytics(self.segments, settings={'n_estimators': 7, 'n_jobs': 1}, segment_names=self.rfm.rule_set.segment_names, monetary_col='total_spent')
+        self.assertEqual(predictive.predict_ltv()['training'], {'n_estimators': 7, 'best_iteration': None, 'fit_seconds': mock.ANY})
+
+class TestFastMode(unittest.TestCase):
+    
+    def test_segments_without_models(self):
+        """Test that fast mode persists the segments without training or importing the models"""
+        rng = np.random.default_rng(5)
+        today = pd.Timestamp(datetime.date.today())
+        data = pd.DataFrame({
+            'customer_id': [f'C{i}' for i in range(2000)],
+            'last_purchase_date': today - pd.to_timedelta(rng.integers(0, 700, 2000), unit='D'),
+            'purchase_count': rng.integers(1, 40, 2000),
+            'total_spent': rng.gamma(2.0, 100.0, 2000).round(2)
+        })
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            results = rfm_analysis.analyze_rfm_data(data, 'customer_id', 'last_purchase_date', 'purchase_count', 'total_spent', 'ecommerce', output_dir=tmp_dir, predictive=False)
+            self.assertIsNone(results['predictive_analytics'])
+            self.assertEqual(results['rfm_analysis']['segment_counts'], RFMAnalysis(data, 'customer_id', 'last_purchase_date', 'purchase_count', 'total_spent', 'ecommerce').get_segment_counts())
+            self.assertFalse(os.path.exists(os.path.join(tmp_dir, 'models.joblib')))
+            record = get_customer_lookup(tmp_dir).get('C7')
+            self.assertIn('segment', record)
+            self.assertNotIn('churn_probability', record)
+        
+        # A fresh interpreter never loads the ML libraries on this path
+        script = (
+            "import sys, pandas as pd\n"
+            "from backend.rfm_analysis import analyze_rfm_data\n"
+            "data = pd.DataFrame({'id': ['a', 'b', 'c', 'd'], 'date': pd.date_range('2024-01-01', periods=4), 'f': [1, 2, 3, 4], 'm': [10.0, 20.0, 30.0, 40.0]})\n"
+            "analyze_rfm_data(data, 'id', 'date', 'f', 'm', 'ecommerce', predictive=False)\n"
+            "print(sorted(name for name in ('sklearn', 'xgboost') if name in sys.modules))\n"
+        )
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        output = subprocess.run([sys.executable, '-c', script], cwd=root, capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip().splitlines()[-1], '[]')
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,137 @@
+# RFM Insights - Unit Tests for Audience Index Module
+
+import unittest
+import tempfile
+import datetime
+import numpy as np
+import pandas as pd
+from backend.rfm_analysis import RFMAnalysis
+from backend.rfm_state import RFMState, apply_delta_upload
+from backend.rfm_events import OnlineRFMStore
+from backend.rfm_lookup import build_lookup_index, get_customer_lookup
+from backend.rfm_audience import build_audience_index, get_audience_index
+
+class TestAudienceIndex(unittest.TestCase):
+
+    def setUp(self):
+        """Set up per-customer results indexed in a temporary analysis directory"""
+        rng = np.random.default_rng(11)
+        self.results = pd.DataFrame({
+            'customer_id': [f'C{i:05d}' for i in range(3001)],
+            'segment': rng.choice(['Campeões', 'Clientes em Risco', 'Outros'], 3001),
+            'churn_probability': rng.random(3001),
+            'ltv_segment': pd.Categorical(rng.choice(['Low', 'High', 'Very High', None], 3001)),
+            'cluster': rng.integers(0, 3, 3001),
+            'upsell_potential': rng.random(3001) < 0.3,
+            'crosssell_potential': rng.random(3001) < 0.2
+        })
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.analysis_dir = self.tmp_dir.name
+        build_lookup_index(self.results, 'customer_id', self.analysis_dir)
+        build_audience_index(self.results, self.analysis_dir)
+        self.audience = get_audience_index(self.analysis_dir)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_queries_match_boolean_masks(self):
+        """Test that bitmap queries select the same customers as boolean masks"""
+        data = self.results
+        cases = [
+            (
+                {'and': [{'upsell_potential': True}, {'churn_probability': {'max': 0.3}}]},
+                data['upsell_potential'] & (data['churn_probability'] < 0.3)
+            ),
+            (
+                {'and': [{'ltv_segment': ['High', 'Very High']}, {'churn_probability': {'min': 0.5}}]},
+                data['ltv_segment'].isin(['High', 'Very High']) & (data['churn_probability'] >= 0.5)
+            ),
+            (
+                {'or': [{'segment': 'Campeões'}, {'not': {'cluster': [0, 1]}}]},
+                (data['segment'] == 'Campeões') | ~data['cluster'].isin([0, 1])
+            ),
+            (
+                {'not': {'ltv_segment': 'Low'}},
+                data['ltv_segment'] != 'Low'
+            ),
+            (
+                {'segment': 'Unknown segment'},
+                pd.Series(False, index=data.index)
+            )
+        ]
+        for query, mask in cases:
+            summary = self.audience.summary(query)
+            self.assertEqual(summary['count'], int(mask.sum()))
+            self.assertEqual(summary['total_customers'], 3001)
+            self.assertEqual(summary['segment_counts'], data.loc[mask, 'segment'].value_counts().to_dict())
+            ids = [customer_id for chunk in self.audience.iter_customer_ids(query, chunk_size=500) for customer_id in chunk]
+            self.assertEqual(ids, data.loc[mask, 'customer_id'].tolist())
+
+    def test_invalid_queries(self):
+        """Test that malformed queries and unknown fields are rejected"""
+        for query in (
+            {'segment': 'Campeões', 'cluster': 1},
+            {'and': []},
+            {'xor': [{'segment': 'Campeões'}]},
+            {'churn_probability': {'max': 0.25}},
+            {'churn_probability': 0.3}
+        ):
+            with self.assertRaises(ValueError):
+                self.audience.bitmap(query)
+
+    def test_duplicates_follow_lookup_rows(self):
+        """Test that duplicate customers are dropped as in the lookup index"""
+        duplicated = pd.concat([self.results, self.results.iloc[:10].assign(segment='Outros')], ignore_index=True)
+        build_lookup_index(duplicated, 'customer_id', self.analysis_dir)
+        build_audience_index(duplicated, self.analysis_dir, user_id_col='customer_id')
+        audience = get_audience_index(self.analysis_dir)
+
+        self.assertEqual(audience.customers, 3001)
+        ids = [customer_id for chunk in audience.iter_customer_ids({'segment': 'Outros'}) for customer_id in chunk]
+        lookup = get_customer_lookup(self.analysis_dir)
+        self.assertEqual(ids, [customer_id for customer_id in lookup.ids.tolist() if lookup.get(customer_id)['segment'] == 'Outros'])
+
+    def test_ids_come_from_the_paired_lookup_build(self):
+        """Test that audience IDs are read from the lookup build the bitmaps were made against"""
+        query = {'segment': 'Campeões'}
+        expected = self.results.loc[self.results['segment'] == 'Campeões', 'customer_id'].tolist()
+        # A lookup rebuild in another row order, before the audience index is rebuilt
+        build_lookup_index(self.results.iloc[::-1], 'customer_id', self.analysis_dir)
+        ids = [customer_id for chunk in get_audience_index(self.analysis_dir).iter_customer_ids(query) for customer_id in chunk]
+        self.assertEqual(ids, expected)
+
+    def test_indexes_follow_deltas_and_events(self):
+        """Test that audiences are rebuilt with the lookup index after delta uploads and events"""
+        rng = np.random.default_rng(2)
+        today = datetime.datetime.now()
+        customers = pd.DataFrame({
+            'customer_id': [f'C{i:04d}' for i in range(500)],
+            'last_purchase_date': [today - datetime.timedelta(days=int(d)) for d in rng.integers(100, 365, 500)],
+            'purchase_count': rng.integers(1, 10, 500),
+            'total_spent': rng.gamma(2.0, 100.0, 500).round(2)
+        })
+        rfm = RFMAnalysis(customers, 'customer_id', 'last_purchase_date', 'purchase_count', 'total_spent', 'ecommerce')
+        rfm.segment_customers()
+        with tempfile.TemporaryDirectory() as analysis_dir:
+            state = RFMState.from_analysis(rfm, 'lineage')
+            state.save(analysis_dir)
+            results = state.customers.reset_index()
+            build_lookup_index(results, 'customer_id', analysis_dir)
+            build_audience_index(results, analysis_dir)
+
+            delta = customers.iloc[:40].assign(last_purchase_date=today, purchase_count=50, total_spent=9000.0)
+            apply_delta_upload(analysis_dir, delta)
+            counts = RFMState.load(analysis_dir).customers['segment'].value_counts().to_dict()
+            self.assertEqual(get_audience_index(analysis_dir).summary({'not': {'segment': 'none'}})['segment_counts'], counts)
+
+            store = OnlineRFMStore.load(analysis_dir)
+            store.ingest_batch([(f'C{i:04d}', 5000.0, None) for i in range(100, 160)] + [('NEW', 10.0, None)])
+            store.persist(refresh_indexes=True)
+            store.close()
+            audience = get_audience_index(analysis_dir)
+            self.assertEqual(audience.customers, 501)
+            self.assertEqual(audience.summary({'not': {'segment': 'none'}})['segment_counts'], store.get_segment_counts())
+            self.assertEqual(get_customer_lookup(analysis_dir).get('C0100')['segment'], store.get_customer('C0100')['segment'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,227 @@
+# RFM Insights - Unit Tests for Online Event Ingestion Module
+
+import unittest
+import tempfile
+from unittest import mock
+import datetime
+import numpy as np
+import pandas as pd
+from backend.rfm_analysis import RFMAnalysis, segment_scores
+from backend.rfm_state import RFMState, apply_delta_upload
+from backend import rfm_events
+from backend.rfm_events import OnlineRFMStore, get_online_store, close_online_stores
+from backend.quantile_sketch import QuantileSketch
+
+class TestQuantileSketch(unittest.TestCase):
+
+    def test_quantiles_within_relative_accuracy(self):
+        """Test log-scaled quantiles against exact quantiles, including after removals and merges"""
+        rng = np.random.default_rng(3)
+        values = rng.gamma(2.0, 150.0, 20000)
+        sketch = QuantileSketch()
+        sketch.add_many(values[:15000])
+        other = QuantileSketch()
+        for value in values[15000:]:
+            other.add(value)
+        sketch.merge(other)
+        for value in values[:1000]:
+            sketch.remove(value)
+
+        expected = np.quantile(values[1000:], [0.25, 0.5, 0.75], method='inverted_cdf')
+        np.testing.assert_allclose(sketch.quantiles([0.25, 0.5, 0.75]), expected, rtol=0.021)
+
+    def test_linear_sketch_round_trip(self):
+        """Test unit-width buckets and serialization"""
+        sketch = QuantileSketch(linear=True)
+        sketch.add_many([1, 2, 2, 3, 4, 5, 6, 7])
+        restored = QuantileSketch.from_dict(sketch.to_dict())
+        self.assertEqual(restored.quantiles([0.0, 0.5, 1.0]), [1.0, 3.0, 7.0])
+
+class TestOnlineRFMStore(unittest.TestCase):
+
+    def setUp(self):
+        """Persist the RFM state of a random customer base"""
+        rng = np.random.default_rng(11)
+        today = datetime.datetime.now()
+        customers = pd.DataFrame({
+            'customer_id': [f'C{i:04d}' for i in range(2000)],
+            'last_purchase_date': [today - datetime.timedelta(days=int(d)) for d in rng.integers(0, 365, 2000)],
+            'purchase_count': rng.integers(1, 30, 2000),
+            'total_spent': rng.gamma(2.0, 150.0, 2000).round(2)
+        })
+        self.customers = customers
+        rfm = RFMAnalysis(customers, 'customer_id', 'last_purchase_date', 'purchase_count', 'total_spent', 'ecommerce')
+        rfm.segment_customers()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.state_dir = self.tmp_dir.name
+        self.state = RFMState.from_analysis(rfm, 'lineage')
+        self.state.save(self.state_dir)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_seeded_segments_match_batch_analysis(self):
+        """Test that sketch boundaries reproduce the batch segments for almost every customer"""
+        store = OnlineRFMStore.load(self.state_dir)
+        segments = [store.get_customer(customer_id)['segment'] for customer_id in self.state.customers.index]
+        agreement = np.mean(np.array(segments) == self.state.customers['segment'].to_numpy())
+        self.assertGreater(agreement, 0.95)
+
+    def test_events_update_customers_and_segments(self):
+        """Test single and batched events, new customers and segment bookkeeping"""
+        store = OnlineRFMStore.load(self.state_dir)
+        before = store.get_customer('C0001')
+
+        customer = store.ingest('C0001', 250.0)
+        self.assertEqual(customer['frequency'], before['frequency'] + 1)
+        self.assertAlmostEqual(customer['monetary'], before['monetary'] + 250.0)
+        self.assertEqual(customer['recency_days'], 0)
+        self.assertEqual(customer['previous_segment'], before['segment'])
+
+        rng = np.random.default_rng(5)
+        today = datetime.datetime.now()
+        events = [
+            (f'C{i:04d}' if i < 2000 else f'N{i}', float(amount), today - datetime.timedelta(days=int(days)))
+            for i, amount, days in zip(rng.integers(0, 2100, 3000), rng.gamma(2.0, 50.0, 3000), rng.integers(0, 30, 3000))
+        ]
+        summary = store.ingest_batch(events)
+        new_ids = {customer_id for customer_id, _, _ in events if customer_id.startswith('N')}
+        self.assertEqual(summary['new_customers'], len(new_ids))
+        self.assertEqual(summary['total_customers'], 2000 + len(new_ids))
+        self.assertTrue(summary['boundaries_refreshed'])
+
+        # Incrementally maintained segments match a re-segmentation of the stored scores
+        scores = store.scores[:store.size]
+        expected = pd.Series(segment_scores(scores[:, 0], scores[:, 1], scores[:, 2])).value_counts().to_dict()
+        self.assertEqual(summary['segment_counts'], expected)
+
+    def test_persistence_round_trip(self):
+        """Test that persisted events survive reloading the store"""
+        store = OnlineRFMStore.load(self.state_dir)
+        store.ingest_batch([('C0002', 10.0, None), ('NEW', 99.0, None)])
+        store.close()
+
+        reloaded = OnlineRFMStore.load(self.state_dir)
+        self.assertEqual(reloaded.size, 2001)
+        self.assertEqual(reloaded.get_customer('NEW')['monetary'], 99.0)
+        self.assertEqual(reloaded.meta['events_ingested'], 2)
+        self.assertEqual(reloaded.get_segment_counts(), store.get_segment_counts())
+
+    def test_processes_share_events_through_logs(self):
+        """Test that stores of different processes see each other's events and persist them once"""
+        first = OnlineRFMStore.load(self.state_dir, writer_id='first')
+        second = OnlineRFMStore.load(self.state_dir, writer_id='second')
+        before = first.get_customer('C0003')
+        first.ingest('C0003', 40.0)
+        second.ingest_batch([('C0003', 60.0, None), ('NEW', 5.0, None)])
+
+        self.assertEqual(first.merge_logs(), 2)
+        self.assertEqual(second.merge_logs(), 1)
+        for store in (first, second):
+            self.assertEqual(store.get_customer('C0003')['frequency'], before['frequency'] + 2)
+            self.assertAlmostEqual(store.get_customer('C0003')['monetary'], before['monetary'] + 100.0)
+        second.persist()
+        first.close()
+        second.close()
+
+        reloaded = OnlineRFMStore.load(self.state_dir, writer_id='third')
+        self.assertEqual(reloaded.meta['events_ingested'], 3)
+        self.assertEqual(reloaded.get_customer('C0003')['frequency'], before['frequency'] + 2)
+        self.assertEqual(reloaded.get_customer('NEW')['monetary'], 5.0)
+
+    def test_snapshots_rebuild_indexes_when_due(self):
+        """Test that snapshots rebuild the lookup and audience indexes only past the event threshold"""
+        first = OnlineRFMStore.load(self.state_dir, writer_id='first')
+        second = OnlineRFMStore.load(self.state_dir, writer_id='second')
+        with mock.patch.object(rfm_events, 'INDEX_REFRESH_EVENTS', 3), \
+                mock.patch.object(rfm_events, 'INDEX_REFRESH_SHARE', 0.0), \
+                mock.patch.object(rfm_events, 'refresh_customer_indexes') as refresh:
+            first.ingest_batch([('C0001', 1.0, None), ('C0002', 1.0, None)])
+            first.persist()
+            refresh.assert_not_called()
+
+            first.ingest('C0003', 1.0)
+            first.persist()
+            self.assertEqual(refresh.call_count, 1)
+
+            # The rebuild is recorded for the other processes' snapshots
+            second.merge_logs()
+            second.persist()
+            self.assertEqual(refresh.call_count, 1)
+
+            second.persist(refresh_indexes=True)
+            self.assertEqual(refresh.call_count, 2)
+
+            # Pending events are indexed once the last rebuild is old enough
+            second.ingest('C0004', 1.0)
+            with mock.patch.object(rfm_events, 'INDEX_REFRESH_SECONDS', 0):
+                second.persist()
+            self.assertEqual(refresh.call_count, 3)
+        first.close(persist=False)
+        second.close(persist=False)
+
+    def test_events_survive_delta_uploads(self):
+        """Test that events ingested against the previous state are folded into a delta upload"""
+        try:
+            store = get_online_store(self.state_dir)
+            before = store.get_customer('C0005')
+            store.ingest('NEW', 99.0)
+            store.ingest('C0005', 20.0)
+
+            delta = pd.DataFrame({
+                'customer_id': ['C0004'],
+                'last_purchase_date': [datetime.datetime.now()],
+                'purchase_count': [500],
+                'total_spent': [12345.0]
+            })
+            results = apply_delta_upload(self.state_dir, delta)
+            self.assertEqual(results['delta']['folded_events'], 2)
+
+            reseeded = get_online_store(self.state_dir)
+            self.assertIsNot(reseeded, store)
+            self.assertEqual(reseeded.get_customer('NEW')['monetary'], 99.0)
+            self.assertEqual(reseeded.get_customer('C0005')['frequency'], before['frequency'] + 1)
+            self.assertAlmostEqual(reseeded.get_customer('C0005')['monetary'], before['monetary'] + 20.0)
+            self.assertEqual(reseeded.get_customer('C0004')['frequency'], 500)
+
+            # A worker that has not reloaded yet keeps logging against the old state
+            store.ingest('LATE', 7.0)
+            self.assertEqual(reseeded.merge_logs(), 1)
+            self.assertEqual(reseeded.get_customer('LATE')['monetary'], 7.0)
+
+            # The next upload folds the late event exactly once
+            apply_delta_upload(self.state_dir, delta)
+            state = RFMState.load(self.state_dir)
+            self.assertEqual(state.customers.loc['LATE', 'frequency'], 1)
+            self.assertEqual(state.customers.loc['C0005', 'frequency'], before['frequency'] + 1)
+            self.assertEqual(get_online_store(self.state_dir).get_customer('LATE')['frequency'], 1)
+        finally:
+            store.close(persist=False)
+            close_online_stores()
+
+    def test_stores_score_on_the_lineage_scale(self):
+        """Test that a lineage scored in deciles keeps decile scores online"""
+        rfm = RFMAnalysis(self.customers, 'customer_id', 'last_purchase_date', 'purchase_count', 'total_spent', 'ecommerce', score_bins=10)
+        rfm.segment_customers()
+        RFMState.from_analysis(rfm, 'lineage').save(self.state_dir)
+
+        store = OnlineRFMStore.load(self.state_dir)
+        self.assertEqual(store.score_bins, 10)
+        scores = store.scores[:store.size]
+        self.assertEqual(scores.max(), 10)
+        np.testing.assert_array_equal(
+            np.array(store.rule_set.segment_names)[store.segments[:store.size]],
+            segment_scores(scores[:, 0], scores[:, 1], scores[:, 2], 10)
+        )
+        customers = self.state.customers
+        agreement = np.mean(rfm.rfm_segments.set_index('customer_id').loc[customers.index, 'r_score'].to_numpy() == scores[:, 0])
+        self.assertGreater(agreement, 0.9)
+
+        store.ingest('C0001', 10.0)
+        store.persist()
+        reloaded = OnlineRFMStore.load(self.state_dir)
+        self.assertEqual(reloaded.score_bins, 10)
+        self.assertEqual(reloaded.get_customer('C0001')['r_score'], 10)
+
+if __name__ == '__main__':
+    unittest.main()
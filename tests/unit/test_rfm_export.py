@@ -0,0 +1,84 @@
+# RFM Insights - Unit Tests for Customer Export Module
+
+import io
+import os
+import unittest
+import tempfile
+from unittest import mock
+import numpy as np
+import pandas as pd
+from backend import rfm_export
+from backend.rfm_lookup import build_lookup_index
+from backend.rfm_export import CustomerExport, parse_byte_range
+
+class TestCustomerExport(unittest.TestCase):
+
+    def setUp(self):
+        """Set up an indexed analysis and small export chunks"""
+        rng = np.random.default_rng(8)
+        self.results = pd.DataFrame({
+            'customer_id': [f'C{i:04d}' for i in range(2500)],
+            'recency_days': rng.integers(0, 365, 2500).astype(float),
+            'r_score': rng.integers(1, 5, 2500),
+            'segment': rng.choice(['Campeões', 'Clientes em Risco', 'Outros'], 2500),
+            'ltv_segment': pd.Categorical(rng.choice(['Low', 'High', None], 2500)),
+            'upsell_potential': rng.random(2500) < 0.3
+        })
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.analysis_dir = self.tmp_dir.name
+        build_lookup_index(self.results, 'customer_id', self.analysis_dir)
+        patcher = mock.patch.object(rfm_export, 'EXPORT_CHUNK_ROWS', 700)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_csv_and_ndjson_exports(self):
+        """Test that exports hold the filtered rows and selected columns across chunks"""
+        expected = self.results[self.results['segment'].isin(['Campeões', 'Outros'])]
+
+        export = CustomerExport(self.analysis_dir, 'csv', segments=['Outros', 'Campeões', 'Unknown'])
+        csv = pd.read_csv(io.BytesIO(b''.join(export.stream())), dtype={'customer_id': str})
+        self.assertEqual(list(csv.columns), list(self.results.columns))
+        self.assertEqual(csv['customer_id'].tolist(), expected['customer_id'].tolist())
+        self.assertEqual(csv['r_score'].tolist(), expected['r_score'].tolist())
+        self.assertEqual(csv['ltv_segment'].isna().sum(), expected['ltv_segment'].isna().sum())
+
+        export = CustomerExport(self.analysis_dir, 'ndjson', columns=['segment', 'customer_id'])
+        ndjson = pd.read_json(io.BytesIO(b''.join(export.stream())), lines=True, dtype={'customer_id': str})
+        self.assertEqual(list(ndjson.columns), ['segment', 'customer_id'])
+        self.assertEqual(ndjson['customer_id'].tolist(), self.results['customer_id'].tolist())
+
+        with self.assertRaises(ValueError):
+            CustomerExport(self.analysis_dir, 'xml')
+        with self.assertRaises(ValueError):
+            CustomerExport(self.analysis_dir, 'csv', columns=['customer_id', 'unknown'])
+
+    def test_cached_file_serves_ranges(self):
+        """Test that the first full download is cached and byte ranges resume it"""
+        export = CustomerExport(self.analysis_dir, 'csv', columns=['customer_id', 'segment'])
+        self.assertFalse(os.path.exists(export.path))
+        # An interrupted download leaves no cache file
+        stream = export.stream()
+        next(stream)
+        stream.close()
+        self.assertFalse(os.path.exists(export.path))
+        self.assertEqual(os.listdir(os.path.dirname(export.path)), [])
+
+        content = b''.join(export.stream())
+        self.assertTrue(os.path.exists(export.path))
+        self.assertEqual(export.materialize(), len(content))
+        self.assertEqual(b''.join(export.iter_file(100, 199)), content[100:200])
+
+        size = len(content)
+        self.assertEqual(parse_byte_range('bytes=100-', size), (100, size - 1))
+        self.assertEqual(parse_byte_range('bytes=-50', size), (size - 50, size - 1))
+        self.assertEqual(parse_byte_range('bytes=0-99999999', size), (0, size - 1))
+        self.assertIsNone(parse_byte_range('bytes=0-1,5-9', size))
+        self.assertIsNone(parse_byte_range('items=0-9', size))
+        with self.assertRaises(ValueError):
+            parse_byte_range(f'bytes={size}-', size)
+
+if __name__ == '__main__':
+    unittest.main()
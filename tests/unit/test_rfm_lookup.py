@@ -0,0 +1,125 @@
+# RFM Insights - Unit Tests for Customer Lookup Index Module
+
+import os
+import unittest
+import tempfile
+import datetime
+import numpy as np
+import pandas as pd
+from backend.rfm_analysis import analyze_rfm_data
+from backend.rfm_state import RFMState, apply_delta_upload
+from backend.rfm_lookup import CustomerLookup, build_lookup_index, get_customer_lookup, _build_slots, LOOKUP_DIR, BUILD_PREFIX
+
+class TestCustomerLookup(unittest.TestCase):
+
+    def setUp(self):
+        """Set up per-customer results and a temporary analysis directory"""
+        rng = np.random.default_rng(4)
+        self.results = pd.DataFrame({
+            'customer_id': [f'C{i:05d}' for i in range(5000)],
+            'recency_days': rng.integers(0, 365, 5000),
+            'frequency': rng.integers(1, 20, 5000),
+            'monetary': rng.gamma(2.0, 100.0, 5000),
+            'r_score': rng.integers(1, 5, 5000),
+            'segment': rng.choice(['Campeões', 'Clientes em Risco', 'Outros'], 5000),
+            'churn_probability': rng.random(5000),
+            'ltv_segment': pd.Categorical(rng.choice(['Low', 'High', None], 5000)),
+            'upsell_potential': rng.random(5000) < 0.3
+        })
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.analysis_dir = self.tmp_dir.name
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_point_and_batch_lookups(self):
+        """Test that lookups return the indexed rows"""
+        self.assertEqual(build_lookup_index(self.results, 'customer_id', self.analysis_dir), 5000)
+        lookup = get_customer_lookup(self.analysis_dir)
+
+        for position in (0, 1234, 4999):
+            expected = self.results.iloc[position]
+            customer = lookup.get(expected['customer_id'])
+            self.assertEqual(customer['segment'], expected['segment'])
+            self.assertEqual(customer['recency_days'], expected['recency_days'])
+            self.assertAlmostEqual(customer['churn_probability'], expected['churn_probability'], places=6)
+            self.assertEqual(customer['upsell_potential'], bool(expected['upsell_potential']))
+            self.assertEqual(customer['ltv_segment'], None if pd.isna(expected['ltv_segment']) else expected['ltv_segment'])
+        self.assertIsNone(lookup.get('unknown'))
+
+        ids = ['C00042', 'nope', 'C04000', 'C00042']
+        customers, missing = lookup.get_many(ids)
+        self.assertEqual([customer['customer_id'] for customer in customers], ['C00042', 'C04000', 'C00042'])
+        self.assertEqual(missing, ['nope'])
+        self.assertEqual(customers[0], lookup.get('C00042'))
+        np.testing.assert_array_equal(lookup.rows(self.results['customer_id']), np.arange(5000))
+
+    def test_rebuilds_swap_whole_builds(self):
+        """Test that an opened index keeps reading its own build while rebuilds replace it"""
+        build_lookup_index(self.results, 'customer_id', self.analysis_dir)
+        first = get_customer_lookup(self.analysis_dir)
+        reordered = self.results.iloc[::-1].assign(segment='Outros')
+        build_lookup_index(reordered, 'customer_id', self.analysis_dir)
+        second = get_customer_lookup(self.analysis_dir)
+
+        self.assertNotEqual(first.build, second.build)
+        self.assertEqual(first.get('C00042')['segment'], self.results.loc[42, 'segment'])
+        self.assertEqual(second.get('C00042')['segment'], 'Outros')
+        self.assertEqual(second.rows(['C00000'])[0], 4999)
+
+        # The replaced build stays available by name; older ones are removed
+        build_lookup_index(self.results, 'customer_id', self.analysis_dir)
+        builds = sorted(name for name in os.listdir(os.path.join(self.analysis_dir, LOOKUP_DIR)) if name.startswith(BUILD_PREFIX))
+        self.assertEqual(builds, sorted([second.build, get_customer_lookup(self.analysis_dir).build]))
+        self.assertEqual(CustomerLookup(self.analysis_dir, build=second.build).get('C00042')['segment'], 'Outros')
+        # Memory-mapped arrays of a removed build stay readable
+        self.assertEqual(first.get('C00042')['customer_id'], 'C00042')
+
+    def test_slots_resolve_collisions(self):
+        """Test that colliding hashes are placed in consecutive free slots"""
+        hashes = np.array([3, 3, 3, 4, 19, 15], dtype=np.uint64)
+        slots = _build_slots(hashes)
+        self.assertEqual(len(slots), 16)
+        self.assertEqual(sorted(slots[slots >= 0].tolist()), list(range(6)))
+        # Every row is reached by probing from its home slot without an empty slot
+        for row, hashed in enumerate(hashes):
+            slot = int(hashed) & 15
+            while slots[slot] != row:
+                self.assertGreaterEqual(slots[slot], 0)
+                slot = (slot + 1) & 15
+
+    def test_delta_upload_refreshes_index(self):
+        """Test that lookups serve the customers re-scored by a delta upload"""
+        rng = np.random.default_rng(8)
+        today = datetime.datetime.now()
+        customers = pd.DataFrame({
+            'customer_id': [f'C{i:04d}' for i in range(600)],
+            'last_purchase_date': [today - datetime.timedelta(days=int(d)) for d in rng.integers(100, 365, 600)],
+            'purchase_count': rng.integers(1, 10, 600),
+            'total_spent': rng.gamma(2.0, 100.0, 600).round(2)
+        })
+        analyze_rfm_data(customers, 'customer_id', 'last_purchase_date', 'purchase_count', 'total_spent', 'ecommerce', output_dir=self.analysis_dir, model_settings={'silhouette_sample_size': 300})
+        before = get_customer_lookup(self.analysis_dir).get('C0001')
+
+        delta = pd.DataFrame({
+            'customer_id': ['C0001', 'N0001'],
+            'last_purchase_date': [today, today],
+            'purchase_count': [100, 1],
+            'total_spent': [50000.0, 10.0]
+        })
+        apply_delta_upload(self.analysis_dir, delta)
+        state = RFMState.load(self.analysis_dir)
+        lookup = get_customer_lookup(self.analysis_dir)
+
+        customer = lookup.get('C0001')
+        self.assertEqual((customer['frequency'], customer['monetary'], customer['recency_days']), (100.0, 50000.0, 0.0))
+        for column in ('r_score', 'f_score', 'm_score', 'rfm_score', 'segment'):
+            self.assertEqual(customer[column], state.customers.loc['C0001', column], column)
+        self.assertNotEqual(customer['segment'], before['segment'])
+        # Predictions are carried over; new customers have none yet
+        self.assertEqual(customer['churn_probability'], before['churn_probability'])
+        self.assertTrue(np.isnan(lookup.get('N0001')['churn_probability']))
+        self.assertEqual(lookup.customers, 601)
+
+if __name__ == '__main__':
+    unittest.main()
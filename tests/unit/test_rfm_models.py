@@ -0,0 +1,83 @@
+# RFM Insights - Unit Tests for Model Scoring Module
+
+import io
+import os
+import json
+import unittest
+import tempfile
+import datetime
+import numpy as np
+import pandas as pd
+from backend import rfm_models
+from backend.rfm_analysis import analyze_rfm_data, FEATURE_COLUMNS
+from backend.rfm_lookup import get_customer_lookup
+from backend.rfm_models import ScoringModels, SCORING_COLUMNS, MODELS_FILE
+from backend.segment_rules import builtin_rule_set
+
+class TestScoringModels(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """Run one persisted analysis shared by the tests"""
+        rng = np.random.default_rng(12)
+        today = pd.Timestamp(datetime.date.today())
+        cls.customers = pd.DataFrame({
+            'customer_id': [f'C{i:04d}' for i in range(3000)],
+            'last_purchase_date': today - pd.to_timedelta(rng.integers(0, 700, 3000), unit='D'),
+            'purchase_count': rng.integers(1, 40, 3000),
+            'total_spent': rng.gamma(2.0, 100.0, 3000).round(2)
+        })
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.analysis_dir = os.path.join(cls.tmp_dir.name, 'analysis')
+        analyze_rfm_data(cls.customers, 'customer_id', 'last_purchase_date', 'purchase_count', 'total_spent', 'ecommerce', score_bins=5, output_dir=cls.analysis_dir, model_settings={'silhouette_sample_size': 1000})
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def test_stable_feature_columns(self):
+        """Test that the segment features follow the rule set catalogue"""
+        rfm_models._MODELS.clear()
+        models = ScoringModels.load(self.analysis_dir)
+        segment_names = builtin_rule_set('ecommerce').segment_names
+        self.assertEqual(models.meta['feature_columns'], FEATURE_COLUMNS + [f'segment_{name}' for name in segment_names])
+        self.assertIs(ScoringModels.load(self.analysis_dir), models)
+
+    def test_scores_match_analysis(self):
+        """Test that rescoring the analysed customers reproduces their results"""
+        models = ScoringModels.load(self.analysis_dir)
+        scored = pd.concat(models.iter_predictions(models.prepare(self.customers), batch_rows=700), ignore_index=True)
+        self.assertEqual(list(scored.columns), SCORING_COLUMNS)
+        self.assertEqual(len(scored), 3000)
+
+        lookup = get_customer_lookup(self.analysis_dir)
+        expected, missing = lookup.get_many(list(scored['customer_id']))
+        self.assertEqual(missing, [])
+        expected = pd.DataFrame(expected)
+        for col in ('r_score', 'f_score', 'm_score', 'rfm_score', 'segment'):
+            np.testing.assert_array_equal(scored[col].to_numpy(), expected[col].to_numpy())
+        np.testing.assert_allclose(scored['churn_probability'], expected['churn_probability'], atol=1e-6)
+        np.testing.assert_allclose(scored['predicted_ltv'], expected['predicted_ltv'], rtol=1e-5)
+
+    def test_streamed_output(self):
+        """Test CSV and NDJSON chunks and input validation"""
+        models = ScoringModels.load(self.analysis_dir)
+        customers = models.prepare(self.customers.iloc[:1500])
+        csv = b''.join(models.iter_chunks(customers, 'csv', batch_rows=400))
+        frame = pd.read_csv(io.BytesIO(csv))
+        self.assertEqual(list(frame.columns), SCORING_COLUMNS)
+        self.assertEqual(len(frame), 1500)
+
+        lines = b''.join(models.iter_chunks(customers, 'ndjson', batch_rows=400)).decode('utf-8').splitlines()
+        self.assertEqual(len(lines), 1500)
+        self.assertEqual(set(json.loads(lines[0])), set(SCORING_COLUMNS))
+
+        self.assertEqual(b''.join(models.iter_chunks(customers.iloc[:0], 'csv')).decode('utf-8').strip(), ','.join(SCORING_COLUMNS))
+        with self.assertRaises(ValueError):
+            models.iter_chunks(customers, 'xml')
+        with self.assertRaises(ValueError):
+            models.prepare(self.customers.drop(columns=['total_spent']))
+        self.assertTrue(os.path.exists(os.path.join(self.analysis_dir, MODELS_FILE)))
+
+if __name__ == '__main__':
+    unittest.main()
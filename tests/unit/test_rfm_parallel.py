@@ -0,0 +1,92 @@
+# RFM Insights - Unit Tests for Partitioned Parallel RFM Engine Module
+
+import unittest
+import datetime
+from unittest import mock
+import numpy as np
+import pandas as pd
+from backend.rfm_analysis import RFMAnalysis
+from backend.data_loader import iter_dataset
+from backend import rfm_parallel
+from backend.rfm_parallel import analyze_rfm_partitioned, partition_customers
+
+class TestPartitionedEngine(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a skewed customer base and matching transaction lines"""
+        rng = np.random.default_rng(21)
+        today = datetime.datetime.now()
+        size = 5000
+        self.customers = pd.DataFrame({
+            'customer_id': [f'C{i:05d}' for i in range(size)],
+            'last_purchase_date': [today - datetime.timedelta(days=int(d)) for d in rng.integers(0, 400, size)],
+            # Most customers bought once, so qcut drops duplicate edges
+            'purchase_count': np.where(rng.random(size) < 0.6, 1, rng.integers(2, 40, size)),
+            'total_spent': rng.gamma(2.0, 150.0, size).round(2)
+        })
+        lines = 12000
+        self.transactions = pd.DataFrame({
+            'customer_id': [f'C{i:05d}' for i in rng.integers(0, 3000, lines)],
+            'order_date': [today - datetime.timedelta(days=int(d)) for d in rng.integers(0, 400, lines)],
+            'amount': rng.gamma(2.0, 40.0, lines).round(2)
+        })
+
+    def assertMatchesSingleProcess(self, results, rfm):
+        """Compare partitioned results with the single-process analysis"""
+        rfm.segment_customers()
+        self.assertEqual(results['rfm_analysis']['segment_counts'], rfm.get_segment_counts())
+        for dimension, edges in rfm.score_edges.items():
+            np.testing.assert_allclose(results['score_edges'][dimension], edges)
+
+        expected_stats = rfm.get_segment_stats()
+        for segment, stats in results['rfm_analysis']['segment_stats'].items():
+            for name, value in stats.items():
+                self.assertAlmostEqual(value, expected_stats[segment][name], delta=abs(value) * 1e-9 + 1e-9)
+
+    def test_partitions_keep_customers_together(self):
+        """Test that hash partitioning never splits a customer"""
+        partitions = partition_customers(self.transactions, 'customer_id', 4)
+        self.assertEqual(sum(len(part) for part in partitions), len(self.transactions))
+        seen = [set(part['customer_id']) for part in partitions]
+        self.assertEqual(sum(len(ids) for ids in seen), len(set().union(*seen)))
+
+    def test_customer_mode_matches_single_process(self):
+        """Test in-process and multi-process runs against RFMAnalysis"""
+        rfm = RFMAnalysis(self.customers, 'customer_id', 'last_purchase_date', 'purchase_count', 'total_spent', 'ecommerce')
+        for workers in (1, 3):
+            results = analyze_rfm_partitioned(
+                self.customers, 'customer_id', 'last_purchase_date', 'purchase_count', 'total_spent', 'ecommerce', workers=workers
+            )
+            self.assertEqual(results['partitions'], workers)
+            self.assertMatchesSingleProcess(results, rfm)
+
+    def test_transaction_mode_matches_single_process(self):
+        """Test that transaction lines are aggregated per partition"""
+        rfm = RFMAnalysis(self.transactions, 'customer_id', 'order_date', None, 'amount', 'ecommerce', input_mode='transaction')
+        results = analyze_rfm_partitioned(
+            self.transactions, 'customer_id', 'order_date', None, 'amount', 'ecommerce', input_mode='transaction', workers=2
+        )
+        self.assertMatchesSingleProcess(results, rfm)
+
+    def test_workers_load_streamed_partitions(self):
+        """Test that raw uploads are partitioned into files the fresh worker processes load"""
+        self.assertNotEqual(rfm_parallel.START_METHOD, 'fork')
+        contents = self.transactions.to_csv(index=False).encode()
+        rfm = RFMAnalysis(self.transactions, 'customer_id', 'order_date', None, 'amount', 'ecommerce', input_mode='transaction')
+        with mock.patch.object(rfm_parallel, 'iter_dataset', wraps=lambda *args, **kwargs: iter_dataset(*args, chunksize=5000, **kwargs)):
+            results = analyze_rfm_partitioned(
+                contents, 'customer_id', 'order_date', None, 'amount', 'ecommerce', input_mode='transaction', workers=2
+            )
+        self.assertEqual(results['record_count'], len(self.transactions))
+        self.assertEqual(results['rfm_analysis']['segment_counts'], rfm.get_segment_counts())
+
+    def test_empty_input(self):
+        """Test that an empty upload returns empty summaries"""
+        results = analyze_rfm_partitioned(
+            self.customers.iloc[:0], 'customer_id', 'last_purchase_date', 'purchase_count', 'total_spent', 'ecommerce', workers=2
+        )
+        self.assertEqual(results['rfm_analysis']['segment_counts'], {})
+        self.assertEqual(results['score_edges'], {'recency': [], 'frequency': [], 'monetary': []})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+# RFM Insights - Unit Tests for Execution Planner Module
+
+import io
+import unittest
+import datetime
+from unittest import mock
+import numpy as np
+import pandas as pd
+from backend import rfm_planner
+from backend.hyperloglog import HyperLogLog
+from backend.data_loader import load_dataset
+from backend.memory_budget import MemoryBudget, MemoryBudgetExceeded, frame_bytes
+from backend.rfm_planner import estimate_upload, estimate_loaded_bytes, plan_analysis, analyze_rfm_planned, summarize_plans
+
+class TestExecutionPlanner(unittest.TestCase):
+
+    def setUp(self):
+        """Set up order lines as CSV bytes"""
+        rng = np.random.default_rng(5)
+        today = pd.Timestamp(datetime.date.today())
+        self.lines = pd.DataFrame({
+            'customer_id': rng.integers(0, 5000, 40000),
+            'order_date': (today - pd.to_timedelta(rng.integers(0, 700, 40000), unit='D')).strftime('%Y-%m-%d'),
+            'amount': rng.gamma(2.0, 50.0, 40000).round(2)
+        })
+        csv = io.BytesIO()
+        self.lines.to_csv(csv, index=False)
+        self.contents = csv.getvalue()
+        self.columns = ['customer_id', 'order_date', 'amount']
+
+    def test_hyperloglog(self):
+        """Test distinct counts of single and merged sketches"""
+        left, right = HyperLogLog(), HyperLogLog()
+        left.add_many(np.arange(60000))
+        right.add_many(np.array([f"C{i}" for i in range(30000)]))
+        self.assertLess(abs(left.count() - 60000) / 60000, 0.03)
+        self.assertLess(abs(right.count() - 30000) / 30000, 0.03)
+        left.add_many(np.arange(30000))
+        self.assertLess(abs(left.count() - 60000) / 60000, 0.03)
+        left.merge(right)
+        self.assertLess(abs(left.count() - 90000) / 90000, 0.03)
+        self.assertEqual(HyperLogLog().count(), 0)
+        with self.assertRaises(ValueError):
+            left.merge(HyperLogLog(precision=10))
+
+    def test_estimates(self):
+        """Test row and customer estimates from a partial and a complete prefix"""
+        with mock.patch.object(rfm_planner, 'PREFIX_BYTES', len(self.contents) // 8):
+            estimates = estimate_upload(self.contents, 'csv', 'customer_id', self.columns)
+        self.assertLess(estimates['prefix_rows'], 40000 // 7)
+        self.assertLess(abs(estimates['rows'] - 40000) / 40000, 0.02)
+        customers = self.lines['customer_id'].nunique()
+        self.assertLess(abs(estimates['customers'] - customers) / customers, 0.1)
+        self.assertTrue(estimates['streamed'])
+
+        estimates = estimate_upload(self.contents, 'csv', 'customer_id', self.columns)
+        self.assertEqual((estimates['rows'], estimates['prefix_rows']), (40000, 40000))
+        self.assertGreater(estimates['memory_bytes'], 0)
+        self.assertFalse(estimate_upload(self.lines, 'xlsx', 'customer_id', self.columns)['streamed'])
+
+    def test_loaded_upload_charged_before_reading(self):
+        """Test loaded-size estimates of Feather, Arrow and Excel uploads and the up-front charge"""
+        import pyarrow as pa
+        import pyarrow.feather as feather
+        lines = self.lines.assign(customer_id='C' + self.lines['customer_id'].astype(str), note='x' * 20)
+        uploads = {}
+        buffer = io.BytesIO()
+        feather.write_feather(lines, buffer)
+        uploads['feather'] = buffer.getvalue()
+        sink = pa.BufferOutputStream()
+        table = pa.Table.from_pandas(lines)
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=10000)
+        uploads['arrow'] = sink.getvalue().to_pybytes()
+        buffer = io.BytesIO()
+        lines.iloc[:5000].to_excel(buffer, index=False)
+        uploads['xlsx'] = buffer.getvalue()
+
+        for file_format, contents in uploads.items():
+            actual = frame_bytes(load_dataset(contents, file_format=file_format, columns=self.columns))
+            estimate = estimate_loaded_bytes(contents, file_format, self.columns)
+            self.assertLess(abs(estimate - actual) / actual, 0.5, file_format)
+
+            with mock.patch.object(rfm_planner, 'load_dataset') as loader:
+                with self.assertRaises(MemoryBudgetExceeded):
+                    analyze_rfm_planned(contents, 'customer_id', 'order_date', None, 'amount', 'ecommerce', file_format=file_format, input_mode='transaction', memory_budget=MemoryBudget(estimate // 2))
+                loader.assert_not_called()
+
+    def test_plan_choice(self):
+        """Test the engine and model settings chosen for different uploads"""
+        small = {'rows': 5000, 'customers': 5000, 'memory_bytes': 2 ** 20, 'streamed': True}
+        large = {'rows': 20000000, 'customers': 3000000, 'memory_bytes': 2 ** 32, 'streamed': True}
+        self.assertEqual(plan_analysis(small, 'customer', workers=4)['engine'], 'in_memory')
+        self.assertEqual(plan_analysis(small, 'customer', per_customer=False, workers=4)['workers'], 1)
+
+        plan = plan_analysis(large, 'transaction', workers=4)
+        self.assertEqual(plan['engine'], 'chunked')
+        self.assertEqual(plan['model_settings']['max_train_rows'], rfm_planner.MODEL_SAMPLE_CUSTOMERS)
+        # No models are sampled in fast mode
+        self.assertEqual(plan_analysis(large, 'transaction', workers=4, predictive=False)['model_settings'], {})
+        self.assertEqual(plan_analysis(large, 'transaction', per_customer=False, workers=4)['engine'], 'parallel')
+        self.assertEqual(plan_analysis(large, 'transaction', per_customer=False, workers=1)['engine'], 'chunked')
+        # Customer rows and files without a chunked reader stay in memory
+        self.assertEqual(plan_analysis(large, 'customer', workers=1)['engine'], 'in_memory')
+        self.assertEqual(plan_analysis(dict(large, streamed=False), 'transaction', workers=1)['engine'], 'in_memory')
+
+    def test_planned_runs(self):
+        """Test that every engine yields the same segments and records its accuracy"""
+        args = ('customer_id', 'order_date', None, 'amount', 'ecommerce')
+        in_memory = analyze_rfm_planned(self.contents, *args, input_mode='transaction', summary_only=True)
+        self.assertEqual(in_memory['execution_plan']['engine'], 'in_memory')
+        self.assertEqual(in_memory['execution_plan']['actual'], {'rows': 40000, 'customers': self.lines['customer_id'].nunique()})
+
+        with mock.patch.object(rfm_planner, 'IN_MEMORY_MAX_BYTES', 1):
+            chunked = analyze_rfm_planned(self.contents, *args, input_mode='transaction', summary_only=True)
+        self.assertEqual(chunked['execution_plan']['engine'], 'chunked')
+        self.assertEqual(chunked['rfm_analysis']['segment_counts'], in_memory['rfm_analysis']['segment_counts'])
+
+        with mock.patch.object(rfm_planner, 'PARALLEL_MIN_CUSTOMERS', 1):
+            parallel = analyze_rfm_planned(self.contents, *args, input_mode='transaction', summary_only=True, workers=2)
+        self.assertEqual(parallel['execution_plan']['engine'], 'parallel')
+        self.assertEqual(parallel['rfm_analysis']['segment_counts'], in_memory['rfm_analysis']['segment_counts'])
+
+        summary = summarize_plans([in_memory['execution_plan'], chunked['execution_plan'], parallel['execution_plan']])
+        self.assertEqual(summary['engines'], {'in_memory': 1, 'chunked': 1, 'parallel': 1})
+        self.assertEqual(summary['accuracy']['rows']['max_abs_error'], 0.0)
+        self.assertLess(summary['accuracy']['customers']['max_abs_error'], 0.03)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+# RFM Insights - Unit Tests for Preview Analysis Module
+
+import io
+import unittest
+import datetime
+import numpy as np
+import pandas as pd
+from backend.rfm_analysis import RFMAnalysis, analyze_rfm_data
+from backend.rfm_preview import reservoir_sample, customer_sample
+
+class TestPreviewAnalysis(unittest.TestCase):
+
+    def setUp(self):
+        """Set up customer rows and order lines"""
+        rng = np.random.default_rng(21)
+        today = pd.Timestamp(datetime.date.today())
+        self.customers = pd.DataFrame({
+            'customer_id': np.arange(20000),
+            'last_purchase_date': today - pd.to_timedelta(rng.integers(0, 700, 20000), unit='D'),
+            'purchase_count': np.where(rng.random(20000) < 0.5, 1, rng.integers(2, 40, 20000)),
+            'total_spent': rng.gamma(2.0, 100.0, 20000).round(2)
+        })
+        self.lines = pd.DataFrame({
+            'customer_id': rng.integers(0, 8000, 60000),
+            'order_date': today - pd.to_timedelta(rng.integers(0, 700, 60000), unit='D'),
+            'amount': rng.gamma(2.0, 50.0, 60000).round(2)
+        })
+
+    def test_samples(self):
+        """Test the row reservoir and the per-customer sample of order lines"""
+        chunks = [self.customers.iloc[start:start + 3000] for start in range(0, 20000, 3000)]
+        sample, rows_read = reservoir_sample(chunks, 5000, seed=1)
+        self.assertEqual((len(sample), rows_read), (5000, 20000))
+        self.assertTrue(sample['customer_id'].is_monotonic_increasing)
+        self.assertTrue(sample['customer_id'].isin(self.customers['customer_id']).all())
+        # Rows are spread over the whole input
+        self.assertGreater(sample['customer_id'].iloc[-1], 19000)
+
+        chunks = [self.lines.iloc[start:start + 7000] for start in range(0, 60000, 7000)]
+        lines, rows_read, customers = customer_sample(chunks, 'customer_id', 1000, seed=1)
+        self.assertEqual(rows_read, 60000)
+        self.assertEqual(lines['customer_id'].nunique(), 1000)
+        # Every line of a sampled customer is kept
+        expected = self.lines[self.lines['customer_id'].isin(lines['customer_id'])]
+        self.assertEqual(len(lines), len(expected))
+        self.assertLess(abs(customers - self.lines['customer_id'].nunique()) / self.lines['customer_id'].nunique(), 0.1)
+
+    def test_preview_shares(self):
+        """Test that preview intervals cover the full shares and collapse on a full sample"""
+        full = RFMAnalysis(self.customers, 'customer_id', 'last_purchase_date', 'purchase_count', 'total_spent', 'ecommerce').get_segment_counts()
+        csv = io.BytesIO()
+        self.customers.to_csv(csv, index=False)
+
+        results = analyze_rfm_data(csv.getvalue(), 'customer_id', 'last_purchase_date', 'purchase_count', 'total_spent', 'ecommerce', file_format='csv', preview=True, sample_size=5000)
+        self.assertNotIn('predictive_analytics', results)
+        self.assertEqual(results['preview']['sample_size'], 5000)
+        self.assertEqual(results['preview']['estimated_total_customers'], 20000)
+        shares = results['rfm_analysis']['segment_shares']
+        self.assertEqual(set(shares), set(results['rfm_analysis']['segment_counts']))
+        covered = sum(values['lower'] <= full.get(segment, 0) / 20000 <= values['upper'] for segment, values in shares.items())
+        self.assertGreaterEqual(covered, len(shares) - 1)
+        for values in shares.values():
+            self.assertLess(values['lower'], values['upper'])
+
+        results = analyze_rfm_data(self.customers, 'customer_id', 'last_purchase_date', 'purchase_count', 'total_spent', 'ecommerce', preview=True, sample_size=50000)
+        for segment, values in results['rfm_analysis']['segment_shares'].items():
+            self.assertEqual(values['estimated_count'], full[segment])
+            self.assertEqual(values['lower'], values['upper'])
+
+        results = analyze_rfm_data(self.lines, 'customer_id', 'order_date', None, 'amount', 'ecommerce', input_mode='transaction', preview=True, sample_size=2000)
+        self.assertEqual(results['preview']['sample_size'], 2000)
+        self.assertEqual(sum(results['rfm_analysis']['segment_counts'].values()), 2000)
+
+if __name__ == '__main__':
+    unittest.main()
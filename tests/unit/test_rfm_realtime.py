@@ -0,0 +1,79 @@
+# RFM Insights - Unit Tests for Real-time Scoring Module
+
+import os
+import asyncio
+import unittest
+import tempfile
+import datetime
+import numpy as np
+import pandas as pd
+from backend.rfm_analysis import analyze_rfm_data
+from backend.rfm_models import ScoringModels
+from backend.rfm_realtime import MicroBatcher, realtime_stats, reset_realtime_stats
+
+class TestMicroBatcher(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """Run one persisted analysis shared by the tests"""
+        rng = np.random.default_rng(21)
+        today = pd.Timestamp(datetime.date.today())
+        cls.customers = pd.DataFrame({
+            'customer_id': np.arange(2000),
+            'last_purchase_date': (today - pd.to_timedelta(rng.integers(0, 700, 2000), unit='D')).strftime('%Y-%m-%d'),
+            'purchase_count': rng.integers(1, 40, 2000),
+            'total_spent': rng.gamma(2.0, 100.0, 2000).round(2)
+        })
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.analysis_dir = os.path.join(cls.tmp_dir.name, 'analysis')
+        analyze_rfm_data(cls.customers, 'customer_id', 'last_purchase_date', 'purchase_count', 'total_spent', 'ecommerce', output_dir=cls.analysis_dir, model_settings={'silhouette_sample_size': 500})
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def test_concurrent_requests_share_batches(self):
+        """Test that concurrent requests are micro-batched and match batch scoring"""
+        reset_realtime_stats()
+        batcher = MicroBatcher(self.analysis_dir, window_ms=20, max_size=64)
+        rows = self.customers.iloc[:100].to_dict('records')
+
+        async def score_all():
+            results = await asyncio.gather(*[batcher.score(row) for row in rows])
+            # Finished batch tasks are released by the batcher
+            await asyncio.sleep(0.01)
+            self.assertEqual(batcher._tasks, set())
+            return results
+        results = asyncio.run(score_all())
+
+        models = ScoringModels.load(self.analysis_dir)
+        expected = models.predict(models.prepare(self.customers.iloc[:100]))
+        self.assertEqual([result['customer_id'] for result in results], list(range(100)))
+        self.assertEqual([result['segment'] for result in results], list(expected['segment']))
+        np.testing.assert_allclose([result['churn_probability'] for result in results], expected['churn_probability'], atol=1e-6)
+
+        stats = realtime_stats()
+        self.assertEqual((stats['requests'], stats['batches']), (100, 2))
+        # 64 requests close the first batch, the window closes the second (36)
+        self.assertEqual(stats['batch_sizes']['<=64'], 2)
+        self.assertLessEqual(stats['latency_ms']['p50'], stats['latency_ms']['p99'])
+
+    def test_invalid_rows_fail_alone(self):
+        """Test that only malformed rows of a batch are rejected"""
+        batcher = MicroBatcher(self.analysis_dir, window_ms=20)
+        rows = self.customers.iloc[:3].to_dict('records')
+        rows[1] = {**rows[1], 'last_purchase_date': 'not a date'}
+        rows[2] = {**rows[2], 'customer_id': 'same'}
+        rows.append({**rows[0], 'customer_id': 'same'})
+
+        async def score_all():
+            return await asyncio.gather(*[batcher.score(row) for row in rows], return_exceptions=True)
+        results = asyncio.run(score_all())
+        self.assertIsInstance(results[1], ValueError)
+        # Rows with the same customer ID are scored independently
+        self.assertEqual(results[0]['segment'], results[3]['segment'])
+        self.assertEqual(results[2]['customer_id'], 'same')
+        self.assertNotEqual(results[2]['monetary'], results[3]['monetary'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+# RFM Insights - Unit Tests for N-tile Scoring Module
+
+import unittest
+import datetime
+import numpy as np
+import pandas as pd
+from backend.rfm_analysis import RFMAnalysis
+from backend.rfm_scoring import ntile_scores, scores_from_edges, resolve_bins, to_rule_scale
+
+class TestNtileScoring(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a skewed frequency column (most customers bought once)"""
+        rng = np.random.default_rng(9)
+        self.frequency = np.where(rng.random(1000) < 0.6, 1, rng.integers(2, 50, 1000)).astype(float)
+
+    def test_skewed_scores_stay_in_range(self):
+        """Test that skewed data still scores from 1 to the number of bins"""
+        for bins in (4, 5, 10):
+            scores, percentiles, edges = ntile_scores(self.frequency, bins, 'frequency')
+            self.assertEqual(scores.min(), 1)
+            self.assertEqual(scores.max(), bins)
+            self.assertEqual(len(edges), bins - 1)
+            np.testing.assert_array_equal(scores_from_edges(self.frequency, edges, 'frequency'), scores)
+            self.assertTrue((percentiles >= 0).all() and (percentiles < 100).all())
+
+    def test_ties_are_deterministic(self):
+        """Test that equal values share a score regardless of row order"""
+        scores, percentiles, _ = ntile_scores(self.frequency, 4, 'recency')
+        order = np.random.default_rng(1).permutation(len(self.frequency))
+        shuffled, shuffled_percentiles, _ = ntile_scores(self.frequency[order], 4, 'recency')
+
+        np.testing.assert_array_equal(shuffled, scores[order])
+        np.testing.assert_array_equal(shuffled_percentiles, percentiles[order])
+        # Fewer recency days score higher, and all one-time values share one score
+        self.assertEqual(len(set(scores[self.frequency == 1])), 1)
+        self.assertEqual(scores[self.frequency == 1][0], 4)
+
+    def test_resolve_bins(self):
+        """Test scale names and validation"""
+        self.assertEqual(resolve_bins('deciles'), 10)
+        self.assertEqual(resolve_bins('5'), 5)
+        with self.assertRaises(ValueError):
+            resolve_bins(1)
+        with self.assertRaises(ValueError):
+            resolve_bins('sextiles')
+        np.testing.assert_array_equal(to_rule_scale(np.arange(1, 11), 10), [1, 1, 1, 2, 2, 3, 3, 3, 4, 4])
+
+    def test_analysis_with_deciles(self):
+        """Test RFMAnalysis with decile scores and percentile outputs"""
+        today = datetime.datetime.now()
+        data = pd.DataFrame({
+            'customer_id': range(1000),
+            'last_purchase_date': [today - datetime.timedelta(days=int(d)) for d in np.arange(1000) % 300],
+            'purchase_count': self.frequency,
+            'total_spent': np.arange(1000) * 1.5
+        })
+        rfm = RFMAnalysis(data, 'customer_id', 'last_purchase_date', 'purchase_count', 'total_spent', 'ecommerce', score_bins='deciles')
+        segments = rfm.segment_customers()
+
+        self.assertEqual(segments['m_score'].min(), 1)
+        self.assertEqual(segments['m_score'].max(), 10)
+        self.assertIn('m_percentile', segments.columns)
+        self.assertEqual(segments.loc[segments['total_spent'].idxmax(), 'rfm_score'] % 100, 10)
+        self.assertTrue(set(segments['segment']) <= set(rfm.rule_set.segment_names))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+# RFM Insights - Unit Tests for Incremental RFM State Module
+
+import os
+import unittest
+import tempfile
+from unittest import mock
+import datetime
+import numpy as np
+import pandas as pd
+from backend.rfm_analysis import RFMAnalysis
+from backend import rfm_state
+from backend.rfm_state import RFMState, apply_delta_upload, score_histogram, state_lock, what_if_segments
+from backend.rfm_scoring import ntile_edges, ntile_scores, scores_from_edges
+
+class TestRFMState(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a random customer base and a temporary analysis directory"""
+        rng = np.random.default_rng(7)
+        today = datetime.datetime.now()
+        self.customers = pd.DataFrame({
+            'customer_id': [f'C{i:04d}' for i in range(400)],
+            'last_purchase_date': [today - datetime.timedelta(days=int(d)) for d in rng.integers(0, 365, 400)],
+            'purchase_count': rng.integers(1, 30, 400),
+            'total_spent': rng.gamma(2.0, 150.0, 400).round(2)
+        })
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.state_dir = self.tmp_dir.name
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _full_analysis(self, data):
+        """Run a full RFM analysis and return segments indexed by customer"""
+        rfm = RFMAnalysis(data, 'customer_id', 'last_purchase_date', 'purchase_count', 'total_spent', 'ecommerce')
+        rfm.segment_customers()
+        return rfm
+
+    def test_edges_from_sorted_values_match_scores(self):
+        """Test that edges from the maintained sorted values reproduce the n-tile scores"""
+        values = self.customers['total_spent'].to_numpy()
+        scores, _, edges = ntile_scores(values, 4, 'monetary')
+
+        np.testing.assert_array_equal(ntile_edges(np.sort(values), 4), edges)
+        np.testing.assert_array_equal(scores_from_edges(values, edges, 'monetary'), scores)
+
+    def test_customer_delta_matches_full_analysis(self):
+        """Test that merging a customer delta matches re-analyzing the merged base"""
+        RFMState.from_analysis(self._full_analysis(self.customers), 'lineage').save(self.state_dir)
+
+        # Change 20 customers and add 10 new ones
+        today = datetime.datetime.now()
+        delta = self.customers.iloc[:20].copy()
+        delta['purchase_count'] += 15
+        delta['total_spent'] *= 3
+        new_customers = pd.DataFrame({
+            'customer_id': [f'N{i:03d}' for i in range(10)],
+            'last_purchase_date': [today - datetime.timedelta(days=i) for i in range(10)],
+            'purchase_count': list(range(1, 11)),
+            'total_spent': [100.0 * i for i in range(1, 11)]
+        })
+        delta = pd.concat([delta, new_customers], ignore_index=True)
+
+        results = apply_delta_upload(self.state_dir, delta)
+        self.assertEqual(results['delta']['new_customers'], 10)
+        self.assertEqual(results['delta']['changed_customers'], 20)
+        self.assertEqual(results['delta']['total_customers'], 410)
+
+        merged = pd.concat([self.customers.iloc[20:], delta], ignore_index=True)
+        expected = self._full_analysis(merged)
+        expected_segments = expected.rfm_segments.set_index('customer_id')
+
+        state = RFMState.load(self.state_dir)
+        for column in ('r_score', 'f_score', 'm_score', 'segment'):
+            actual = state.customers.loc[expected_segments.index, column]
+            self.assertTrue((actual.to_numpy() == expected_segments[column].to_numpy()).all(), column)
+        self.assertEqual(results['rfm_analysis']['segment_counts'], expected.get_segment_counts())
+
+    def test_what_if_from_score_histogram(self):
+        """Test that what-if results from the histogram match full re-analyses"""
+        RFMState.from_analysis(self._full_analysis(self.customers), 'lineage').save(self.state_dir)
+
+        unchanged = what_if_segments(self.state_dir, 'ecommerce')
+        self.assertEqual(unchanged['segment_count_changes'], {})
+        self.assertEqual(unchanged['rfm_analysis']['segment_counts'], self._full_analysis(self.customers).get_segment_counts())
+
+        what_if = what_if_segments(self.state_dir, 'recorrente')
+        expected = RFMAnalysis(self.customers, 'customer_id', 'last_purchase_date', 'purchase_count', 'total_spent', 'assinatura_de_varejo')
+        self.assertEqual(what_if['rfm_analysis']['segment_counts'], expected.get_segment_counts())
+        stats = expected.get_segment_stats()
+        for segment, values in what_if['rfm_analysis']['segment_stats'].items():
+            self.assertAlmostEqual(values['avg_monetary'], stats[segment]['avg_monetary'])
+
+        # The histogram follows delta updates
+        delta = self.customers.iloc[:50].copy()
+        delta['purchase_count'] += 40
+        apply_delta_upload(self.state_dir, delta)
+        merged = pd.concat([self.customers.iloc[50:], delta], ignore_index=True)
+        self.assertEqual(what_if_segments(self.state_dir, 'ecommerce')['rfm_analysis']['segment_counts'], self._full_analysis(merged).get_segment_counts())
+
+    def test_histogram_is_updated_incrementally(self):
+        """Test that the histogram kept through deltas and date shifts matches a rebuild"""
+        RFMState.from_analysis(self._full_analysis(self.customers), 'lineage').save(self.state_dir)
+
+        delta = self.customers.iloc[:30].copy()
+        delta['total_spent'] *= 4
+        apply_delta_upload(self.state_dir, delta, as_of=datetime.date.today() + datetime.timedelta(days=3))
+
+        state = RFMState.load(self.state_dir)
+        np.testing.assert_allclose(state.histogram, score_histogram(state.customers, state.meta['score_bins']))
+
+    @unittest.skipIf(rfm_state.fcntl is None, "fcntl is not available")
+    def test_state_lock_excludes_other_processes(self):
+        """Test that the state lock is a file lock other processes contend on"""
+        with state_lock(self.state_dir):
+            with open(os.path.join(self.state_dir, rfm_state.STATE_LOCK_FILE), "a") as f:
+                with self.assertRaises(BlockingIOError):
+                    rfm_state.fcntl.flock(f, rfm_state.fcntl.LOCK_EX | rfm_state.fcntl.LOCK_NB)
+
+    def test_what_if_does_not_read_customer_rows(self):
+        """Test that what-if requests only read the state metadata and the histogram"""
+        RFMState.from_analysis(self._full_analysis(self.customers), 'lineage').save(self.state_dir)
+        rfm_state._STATE_CACHE.pop(self.state_dir, None)
+        rfm_state._HISTOGRAM_CACHE.pop(self.state_dir, None)
+
+        with mock.patch.object(rfm_state.pd, 'read_feather', side_effect=AssertionError("state.feather was read")):
+            what_if = what_if_segments(self.state_dir, 'recorrente')
+        self.assertEqual(sum(what_if['rfm_analysis']['segment_counts'].values()), len(self.customers))
+
+    def test_transaction_delta_adds_orders(self):
+        """Test that transaction deltas extend customer histories"""
+        today = datetime.datetime.now()
+        transactions = pd.DataFrame({
+            'customer_id': ['A', 'A', 'B', 'C', 'D', 'E'],
+            'order_date': [today - datetime.timedelta(days=d) for d in (50, 40, 100, 10, 200, 5)],
+            'amount': [10.0, 20.0, 50.0, 5.0, 80.0, 15.0]
+        })
+        rfm = RFMAnalysis(transactions, 'customer_id', 'order_date', None, 'amount', 'ecommerce', input_mode='transaction')
+        rfm.segment_customers()
+        RFMState.from_analysis(rfm, 'lineage').save(self.state_dir)
+
+        delta = pd.DataFrame({
+            'customer_id': ['A', 'F'],
+            'order_date': [today - datetime.timedelta(days=1), today],
+            'amount': [30.0, 12.0]
+        })
+        results = apply_delta_upload(self.state_dir, delta)
+        state = RFMState.load(self.state_dir)
+
+        self.assertEqual(results['delta']['new_customers'], 1)
+        self.assertEqual(state.customers.loc['A', 'frequency'], 3)
+        self.assertEqual(state.customers.loc['A', 'monetary'], 60.0)
+        self.assertEqual(state.customers.loc['A', 'recency_days'], 1)
+        self.assertEqual(sum(results['rfm_analysis']['segment_counts'].values()), 6)
+
+    def test_state_cache_is_bounded(self):
+        """Test that the least recently used states are evicted from the cache"""
+        state = RFMState.from_analysis(self._full_analysis(self.customers), 'lineage')
+        state_dirs = [os.path.join(self.state_dir, name) for name in ('a', 'b', 'c')]
+        with mock.patch.object(rfm_state, 'STATE_CACHE_MAX_ENTRIES', 2), mock.patch.dict(rfm_state._STATE_CACHE, clear=True):
+            state.save(state_dirs[0])
+            state.save(state_dirs[1])
+            RFMState.load(state_dirs[0])
+            state.save(state_dirs[2])
+            self.assertEqual(list(rfm_state._STATE_CACHE), [state_dirs[0], state_dirs[2]])
+
+            with mock.patch.object(rfm_state, 'STATE_CACHE_MAX_BYTES', 1):
+                RFMState.load(state_dirs[1])
+            self.assertEqual(list(rfm_state._STATE_CACHE), [state_dirs[1]])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+# RFM Insights - Unit Tests for Model Tuning Module
+
+import os
+import time
+import unittest
+import tempfile
+import datetime
+import numpy as np
+import pandas as pd
+from backend.rfm_analysis import analyze_rfm_data
+from backend.rfm_models import ScoringModels
+from backend.rfm_tuning import successive_halving, tune_analysis, load_tuning, tuned_model_settings, _fit_forest, _deadline_callback
+
+class TestSuccessiveHalving(unittest.TestCase):
+
+    def test_elimination(self):
+        """Test rung sizes, elimination and the winner"""
+        calls = []
+
+        def evaluate(params, rows):
+            calls.append((params['id'], rows))
+            if params['id'] == 5:
+                raise ValueError("invalid configuration")
+            return -abs(params['id'] - 7) + rows / 1e6
+
+        candidates = [{'id': index} for index in range(9)]
+        result = successive_halving(evaluate, candidates, 9000, time.monotonic() + 60, workers=2, eta=3, min_rows=100)
+        self.assertEqual(result['params'], {'id': 7})
+        self.assertTrue(result['complete'])
+        self.assertEqual([(rung['rows'], rung['candidates'], rung['evaluated']) for rung in result['rungs']], [(3000, 9, 8), (9000, 3, 3)])
+        self.assertEqual(sorted(params for params, rows in calls if rows == 9000), [6, 7, 8])
+
+    def test_deadline(self):
+        """Test that an exhausted budget keeps the default configuration"""
+        result = successive_halving(lambda params, rows: 1.0, [{}, {'max_depth': 3}], 1000, time.monotonic() - 1)
+        self.assertEqual((result['params'], result['score'], result['rungs'], result['complete']), ({}, None, [], False))
+
+        def slow(params, rows):
+            time.sleep(0.5 if params else 0)
+            return 1.0 if params else 0.0
+
+        # A rung cut short by the deadline does not replace the last finished one
+        result = successive_halving(slow, [{}, {'max_depth': 3}], 1000, time.monotonic() + 0.2, workers=2)
+        self.assertEqual((result['params'], result['score'], result['complete']), ({}, 0.0, False))
+
+    def test_running_evaluations_are_waited_for(self):
+        """Test that no evaluation outlives the search"""
+        running = []
+
+        def slow(params, rows):
+            running.append(params['id'])
+            time.sleep(0.3)
+            running.remove(params['id'])
+            return 1.0
+
+        successive_halving(slow, [{'id': index} for index in range(4)], 1000, time.monotonic() + 0.1, workers=2)
+        self.assertEqual(running, [])
+
+    def test_fits_stop_at_deadline(self):
+        """Test that forests and boosting give up past the deadline and match untimed fits before it"""
+        from sklearn.ensemble import RandomForestClassifier
+        import xgboost as xgb
+        rng = np.random.default_rng(0)
+        features = rng.normal(size=(500, 4))
+        target = features[:, 0] + rng.normal(scale=0.1, size=500) > 0
+
+        forest = _fit_forest(RandomForestClassifier(n_estimators=25, random_state=42), features, target, time.monotonic() + 60)
+        expected = RandomForestClassifier(n_estimators=25, random_state=42).fit(features, target)
+        self.assertEqual(len(forest.estimators_), 25)
+        np.testing.assert_allclose(forest.predict_proba(features), expected.predict_proba(features))
+        with self.assertRaises(TimeoutError):
+            _fit_forest(RandomForestClassifier(n_estimators=25), features, target, time.monotonic() - 1)
+
+        booster = xgb.XGBRegressor(n_estimators=50, callbacks=[_deadline_callback(time.monotonic() - 1)]).fit(features, target)
+        self.assertEqual(booster.get_booster().num_boosted_rounds(), 1)
+
+class TestModelTuning(unittest.TestCase):
+
+    def test_tune_and_reuse(self):
+        """Test that the tuned configuration is cached and applied to later analyses"""
+        rng = np.random.default_rng(3)
+        today = pd.Timestamp(datetime.date.today())
+        customers = pd.DataFrame({
+            'customer_id': [f'C{i:04d}' for i in range(4000)],
+            'last_purchase_date': today - pd.to_timedelta(rng.integers(0, 700, 4000), unit='D'),
+            'purchase_count': rng.integers(1, 40, 4000),
+            'total_spent': rng.gamma(2.0, 100.0, 4000).round(2)
+        })
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            analysis_dir = os.path.join(tmp_dir, 'analysis')
+            tuning_dir = os.path.join(tmp_dir, 'tuning')
+            analyze_rfm_data(customers, 'customer_id', 'last_purchase_date', 'purchase_count', 'total_spent', 'ecommerce', score_bins=5, output_dir=analysis_dir, model_settings={'silhouette_sample_size': 1000})
+            self.assertEqual(tuned_model_settings('ana', 'ecommerce', tuning_dir), {})
+
+            entry = tune_analysis(analysis_dir, 'ana', time_budget=60, workers=2, tuning_dir=tuning_dir)
+            self.assertEqual((entry['segment_type'], entry['customers'], entry['analysis_id']), ('ecommerce', 4000, 'analysis'))
+            for model in ('churn', 'ltv'):
+                self.assertTrue(entry[model]['complete'])
+                self.assertEqual(entry[model]['rungs'][-1]['rows'], 2800)
+            self.assertEqual(load_tuning('ana', 'ecommerce', tuning_dir), entry)
+            self.assertIsNone(load_tuning('ana', 'retail', tuning_dir))
+            self.assertIsNone(load_tuning('bob', 'ecommerce', tuning_dir))
+
+            settings = tuned_model_settings('ana', 'ecommerce', tuning_dir)
+            analyze_rfm_data(customers, 'customer_id', 'last_purchase_date', 'purchase_count', 'total_spent', 'ecommerce', score_bins=5, output_dir=analysis_dir, model_settings={'silhouette_sample_size': 1000, **settings})
+            models = ScoringModels.load(analysis_dir)
+            for name, value in settings['churn_params'].items():
+                self.assertEqual(getattr(models.churn_model, name), value)
+            for name, value in settings['ltv_params'].items():
+                self.assertEqual(getattr(models.ltv_model, name), value)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+# RFM Insights - Unit Tests for Segment Rule Sets Module
+
+import os
+import shutil
+import tempfile
+import unittest
+import datetime
+import numpy as np
+import pandas as pd
+from backend.rfm_analysis import RFMAnalysis
+from backend.rfm_parallel import analyze_rfm_partitioned
+from backend.segment_rules import (
+    builtin_rule_set, compile_rule_set, resolve_rule_set, validate_rule_set,
+    save_custom_rule_set, load_custom_rule_set, list_custom_rule_sets
+)
+
+def legacy_segment_rule(r, f, m):
+    """The if/elif segmentation the ecommerce rule set replaces"""
+    if r >= 4 and f >= 4 and m >= 4:
+        return "Campeões"
+    elif (f >= 3 and m >= 3) and r >= 3:
+        return "Clientes Fiéis"
+    elif r >= 4 and (f >= 2 and f < 4) and (m >= 2 and m < 4):
+        return "Fiéis em Potencial"
+    elif r >= 4 and f <= 1:
+        return "Novos Clientes"
+    elif r >= 3 and f <= 2 and m >= 3:
+        return "Clientes Promissores"
+    elif (r >= 2 and r < 4) and (f >= 2 and f < 4) and (m >= 2 and m < 4):
+        return "Clientes que Precisam de Atenção"
+    elif r <= 2 and (f >= 2 and f < 4) and (m >= 2 and m < 4):
+        return "Clientes Quase Dormentes"
+    elif r <= 2 and f >= 3 and m >= 3:
+        return "Clientes que Não Posso Perder"
+    elif r <= 2 and (f >= 2 and f < 4):
+        return "Clientes em Risco"
+    elif r <= 1 and f <= 2 and m <= 2:
+        return "Clientes Hibernando"
+    elif r <= 1 and f <= 1:
+        return "Clientes Perdidos"
+    return "Outros"
+
+# Custom rule set on a quintile scale
+CUSTOM_RULES = {
+    'name': "VIP",
+    'score_bins': 5,
+    'default': "Demais",
+    'rules': [
+        {'segment': "VIP", 'r': [4, 5], 'm': 5},
+        {'segment': "Ativos", 'r': [3, 5], 'f': [2, 5]},
+        {'segment': "Inativos", 'r': 1}
+    ]
+}
+
+class TestSegmentRules(unittest.TestCase):
+
+    def setUp(self):
+        """Set up customer data and a temporary rule set directory"""
+        rng = np.random.default_rng(5)
+        today = datetime.datetime.now()
+        self.data = pd.DataFrame({
+            'customer_id': range(500),
+            'last_purchase_date': [today - datetime.timedelta(days=int(d)) for d in rng.integers(0, 365, 500)],
+            'purchase_count': rng.integers(1, 20, 500),
+            'total_spent': rng.gamma(2.0, 100.0, 500).round(2)
+        })
+        self.columns = ('customer_id', 'last_purchase_date', 'purchase_count', 'total_spent')
+        self.rules_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Remove the temporary rule set directory"""
+        shutil.rmtree(self.rules_dir, ignore_errors=True)
+
+    def test_ecommerce_rule_set_matches_legacy_rules(self):
+        """Test that the built-in ecommerce rules reproduce the original segmentation"""
+        rules = builtin_rule_set('ecommerce')
+        for r in range(1, 5):
+            for f in range(1, 5):
+                for m in range(1, 5):
+                    self.assertEqual(rules.segments(r, f, m), legacy_segment_rule(r, f, m))
+
+    def test_compiled_once_per_hash(self):
+        """Test that rule sets with the same logic share one compiled lookup"""
+        first = compile_rule_set(CUSTOM_RULES)
+        renamed = compile_rule_set(dict(CUSTOM_RULES, name="Outro nome"))
+        self.assertIs(first, renamed)
+        self.assertEqual(first.segment_names, ["VIP", "Ativos", "Inativos", "Demais"])
+        self.assertEqual(first.cube.shape, (6, 6, 6))
+        # Quartile scores are mapped onto the rule set's quintile scale
+        self.assertEqual(first.segments(4, 1, 4, score_bins=4), "VIP")
+
+    def test_invalid_rule_sets(self):
+        """Test rule set validation"""
+        for definition in (
+            {'rules': []},
+            {'rules': [{'segment': "A", 'r': [3, 2]}]},
+            {'rules': [{'segment': "A", 'x': 1}]},
+            {'rules': [{'r': 1}]},
+            {'score_bins': 1, 'rules': [{'segment': "A"}]}
+        ):
+            with self.assertRaises(ValueError):
+                validate_rule_set(definition)
+        with self.assertRaises(KeyError):
+            load_custom_rule_set('0123abcd', self.rules_dir)
+
+    def test_custom_rule_set_analysis(self):
+        """Test storing a custom rule set and segmenting with it"""
+        entry = save_custom_rule_set(CUSTOM_RULES, owner='user-1', rules_dir=self.rules_dir)
+        self.assertEqual([e['id'] for e in list_custom_rule_sets('user-1', self.rules_dir)], [entry['id']])
+        self.assertEqual(list_custom_rule_sets('user-2', self.rules_dir), [])
+
+        rule_set = resolve_rule_set('ecommerce', entry['id'], rules_dir=self.rules_dir)
+        rfm = RFMAnalysis(self.data, *self.columns, 'ecommerce', score_bins=10, rule_set=rule_set)
+        segments = rfm.segment_customers()
+        for _, row in segments.iterrows():
+            r, f, m = ((row[col] - 1) * 5 // 10 + 1 for col in ('r_score', 'f_score', 'm_score'))
+            if r >= 4 and m == 5:
+                expected = "VIP"
+            elif r >= 3 and f >= 2:
+                expected = "Ativos"
+            elif r == 1:
+                expected = "Inativos"
+            else:
+                expected = "Demais"
+            self.assertEqual(row['segment'], expected)
+
+        partitioned = analyze_rfm_partitioned(self.data, *self.columns, 'ecommerce', workers=1, score_bins=10, rule_set=rule_set)
+        self.assertEqual(partitioned['rfm_analysis']['segment_counts'], rfm.get_segment_counts())
+
+    def test_segment_type_selects_rule_set(self):
+        """Test that business segment types use their built-in rule set"""
+        self.assertEqual(resolve_rule_set('assinatura_de_varejo').name, 'recorrente')
+        self.assertEqual(resolve_rule_set('agencia_de_turismo-hotelaria').name, 'ocasional')
+        self.assertEqual(resolve_rule_set('desconhecido').name, 'ecommerce')
+
+        rfm = RFMAnalysis(self.data, *self.columns, 'assinatura_de_varejo')
+        segments = rfm.segment_customers()
+        self.assertTrue(set(segments['segment']) <= set(rfm.rule_set.segment_names))
+        self.assertNotIn("Clientes Quase Dormentes", set(segments['segment']))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+# RFM Insights - Unit Tests for Worker Memory Hygiene Module
+
+import unittest
+from unittest import mock
+import numpy as np
+from backend import worker_hygiene
+from backend.worker_hygiene import track_job, release_memory, current_rss
+
+MB = 1024 * 1024
+
+class TestWorkerHygiene(unittest.TestCase):
+
+    def test_release_memory(self):
+        """Test that freed buffers are returned to the OS"""
+        rss = current_rss()
+        self.assertGreater(rss, 0)
+        # Many mid-sized buffers are served from the heap, not from mmap
+        buffers = [np.ones(16 * 1024) for _ in range(4000)]
+        del buffers
+        report = release_memory()
+        self.assertGreaterEqual(report['released_bytes'], 0)
+        self.assertLessEqual(report['rss_after'], report['rss_before'])
+
+    def test_cleanup_and_recycle(self):
+        """Test cleanup after large jobs and a recycle deferred to the last running job"""
+        rss = iter([100 * MB, 300 * MB, 120 * MB])
+        cleanup = {'collected': 0, 'trimmed': True, 'rss_before': 300 * MB, 'rss_after': 120 * MB, 'released_bytes': 180 * MB}
+        with mock.patch.object(worker_hygiene, 'current_rss', lambda: next(rss)), \
+                mock.patch.object(worker_hygiene, 'release_memory', return_value=cleanup) as release, \
+                mock.patch.object(worker_hygiene, '_recycle_worker') as recycle, \
+                mock.patch.object(worker_hygiene, 'CLEANUP_MIN_BYTES', 64 * MB), \
+                mock.patch.object(worker_hygiene, 'RSS_HIGH_WATER_BYTES', 400 * MB):
+            with track_job("analysis") as report:
+                pass
+        release.assert_called_once()
+        recycle.assert_not_called()
+        self.assertEqual((report['rss_growth'], report['rss_after'], report['recycle']), (200 * MB, 120 * MB, False))
+
+        rss = iter([450 * MB, 460 * MB, 470 * MB, 480 * MB])
+        caches = {'collected': 0, 'trimmed': True, 'rss_before': 480 * MB, 'rss_after': 460 * MB, 'released_bytes': 20 * MB}
+        with mock.patch.object(worker_hygiene, 'current_rss', lambda: next(rss)), \
+                mock.patch.object(worker_hygiene, 'release_memory') as release, \
+                mock.patch.object(worker_hygiene, 'release_caches', return_value=caches) as release_caches, \
+                mock.patch.object(worker_hygiene, '_respawned_by_process_manager', return_value=True), \
+                mock.patch.object(worker_hygiene, '_recycle_worker') as recycle, \
+                mock.patch.object(worker_hygiene, 'CLEANUP_MIN_BYTES', 64 * MB), \
+                mock.patch.object(worker_hygiene, 'RSS_HIGH_WATER_BYTES', 400 * MB):
+            with track_job("analysis") as outer:
+                with track_job("analysis") as inner:
+                    pass
+                # The worker is not recycled while another job runs in it
+                recycle.assert_not_called()
+                release_caches.assert_not_called()
+            release_caches.assert_called_once()
+            recycle.assert_called_once()
+        release.assert_not_called()
+        self.assertEqual((inner['recycle'], outer['recycle'], outer['rss_after']), (False, True, 460 * MB))
+
+    def test_recycle_needs_process_manager(self):
+        """Test that dropping caches can avoid a recycle and that a lone server is never stopped"""
+        for rss_after_caches, supervised, expected in ((300 * MB, True, None), (460 * MB, False, 'no_process_manager')):
+            rss = iter([450 * MB, 470 * MB])
+            caches = {'collected': 0, 'trimmed': True, 'rss_before': 470 * MB, 'rss_after': rss_after_caches, 'released_bytes': 0}
+            with mock.patch.object(worker_hygiene, 'current_rss', lambda: next(rss)), \
+                    mock.patch.object(worker_hygiene, 'release_caches', return_value=caches), \
+                    mock.patch.object(worker_hygiene, '_respawned_by_process_manager', return_value=supervised), \
+                    mock.patch.object(worker_hygiene, '_recycle_worker') as recycle, \
+                    mock.patch.object(worker_hygiene, 'CLEANUP_MIN_BYTES', 64 * MB), \
+                    mock.patch.object(worker_hygiene, 'RSS_HIGH_WATER_BYTES', 400 * MB):
+                with track_job("analysis") as report:
+                    pass
+            recycle.assert_not_called()
+            self.assertEqual((report['recycle'], report.get('recycle_skipped')), (False, expected))
+
+    def test_release_caches(self):
+        """Test that the per-process caches are emptied"""
+        from backend import rfm_state, rfm_lookup, rfm_models
+        rfm_state._HISTOGRAM_CACHE['dir'] = (0, None)
+        rfm_lookup._INDEXES['dir'] = (0, None)
+        rfm_models._MODELS['dir'] = (0, None)
+        report = worker_hygiene.release_caches()
+        self.assertEqual((rfm_state._HISTOGRAM_CACHE, rfm_lookup._INDEXES, rfm_models._MODELS), ({}, {}, {}))
+        self.assertIn('rss_after', report)
+
+if __name__ == '__main__':
+    unittest.main()